@@ -22,17 +22,44 @@ Event Format:
 
 Response Format:
     Success: {"output": results_dict}
+             (+ results_dict["worker_metrics"] once the worker recorded metrics,
+              e.g. warmup_seconds from main.py's startup warmup)
     Failure: {"error": error_message}
+
+Pipeline engine (PIPELINE_ENGINE env):
+    "asyncio" (default) → engine.async_pipeline.run_async_job
+    "threads"           → engine.pipeline.process_job
 """
 
 import logging
 import os
 
+from engine import metrics
+
 # Configure logging
 logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
 logger = logging.getLogger(__name__)
 
 
+def run_pipeline(job_input: dict) -> dict:
+    """
+    Run a job on the engine selected by PIPELINE_ENGINE.
+
+    - "asyncio" (default): engine.async_pipeline (high-concurrency network stages)
+    - "threads": engine.pipeline.process_job (bounded-queue thread stages)
+    """
+    engine = os.getenv("PIPELINE_ENGINE", "asyncio")
+
+    if engine == "asyncio":
+        from engine.async_pipeline import run_async_job
+        return run_async_job(job_input)
+    elif engine == "threads":
+        from engine.pipeline import process_job
+        return process_job(job_input)
+    else:
+        raise ValueError(f"Unknown PIPELINE_ENGINE: {engine}")
+
+
 def handler(event: dict) -> dict:
     """
     Runpod serverless handler. Receives job from queue, processes it, returns result.
@@ -70,13 +97,14 @@ def handler(event: dict) -> dict:
         job_id = job_input.get("job_id", "unknown")
         logger.info(f"Runpod handler received job: {job_id}")
 
-        # Import and call pipeline
-        from engine.pipeline import process_job
-
-        results = process_job(job_input)
+        results = run_pipeline(job_input)
 
         logger.info(f"Job {job_id} completed: {results}")
 
+        worker_metrics = metrics.snapshot()
+        if worker_metrics:
+            results["worker_metrics"] = worker_metrics
+
         # Return success response
         return {"output": results}
 
@@ -7,11 +7,15 @@ Implements rule application for image transformations:
 - texture: Apply texture patterns (v2 feature)
 
 Protected mask areas are preserved from the original image.
+Masks may be dense arrays or CompactMask (bounding box + bit-packed); compact
+masks are blended inside their bounding box only.
 """
 
 import numpy as np
 from PIL import Image
 
+from .compact_mask import CompactMask
+
 
 def apply_rules(image, masks: dict, concepts: dict, protect_mask=None):
     """
@@ -20,10 +24,11 @@ def apply_rules(image, masks: dict, concepts: dict, protect_mask=None):
     Args:
         image: PIL Image to process
         masks: Dict mapping concept names to mask arrays or lists of mask arrays
-               Each mask is a numpy array of shape (H, W) with values 0-255 or 0-1
+               Each mask is a numpy array of shape (H, W) with values 0-255 or 0-1,
+               or an engine.compact_mask.CompactMask
         concepts: Dict mapping concept names to rule definitions
                   Example: {"Floor": {"action": "recolor", "value": "#FF5733"}}
-        protect_mask: Optional numpy array (H, W) marking protected regions
+        protect_mask: Optional numpy array (H, W) or CompactMask marking protected regions
                      Protected pixels will not be modified
 
     Returns:
@@ -47,6 +52,9 @@ def apply_rules(image, masks: dict, concepts: dict, protect_mask=None):
     # Create a copy to modify
     result_array = img_array.copy()
 
+    # Protect mask is normalized once (compact protect masks stay compact)
+    protect = _prepare_protect(protect_mask, height, width)
+
     # Process each concept with its rule
     for concept_name, rule in concepts.items():
         # Skip if concept not in masks
@@ -72,6 +80,8 @@ def apply_rules(image, masks: dict, concepts: dict, protect_mask=None):
             else:
                 # Shape: [H, W]
                 mask_list = [concept_masks]
+        elif isinstance(concept_masks, CompactMask):
+            mask_list = [concept_masks]
         elif isinstance(concept_masks, list):
             mask_list = concept_masks
         else:
@@ -86,17 +96,30 @@ def apply_rules(image, masks: dict, concepts: dict, protect_mask=None):
 
             # Apply color to each instance mask
             for mask in mask_list:
+                if isinstance(mask, CompactMask):
+                    # Only the bounding box can change
+                    if mask.shape != (height, width) or mask.empty:
+                        continue
+                    x0, y0, x1, y1 = mask.box
+                    region_mask = mask.crop().astype(np.float32)
+                    if protect is not None:
+                        region_mask = region_mask * (1 - _mask_region(protect, mask.box))
+                    region_3d = np.expand_dims(region_mask, axis=2)
+                    region = result_array[y0:y1, x0:x1]
+                    color = np.array(color_rgb)
+                    result_array[y0:y1, x0:x1] = region * (1 - region_3d) + color * region_3d
+                    continue
+
                 # Normalize mask to 0-1 range
                 mask_normalized = _normalize_mask(mask, height, width)
                 if mask_normalized is None:
                     continue
 
                 # Apply protect mask if provided
-                if protect_mask is not None:
-                    protect_normalized = _normalize_mask(protect_mask, height, width)
-                    if protect_normalized is not None:
-                        # Exclude protected regions from the mask
-                        mask_normalized = mask_normalized * (1 - protect_normalized)
+                if protect is not None:
+                    # Exclude protected regions from the mask
+                    protect_region = _mask_region(protect, (0, 0, width, height))
+                    mask_normalized = mask_normalized * (1 - protect_region)
 
                 # Apply recolor: blend original with target color based on mask
                 # mask_normalized shape: (H, W), need to expand to (H, W, 3)
@@ -182,3 +205,23 @@ def _normalize_mask(mask, target_height: int, target_width: int):
     else:
         # Already in 0-1 range
         return mask.astype(np.float32)
+
+
+def _prepare_protect(protect_mask, target_height: int, target_width: int):
+    """
+    Validate the protect mask once per call.
+
+    Returns:
+        CompactMask of the image size, normalized (H, W) array, or None if absent/invalid
+    """
+    if isinstance(protect_mask, CompactMask):
+        return protect_mask if protect_mask.shape == (target_height, target_width) else None
+    return _normalize_mask(protect_mask, target_height, target_width)
+
+
+def _mask_region(mask, box: tuple) -> np.ndarray:
+    """0-1 float values of a prepared mask inside box (x0, y0, x1, y1)."""
+    if isinstance(mask, CompactMask):
+        return mask.region(box).astype(np.float32)
+    x0, y0, x1, y1 = box
+    return mask[y0:y1, x0:x1]
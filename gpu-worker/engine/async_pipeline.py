@@ -0,0 +1,191 @@
+"""
+Async Pipeline — asyncio 기반 process_job
+
+engine.pipeline.process_job과 같은 결과를 내지만 네트워크 stage의 동시성을
+batch_concurrency와 분리한다:
+
+- download / upload (boto3, blocking) → 전용 I/O 스레드 풀 (IO_CONCURRENCY)
+- callback → httpx.AsyncClient coroutine (IO_CONCURRENCY)
+- decode / apply / encode (CPU) → CPU 스레드 풀 (batch_concurrency)
+- segment (GPU) → 단일 스레드 executor
+
+메모리에 동시에 올라가는 item 수는 ASYNC_MAX_IN_FLIGHT로 제한한다.
+run_async_job(job_message) → 동기 wrapper (adapters.runpod_serverless.handler용).
+"""
+
+import asyncio
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Optional
+
+from .callback import report_async
+from .pipeline import DEFAULT_BATCH_CONCURRENCY, STAGE_NAMES, _JobRunner, _WorkItem
+from .r2_io import R2Client
+from .stages import StageStats
+
+logger = logging.getLogger(__name__)
+
+# Concurrent network operations (R2 + callbacks), independent of batch_concurrency
+DEFAULT_IO_CONCURRENCY = int(os.getenv("IO_CONCURRENCY", "32"))
+
+# Items held in memory at once (downloaded bytes → encoded outputs)
+DEFAULT_MAX_IN_FLIGHT = int(os.getenv("ASYNC_MAX_IN_FLIGHT", "16"))
+
+# CPU stages that do not scale with batch_concurrency
+DECODE_CONCURRENCY = 2
+
+
+class _AsyncStage:
+    """Concurrency limit + StageStats for one stage of the asyncio pipeline."""
+
+    def __init__(self, name: str, limit: int, executor: Optional[ThreadPoolExecutor] = None):
+        self.name = name
+        self.executor = executor
+        self.stats = StageStats(workers=limit)
+        self._semaphore = asyncio.Semaphore(limit)
+        self._waiting = 0
+
+    async def run(self, fn: Callable, *args):
+        """Run fn (sync → executor, async → awaited) once a slot is free."""
+        self._waiting += 1
+        self.stats.sample_depth(self._waiting)
+        async with self._semaphore:
+            self._waiting -= 1
+            start = time.perf_counter()
+            try:
+                if self.executor is not None:
+                    loop = asyncio.get_running_loop()
+                    result = await loop.run_in_executor(self.executor, fn, *args)
+                else:
+                    result = await fn(*args)
+            except Exception:
+                self.stats.failed += 1
+                raise
+            finally:
+                self.stats.busy_sec += time.perf_counter() - start
+            self.stats.processed += 1
+            return result
+
+
+async def process_job_async(job_message: dict) -> dict:
+    """
+    Process a GPU job with asyncio: network stages as high-concurrency coroutines,
+    CPU and GPU stages on executors.
+
+    Args:
+        job_message: Same job specification as engine.pipeline.process_job, plus:
+            - io_concurrency: Max concurrent R2/callback operations (optional)
+
+    Returns:
+        dict: Same result summary as process_job (total/successful/failed items,
+              errors, per-stage stats)
+    """
+    job_id = job_message.get("job_id", "unknown")
+    user_id = job_message.get("user_id", "unknown")
+    items = job_message.get("items", [])
+    batch_concurrency = job_message.get("batch_concurrency", DEFAULT_BATCH_CONCURRENCY)
+    io_concurrency = job_message.get("io_concurrency", DEFAULT_IO_CONCURRENCY)
+
+    logger.info(f"Starting async job {job_id} for user {user_id} with {len(items)} items")
+
+    result_summary = {
+        "total_items": len(items),
+        "successful_items": 0,
+        "failed_items": 0,
+        "errors": []
+    }
+
+    if not items:
+        logger.warning(f"Job {job_id} has no items to process")
+        return result_summary
+
+    runner = _JobRunner(job_message, result_summary, R2Client())
+
+    io_pool = ThreadPoolExecutor(max_workers=io_concurrency, thread_name_prefix="io")
+    cpu_pool = ThreadPoolExecutor(
+        max_workers=max(batch_concurrency, DECODE_CONCURRENCY), thread_name_prefix="cpu"
+    )
+    gpu_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="gpu")
+
+    stages = {
+        "download": _AsyncStage("download", io_concurrency, io_pool),
+        "decode": _AsyncStage("decode", DECODE_CONCURRENCY, cpu_pool),
+        "segment": _AsyncStage("segment", 1, gpu_pool),
+        "apply": _AsyncStage("apply", batch_concurrency, cpu_pool),
+        "encode": _AsyncStage("encode", batch_concurrency, cpu_pool),
+        "upload": _AsyncStage("upload", io_concurrency),  # fans out to io_pool itself
+        "callback": _AsyncStage("callback", io_concurrency),
+    }
+    in_flight = asyncio.Semaphore(DEFAULT_MAX_IN_FLIGHT)
+
+    async def upload(work: _WorkItem) -> None:
+        # Output and preview go up concurrently
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(
+            loop.run_in_executor(io_pool, runner.upload_output, work),
+            loop.run_in_executor(io_pool, runner.upload_preview, work),
+        )
+
+    async def callback(work: _WorkItem) -> None:
+        runner.complete(work, await report_async(**runner.completed_report(work)))
+
+    steps: list[tuple[str, Callable[[_WorkItem], Optional[Awaitable]]]] = [
+        ("download", runner.download),
+        ("decode", runner.decode),
+        ("segment", runner.segment),
+        ("apply", runner.apply),
+        ("encode", runner.encode),
+        ("upload", upload),
+        ("callback", callback),
+    ]
+
+    async def process_item(work: _WorkItem) -> None:
+        async with in_flight:
+            for name, fn in steps:
+                try:
+                    await stages[name].run(fn, work)
+                except Exception as e:
+                    error_msg = runner.record_failure(work, name, e)
+                    if runner.callback_url:
+                        await report_async(
+                            callback_url=runner.callback_url,
+                            idx=work.idx,
+                            status="failed",
+                            error=error_msg,
+                        )
+                    return
+
+    try:
+        await asyncio.gather(*(process_item(_WorkItem(item)) for item in items))
+    finally:
+        for pool in (io_pool, cpu_pool, gpu_pool):
+            pool.shutdown(wait=True)
+
+    result_summary["stages"] = {name: stages[name].stats.to_dict() for name in STAGE_NAMES}
+
+    logger.info(
+        f"Job {job_id} complete: "
+        f"{result_summary['successful_items']}/{result_summary['total_items']} successful, "
+        f"{result_summary['failed_items']} failed"
+    )
+
+    return result_summary
+
+
+def run_async_job(job_message: dict) -> dict:
+    """
+    Synchronous wrapper around process_job_async.
+
+    Works both from plain threads and from inside a running event loop (e.g. the
+    Runpod worker loop calling a sync handler): in the latter case the job runs on
+    a private event loop in a helper thread.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(process_job_async(job_message))
+
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="async-job") as pool:
+        return pool.submit(asyncio.run, process_job_async(job_message)).result()
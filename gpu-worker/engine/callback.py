@@ -7,15 +7,17 @@ TODO: Auto-Claude 구현
 - GPU_CALLBACK_SECRET 헤더 포함
 - timeout: CALLBACK_TIMEOUT_SEC (기본 10초)
 - 실패 시 retry 1회
+- report_async(...) → asyncio 파이프라인용 (httpx.AsyncClient)
 """
 
-import os
+import asyncio
 import hashlib
-import time
+import os
 import re
-import httpx
+import time
 from typing import Optional
 
+import httpx
 
 CALLBACK_TIMEOUT = int(os.getenv("CALLBACK_TIMEOUT_SEC", "10"))
 
@@ -34,16 +36,16 @@ def _generate_idempotency_key(job_id: str, idx: int, attempt: int = 1) -> str:
     return hashlib.sha256(payload.encode()).hexdigest()[:16]
 
 
-def report(
+def _build_request(
     callback_url: str,
     idx: int,
     status: str,
-    output_key: str | None = None,
-    preview_key: str | None = None,
-    error: str | None = None,
-    idempotency_key: str = "",
-) -> bool:
-    """POST callback to Workers. Returns True on success."""
+    output_key: str | None,
+    preview_key: str | None,
+    error: str | None,
+    idempotency_key: str,
+) -> tuple[dict, dict]:
+    """Build (headers, payload) for a callback POST."""
     gpu_callback_secret = os.getenv("GPU_CALLBACK_SECRET", "")
 
     # Generate idempotency key if not provided
@@ -72,6 +74,23 @@ def report(
     if error is not None:
         payload["error"] = error
 
+    return headers, payload
+
+
+def report(
+    callback_url: str,
+    idx: int,
+    status: str,
+    output_key: str | None = None,
+    preview_key: str | None = None,
+    error: str | None = None,
+    idempotency_key: str = "",
+) -> bool:
+    """POST callback to Workers. Returns True on success."""
+    headers, payload = _build_request(
+        callback_url, idx, status, output_key, preview_key, error, idempotency_key
+    )
+
     # Send POST request with retry logic
     max_retries = 1
     for attempt in range(max_retries + 1):
@@ -91,3 +110,37 @@ def report(
                 return False
 
     return False
+
+
+async def report_async(
+    callback_url: str,
+    idx: int,
+    status: str,
+    output_key: str | None = None,
+    preview_key: str | None = None,
+    error: str | None = None,
+    idempotency_key: str = "",
+) -> bool:
+    """Async report() for the asyncio pipeline (same payload, headers and retry)."""
+    headers, payload = _build_request(
+        callback_url, idx, status, output_key, preview_key, error, idempotency_key
+    )
+
+    max_retries = 1
+    for attempt in range(max_retries + 1):
+        try:
+            async with httpx.AsyncClient(timeout=CALLBACK_TIMEOUT) as client:
+                response = await client.post(callback_url, json=payload, headers=headers)
+                response.raise_for_status()
+                return True
+        except httpx.HTTPError as e:
+            if attempt < max_retries:
+                # Retry once on failure
+                await asyncio.sleep(1)
+                continue
+            else:
+                # Log warning but don't raise - don't block pipeline on callback failure
+                print(f"WARNING: Callback failed after {max_retries + 1} attempts: {str(e)}")
+                return False
+
+    return False
@@ -0,0 +1,153 @@
+"""
+Checkpoint — SAM3 가중치 포맷 변환 / 빠른 cold-start 로딩
+
+sam3.pt (3.4GB) torch.load는 state dict 전체를 RAM에 올린 뒤 모델로 복사한다.
+safetensors 파일은 mmap으로 열고 텐서를 하나씩 모델 파라미터에 복사하므로
+(필요한 페이지만 읽음) 로딩이 빠르고 peak RSS가 모델 크기 근처에 머문다.
+
+- convert_checkpoint(src, dst, dtype) → sam3.pt → .safetensors (선택: fp16)
+- load_safetensors_into(model, path) → mmap 로딩, missing/unexpected key 반환
+- is_safetensors(path) → 확장자로 포맷 판별
+
+safetensors 패키지는 이 경로에서만 필요하므로 lazy import 한다.
+"""
+
+import json
+import logging
+import os
+from typing import Optional
+
+import torch
+
+logger = logging.getLogger(__name__)
+
+SAFETENSORS_SUFFIX = ".safetensors"
+
+# Weight dtypes convert_checkpoint() can write (None = keep checkpoint dtype)
+CONVERT_DTYPES = {"fp16": torch.float16, "bf16": torch.bfloat16}
+
+# SAM3 checkpoints hold the image detector and the video tracker; the image
+# model only loads "detector.*" keys (prefix stripped), like sam3's own loader.
+_DETECTOR_PREFIX = "detector."
+
+
+def is_safetensors(path: str) -> bool:
+    """True if the checkpoint path is a safetensors file."""
+    return path.endswith(SAFETENSORS_SUFFIX)
+
+
+def sam3_image_state_dict(checkpoint: dict) -> dict:
+    """
+    Image-model state dict from a raw sam3.pt checkpoint.
+
+    Unwraps {"model": {...}} and keeps detector weights with the "detector."
+    prefix removed. Checkpoints without detector keys are returned unchanged.
+    """
+    if isinstance(checkpoint.get("model"), dict):
+        checkpoint = checkpoint["model"]
+    if not any(key.startswith(_DETECTOR_PREFIX) for key in checkpoint):
+        return dict(checkpoint)
+    return {
+        key[len(_DETECTOR_PREFIX):]: value
+        for key, value in checkpoint.items()
+        if key.startswith(_DETECTOR_PREFIX)
+    }
+
+
+def convert_checkpoint(
+    input_path: str,
+    output_path: Optional[str] = None,
+    dtype: Optional[str] = None,
+) -> str:
+    """
+    Convert a sam3.pt checkpoint to safetensors.
+
+    The source is opened with torch.load(mmap=True), so conversion does not need
+    the whole checkpoint in RAM either.
+
+    Args:
+        input_path: Source sam3.pt
+        output_path: Destination (default: next to the input, sam3.safetensors or
+                     sam3_fp16.safetensors)
+        dtype: "fp16" / "bf16" to cast floating point weights, None to keep them
+
+    Returns:
+        Path of the written safetensors file
+
+    Raises:
+        ValueError: If dtype is not supported
+    """
+    from safetensors.torch import save_file
+
+    if dtype is not None and dtype not in CONVERT_DTYPES:
+        raise ValueError(f"Unsupported dtype: {dtype}. Supported: {', '.join(CONVERT_DTYPES)}")
+    if output_path is None:
+        stem = os.path.splitext(input_path)[0]
+        suffix = f"_{dtype}" if dtype else ""
+        output_path = f"{stem}{suffix}{SAFETENSORS_SUFFIX}"
+
+    checkpoint = torch.load(input_path, map_location="cpu", weights_only=True, mmap=True)
+    state = sam3_image_state_dict(checkpoint)
+
+    tensors = {}
+    seen_storage = set()
+    for key, value in state.items():
+        if not isinstance(value, torch.Tensor):
+            continue
+        if dtype is not None and value.is_floating_point():
+            value = value.to(CONVERT_DTYPES[dtype])
+        # safetensors refuses tensors that share storage (tied weights)
+        pointer = value.untyped_storage().data_ptr()
+        if pointer in seen_storage:
+            value = value.clone()
+        seen_storage.add(pointer)
+        tensors[key] = value.contiguous()
+
+    metadata = {
+        "source": os.path.basename(input_path),
+        "dtype": dtype or "original",
+        "format": "pt",
+    }
+    save_file(tensors, output_path, metadata=metadata)
+    logger.info(f"Wrote {len(tensors)} tensors to {output_path} ({json.dumps(metadata)})")
+    return output_path
+
+
+def load_safetensors_into(model, path: str) -> dict:
+    """
+    Copy weights from a memory-mapped safetensors file into a built model.
+
+    Tensors are materialised one at a time (only the pages of the current tensor
+    are read) and copied into the existing parameters/buffers, casting to their
+    dtype and device. The full state dict never exists in memory.
+
+    Args:
+        model: torch.nn.Module with the SAM3 image model layout
+        path: .safetensors file written by convert_checkpoint()
+
+    Returns:
+        dict: {"loaded": int, "missing": [...], "unexpected": [...]}
+    """
+    from safetensors import safe_open
+
+    targets = model.state_dict(keep_vars=True)
+    missing = set(targets)
+    unexpected = []
+    loaded = 0
+
+    with torch.no_grad(), safe_open(path, framework="pt", device="cpu") as f:
+        for key in f.keys():
+            target = targets.get(key)
+            if target is None:
+                unexpected.append(key)
+                continue
+            target.copy_(f.get_tensor(key))
+            missing.discard(key)
+            loaded += 1
+
+    if missing or unexpected:
+        logger.warning(
+            f"Checkpoint {os.path.basename(path)}: "
+            f"{len(missing)} missing, {len(unexpected)} unexpected keys"
+        )
+    return {"loaded": loaded, "missing": sorted(missing), "unexpected": unexpected}
@@ -0,0 +1,130 @@
+"""
+Compact Mask — bounding box로 잘라 1 bit/pixel로 압축한 instance mask
+
+12MP 사진에서 instance 하나의 dense bool mask는 12MB다. CompactMask는 mask를
+bounding box로 자르고 np.packbits 형식으로 저장해 host 메모리와 device→host 전송량을
+instance 크기 / 8 수준으로 줄인다.
+
+- CompactMask(shape, box, bits): shape=(H, W) 원본 크기, box=(x0, y0, x1, y1)
+- from_dense(mask) / crop() / region(box) / to_dense() / np.asarray(mask)
+- union_masks(masks) → 여러 instance의 합집합 (CompactMask끼리는 압축된 채로)
+
+apply_rules는 CompactMask를 받으면 box 영역만 blend 한다.
+"""
+
+from typing import Optional, Sequence, Union
+
+import numpy as np
+
+Box = tuple[int, int, int, int]
+
+
+class CompactMask:
+    """Instance mask cropped to its bounding box and bit-packed (1 bit/pixel)."""
+
+    __slots__ = ("shape", "box", "bits")
+
+    def __init__(self, shape: tuple[int, int], box: Box, bits: np.ndarray):
+        """
+        Args:
+            shape: (height, width) of the full image
+            box: (x0, y0, x1, y1) of the cropped region, (0, 0, 0, 0) if empty
+            bits: np.packbits of the cropped bool mask (row-major, big bit order)
+        """
+        self.shape = (int(shape[0]), int(shape[1]))
+        self.box = tuple(int(v) for v in box)
+        self.bits = np.asarray(bits, dtype=np.uint8)
+
+    @classmethod
+    def from_crop(cls, shape: tuple[int, int], x0: int, y0: int, crop: np.ndarray) -> "CompactMask":
+        """Build from a bool crop placed at (x0, y0); the crop is tightened to its content."""
+        crop = np.asarray(crop) > 0
+        rows = np.flatnonzero(crop.any(axis=1))
+        if rows.size == 0:
+            return cls(shape, (0, 0, 0, 0), np.zeros(0, dtype=np.uint8))
+        cols = np.flatnonzero(crop.any(axis=0))
+        tight = crop[rows[0]:rows[-1] + 1, cols[0]:cols[-1] + 1]
+        box = (x0 + int(cols[0]), y0 + int(rows[0]), x0 + int(cols[-1]) + 1, y0 + int(rows[-1]) + 1)
+        return cls(shape, box, np.packbits(tight, axis=None))
+
+    @classmethod
+    def from_dense(cls, mask: np.ndarray) -> "CompactMask":
+        """Compact a full-size (H, W) mask (nonzero = inside)."""
+        mask = np.asarray(mask)
+        return cls.from_crop(mask.shape, 0, 0, mask)
+
+    @property
+    def ndim(self) -> int:
+        return 2
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes held (packed bits only)."""
+        return int(self.bits.nbytes)
+
+    @property
+    def empty(self) -> bool:
+        x0, y0, x1, y1 = self.box
+        return x1 <= x0 or y1 <= y0
+
+    def crop(self) -> np.ndarray:
+        """Bool mask of the bounding box region, shape (y1 - y0, x1 - x0)."""
+        x0, y0, x1, y1 = self.box
+        height, width = max(y1 - y0, 0), max(x1 - x0, 0)
+        return np.unpackbits(self.bits, count=height * width).astype(bool).reshape(height, width)
+
+    def region(self, box: Box) -> np.ndarray:
+        """Bool mask restricted to an arbitrary box of the full image."""
+        x0, y0, x1, y1 = box
+        out = np.zeros((y1 - y0, x1 - x0), dtype=bool)
+        if self.empty:
+            return out
+        mx0, my0, mx1, my1 = self.box
+        ix0, iy0, ix1, iy1 = max(x0, mx0), max(y0, my0), min(x1, mx1), min(y1, my1)
+        if ix0 < ix1 and iy0 < iy1:
+            crop = self.crop()[iy0 - my0:iy1 - my0, ix0 - mx0:ix1 - mx0]
+            out[iy0 - y0:iy1 - y0, ix0 - x0:ix1 - x0] = crop
+        return out
+
+    def to_dense(self) -> np.ndarray:
+        """Full-size (H, W) bool mask."""
+        return self.region((0, 0, self.shape[1], self.shape[0]))
+
+    def __array__(self, dtype=None, copy=None):
+        dense = self.to_dense()
+        return dense if dtype is None else dense.astype(dtype)
+
+    def __repr__(self) -> str:
+        return f"CompactMask(shape={self.shape}, box={self.box}, nbytes={self.nbytes})"
+
+
+def union_masks(
+    masks: Sequence[Union[np.ndarray, CompactMask]],
+) -> Optional[Union[np.ndarray, CompactMask]]:
+    """
+    Union of instance masks.
+
+    CompactMasks are combined without expanding to full size. Dense arrays keep
+    the existing np.maximum semantics; mixed inputs are unioned as bool.
+    """
+    if not masks:
+        return None
+    if len(masks) == 1:
+        return masks[0]
+    if all(isinstance(m, np.ndarray) for m in masks):
+        return np.maximum.reduce(masks)
+    if not all(isinstance(m, CompactMask) for m in masks):
+        return np.logical_or.reduce([np.asarray(m) > 0 for m in masks])
+
+    filled = [m for m in masks if not m.empty]
+    if not filled:
+        return masks[0]
+    x0 = min(m.box[0] for m in filled)
+    y0 = min(m.box[1] for m in filled)
+    x1 = max(m.box[2] for m in filled)
+    y1 = max(m.box[3] for m in filled)
+    crop = np.zeros((y1 - y0, x1 - x0), dtype=bool)
+    for m in filled:
+        mx0, my0, mx1, my1 = m.box
+        crop[my0 - y0:my1 - y0, mx0 - x0:mx1 - x0] |= m.crop()
+    return CompactMask.from_crop(masks[0].shape, x0, y0, crop)
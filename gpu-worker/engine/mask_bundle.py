@@ -0,0 +1,155 @@
+"""
+Mask Bundle — item별 segment 결과를 R2에 저장/재사용하는 압축 포맷
+
+workflow.md 섹션 8 "R2 Upload (result + preview + masks)"의 masks 부분.
+로컬 mask cache가 없는 다른 워커도 rerun 시 Stage 1(SAM3)을 건너뛸 수 있다.
+
+R2 키 (input_key에서 결정적으로 파생 — 같은 사진을 참조하는 rerun은 같은 키):
+  inputs/{userId}/{jobId}/{idx}.jpg → masks/{userId}/{jobId}/{idx}_masks.npz
+
+포맷 (np.savez_compressed):
+  - header: JSON (format, model_version, confidence_threshold, image_sha256,
+            merged: union mask로 저장된 prompt 목록,
+            concepts: {name: {instance_count, shape, metadata(scores 포함), boxes(compact만)}})
+  - bits:   모든 instance mask를 np.packbits로 1 bit/pixel 압축해 이어붙인 배열
+            (CompactMask는 bounding box 영역의 bits 그대로 → 읽을 때 CompactMask로 복원)
+"""
+
+import io
+import json
+import os
+from dataclasses import dataclass
+from typing import Collection, Optional
+
+import numpy as np
+
+from .compact_mask import CompactMask
+
+# 2 = concepts may carry CompactMask boxes; format 1 bundles (dense only) still load
+BUNDLE_FORMAT = 2
+SUPPORTED_BUNDLE_FORMATS = (1, 2)
+BUNDLE_CONTENT_TYPE = "application/octet-stream"
+
+# prompt -> (masks, metadata), same as SAM3Segmenter.segment_concepts() output
+SegmentResults = dict[str, tuple[list[np.ndarray], dict]]
+
+
+@dataclass
+class MaskBundle:
+    results: SegmentResults
+    model_version: str
+    confidence_threshold: float
+    image_hash: str
+    # Prompts stored as one union mask; None for bundles written before it was recorded
+    merged: Optional[frozenset[str]] = None
+
+
+def bundle_key(input_key: str) -> str:
+    """
+    Deterministic R2 key of the mask bundle for an input image.
+
+    Example:
+        >>> bundle_key("inputs/u_abc/job_123/0.jpg")
+        'masks/u_abc/job_123/0_masks.npz'
+    """
+    prefix, _, rest = input_key.partition("/")
+    stem = os.path.splitext(rest if prefix == "inputs" and rest else input_key)[0]
+    return f"masks/{stem}_masks.npz"
+
+
+def encode_bundle(
+    results: SegmentResults,
+    model_version: str,
+    confidence_threshold: float,
+    image_hash: str,
+    merged: Collection[str] = (),
+) -> bytes:
+    """
+    Serialize segment results into a compact bundle.
+
+    Masks are thresholded (> 0) and bit-packed, so a 12MP instance mask costs
+    ~1.5MB before compression instead of 12MB. CompactMasks are stored as their
+    box + packed crop and come back as CompactMasks. merged lists the prompts
+    whose instances were unioned into one mask.
+    """
+    concepts = {}
+    packed = []
+    for name, (masks, metadata) in results.items():
+        compact = bool(masks) and all(isinstance(m, CompactMask) for m in masks)
+        shape = list(masks[0].shape if compact else np.asarray(masks[0]).shape) if masks else [0, 0]
+        concepts[name] = {
+            "instance_count": len(masks),
+            "shape": shape,
+            "metadata": metadata,
+        }
+        if compact:
+            concepts[name]["boxes"] = [list(m.box) for m in masks]
+            packed.extend(m.bits for m in masks)
+            continue
+        for mask in masks:
+            packed.append(np.packbits(np.asarray(mask) > 0, axis=None))
+
+    header = {
+        "format": BUNDLE_FORMAT,
+        "model_version": str(model_version),
+        "confidence_threshold": float(confidence_threshold),
+        "image_sha256": image_hash,
+        "merged": [name for name in results if name in merged],
+        "concepts": concepts,
+    }
+    bits = np.concatenate(packed) if packed else np.zeros(0, dtype=np.uint8)
+
+    buffer = io.BytesIO()
+    np.savez_compressed(buffer, header=np.array(json.dumps(header)), bits=bits)
+    return buffer.getvalue()
+
+
+def decode_bundle(data: bytes) -> MaskBundle:
+    """
+    Parse a bundle written by encode_bundle().
+
+    Raises:
+        ValueError: If the data is not a supported mask bundle
+    """
+    try:
+        with np.load(io.BytesIO(data), allow_pickle=False) as archive:
+            header = json.loads(str(archive["header"]))
+            bits = archive["bits"]
+    except Exception as e:
+        raise ValueError(f"Invalid mask bundle: {str(e)}")
+
+    if header.get("format") not in SUPPORTED_BUNDLE_FORMATS:
+        raise ValueError(f"Unsupported mask bundle format: {header.get('format')}")
+
+    results = {}
+    offset = 0
+    for name, concept in header["concepts"].items():
+        height, width = concept["shape"]
+        masks = []
+        for i in range(concept["instance_count"]):
+            if "boxes" in concept:
+                x0, y0, x1, y1 = concept["boxes"][i]
+                nbytes = (max(x1 - x0, 0) * max(y1 - y0, 0) + 7) // 8
+                chunk = bits[offset:offset + nbytes]
+                masks.append(CompactMask((height, width), (x0, y0, x1, y1), chunk))
+            else:
+                nbytes = (height * width + 7) // 8
+                chunk = bits[offset:offset + nbytes]
+                dense = np.unpackbits(chunk, count=height * width).astype(bool)
+                masks.append(dense.reshape(height, width))
+            offset += nbytes
+        metadata = concept["metadata"]
+        if "image_size" in metadata:
+            metadata["image_size"] = tuple(metadata["image_size"])
+        results[name] = (masks, metadata)
+
+    if offset != bits.size:
+        raise ValueError(f"Invalid mask bundle: {bits.size - offset} trailing bytes")
+
+    return MaskBundle(
+        results=results,
+        model_version=header["model_version"],
+        confidence_threshold=header["confidence_threshold"],
+        image_hash=header["image_sha256"],
+        merged=frozenset(header["merged"]) if "merged" in header else None,
+    )
@@ -0,0 +1,305 @@
+"""
+Mask Cache — content-addressed SAM3 segment 결과 캐시
+
+같은 사진에 룰만 바꿔 다시 돌리는 시안 비교 흐름(workflow.md §4, Job A/B/C)에서
+Stage 1 segment 결과를 재사용한다. 룰만 바뀐 재실행은 SAM3 추론 0회.
+
+- key: (image content sha256, prompt, confidence_threshold, model_version)
+- memory tier: bytes 기준 LRU (MASK_CACHE_MEMORY_MB)
+- disk tier: MODEL_CACHE_DIR/mask_cache/*.npz, 총 크기 초과 시 오래 안 쓴 파일부터 삭제
+  (MASK_CACHE_DISK_MB, 0 = disk tier 끔)
+- get(...) → (masks, metadata) 또는 None, put(...) → 두 tier 모두 저장
+- 디스크 hit은 memory tier로 승격
+- CompactMask는 box + packed bits 그대로 저장/복원 (dense로 펼치지 않음)
+"""
+
+import hashlib
+import io
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+
+from .compact_mask import CompactMask
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MEMORY_MB = int(os.getenv("MASK_CACHE_MEMORY_MB", "512"))
+DEFAULT_DISK_MB = int(os.getenv("MASK_CACHE_DISK_MB", "2048"))
+
+# (masks, metadata) — same shape as SAM3Segmenter.segment() output
+SegmentResult = tuple[list[np.ndarray], dict]
+
+
+def image_digest(image_bytes: bytes) -> str:
+    """Content hash of the encoded image bytes (as downloaded from R2)."""
+    return hashlib.sha256(image_bytes).hexdigest()
+
+
+def cache_key(image_hash: str, prompt: str, threshold: float, model_version: str) -> str:
+    """Stable cache key for one (image, prompt) segmentation."""
+    raw = json.dumps([image_hash, prompt, round(float(threshold), 6), str(model_version)])
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def _result_nbytes(result: SegmentResult) -> int:
+    masks, _ = result
+    # CompactMask counts its packed bytes, not the dense size
+    return sum(m.nbytes if isinstance(m, CompactMask) else int(np.asarray(m).nbytes) for m in masks)
+
+
+def _serialize(result: SegmentResult) -> bytes:
+    masks, metadata = result
+    arrays = {"metadata": np.array(json.dumps(metadata))}
+    if masks and all(isinstance(m, CompactMask) for m in masks):
+        # Compact results stay compact: image shape, boxes and concatenated packed bits
+        arrays["compact_shape"] = np.array(masks[0].shape, dtype=np.int64)
+        arrays["boxes"] = np.array([m.box for m in masks], dtype=np.int64)
+        arrays["bits"] = np.concatenate([m.bits for m in masks])
+    else:
+        if masks:
+            arrays["masks"] = np.stack([np.asarray(m) for m in masks])
+        else:
+            arrays["masks"] = np.zeros((0, 0, 0), dtype=bool)
+    buffer = io.BytesIO()
+    np.savez_compressed(buffer, **arrays)
+    return buffer.getvalue()
+
+
+def _deserialize(data: bytes) -> SegmentResult:
+    with np.load(io.BytesIO(data), allow_pickle=False) as archive:
+        metadata = json.loads(str(archive["metadata"]))
+        if "boxes" in archive.files:
+            masks = _unpack_compact(
+                tuple(archive["compact_shape"]), archive["boxes"], archive["bits"]
+            )
+        else:
+            masks = [m for m in archive["masks"]]
+    if "image_size" in metadata:
+        metadata["image_size"] = tuple(metadata["image_size"])
+    return masks, metadata
+
+
+def _unpack_compact(
+    shape: tuple[int, int],
+    boxes: np.ndarray,
+    bits: np.ndarray,
+) -> list[CompactMask]:
+    """Split concatenated packed bits back into CompactMasks (sizes follow from the boxes)."""
+    masks = []
+    offset = 0
+    for x0, y0, x1, y1 in boxes:
+        nbytes = (max(x1 - x0, 0) * max(y1 - y0, 0) + 7) // 8
+        masks.append(CompactMask(shape, (x0, y0, x1, y1), bits[offset:offset + nbytes]))
+        offset += nbytes
+    if offset != bits.size:
+        raise ValueError(f"{bits.size - offset} trailing bytes after compact masks")
+    return masks
+
+
+class MaskCache:
+    def __init__(
+        self,
+        memory_bytes: Optional[int] = None,
+        disk_dir: Optional[str] = None,
+        disk_bytes: Optional[int] = None,
+    ):
+        """
+        Initialize a two-tier mask cache.
+
+        Args:
+            memory_bytes: Max mask bytes kept in memory (0 = memory tier off)
+                          Default: MASK_CACHE_MEMORY_MB env (512 MB)
+            disk_dir: Directory for the disk tier (None = disk tier off)
+            disk_bytes: Max total size of cache files on disk (0 = disk tier off)
+                        Default: MASK_CACHE_DISK_MB env (2048 MB)
+        """
+        if memory_bytes is None:
+            memory_bytes = DEFAULT_MEMORY_MB * 1024 * 1024
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = DEFAULT_DISK_MB * 1024 * 1024 if disk_bytes is None else disk_bytes
+        self.disk_dir = disk_dir if self.disk_bytes > 0 else None
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._memory: OrderedDict[str, SegmentResult] = OrderedDict()
+        self._memory_used = 0
+        self._disk_used: Optional[int] = None  # lazily scanned
+        self._lock = threading.Lock()
+
+    def get(
+        self,
+        image_hash: str,
+        prompt: str,
+        threshold: float,
+        model_version: str,
+    ) -> Optional[SegmentResult]:
+        """Return cached (masks, metadata) for this segmentation, or None."""
+        key = cache_key(image_hash, prompt, threshold, model_version)
+
+        with self._lock:
+            result = self._memory.get(key)
+            if result is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return result
+
+        result = self._read_disk(key)
+        with self._lock:
+            if result is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.disk_hits += 1
+            self._put_memory(key, result)
+        return result
+
+    def put(
+        self,
+        image_hash: str,
+        prompt: str,
+        threshold: float,
+        model_version: str,
+        result: SegmentResult,
+    ) -> None:
+        """Store (masks, metadata) in both tiers."""
+        key = cache_key(image_hash, prompt, threshold, model_version)
+        with self._lock:
+            self._put_memory(key, result)
+        self._write_disk(key, result)
+
+    def clear(self) -> None:
+        """Drop the memory tier (disk files are left for other workers/restarts)."""
+        with self._lock:
+            self._memory.clear()
+            self._memory_used = 0
+
+    def stats(self) -> dict:
+        """Cache counters for logging/metrics."""
+        with self._lock:
+            return {
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_used,
+                "disk_bytes": self._disk_used or 0,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+            }
+
+    # ---- memory tier ----
+
+    def _put_memory(self, key: str, result: SegmentResult) -> None:
+        size = _result_nbytes(result)
+        if size > self.memory_bytes:
+            return
+        if key in self._memory:
+            self._memory_used -= _result_nbytes(self._memory.pop(key))
+        self._memory[key] = result
+        self._memory_used += size
+        while self._memory_used > self.memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_used -= _result_nbytes(evicted)
+
+    # ---- disk tier ----
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, key[:2], f"{key}.npz")
+
+    def _read_disk(self, key: str) -> Optional[SegmentResult]:
+        if self.disk_dir is None:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)  # mark recently used for eviction order
+            return _deserialize(data)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Discarding unreadable mask cache file {path}: {str(e)}")
+            self._remove(path)
+            return None
+
+    def _write_disk(self, key: str, result: SegmentResult) -> None:
+        if self.disk_dir is None:
+            return
+        path = self._path(key)
+        try:
+            data = _serialize(result)
+            if len(data) > self.disk_bytes:
+                return
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            previous = os.path.getsize(path) if os.path.exists(path) else 0
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logger.warning(f"Failed to write mask cache file {path}: {str(e)}")
+            return
+
+        with self._lock:
+            if self._disk_used is None:
+                self._disk_used = self._scan_disk_usage()
+            else:
+                self._disk_used += len(data) - previous
+            if self._disk_used > self.disk_bytes:
+                self._evict_disk()
+
+    def _cache_files(self) -> list[tuple[float, int, str]]:
+        """(mtime, size, path) of every cache file."""
+        files = []
+        for root, _, names in os.walk(self.disk_dir):
+            for name in names:
+                if not name.endswith(".npz"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+        return files
+
+    def _scan_disk_usage(self) -> int:
+        return sum(size for _, size, _ in self._cache_files())
+
+    def _evict_disk(self) -> None:
+        """Delete least recently used files until the disk tier fits its budget."""
+        files = sorted(self._cache_files())
+        self._disk_used = sum(size for _, size, _ in files)
+        for _, size, path in files:
+            if self._disk_used <= self.disk_bytes:
+                break
+            if self._remove(path):
+                self._disk_used -= size
+
+    @staticmethod
+    def _remove(path: str) -> bool:
+        try:
+            os.remove(path)
+            return True
+        except OSError:
+            return False
+
+
+# Process-wide default cache (disk tier under MODEL_CACHE_DIR)
+_cache: Optional[MaskCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_mask_cache() -> MaskCache:
+    """Return the process-wide mask cache, creating it on first use."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            disk_dir = os.path.join(os.getenv("MODEL_CACHE_DIR", "/models"), "mask_cache")
+            _cache = MaskCache(disk_dir=disk_dir)
+        return _cache
@@ -0,0 +1,114 @@
+"""
+Metrics — 프로세스 단위 worker 지표
+
+외부 metrics 백엔드 없이 워커 프로세스 안에서 값을 모은다.
+- set_gauge(name, value) → 마지막 값 (예: warmup_seconds, worker_ready)
+- inc(name, amount) → 누적 counter
+- observe(name, value) → 고정 bucket histogram (ms 단위 지연 분포, 예: segmenter phase 시간)
+- PhaseTimer → 호출 하나의 phase별 소요 시간 (선택적으로 phase 경계마다 device sync)
+- snapshot() → {name: value} (Runpod 응답의 worker_metrics 로 노출)
+- reset() → 전부 비움 (테스트용)
+"""
+
+import bisect
+import contextlib
+import threading
+import time
+from typing import Callable, Optional, Union
+
+Number = Union[int, float]
+
+# Histogram bucket upper bounds in ms (an extra +inf bucket follows)
+HISTOGRAM_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+_values: dict[str, Number] = {}
+_histograms: dict[str, dict] = {}
+_lock = threading.Lock()
+
+
+def set_gauge(name: str, value: Number) -> None:
+    """Record the current value of a gauge."""
+    with _lock:
+        _values[name] = value
+
+
+def inc(name: str, amount: Number = 1) -> None:
+    """Add amount to a counter (starting at 0)."""
+    with _lock:
+        _values[name] = _values.get(name, 0) + amount
+
+
+def observe(name: str, value: Number) -> None:
+    """Add one observation (ms) to a histogram."""
+    with _lock:
+        histogram = _histograms.setdefault(
+            name, {"count": 0, "sum": 0.0, "buckets": [0] * (len(HISTOGRAM_BUCKETS_MS) + 1)}
+        )
+        histogram["count"] += 1
+        histogram["sum"] += value
+        histogram["buckets"][bisect.bisect_left(HISTOGRAM_BUCKETS_MS, value)] += 1
+
+
+def _export_histogram(histogram: dict) -> dict:
+    """Cumulative bucket counts keyed by upper bound ("le"), Prometheus style."""
+    cumulative = 0
+    buckets = {}
+    for bound, count in zip([*HISTOGRAM_BUCKETS_MS, "inf"], histogram["buckets"]):
+        cumulative += count
+        buckets[str(bound)] = cumulative
+    return {"count": histogram["count"], "sum": round(histogram["sum"], 3), "buckets": buckets}
+
+
+def snapshot() -> dict[str, Union[Number, dict]]:
+    """Copy of every recorded metric (histograms as {"count", "sum", "buckets"})."""
+    with _lock:
+        values: dict = dict(_values)
+        values.update({name: _export_histogram(h) for name, h in _histograms.items()})
+        return values
+
+
+def reset() -> None:
+    """Drop every recorded metric."""
+    with _lock:
+        _values.clear()
+        _histograms.clear()
+
+
+class PhaseTimer:
+    """
+    Wall-clock time per named phase of one call (repeated phases add up).
+
+    With sync (e.g. torch.cuda.synchronize) the device is synchronized at every
+    phase boundary, so queued GPU work is charged to the phase that launched it.
+    Without it, asynchronous kernels show up in whichever phase waits for them.
+    """
+
+    def __init__(self, sync: Optional[Callable[[], None]] = None):
+        self.sync = sync
+        self.started = time.perf_counter()
+        self.seconds: dict[str, float] = {}
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        if self.sync is not None:
+            self.sync()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            if self.sync is not None:
+                self.sync()
+            self.seconds[name] = self.seconds.get(name, 0.0) + time.perf_counter() - start
+
+    def timings_ms(self) -> dict[str, float]:
+        """{phase: ms} in first-seen order, plus "total" since the timer started."""
+        timings = {name: round(seconds * 1000, 3) for name, seconds in self.seconds.items()}
+        timings["total"] = round((time.perf_counter() - self.started) * 1000, 3)
+        return timings
+
+    def observe(self, prefix: str) -> dict[str, float]:
+        """Record every phase into the {prefix}_{phase}_ms histograms. Returns timings_ms()."""
+        timings = self.timings_ms()
+        for name, ms in timings.items():
+            observe(f"{prefix}_{name}_ms", ms)
+        return timings
@@ -0,0 +1,610 @@
+"""
+ONNX Backend — onnxruntime CPU 추론 (GPU / CUDA 빌드 없는 박스용)
+
+SAM3 image model을 세 개의 ONNX graph (image encoder, text encoder, decoder)로
+export 하고, onnxruntime CPUExecutionProvider 세션으로 SAM3 model / processor
+인터페이스를 재현해 SAM3Segmenter.from_model로 감싼다. batched decoding,
+text cache, tiling, compact mask 등 segmenter 기능은 그대로 동작한다.
+
+- export_onnx(model, output_dir) → image_encoder.onnx / text_encoder.onnx / decoder.onnx
+  + manifest.json
+- export_sam3_onnx(checkpoint_path) → 체크포인트로 모델 빌드 후 export
+  (convert_model.py --format onnx)
+- load_onnx_segmenter(model_dir) → onnxruntime CPU 세션 기반 SAM3Segmenter
+- is_onnx_model(path) → manifest.json 이 있는 export 디렉터리인지
+  (MODEL_CHECKPOINT가 export 디렉터리면 registry가 이 backend로 빌드)
+- quantize_onnx(model_dir) → linear layer (MatMul / Gemm) dynamic int8 양자화 graph (*.int8.onnx),
+  precision="int8" (MODEL_PRECISION=int8) 로 선택
+- thread 수: ONNX_NUM_THREADS (intra-op) / ONNX_INTER_OP_THREADS
+
+text encoder graph는 token id를 입력으로 받는다. BPE 토크나이저는 graph 밖에서
+Python으로 돌린다 (sam3.model.tokenizer_ve, CUDA 불필요).
+mask 후처리(threshold, resize)는 segmenter가 CPU torch로 수행한다.
+onnxruntime 패키지는 이 backend에서만 필요하므로 lazy import 한다.
+"""
+
+import json
+import logging
+import os
+from typing import Callable, Optional, Sequence
+
+import numpy as np
+import torch
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+ONNX_MANIFEST = "manifest.json"
+IMAGE_ENCODER_FILE = "image_encoder.onnx"
+TEXT_ENCODER_FILE = "text_encoder.onnx"
+DECODER_FILE = "decoder.onnx"
+GRAPH_FILES = (IMAGE_ENCODER_FILE, TEXT_ENCODER_FILE, DECODER_FILE)
+
+# File suffix of the dynamically quantized graphs written by quantize_onnx()
+INT8_SUFFIX = ".int8.onnx"
+
+# Precisions the backend has graphs for (int8 only after quantize_onnx)
+ONNX_PRECISIONS = ("fp32", "int8")
+
+# ONNX ops holding linear layer weights (quantized by quantize_onnx)
+_LINEAR_OPS = ["MatMul", "Gemm"]
+
+# Bumped when the graph inputs/outputs or manifest layout change
+ONNX_FORMAT_VERSION = 1
+
+DEFAULT_ONNX_OPSET = 17
+
+# SAM3 image encoder input side (Sam3Processor resizes every image to this)
+DEFAULT_RESOLUTION = 1008
+
+# SAM3 text encoder context length (tokens per prompt)
+DEFAULT_CONTEXT_LENGTH = 32
+
+# onnxruntime threads (0 = onnxruntime default: one intra-op thread per physical core)
+DEFAULT_NUM_THREADS = int(os.getenv("ONNX_NUM_THREADS", "0"))
+DEFAULT_INTER_OP_THREADS = int(os.getenv("ONNX_INTER_OP_THREADS", "0"))
+
+# Decoder outputs the segmenter's postprocessing reads (everything else is pruned)
+DECODER_OUTPUTS = ("pred_logits", "presence_logit_dec", "pred_masks", "pred_boxes")
+
+# Example batch used for tracing. Decoder feature inputs get a dynamic axis
+# wherever their size equals the example image / prompt count, so these are
+# chosen not to collide with feature dims.
+_EXAMPLE_IMAGES = 2
+_EXAMPLE_PROMPTS = ("wall", "floor", "window")
+
+# Sam3Processor normalization: x / 255, then (x - 0.5) / 0.5 per channel
+_PIXEL_MEAN = 0.5
+_PIXEL_STD = 0.5
+
+Tokenizer = Callable[..., object]
+
+
+def _graph_path(model_dir: str, name: str, quantized: bool = False) -> str:
+    """Path of a graph file, or of its int8 variant."""
+    if quantized:
+        name = name[:-len(".onnx")] + INT8_SUFFIX
+    return os.path.join(model_dir, name)
+
+
+def is_onnx_model(path: str) -> bool:
+    """True if path is an export_onnx() output directory."""
+    return os.path.isfile(os.path.join(path, ONNX_MANIFEST))
+
+
+def load_manifest(model_dir: str) -> dict:
+    """
+    Read the manifest written by export_onnx().
+
+    Raises:
+        FileNotFoundError: If model_dir has no manifest
+        ValueError: If the manifest format version is not supported
+    """
+    path = os.path.join(model_dir, ONNX_MANIFEST)
+    if not os.path.isfile(path):
+        raise FileNotFoundError(
+            f"ONNX manifest not found: {path}. Export with scripts/convert_model.py --format onnx"
+        )
+    with open(path) as f:
+        manifest = json.load(f)
+    if manifest.get("format_version") != ONNX_FORMAT_VERSION:
+        raise ValueError(
+            f"Unsupported ONNX export format {manifest.get('format_version')} in {path}, "
+            f"expected {ONNX_FORMAT_VERSION}. Re-export the model."
+        )
+    return manifest
+
+
+# ---- nested model outputs <-> flat named tensors ----
+
+def _flatten(value, prefix: str = "") -> list[tuple[str, object]]:
+    """
+    Flatten nested dict / list model outputs into (dotted name, tensor) pairs.
+
+    Non-tensor leaves (None, ints) are dropped; _unflatten() restores list
+    positions with None.
+    """
+    if isinstance(value, dict):
+        return [item for key, child in value.items() for item in _flatten(child, f"{prefix}{key}.")]
+    if isinstance(value, (list, tuple)):
+        return [item for i, child in enumerate(value) for item in _flatten(child, f"{prefix}{i}.")]
+    if isinstance(value, (torch.Tensor, np.ndarray)):
+        return [(prefix[:-1], value)]
+    return []
+
+
+def _unflatten(names: Sequence[str], values: Sequence) -> dict:
+    """Inverse of _flatten(): nested dicts, with all-digit key levels turned back into lists."""
+    root: dict = {}
+    for name, value in zip(names, values):
+        *parents, leaf = name.split(".")
+        node = root
+        for part in parents:
+            node = node.setdefault(part, {})
+        node[leaf] = value
+    return _restore_lists(root)
+
+
+def _restore_lists(node):
+    if not isinstance(node, dict):
+        return node
+    node = {key: _restore_lists(child) for key, child in node.items()}
+    if node and all(key.isdigit() for key in node):
+        return [node.get(str(i)) for i in range(max(int(key) for key in node) + 1)]
+    return node
+
+
+def _to_numpy(value) -> np.ndarray:
+    """torch tensor / array-like → numpy (host copy for tensors)."""
+    if isinstance(value, torch.Tensor):
+        return value.detach().cpu().numpy()
+    return np.asarray(value)
+
+
+# ---- export ----
+
+def _tokenizer_owner(backbone):
+    """Submodule of the backbone whose `tokenizer` the text path calls (SAM3: language_backbone)."""
+    for module in backbone.modules():
+        if getattr(module, "tokenizer", None) is not None:
+            return module
+    raise ValueError(
+        "Model backbone has no tokenizer; cannot export the text encoder with token inputs"
+    )
+
+
+def _batch_axes(tensor, size: int, name: str) -> dict[int, str]:
+    """Dynamic axes of a traced input: every axis whose example size is the example batch size."""
+    return {axis: name for axis, dim in enumerate(tensor.shape) if dim == size}
+
+
+def export_onnx(
+    model,
+    output_dir: str,
+    resolution: int = DEFAULT_RESOLUTION,
+    opset: int = DEFAULT_ONNX_OPSET,
+    source: Optional[str] = None,
+) -> dict:
+    """
+    Export a SAM3 image model as three ONNX graphs plus a manifest.
+
+    - image_encoder.onnx: pixels [B, 3, R, R] → flattened backbone.forward_image outputs
+    - text_encoder.onnx: token_ids [N, L] → flattened backbone.forward_text outputs
+      (traced by feeding the ids through the model's own text path in place of its tokenizer)
+    - decoder.onnx: img_ids [Q], text_ids [Q] + image / text features → DECODER_OUTPUTS
+
+    Image, prompt and query counts are dynamic axes. Graphs are traced in fp32.
+
+    Args:
+        model: SAM3 image model (or a stand-in with backbone.forward_image,
+               backbone.forward_text + tokenizer, forward_grounding)
+        output_dir: Directory for the .onnx files and manifest.json (created)
+        resolution: Encoder input side
+        opset: ONNX opset version
+        source: Checkpoint name recorded in the manifest
+
+    Returns:
+        The manifest dict
+    """
+    from torch import nn
+
+    from .segmenter import FindStage
+
+    os.makedirs(output_dir, exist_ok=True)
+    model = model.float().eval()
+    device = next(model.parameters()).device
+    owner = _tokenizer_owner(model.backbone)
+    context_length = getattr(owner, "context_length", DEFAULT_CONTEXT_LENGTH)
+
+    class ImageEncoder(nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.model = model
+
+        def forward(self, pixels):
+            return tuple(value for _, value in _flatten(self.model.backbone.forward_image(pixels)))
+
+    class TextEncoder(nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.model = model
+
+        def forward(self, token_ids):
+            tokenizer = owner.tokenizer
+            owner.tokenizer = lambda texts, context_length=None: token_ids
+            try:
+                outputs = self.model.backbone.forward_text(
+                    [""] * token_ids.shape[0], device=token_ids.device
+                )
+            finally:
+                owner.tokenizer = tokenizer
+            return tuple(value for _, value in _flatten(outputs))
+
+    class Decoder(nn.Module):
+        def __init__(self, feature_names):
+            super().__init__()
+            self.model = model
+            self.feature_names = feature_names
+
+        def forward(self, img_ids, text_ids, *features):
+            find_input = FindStage(
+                img_ids=img_ids,
+                text_ids=text_ids,
+                input_boxes=None,
+                input_boxes_mask=None,
+                input_boxes_label=None,
+                input_points=None,
+                input_points_mask=None,
+            )
+            outputs = self.model.forward_grounding(
+                backbone_out=_unflatten(self.feature_names, features),
+                find_input=find_input,
+                geometric_prompt=self.model._get_dummy_prompt(num_prompts=img_ids.shape[0]),
+                find_target=None,
+            )
+            return tuple(outputs[key] for key in DECODER_OUTPUTS)
+
+    with torch.no_grad():
+        pixels = torch.rand(_EXAMPLE_IMAGES, 3, resolution, resolution, device=device) * 2 - 1
+        image_out = _flatten(model.backbone.forward_image(pixels))
+        token_ids = torch.as_tensor(
+            _to_numpy(owner.tokenizer(list(_EXAMPLE_PROMPTS), context_length=context_length)),
+            dtype=torch.long, device=device,
+        )
+        text_out = _flatten(model.backbone.forward_text(list(_EXAMPLE_PROMPTS), device=device))
+
+        torch.onnx.export(
+            ImageEncoder(), (pixels,), os.path.join(output_dir, IMAGE_ENCODER_FILE),
+            input_names=["pixels"], output_names=[name for name, _ in image_out],
+            dynamic_axes={"pixels": {0: "images"}},
+            opset_version=opset,
+            do_constant_folding=True,
+        )
+        torch.onnx.export(
+            TextEncoder(), (token_ids,), os.path.join(output_dir, TEXT_ENCODER_FILE),
+            input_names=["token_ids"], output_names=[name for name, _ in text_out],
+            dynamic_axes={"token_ids": {0: "prompts"}},
+            opset_version=opset,
+            do_constant_folding=True,
+        )
+
+        # Every (image, prompt) pair as one query
+        num_prompts = len(_EXAMPLE_PROMPTS)
+        img_ids = torch.arange(_EXAMPLE_IMAGES, device=device).repeat_interleave(num_prompts)
+        text_ids = torch.arange(num_prompts, device=device).repeat(_EXAMPLE_IMAGES)
+        features = image_out + text_out
+        feature_names = [name for name, _ in features]
+        dynamic_axes = {"img_ids": {0: "queries"}, "text_ids": {0: "queries"}}
+        for name, value in image_out:
+            dynamic_axes[name] = _batch_axes(value, _EXAMPLE_IMAGES, "images")
+        for name, value in text_out:
+            dynamic_axes[name] = _batch_axes(value, num_prompts, "prompts")
+        torch.onnx.export(
+            Decoder(feature_names), (img_ids, text_ids, *[value for _, value in features]),
+            os.path.join(output_dir, DECODER_FILE),
+            input_names=["img_ids", "text_ids", *feature_names], output_names=list(DECODER_OUTPUTS),
+            dynamic_axes=dynamic_axes, opset_version=opset, do_constant_folding=True,
+        )
+
+    manifest = {
+        "format_version": ONNX_FORMAT_VERSION,
+        "precisions": ["fp32"],
+        "opset": opset,
+        "resolution": resolution,
+        "context_length": context_length,
+        "image_outputs": [name for name, _ in image_out],
+        "text_outputs": [name for name, _ in text_out],
+        "decoder_outputs": list(DECODER_OUTPUTS),
+        "source": source,
+    }
+    with open(os.path.join(output_dir, ONNX_MANIFEST), "w") as f:
+        json.dump(manifest, f, indent=2)
+    logger.info(f"Exported ONNX model to {output_dir} (opset {opset}, resolution {resolution})")
+    return manifest
+
+
+def export_sam3_onnx(
+    checkpoint_path: str,
+    output_dir: Optional[str] = None,
+    bpe_path: Optional[str] = None,
+    resolution: int = DEFAULT_RESOLUTION,
+    opset: int = DEFAULT_ONNX_OPSET,
+) -> str:
+    """
+    Build SAM3 from a checkpoint (sam3.pt or .safetensors) and export it with export_onnx().
+
+    Args:
+        checkpoint_path: SAM3 checkpoint
+        output_dir: Export directory (default: <checkpoint without extension>_onnx)
+        bpe_path: BPE vocab file (default: BPE_PATH env, as SAM3Segmenter)
+
+    Returns:
+        The export directory (usable as MODEL_CHECKPOINT)
+    """
+    from .segmenter import SAM3Segmenter
+
+    output_dir = output_dir or os.path.splitext(checkpoint_path)[0] + "_onnx"
+    segmenter = SAM3Segmenter(checkpoint_path=checkpoint_path, bpe_path=bpe_path, precision="fp32")
+    export_onnx(
+        segmenter.model, output_dir, resolution, opset, source=os.path.basename(checkpoint_path)
+    )
+    return output_dir
+
+
+def quantize_onnx(model_dir: str) -> dict:
+    """
+    Write int8 variants of an export's graphs with onnxruntime dynamic quantization.
+
+    Only linear layer weights (MatMul / Gemm) are quantized to int8, per output
+    channel; activations are quantized on the fly per call. Convolutions, norms and
+    the mask head stay fp32. The fp32 graphs are kept, so one export serves both
+    precision="fp32" and precision="int8".
+
+    Returns:
+        The updated manifest ("int8" added to "precisions")
+    """
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    manifest = load_manifest(model_dir)
+    for name in GRAPH_FILES:
+        source = _graph_path(model_dir, name)
+        target = _graph_path(model_dir, name, quantized=True)
+        quantize_dynamic(
+            model_input=source,
+            model_output=target,
+            op_types_to_quantize=_LINEAR_OPS,
+            per_channel=True,
+            weight_type=QuantType.QInt8,
+        )
+        logger.info(
+            f"Quantized {name}: {os.path.getsize(source) / 2**20:.0f} MB → "
+            f"{os.path.getsize(target) / 2**20:.0f} MB"
+        )
+
+    manifest["precisions"] = sorted(set(manifest.get("precisions", ["fp32"])) | {"int8"})
+    with open(os.path.join(model_dir, ONNX_MANIFEST), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+# ---- onnxruntime inference ----
+
+def _create_session(path: str, num_threads: int, inter_op_threads: int):
+    """onnxruntime CPU session with full graph optimization and the given thread counts."""
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if num_threads:
+        options.intra_op_num_threads = num_threads
+    if inter_op_threads:
+        options.inter_op_num_threads = inter_op_threads
+    return ort.InferenceSession(path, sess_options=options, providers=["CPUExecutionProvider"])
+
+
+def load_tokenizer(bpe_path: Optional[str] = None) -> Tokenizer:
+    """
+    SAM3 BPE tokenizer (pure Python) for the ONNX text encoder.
+
+    Raises:
+        RuntimeError: If the sam3 tokenizer module cannot be imported
+    """
+    bpe_path = bpe_path or os.getenv(
+        "BPE_PATH", "/app/sam3/sam3/assets/bpe_simple_vocab_16e6.txt.gz"
+    )
+    try:
+        from sam3.model.tokenizer_ve import SimpleTokenizer
+    except ImportError as e:
+        raise RuntimeError(
+            f"ONNX backend needs the SAM3 tokenizer (sam3.model.tokenizer_ve): {str(e)}"
+        )
+    return SimpleTokenizer(bpe_path=bpe_path)
+
+
+class OnnxSam3Backbone:
+    """backbone.forward_image / forward_text over onnxruntime sessions (set by OnnxSam3Model)."""
+
+    def __init__(self, manifest: dict, tokenizer: Tokenizer):
+        self.image_session = None
+        self.text_session = None
+        self.tokenizer = tokenizer
+        self.context_length = manifest["context_length"]
+        self.image_outputs = manifest["image_outputs"]
+        self.text_outputs = manifest["text_outputs"]
+
+    def forward_image(self, pixels) -> dict:
+        feeds = {"pixels": _to_numpy(pixels).astype(np.float32)}
+        outputs = self.image_session.run(self.image_outputs, feeds)
+        return _unflatten(self.image_outputs, [torch.from_numpy(value) for value in outputs])
+
+    def forward_text(self, prompts: list[str], device=None) -> dict:
+        token_ids = _to_numpy(self.tokenizer(list(prompts), context_length=self.context_length))
+        feeds = {"token_ids": token_ids.astype(np.int64)}
+        outputs = self.text_session.run(self.text_outputs, feeds)
+        return _unflatten(self.text_outputs, [torch.from_numpy(value) for value in outputs])
+
+
+class OnnxSam3Model:
+    """SAM3 image model interface (backbone + forward_grounding) backed by onnxruntime."""
+
+    def __init__(
+        self,
+        model_dir: str,
+        manifest: dict,
+        tokenizer: Tokenizer,
+        num_threads: int = 0,
+        inter_op_threads: int = 0,
+        quantized: bool = False,
+    ):
+        self.model_dir = model_dir
+        self.manifest = manifest
+        self.num_threads = num_threads
+        self.inter_op_threads = inter_op_threads
+        self.backbone = OnnxSam3Backbone(manifest, tokenizer)
+        self.decoder_outputs = manifest["decoder_outputs"]
+        self.decoder_session = None
+        self.decoder_inputs: list[str] = []
+        self.quantized: Optional[bool] = None
+        self.set_quantized(quantized)
+
+    def set_quantized(self, enabled: bool) -> None:
+        """
+        Load the int8 (enabled) or fp32 graphs; the other variant's sessions are released.
+
+        Raises:
+            ValueError: If int8 is requested but the export has no int8 graphs
+        """
+        if enabled == self.quantized:
+            return
+        if enabled and "int8" not in self.manifest.get("precisions", ()):
+            raise ValueError(
+                f"No int8 graphs in {self.model_dir}. "
+                "Run scripts/convert_model.py --format int8 on it"
+            )
+        image, text, decoder = [
+            _create_session(
+                _graph_path(self.model_dir, name, enabled),
+                self.num_threads,
+                self.inter_op_threads,
+            )
+            for name in GRAPH_FILES
+        ]
+        self.backbone.image_session = image
+        self.backbone.text_session = text
+        self.decoder_session = decoder
+        # Unused feature inputs may have been pruned from the graph at export
+        self.decoder_inputs = [node.name for node in decoder.get_inputs()]
+        self.quantized = enabled
+
+    def _get_dummy_prompt(self, num_prompts: int = 1):
+        # The decoder graph builds its own empty geometric prompt
+        return None
+
+    def forward_grounding(
+        self,
+        backbone_out: dict,
+        find_input,
+        geometric_prompt=None,
+        find_target=None,
+    ) -> dict:
+        values = dict(_flatten(backbone_out))
+        values["img_ids"] = find_input.img_ids
+        values["text_ids"] = find_input.text_ids
+        feeds = {name: _to_numpy(values[name]) for name in self.decoder_inputs}
+        outputs = self.decoder_session.run(self.decoder_outputs, feeds)
+        return {name: torch.from_numpy(value) for name, value in zip(self.decoder_outputs, outputs)}
+
+
+class OnnxSam3Processor:
+    """Sam3Processor.set_image / set_image_batch with numpy preprocessing (resize + normalize)."""
+
+    device = "cpu"
+
+    def __init__(self, model: OnnxSam3Model, resolution: int = DEFAULT_RESOLUTION):
+        self.model = model
+        self.resolution = resolution
+
+    def _pixels(self, images: list[Image.Image]) -> np.ndarray:
+        """[B, 3, R, R] float32 encoder input."""
+        size = (self.resolution, self.resolution)
+        arrays = [np.asarray(image.convert("RGB").resize(size, Image.BILINEAR), dtype=np.float32)
+                  for image in images]
+        pixels = (np.stack(arrays) / 255.0 - _PIXEL_MEAN) / _PIXEL_STD
+        return pixels.transpose(0, 3, 1, 2).astype(np.float32)
+
+    def set_image(self, image: Image.Image, state: Optional[dict] = None) -> dict:
+        state = {} if state is None else state
+        state["original_height"] = image.height
+        state["original_width"] = image.width
+        state["backbone_out"] = self.model.backbone.forward_image(self._pixels([image]))
+        return state
+
+    def set_image_batch(self, images: list[Image.Image], state: Optional[dict] = None) -> dict:
+        state = {} if state is None else state
+        state["original_heights"] = [image.height for image in images]
+        state["original_widths"] = [image.width for image in images]
+        state["backbone_out"] = self.model.backbone.forward_image(self._pixels(images))
+        return state
+
+
+def load_onnx_segmenter(
+    model_dir: str,
+    bpe_path: Optional[str] = None,
+    tokenizer: Optional[Tokenizer] = None,
+    num_threads: Optional[int] = None,
+    inter_op_threads: Optional[int] = None,
+    precision: Optional[str] = None,
+    **options,
+):
+    """
+    SAM3Segmenter running an export_onnx() directory on onnxruntime's CPU provider.
+
+    Args:
+        model_dir: export_onnx() output directory
+        bpe_path: BPE vocab for the default SAM3 tokenizer
+        tokenizer: Callable (texts, context_length=...) → token ids [N, L]
+                   Default: SAM3 SimpleTokenizer (load_tokenizer)
+        num_threads: onnxruntime intra-op threads (also torch's CPU threads for postprocessing)
+                     Default: ONNX_NUM_THREADS env (0 = onnxruntime default)
+        inter_op_threads: onnxruntime inter-op threads
+                          Default: ONNX_INTER_OP_THREADS env (0 = onnxruntime default)
+        precision: "fp32" or "int8" (quantize_onnx graphs); others fall back to fp32
+                   with a warning (autocast does not apply to onnxruntime)
+        options: SAM3Segmenter.from_model options (max_prompts_per_batch, tiling, ...)
+
+    Returns:
+        SAM3Segmenter whose model_version is derived from the export manifest
+
+    Raises:
+        FileNotFoundError: If model_dir is not an ONNX export
+        ValueError: If the export format is not supported, or int8 was not exported
+    """
+    from .segmenter import SAM3Segmenter
+
+    manifest = load_manifest(model_dir)
+    num_threads = DEFAULT_NUM_THREADS if num_threads is None else num_threads
+    inter_op_threads = DEFAULT_INTER_OP_THREADS if inter_op_threads is None else inter_op_threads
+    precision = precision or "fp32"
+    if precision not in ONNX_PRECISIONS:
+        logger.warning(f"ONNX backend has fp32 / int8 graphs only; ignoring precision={precision}")
+        precision = "fp32"
+    if num_threads:
+        # Postprocessing (mask resize / threshold) runs in torch on the same cores
+        torch.set_num_threads(num_threads)
+
+    model = OnnxSam3Model(
+        model_dir, manifest, tokenizer or load_tokenizer(bpe_path), num_threads, inter_op_threads,
+        quantized=precision == "int8",
+    )
+    processor = OnnxSam3Processor(model, manifest["resolution"])
+    logger.info(
+        f"Loaded ONNX segmenter from {model_dir} (source={manifest.get('source')}, {precision}, "
+        f"threads={num_threads or 'default'}/{inter_op_threads or 'default'})"
+    )
+    return SAM3Segmenter.from_model(
+        model,
+        processor,
+        checkpoint_path=os.path.join(model_dir, ONNX_MANIFEST),
+        precision=precision,
+        **options,
+    )
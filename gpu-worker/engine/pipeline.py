@@ -3,27 +3,50 @@ Pipeline — 전체 추론 파이프라인
 
 흐름: R2 다운로드 → SAM3 segment → rule apply → 후처리 → R2 업로드 → Workers callback
 
-2-Stage Pipeline:
-  Stage 1: Segment ALL concepts ONCE (expensive SAM3 operation)
-  Stage 2: Apply rules per item using cached masks (fast operations)
+2-Stage Pipeline (per item, overlapped):
+  Stage 1: Segment ALL concepts for each item (expensive SAM3 operation, GPU stage)
+           — image encoded once, every rule/protect prompt decoded against it
+           — byte-identical items in a job are segmented once (masks of the last
+             PIPELINE_SAME_IMAGE_ENTRIES images kept; older ones via the mask cache)
+           — protect concepts and preset multi_instance=False concepts are unioned
+             on the GPU, so one mask per concept is transferred instead of N
+           — mask cache consulted first (same photo + prompt → no SAM3 inference)
+           — probe_first: mask 없이 score만 먼저 보고 검출된 concept만 full decode
+             (PROBE_FIRST env 또는 job의 probe_first)
+           — results persisted to R2 as a mask bundle (reuse_masks=True skips SAM3
+             on any worker)
+  Stage 2: Apply rules per item using its own masks (fast operations)
+           — GPU work for item N+1 overlaps apply/upload/callback of item N
+
+Stages (engine.stages, bounded queues, own worker count each):
+  download → decode → segment → apply → encode → upload → callback
 
 Per-item callbacks after each upload.
 Error handling per-item (partial job success).
-Uses BATCH_CONCURRENCY for parallelism.
+Uses BATCH_CONCURRENCY workers for the download/apply/encode/upload stages.
 """
 
 import os
 import io
 import logging
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from typing import Optional
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Collection, Optional
 
+import numpy as np
 from PIL import Image
 
-from .segmenter import SAM3Segmenter
+from .registry import get_segmenter
+from .mask_cache import get_mask_cache, image_digest
+from .mask_bundle import BUNDLE_CONTENT_TYPE, bundle_key, decode_bundle, encode_bundle
 from .applier import apply_rules
+from .compact_mask import union_masks
 from .r2_io import R2Client
+from .scheduler import SCHEDULER_ENABLED, get_scheduler
 from .callback import report
+from .stages import Stage, StagedPipeline
+from presets import is_multi_instance
 
 
 # Configure logging
@@ -33,6 +56,245 @@ logger = logging.getLogger(__name__)
 # Get batch concurrency from environment or job message
 DEFAULT_BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
 
+# Max work items waiting in front of each pipeline stage
+DEFAULT_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "4"))
+
+# Probe every concept without masks first and fully decode only detected ones
+DEFAULT_PROBE_FIRST = os.getenv("PROBE_FIRST", "0") == "1"
+
+# Recently segmented images whose masks are kept for byte-identical items later in
+# the job (full-size masks, so only a few; the mask cache covers the rest)
+DEFAULT_SAME_IMAGE_ENTRIES = int(os.getenv("PIPELINE_SAME_IMAGE_ENTRIES", "4"))
+
+# Stages whose worker count does not follow batch_concurrency
+# (segment owns the GPU and must stay single-worker)
+FIXED_STAGE_WORKERS = {"decode": 2, "segment": 1, "callback": 2}
+STAGE_NAMES = ("download", "decode", "segment", "apply", "encode", "upload", "callback")
+
+
+@dataclass
+class _WorkItem:
+    """One job item moving through the stages (fields are filled stage by stage)."""
+    item: dict
+    image_bytes: Optional[bytes] = None
+    image_hash: Optional[str] = None
+    image: Optional[Image.Image] = None
+    all_masks: Optional[dict] = None
+    protect_mask: Optional[np.ndarray] = None
+    result_image: Optional[Image.Image] = None
+    output_bytes: Optional[bytes] = None
+    preview_bytes: Optional[bytes] = None
+
+    @property
+    def idx(self) -> int:
+        return self.item["idx"]
+
+
+class _JobRunner:
+    """
+    Per-job state + stage functions shared by process_job and process_job_async.
+
+    Stage methods take a _WorkItem, fill in the next fields and free the ones no
+    longer needed. segment() must only ever run on one thread at a time (GPU).
+    """
+
+    def __init__(self, job_message: dict, result_summary: dict, r2_client: R2Client):
+        self.concepts = job_message.get("concepts", {})
+        self.protect = job_message.get("protect", [])
+        self.callback_url = job_message.get("callback_url", "")
+        self.reuse_masks = job_message.get("reuse_masks", False)
+        self.probe_first = job_message.get("probe_first", DEFAULT_PROBE_FIRST)
+        self.prompts = list(dict.fromkeys([*self.concepts.keys(), *self.protect]))
+        # Protect concepts and single-instance preset concepts come back as one union mask
+        preset = job_message.get("preset")
+        self.merge = {
+            p for p in self.prompts
+            if p in self.protect or not is_multi_instance(preset, p)
+        }
+        self.result_summary = result_summary
+        self.r2_client = r2_client
+
+        # Shared SAM3 segmenter (built once per worker process), fetched on first cache miss
+        self._segmenter = None
+        self._segmenter_error = None
+        # image sha256 → (all_masks, protect_mask) of the last DEFAULT_SAME_IMAGE_ENTRIES
+        # images (LRU): byte-identical items close together are segmented once
+        self._masks_by_hash: OrderedDict[str, tuple] = OrderedDict()
+        self._lock = threading.Lock()
+
+    # ---- stages ----
+
+    def download(self, work: _WorkItem) -> None:
+        logger.info(f"Processing item {work.idx}: {work.item['input_key']}")
+        work.image_bytes = self.r2_client.download(work.item["input_key"])
+
+    def decode(self, work: _WorkItem) -> None:
+        work.image_hash = image_digest(work.image_bytes)
+        work.image = Image.open(io.BytesIO(work.image_bytes))
+        work.image.load()
+        work.image_bytes = None
+
+    def segment(self, work: _WorkItem) -> None:
+        """
+        Stage 1 for one item: masks for every rule/protect concept of this image.
+
+        Order of sources: identical image earlier in this job → R2 mask bundle
+        (reuse_masks) → local mask cache → SAM3.
+        """
+        if work.image_hash in self._masks_by_hash:
+            logger.info(f"Item {work.idx}: identical image already segmented, reusing masks")
+            self._masks_by_hash.move_to_end(work.image_hash)
+            work.all_masks, work.protect_mask = self._masks_by_hash[work.image_hash]
+            return
+
+        key = bundle_key(work.item["input_key"])
+        segment_results = {}
+        segment_failures = {}
+        if self.reuse_masks:
+            segment_results = _load_mask_bundle(
+                self.r2_client,
+                key,
+                work.image_hash,
+                self.prompts,
+                self._get_segmenter(),
+                self.merge,
+            )
+        missing_prompts = [p for p in self.prompts if p not in segment_results]
+
+        if missing_prompts:
+            segmenter = self._get_segmenter()
+            segmented, segment_failures = _segment_prompts_cached(
+                segmenter,
+                work.image,
+                work.image_hash,
+                missing_prompts,
+                self.merge,
+                self.probe_first,
+            )
+            segment_results.update(segmented)
+            if segmented:
+                _save_mask_bundle(
+                    self.r2_client, key, segment_results, segmenter, work.image_hash, self.merge
+                )
+        elif self.prompts:
+            logger.info(
+                f"Item {work.idx}: all {len(self.prompts)} prompts loaded from mask bundle {key}"
+            )
+
+        with self._lock:
+            work.all_masks, work.protect_mask = _collect_masks(
+                self.concepts,
+                self.protect,
+                segment_results,
+                segment_failures,
+                self.result_summary["errors"],
+            )
+        self._remember_masks(work)
+
+    def _remember_masks(self, work: _WorkItem) -> None:
+        """Keep an item's masks for identical images, evicting the least recently used."""
+        if DEFAULT_SAME_IMAGE_ENTRIES <= 0:
+            return
+        self._masks_by_hash[work.image_hash] = (work.all_masks, work.protect_mask)
+        while len(self._masks_by_hash) > DEFAULT_SAME_IMAGE_ENTRIES:
+            self._masks_by_hash.popitem(last=False)
+
+    def apply(self, work: _WorkItem) -> None:
+        work.result_image = apply_rules(
+            work.image, work.all_masks, self.concepts, work.protect_mask
+        )
+        work.image = work.all_masks = work.protect_mask = None
+
+    def encode(self, work: _WorkItem) -> None:
+        output_buffer = io.BytesIO()
+        work.result_image.save(output_buffer, format="PNG")
+        work.output_bytes = output_buffer.getvalue()
+
+        # Low-res thumbnail for the preview
+        if work.item.get("preview_key"):
+            preview_image = work.result_image.copy()
+            preview_image.thumbnail((400, 400))  # Max 400px on longest side
+            preview_buffer = io.BytesIO()
+            preview_image.save(preview_buffer, format="JPEG", quality=85)
+            work.preview_bytes = preview_buffer.getvalue()
+        work.result_image = None
+
+    def upload(self, work: _WorkItem) -> None:
+        self.upload_output(work)
+        self.upload_preview(work)
+
+    def upload_output(self, work: _WorkItem) -> None:
+        output_key = work.item["output_key"]
+        self.r2_client.upload(output_key, work.output_bytes, content_type="image/png")
+        logger.info(f"  → Uploaded output: {output_key}")
+        work.output_bytes = None
+
+    def upload_preview(self, work: _WorkItem) -> None:
+        preview_key = work.item.get("preview_key", "")
+        if preview_key:
+            self.r2_client.upload(preview_key, work.preview_bytes, content_type="image/jpeg")
+            logger.info(f"  → Uploaded preview: {preview_key}")
+        work.preview_bytes = None
+
+    def callback(self, work: _WorkItem) -> None:
+        self.complete(work, report(**self.completed_report(work)))
+
+    # ---- bookkeeping ----
+
+    def completed_report(self, work: _WorkItem) -> dict:
+        """Keyword arguments for the 'completed' callback of an item."""
+        preview_key = work.item.get("preview_key", "")
+        return {
+            "callback_url": self.callback_url,
+            "idx": work.idx,
+            "status": "completed",
+            "output_key": work.item["output_key"],
+            "preview_key": preview_key if preview_key else None,
+        }
+
+    def complete(self, work: _WorkItem, callback_sent: bool) -> None:
+        """Count an item as successful once its 'completed' callback was attempted."""
+        if callback_sent:
+            logger.info(f"  → Callback sent successfully for item {work.idx}")
+        else:
+            logger.warning(
+                f"  → Callback failed for item {work.idx} (but item processed successfully)"
+            )
+        with self._lock:
+            self.result_summary["successful_items"] += 1
+
+    def record_failure(self, work: _WorkItem, stage_name: str, error: Exception) -> str:
+        """Count an item as failed. Returns the error message for its failure callback."""
+        error_msg = f"Failed to process item {work.idx}: {str(error)}"
+        logger.error(f"{error_msg} (stage: {stage_name})")
+        with self._lock:
+            self.result_summary["failed_items"] += 1
+            self.result_summary["errors"].append(error_msg)
+        return error_msg
+
+    def fail(self, work: _WorkItem, stage_name: str, error: Exception) -> None:
+        """StagedPipeline error handler: record the failure and send its callback."""
+        _callback_failure(self.callback_url, work.idx, self.record_failure(work, stage_name, error))
+
+    def _get_segmenter(self):
+        """Shared segmenter; a failed build is remembered for the rest of the job."""
+        if self._segmenter is not None:
+            return self._segmenter
+        if self._segmenter_error is not None:
+            raise RuntimeError(self._segmenter_error)
+        try:
+            segmenter = get_segmenter()
+            # Concurrent jobs share the GPU through the micro-batching scheduler
+            self._segmenter = get_scheduler(segmenter) if SCHEDULER_ENABLED else segmenter
+            logger.info("SAM3 segmenter ready")
+            return self._segmenter
+        except Exception as e:
+            self._segmenter_error = f"Failed to initialize SAM3 segmenter: {str(e)}"
+            logger.error(self._segmenter_error)
+            with self._lock:
+                self.result_summary["errors"].append(self._segmenter_error)
+            raise RuntimeError(self._segmenter_error)
+
 
 def process_job(job_message: dict) -> dict:
     """
@@ -53,6 +315,11 @@ def process_job(job_message: dict) -> dict:
                 - preview_key: R2 key for preview thumbnail
             - callback_url: Workers callback URL
             - batch_concurrency: Max concurrent item processing (optional)
+            - reuse_masks: Load masks from the R2 mask bundle written by an earlier
+                           run on the same input_key instead of segmenting (optional)
+            - probe_first: Probe concepts without masks and fully decode only the
+                           detected ones (optional, default PROBE_FIRST env)
+            - stage_workers: Per-stage worker count overrides, e.g. {"upload": 8} (optional)
 
     Returns:
         dict: Result summary with:
@@ -60,6 +327,8 @@ def process_job(job_message: dict) -> dict:
             - successful_items: Number of successfully processed items
             - failed_items: Number of failed items
             - errors: List of error messages (if any)
+            - stages: Per-stage stats (workers, processed, failed, busy_sec,
+                      max_queue_depth, avg_queue_depth)
 
     Example:
         >>> job_message = {
@@ -83,14 +352,13 @@ def process_job(job_message: dict) -> dict:
         ... }
         >>> result = process_job(job_message)
         >>> print(result)
-        {'total_items': 1, 'successful_items': 1, 'failed_items': 0, 'errors': []}
+        {'total_items': 1, 'successful_items': 1, 'failed_items': 0, 'errors': [], 'stages': {...}}
     """
     job_id = job_message.get("job_id", "unknown")
     user_id = job_message.get("user_id", "unknown")
     concepts = job_message.get("concepts", {})
     protect = job_message.get("protect", [])
     items = job_message.get("items", [])
-    callback_url = job_message.get("callback_url", "")
     batch_concurrency = job_message.get("batch_concurrency", DEFAULT_BATCH_CONCURRENCY)
 
     logger.info(f"Starting job {job_id} for user {user_id} with {len(items)} items")
@@ -108,190 +376,272 @@ def process_job(job_message: dict) -> dict:
         logger.warning(f"Job {job_id} has no items to process")
         return result_summary
 
-    # Initialize R2 client
-    r2_client = R2Client()
+    runner = _JobRunner(job_message, result_summary, R2Client())
+    logger.info(f"Segmenting {len(concepts)} concepts + {len(protect)} protect concepts per item")
 
     # ====================
-    # STAGE 1: Segment ALL concepts ONCE (expensive SAM3 operation)
+    # download → decode → segment (GPU) → apply → encode → upload → callback
+    # Each stage has its own workers; bounded queues between stages keep at most
+    # queue_size items waiting per stage, so network, GPU and CPU work overlap.
     # ====================
-    logger.info(f"Stage 1: Segmenting {len(concepts)} concepts + {len(protect)} protect concepts")
+    workers = _stage_workers(batch_concurrency, job_message.get("stage_workers", {}))
+    logger.info(f"Processing {len(items)} items with stage workers {workers}")
 
-    # Download first image to use as reference for segmentation
-    # (In a real implementation, we might want to segment per image if they differ significantly)
-    first_item = items[0]
-    try:
-        first_image_bytes = r2_client.download(first_item["input_key"])
-        first_image = Image.open(io.BytesIO(first_image_bytes))
-    except Exception as e:
-        error_msg = f"Failed to download first image for segmentation: {str(e)}"
-        logger.error(error_msg)
-        result_summary["errors"].append(error_msg)
-        # If we can't get the first image, fail all items
-        for item in items:
-            _callback_failure(callback_url, item["idx"], error_msg)
-            result_summary["failed_items"] += 1
-        return result_summary
+    pipeline = StagedPipeline(
+        [Stage(name, getattr(runner, name), workers[name]) for name in STAGE_NAMES],
+        queue_size=DEFAULT_QUEUE_SIZE,
+        on_error=runner.fail,
+    )
+    result_summary["stages"] = pipeline.run(_WorkItem(item) for item in items)
 
-    # Initialize SAM3 segmenter
-    try:
-        segmenter = SAM3Segmenter()
-        logger.info("SAM3 segmenter initialized successfully")
-    except Exception as e:
-        error_msg = f"Failed to initialize SAM3 segmenter: {str(e)}"
-        logger.error(error_msg)
-        result_summary["errors"].append(error_msg)
-        # If segmenter fails, fail all items
-        for item in items:
-            _callback_failure(callback_url, item["idx"], error_msg)
-            result_summary["failed_items"] += 1
-        return result_summary
+    logger.info(
+        f"Job {job_id} complete: {result_summary['successful_items']}/{result_summary['total_items']} successful, "
+        f"{result_summary['failed_items']} failed"
+    )
+
+    return result_summary
+
+
+def _stage_workers(batch_concurrency: int, overrides: dict) -> dict[str, int]:
+    """
+    Worker count per stage: batch_concurrency for network/CPU-heavy stages,
+    fixed counts for the rest, then per-job overrides (segment is always 1).
+    """
+    workers = {name: FIXED_STAGE_WORKERS.get(name, batch_concurrency) for name in STAGE_NAMES}
+    for name, count in overrides.items():
+        if name not in workers:
+            logger.warning(f"Ignoring stage_workers for unknown stage '{name}'")
+        elif name == "segment" and count != 1:
+            logger.warning("Ignoring stage_workers['segment']: the GPU stage is single-worker")
+        else:
+            workers[name] = max(1, int(count))
+    return workers
+
+
+def _collect_masks(
+    concepts: dict,
+    protect: list[str],
+    segment_results: dict,
+    segment_failures: dict,
+    errors: list[str],
+) -> tuple[dict, Optional[np.ndarray]]:
+    """
+    Split segment results into per-concept masks and one combined protect mask.
+
+    Failed rule concepts get empty masks and an error message (recorded once per job
+    in errors); failed protect concepts are skipped.
 
-    # Segment all concepts
+    Returns:
+        tuple: (all_masks: concept -> list of masks, protect_mask or None)
+    """
     all_masks = {}
-    all_metadata = {}
 
-    # Segment concepts that have rules
+    # Collect masks for concepts that have rules
     for concept_name in concepts.keys():
-        try:
-            logger.info(f"Segmenting concept: {concept_name}")
-            masks, metadata = segmenter.segment(first_image, concept_name)
+        if concept_name in segment_results:
+            masks, metadata = segment_results[concept_name]
             all_masks[concept_name] = masks
-            all_metadata[concept_name] = metadata
-            logger.info(f"  → Found {metadata['instance_count']} instances")
-        except Exception as e:
-            error_msg = f"Failed to segment concept '{concept_name}': {str(e)}"
+            logger.info(f"Concept {concept_name}: found {metadata['instance_count']} instances")
+        else:
+            error_msg = (
+                f"Failed to segment concept '{concept_name}': "
+                f"{segment_failures.get(concept_name)}"
+            )
             logger.warning(error_msg)
-            result_summary["errors"].append(error_msg)
+            if error_msg not in errors:
+                errors.append(error_msg)
             # Continue with other concepts even if one fails
             all_masks[concept_name] = []
-            all_metadata[concept_name] = {"concept": concept_name, "instance_count": 0, "scores": []}
 
-    # Segment protect concepts and combine into single protect mask
-    protect_mask = None
-    if protect:
-        logger.info(f"Segmenting {len(protect)} protect concepts")
-        protect_masks_list = []
-        for protect_concept in protect:
-            try:
-                logger.info(f"Segmenting protect concept: {protect_concept}")
-                masks, metadata = segmenter.segment(first_image, protect_concept)
-                if len(masks) > 0:
-                    # Combine all instances of this protect concept
-                    import numpy as np
-                    combined_mask = np.maximum.reduce(masks) if len(masks) > 1 else masks[0]
-                    protect_masks_list.append(combined_mask)
-                    logger.info(f"  → Found {metadata['instance_count']} instances")
-            except Exception as e:
-                logger.warning(f"Failed to segment protect concept '{protect_concept}': {str(e)}")
-                # Continue with other protect concepts
-
-        # Combine all protect masks into one
-        if protect_masks_list:
-            import numpy as np
-            protect_mask = np.maximum.reduce(protect_masks_list) if len(protect_masks_list) > 1 else protect_masks_list[0]
-            logger.info(f"Combined {len(protect_masks_list)} protect masks")
-
-    logger.info("Stage 1 complete: All concepts segmented")
+    # Combine protect concepts into single protect mask
+    protect_masks_list = []
+    for protect_concept in protect:
+        if protect_concept not in segment_results:
+            logger.warning(
+                f"Failed to segment protect concept '{protect_concept}': "
+                f"{segment_failures.get(protect_concept)}"
+            )
+            # Continue with other protect concepts
+            continue
+        masks, metadata = segment_results[protect_concept]
+        if len(masks) > 0:
+            # Combine all instances of this protect concept
+            combined_mask = union_masks(masks)
+            protect_masks_list.append(combined_mask)
+            logger.info(
+                f"Protect concept {protect_concept}: "
+                f"found {metadata['instance_count']} instances"
+            )
 
-    # ====================
-    # STAGE 2: Apply rules per item using cached masks (with concurrency)
-    # ====================
-    logger.info(f"Stage 2: Processing {len(items)} items with batch_concurrency={batch_concurrency}")
+    # Combine all protect masks into one
+    protect_mask = None
+    if protect_masks_list:
+        protect_mask = union_masks(protect_masks_list)
+        logger.info(f"Combined {len(protect_masks_list)} protect masks")
 
-    def process_single_item(item: dict) -> tuple[int, bool, Optional[str]]:
-        """
-        Process a single item. Returns (idx, success, error_message).
+    return all_masks, protect_mask
 
-        Args:
-            item: Item dict with idx, input_key, output_key, preview_key
 
-        Returns:
-            tuple: (idx, success: bool, error_message: Optional[str])
-        """
-        idx = item["idx"]
-        input_key = item["input_key"]
-        output_key = item["output_key"]
-        preview_key = item.get("preview_key", "")
+def _segment_prompts(
+    segmenter,
+    image: Image.Image,
+    prompts: list[str],
+    merge: Collection[str] = (),
+    probe_first: bool = False,
+) -> tuple[dict, dict]:
+    """
+    Segment all prompts against one image encoding.
 
-        try:
-            logger.info(f"Processing item {idx}: {input_key}")
-
-            # Download input image
-            image_bytes = r2_client.download(input_key)
-            image = Image.open(io.BytesIO(image_bytes))
-
-            # Apply rules using cached masks
-            result_image = apply_rules(image, all_masks, concepts, protect_mask)
-
-            # Upload output image
-            output_buffer = io.BytesIO()
-            result_image.save(output_buffer, format="PNG")
-            output_bytes = output_buffer.getvalue()
-            r2_client.upload(output_key, output_bytes, content_type="image/png")
-            logger.info(f"  → Uploaded output: {output_key}")
-
-            # Generate and upload preview (low-res thumbnail)
-            if preview_key:
-                preview_image = result_image.copy()
-                preview_image.thumbnail((400, 400))  # Max 400px on longest side
-                preview_buffer = io.BytesIO()
-                preview_image.save(preview_buffer, format="JPEG", quality=85)
-                preview_bytes = preview_buffer.getvalue()
-                r2_client.upload(preview_key, preview_bytes, content_type="image/jpeg")
-                logger.info(f"  → Uploaded preview: {preview_key}")
-
-            # Callback success
-            success = report(
-                callback_url=callback_url,
-                idx=idx,
-                status="completed",
-                output_key=output_key,
-                preview_key=preview_key if preview_key else None,
-            )
+    Prompts in merge are returned as one union mask (unioned on the device).
+    With probe_first, prompts without a detection skip mask decoding (empty result).
+    If the combined call fails, fall back to per-prompt segment() so a single bad
+    prompt does not drop every concept.
 
-            if success:
-                logger.info(f"  → Callback sent successfully for item {idx}")
-            else:
-                logger.warning(f"  → Callback failed for item {idx} (but item processed successfully)")
+    Returns:
+        tuple: (results: prompt -> (masks, metadata), failures: prompt -> error message)
+    """
+    if not prompts:
+        return {}, {}
 
-            return (idx, True, None)
+    try:
+        logger.info(f"Segmenting {len(prompts)} prompts: {prompts}")
+        # Passed only when enabled, so segmenters without probing keep working
+        options = {"probe_first": True} if probe_first else {}
+        merged = [p for p in prompts if p in merge]
+        return segmenter.segment_concepts(image, prompts, merge=merged, **options), {}
+    except Exception as e:
+        logger.warning(f"Combined segmentation failed, retrying per concept: {str(e)}")
 
+    results = {}
+    failures = {}
+    for prompt in prompts:
+        try:
+            results[prompt] = segmenter.segment(image, prompt, merge=prompt in merge)
         except Exception as e:
-            error_msg = f"Failed to process item {idx}: {str(e)}"
-            logger.error(error_msg)
-
-            # Callback failure
-            report(
-                callback_url=callback_url,
-                idx=idx,
-                status="failed",
-                error=error_msg,
-            )
+            failures[prompt] = str(e)
+    return results, failures
+
+
+def _segment_prompts_cached(
+    segmenter,
+    image: Image.Image,
+    image_hash: str,
+    prompts: list[str],
+    merge: Collection[str] = (),
+    probe_first: bool = False,
+) -> tuple[dict, dict]:
+    """
+    Segment prompts, serving (image, prompt) pairs from the mask cache when possible.
 
-            return (idx, False, error_msg)
+    Only cache misses reach SAM3; their successful results are stored for later jobs.
+    Union (merged) results are cached apart from per-instance results.
 
-    # Process items with concurrency
-    with ThreadPoolExecutor(max_workers=batch_concurrency) as executor:
-        # Submit all items for processing
-        future_to_idx = {executor.submit(process_single_item, item): item["idx"] for item in items}
+    Returns:
+        tuple: (results: prompt -> (masks, metadata), failures: prompt -> error message)
+    """
+    cache = get_mask_cache()
+    threshold = segmenter.confidence_threshold
+    versions = {
+        prompt: _cache_version(segmenter.model_version, prompt in merge) for prompt in prompts
+    }
 
-        # Collect results as they complete
-        for future in as_completed(future_to_idx):
-            idx, success, error_msg = future.result()
+    results = {}
+    missing = []
+    for prompt in prompts:
+        cached = cache.get(image_hash, prompt, threshold, versions[prompt])
+        if cached is not None:
+            results[prompt] = cached
+        else:
+            missing.append(prompt)
+
+    if results:
+        logger.info(f"Mask cache: {len(results)}/{len(prompts)} prompts served from cache")
+
+    segmented, failures = _segment_prompts(segmenter, image, missing, merge, probe_first)
+    for prompt, result in segmented.items():
+        cache.put(image_hash, prompt, threshold, versions[prompt], result)
+    results.update(segmented)
+    return results, failures
+
+
+def _cache_version(model_version: str, merged: bool) -> str:
+    """Mask cache version of a prompt result (":merged" marks union masks, as in SAM3Segmenter)."""
+    if merged and not str(model_version).endswith(":merged"):
+        return f"{model_version}:merged"
+    return model_version
+
+
+def _load_mask_bundle(
+    r2_client: R2Client,
+    key: str,
+    image_hash: str,
+    prompts: list[str],
+    segmenter,
+    merge: Collection[str] = (),
+) -> dict:
+    """
+    Load segment results for prompts from an R2 mask bundle.
 
-            if success:
-                result_summary["successful_items"] += 1
-            else:
-                result_summary["failed_items"] += 1
-                if error_msg:
-                    result_summary["errors"].append(error_msg)
+    Missing, unreadable, or stale bundles (written for different image bytes, or
+    by a segmenter with another model_version or confidence_threshold) are
+    ignored so the caller falls back to segmenting. As in the mask cache, a prompt
+    stored as a union mask only serves a job that merges it too (and vice versa);
+    bundles that do not record their merged prompts are ignored.
 
-    logger.info(
-        f"Job {job_id} complete: {result_summary['successful_items']}/{result_summary['total_items']} successful, "
-        f"{result_summary['failed_items']} failed"
-    )
-
-    return result_summary
+    Returns:
+        dict: prompt -> (masks, metadata) for prompts found in the bundle
+    """
+    try:
+        bundle = decode_bundle(r2_client.download(key))
+    except Exception as e:
+        logger.info(f"No usable mask bundle at {key}: {str(e)}")
+        return {}
+
+    if bundle.image_hash != image_hash:
+        logger.warning(f"Mask bundle {key} was written for a different image, ignoring")
+        return {}
+    if bundle.model_version != segmenter.model_version:
+        logger.warning(
+            f"Mask bundle {key} was written by model_version={bundle.model_version} "
+            f"(current {segmenter.model_version}), ignoring"
+        )
+        return {}
+    if bundle.confidence_threshold != segmenter.confidence_threshold:
+        logger.warning(
+            f"Mask bundle {key} was written at confidence_threshold={bundle.confidence_threshold} "
+            f"(current {segmenter.confidence_threshold}), ignoring"
+        )
+        return {}
+    if bundle.merged is None:
+        logger.warning(f"Mask bundle {key} does not record its merged prompts, ignoring")
+        return {}
+
+    results = {
+        p: bundle.results[p]
+        for p in prompts
+        if p in bundle.results and (p in bundle.merged) == (p in merge)
+    }
+    logger.info(f"Mask bundle {key}: {len(results)}/{len(prompts)} prompts")
+    return results
+
+
+def _save_mask_bundle(
+    r2_client: R2Client,
+    key: str,
+    results: dict,
+    segmenter,
+    image_hash: str,
+    merge: Collection[str] = (),
+) -> None:
+    """Upload segment results as a mask bundle. Failures are logged, not raised."""
+    try:
+        data = encode_bundle(
+            results, segmenter.model_version, segmenter.confidence_threshold, image_hash, merge
+        )
+        r2_client.upload(key, data, content_type=BUNDLE_CONTENT_TYPE)
+        logger.info(f"Uploaded mask bundle: {key} ({len(data)} bytes)")
+    except Exception as e:
+        logger.warning(f"Failed to upload mask bundle {key}: {str(e)}")
 
 
 def _callback_failure(callback_url: str, idx: int, error_msg: str) -> None:
@@ -0,0 +1,255 @@
+"""
+Precision Check — reduced-precision 추론의 mask 정확도 / 속도 비교
+
+같은 이미지/프롬프트 corpus를 precision mode별로 돌려 fp32 기준 mask IoU drift와
+speedup을 보고한다. 배포 전 MODEL_PRECISION=bf16/fp16 전환 검증용.
+
+- mask_iou(a, b) → instance mask 합집합끼리의 IoU (둘 다 비어있으면 1.0)
+- compare_precisions(segmenter, images, prompts) → mode별 report dict
+- compare_backends({"torch": seg, "onnx": seg}, images, prompts) → backend별 latency / IoU
+  (첫 backend가 기준, 예: torch GPU vs onnxruntime CPU)
+- format_report(report) → 사람이 읽는 표
+
+segmenter는 SAM3Segmenter (실제 모델 또는 SAM3Segmenter.from_model 로 만든 stand-in).
+"""
+
+import logging
+import time
+from typing import Callable, Optional, Sequence
+
+import numpy as np
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# Baseline precision all other modes are compared against
+BASELINE_PRECISION = "fp32"
+
+# Number of lowest-IoU (image, prompt) pairs kept per mode
+WORST_PAIRS = 5
+
+
+def _union(masks: Sequence[np.ndarray], shape: Optional[tuple] = None) -> np.ndarray:
+    """Union of instance masks as a bool array."""
+    if not masks:
+        return np.zeros(shape or (0, 0), dtype=bool)
+    union = np.zeros(np.asarray(masks[0]).shape, dtype=bool)
+    for mask in masks:
+        union |= np.asarray(mask) > 0
+    return union
+
+
+def mask_iou(masks_a: Sequence[np.ndarray], masks_b: Sequence[np.ndarray]) -> float:
+    """
+    IoU between the unions of two instance mask lists.
+
+    Args:
+        masks_a: Instance masks (H, W) of one run
+        masks_b: Instance masks (H, W) of the other run
+
+    Returns:
+        float: Intersection over union, 1.0 when both are empty
+    """
+    if not masks_a and not masks_b:
+        return 1.0
+    shape = np.asarray((masks_a or masks_b)[0]).shape
+    union_a = _union(masks_a, shape)
+    union_b = _union(masks_b, shape)
+    union = np.logical_or(union_a, union_b).sum()
+    if union == 0:
+        return 1.0
+    return float(np.logical_and(union_a, union_b).sum() / union)
+
+
+def run_corpus(
+    segmenter,
+    images: Sequence[Image.Image],
+    prompts: Sequence[str],
+    repeats: int = 3,
+    sync: Optional[Callable[[], None]] = None,
+) -> tuple[list[dict], float]:
+    """
+    Segment every image with every prompt.
+
+    One untimed warmup pass runs first (kernel selection, text cache fill).
+
+    Args:
+        segmenter: SAM3Segmenter
+        images: Corpus images
+        prompts: Prompts applied to every image
+        repeats: Timed passes over the corpus
+        sync: Called before reading the clock (e.g. torch.cuda.synchronize)
+
+    Returns:
+        (results per image from the last pass, mean seconds per corpus pass)
+    """
+    def run_once() -> list[dict]:
+        return [segmenter.segment_concepts(image, list(prompts)) for image in images]
+
+    results = run_once()
+    if sync:
+        sync()
+
+    start = time.perf_counter()
+    for _ in range(repeats):
+        results = run_once()
+    if sync:
+        sync()
+    return results, (time.perf_counter() - start) / max(repeats, 1)
+
+
+def compare_precisions(
+    segmenter,
+    images: Sequence[Image.Image],
+    prompts: Sequence[str],
+    precisions: Sequence[str] = ("fp32", "bf16", "fp16"),
+    repeats: int = 3,
+    sync: Optional[Callable[[], None]] = None,
+) -> dict:
+    """
+    Run the corpus in every precision mode and compare against fp32.
+
+    The segmenter's precision is restored afterwards.
+
+    Args:
+        segmenter: SAM3Segmenter (set_precision is used to switch modes)
+        images: Corpus images
+        prompts: Prompts applied to every image
+        precisions: Modes to run (fp32 is always run first as the baseline)
+        repeats: Timed passes per mode
+        sync: Device synchronization before reading the clock
+
+    Returns:
+        dict: {"baseline": "fp32", "pairs": N, "modes": {mode: {...}}} where each
+              mode has seconds, speedup, mean_iou, min_iou, count_mismatches and
+              worst (lowest-IoU pairs), or error if the mode failed
+    """
+    original = segmenter.precision
+    modes = [BASELINE_PRECISION] + [p for p in precisions if p != BASELINE_PRECISION]
+    report = {"baseline": BASELINE_PRECISION, "pairs": len(images) * len(prompts), "modes": {}}
+
+    baseline_results = None
+    baseline_seconds = None
+    try:
+        for mode in modes:
+            try:
+                segmenter.set_precision(mode)
+                results, seconds = run_corpus(segmenter, images, prompts, repeats, sync)
+            except Exception as e:
+                logger.warning(f"Precision {mode} failed: {str(e)}")
+                report["modes"][mode] = {"error": str(e)}
+                if mode == BASELINE_PRECISION:
+                    raise
+                continue
+
+            if baseline_results is None:
+                baseline_results, baseline_seconds = results, seconds
+            report["modes"][mode] = _compare_runs(
+                prompts, baseline_results, baseline_seconds, results, seconds
+            )
+    finally:
+        segmenter.set_precision(original)
+
+    return report
+
+
+def compare_backends(
+    segmenters: dict,
+    images: Sequence[Image.Image],
+    prompts: Sequence[str],
+    repeats: int = 3,
+    sync: Optional[Callable[[], None]] = None,
+) -> dict:
+    """
+    Run the corpus on several segmenter backends and compare against the first.
+
+    Args:
+        segmenters: {name: segmenter} (e.g. {"torch": gpu_segmenter, "onnx": cpu_segmenter}),
+                    the first entry is the baseline
+        images: Corpus images
+        prompts: Prompts applied to every image
+        repeats: Timed passes per backend
+        sync: Device synchronization before reading the clock
+
+    Returns:
+        dict: Same layout as compare_precisions(), with backends as modes
+    """
+    names = list(segmenters)
+    report = {"baseline": names[0], "pairs": len(images) * len(prompts), "modes": {}}
+
+    baseline_results = None
+    baseline_seconds = None
+    for name in names:
+        try:
+            results, seconds = run_corpus(segmenters[name], images, prompts, repeats, sync)
+        except Exception as e:
+            logger.warning(f"Backend {name} failed: {str(e)}")
+            if baseline_results is None:
+                raise
+            report["modes"][name] = {"error": str(e)}
+            continue
+
+        if baseline_results is None:
+            baseline_results, baseline_seconds = results, seconds
+        report["modes"][name] = _compare_runs(
+            prompts, baseline_results, baseline_seconds, results, seconds
+        )
+
+    return report
+
+
+def _compare_runs(
+    prompts: Sequence[str],
+    baseline_results: list[dict],
+    baseline_seconds: float,
+    results: list[dict],
+    seconds: float,
+) -> dict:
+    """Speed and mask agreement of one corpus run against the baseline run."""
+    ious = []
+    count_mismatches = 0
+    for image_idx, (base, current) in enumerate(zip(baseline_results, results)):
+        for prompt in prompts:
+            base_masks, base_meta = base[prompt]
+            masks, meta = current[prompt]
+            ious.append((mask_iou(base_masks, masks), image_idx, prompt))
+            if meta.get("instance_count") != base_meta.get("instance_count"):
+                count_mismatches += 1
+
+    ious.sort(key=lambda entry: entry[0])
+    values = [iou for iou, _, _ in ious]
+    return {
+        "seconds": round(seconds, 4),
+        "speedup": round(baseline_seconds / seconds, 3) if seconds > 0 else None,
+        "mean_iou": round(float(np.mean(values)), 4) if values else 1.0,
+        "min_iou": round(values[0], 4) if values else 1.0,
+        "count_mismatches": count_mismatches,
+        "worst": [
+            {"image": image_idx, "prompt": prompt, "iou": round(iou, 4)}
+            for iou, image_idx, prompt in ious[:WORST_PAIRS]
+        ],
+    }
+
+
+def format_report(report: dict) -> str:
+    """Render a compare_precisions() / compare_backends() report as a text table."""
+    lines = [
+        f"{report['pairs']} image/prompt pairs, baseline {report['baseline']}",
+        f"{'mode':<6} {'sec/pass':>9} {'speedup':>8} {'mean IoU':>9} {'min IoU':>8} {'count Δ':>8}",
+    ]
+    for mode, entry in report["modes"].items():
+        if "error" in entry:
+            lines.append(f"{mode:<6} failed: {entry['error']}")
+            continue
+        lines.append(
+            f"{mode:<6} {entry['seconds']:>9.4f} {entry['speedup']:>7.2f}x "
+            f"{entry['mean_iou']:>9.4f} {entry['min_iou']:>8.4f} {entry['count_mismatches']:>8d}"
+        )
+        if mode != report["baseline"]:
+            for worst in entry["worst"]:
+                if worst["iou"] < 1.0:
+                    lines.append(
+                        f"         image {worst['image']} '{worst['prompt']}': "
+                        f"IoU {worst['iou']:.4f}"
+                    )
+    return "\n".join(lines)
@@ -0,0 +1,213 @@
+"""
+Segmenter Registry — 프로세스 단위 warm SAM3Segmenter 공유
+
+SAM3 모델 빌드(848M params, /models/sam3.pt 로드)는 job 처리 시간의 대부분을 차지한다.
+워커 프로세스가 살아있는 동안 모델을 한 번만 빌드하고 모든 호출자가 공유한다.
+
+- key: (checkpoint_path, bpe_path, precision)
+- build option 기본값 (CONFIDENCE_THRESHOLD env)은 resolve_options()에서 한 번에 결정
+  → warmup preload, pipeline, handler 중 누가 먼저 빌드해도 같은 segmenter
+- get(...) → 캐시된 segmenter (없으면 빌드)
+- preload(...) → 미리 빌드 (cold start 단계에서 호출)
+- evict(...) → 캐시에서 제거
+- checkpoint 파일이 바뀌면 (mtime/size) 다음 get()에서 재빌드
+- checkpoint가 ONNX export 디렉터리면 onnxruntime CPU backend로 빌드 (engine.onnx_backend)
+- build_count → 지금까지 실제 모델 빌드 횟수
+
+pipeline.process_job, handler.get_segmenter, adapters가 모두 같은 registry를 쓴다.
+"""
+
+import logging
+import os
+import threading
+from dataclasses import dataclass
+from typing import Any, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+# (checkpoint_path, bpe_path, precision)
+SegmenterKey = tuple[str, str, str]
+
+# factory(checkpoint_path=..., bpe_path=..., precision=..., **options) -> segmenter
+SegmenterFactory = Callable[..., Any]
+
+
+def _default_factory(checkpoint_path: str, bpe_path: str, precision: str, **options):
+    """
+    Build a real SAM3Segmenter and warm its text cache with every preset prompt.
+
+    A checkpoint path that is an ONNX export directory (engine.onnx_backend)
+    builds the onnxruntime CPU backend instead.
+
+    Imported lazily so the registry has no sam3 dependency.
+    """
+    from presets import preset_prompts
+
+    from .onnx_backend import is_onnx_model, load_onnx_segmenter
+    from .segmenter import SAM3Segmenter
+
+    if is_onnx_model(checkpoint_path):
+        segmenter = load_onnx_segmenter(
+            checkpoint_path, bpe_path=bpe_path, precision=precision, **options
+        )
+    else:
+        segmenter = SAM3Segmenter(
+            checkpoint_path=checkpoint_path,
+            bpe_path=bpe_path,
+            precision=precision,
+            **options,
+        )
+    warmed = segmenter.warm_text_cache(preset_prompts())
+    logger.info(f"Text cache warmed with {warmed} preset prompts")
+    return segmenter
+
+
+def _checkpoint_fingerprint(path: str) -> Optional[tuple[int, int]]:
+    """Return (mtime_ns, size) of the checkpoint, or None if it does not exist."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+@dataclass
+class _Entry:
+    segmenter: Any
+    fingerprint: Optional[tuple[int, int]]
+
+
+class SegmenterRegistry:
+    def __init__(self, factory: Optional[SegmenterFactory] = None):
+        """
+        Initialize an empty registry.
+
+        Args:
+            factory: Callable building a segmenter from checkpoint_path, bpe_path,
+                     precision (+ extra options). Default: SAM3Segmenter.
+                     Tests pass a stub factory to avoid loading the model.
+        """
+        self._factory = factory or _default_factory
+        self._entries: dict[SegmenterKey, _Entry] = {}
+        self._lock = threading.Lock()
+        self.build_count = 0
+
+    @staticmethod
+    def resolve_key(
+        checkpoint_path: Optional[str] = None,
+        bpe_path: Optional[str] = None,
+        precision: Optional[str] = None,
+    ) -> SegmenterKey:
+        """
+        Resolve registry key from arguments, environment, or defaults.
+
+        Uses the same environment variables as SAM3Segmenter:
+        MODEL_CHECKPOINT, BPE_PATH, MODEL_PRECISION.
+        """
+        return (
+            checkpoint_path or os.getenv("MODEL_CHECKPOINT", "/models/sam3.pt"),
+            bpe_path or os.getenv("BPE_PATH", "/app/sam3/sam3/assets/bpe_simple_vocab_16e6.txt.gz"),
+            precision or os.getenv("MODEL_PRECISION", "fp32"),
+        )
+
+    @staticmethod
+    def resolve_options(**options) -> dict:
+        """
+        Build options with environment defaults filled in.
+
+        CONFIDENCE_THRESHOLD sets confidence_threshold (default 0.5). Other settings
+        (MAX_INPUT_SIDE, MASK_FORMAT, ...) are read by SAM3Segmenter itself.
+        Explicit options win over the environment.
+        """
+        return {"confidence_threshold": float(os.getenv("CONFIDENCE_THRESHOLD", "0.5")), **options}
+
+    def get(
+        self,
+        checkpoint_path: Optional[str] = None,
+        bpe_path: Optional[str] = None,
+        precision: Optional[str] = None,
+        **options,
+    ):
+        """
+        Return the shared segmenter for this key, building it on first use.
+
+        If the checkpoint file changed on disk since the cached segmenter was built,
+        the segmenter is rebuilt. Extra options (e.g. confidence_threshold, see
+        resolve_options) are only used when a build actually happens, so every
+        caller should rely on the same resolved defaults.
+
+        Raises:
+            Whatever the factory raises (FileNotFoundError, RuntimeError, ...).
+            A failed build leaves the registry unchanged.
+        """
+        key = self.resolve_key(checkpoint_path, bpe_path, precision)
+        fingerprint = _checkpoint_fingerprint(key[0])
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry.fingerprint == fingerprint:
+                    return entry.segmenter
+                logger.info(f"Checkpoint changed on disk, reloading segmenter: {key[0]}")
+                del self._entries[key]
+
+            logger.info(f"Building segmenter (checkpoint={key[0]}, precision={key[2]})")
+            segmenter = self._factory(
+                checkpoint_path=key[0],
+                bpe_path=key[1],
+                precision=key[2],
+                **self.resolve_options(**options),
+            )
+            self.build_count += 1
+            self._entries[key] = _Entry(segmenter=segmenter, fingerprint=fingerprint)
+            return segmenter
+
+    def preload(
+        self,
+        checkpoint_path: Optional[str] = None,
+        bpe_path: Optional[str] = None,
+        precision: Optional[str] = None,
+        **options,
+    ):
+        """Build (or reuse) the segmenter ahead of the first job. Returns it."""
+        return self.get(checkpoint_path, bpe_path, precision, **options)
+
+    def evict(
+        self,
+        checkpoint_path: Optional[str] = None,
+        bpe_path: Optional[str] = None,
+        precision: Optional[str] = None,
+    ) -> bool:
+        """Drop the cached segmenter for this key. Returns True if one was cached."""
+        key = self.resolve_key(checkpoint_path, bpe_path, precision)
+        with self._lock:
+            return self._entries.pop(key, None) is not None
+
+    def clear(self) -> None:
+        """Drop every cached segmenter."""
+        with self._lock:
+            self._entries.clear()
+
+    def keys(self) -> list[SegmenterKey]:
+        """Keys of currently cached segmenters."""
+        with self._lock:
+            return list(self._entries.keys())
+
+
+# Process-wide default registry
+_registry = SegmenterRegistry()
+
+
+def get_registry() -> SegmenterRegistry:
+    """Return the process-wide segmenter registry."""
+    return _registry
+
+
+def get_segmenter(
+    checkpoint_path: Optional[str] = None,
+    bpe_path: Optional[str] = None,
+    precision: Optional[str] = None,
+    **options,
+):
+    """Shortcut for get_registry().get(...)."""
+    return _registry.get(checkpoint_path, bpe_path, precision, **options)
@@ -0,0 +1,126 @@
+"""
+Resolution Check — 축소 인코딩(max_input_side)의 mask 품질 보고
+
+원본 해상도 mask를 기준으로, 긴 변 제한 / upsample 방식 조합마다
+docs/legacy-prompts.json 카테고리별 mask IoU와 처리 시간을 비교한다.
+SAM3 encoder는 항상 1008 정사각형을 처리하므로 speedup은 encoder가 아니라
+mask 보간 / 전송 (nearest 모드) 차이만 반영한다.
+
+- load_prompt_categories(path) → {category: [prompts]}
+- compare_resolutions(segmenter, images, categories, sides, upsample_modes) → report dict
+- format_report(report) → 사람이 읽는 표
+"""
+
+import json
+import os
+import time
+from typing import Sequence
+
+import numpy as np
+from PIL import Image
+
+from .precision_check import mask_iou
+
+# Prompt corpus grouped by category (objects, complex, background, body_parts)
+LEGACY_PROMPTS_PATH = os.path.join(os.path.dirname(__file__), "..", "docs", "legacy-prompts.json")
+
+
+def load_prompt_categories(path: str = LEGACY_PROMPTS_PATH) -> dict[str, list[str]]:
+    """Read {category: prompts} from a legacy-prompts.json style file."""
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    return {name: list(entry["prompts"]) for name, entry in data["categories"].items()}
+
+
+def _run(segmenter, images: Sequence[Image.Image], prompts: list[str]) -> tuple[list[dict], float]:
+    start = time.perf_counter()
+    results = [segmenter.segment_concepts(image, prompts) for image in images]
+    return results, time.perf_counter() - start
+
+
+def compare_resolutions(
+    segmenter,
+    images: Sequence[Image.Image],
+    categories: dict[str, list[str]],
+    sides: Sequence[int] = (1008, 1536, 2048),
+    upsample_modes: Sequence[str] = ("nearest", "bilinear"),
+) -> dict:
+    """
+    Compare downscaled-encode masks against native-resolution masks.
+
+    The segmenter's input resolution settings are restored afterwards.
+
+    Args:
+        segmenter: SAM3Segmenter (set_input_resolution is used to switch settings)
+        images: Corpus images (full resolution)
+        categories: {category: prompts}, e.g. load_prompt_categories()
+        sides: max_input_side values to test
+        upsample_modes: Mask upsampling modes to test
+
+    Returns:
+        dict: {"configs": [{"max_input_side", "mask_upsample", "seconds", "speedup",
+              "categories": {name: {"mean_iou", "min_iou"}}, "mean_iou"}, ...],
+              "baseline_seconds": float}
+    """
+    original = (segmenter.max_input_side, segmenter.mask_upsample)
+    prompts = list(dict.fromkeys(p for group in categories.values() for p in group))
+    report = {"images": len(images), "prompts": len(prompts), "configs": []}
+
+    try:
+        segmenter.set_input_resolution(0, original[1])
+        _run(segmenter, images[:1], prompts)  # warmup
+        baseline, baseline_seconds = _run(segmenter, images, prompts)
+        report["baseline_seconds"] = round(baseline_seconds, 4)
+
+        for side in sides:
+            for mode in upsample_modes:
+                segmenter.set_input_resolution(side, mode)
+                results, seconds = _run(segmenter, images, prompts)
+
+                per_category = {}
+                all_ious = []
+                for name, group in categories.items():
+                    ious = [
+                        mask_iou(base[prompt][0], current[prompt][0])
+                        for base, current in zip(baseline, results)
+                        for prompt in group
+                    ]
+                    all_ious.extend(ious)
+                    per_category[name] = {
+                        "mean_iou": round(float(np.mean(ious)), 4) if ious else 1.0,
+                        "min_iou": round(float(np.min(ious)), 4) if ious else 1.0,
+                    }
+
+                report["configs"].append({
+                    "max_input_side": side,
+                    "mask_upsample": mode,
+                    "seconds": round(seconds, 4),
+                    "speedup": round(baseline_seconds / seconds, 3) if seconds > 0 else None,
+                    "mean_iou": round(float(np.mean(all_ious)), 4) if all_ious else 1.0,
+                    "categories": per_category,
+                })
+    finally:
+        segmenter.set_input_resolution(*original)
+
+    return report
+
+
+def format_report(report: dict) -> str:
+    """Render a compare_resolutions() report as a text table."""
+    categories = list(report["configs"][0]["categories"]) if report["configs"] else []
+    header = f"{'side':>6} {'upsample':<9} {'sec':>8} {'speedup':>8} {'mean IoU':>9}"
+    header += "".join(f" {name[:10]:>10}" for name in categories)
+    lines = [
+        f"{report['images']} images x {report['prompts']} prompts, "
+        f"native resolution {report['baseline_seconds']:.3f}s",
+        "encoder cost is the same for every side (1008x1008); speedup = mask decode/transfer only",
+        header,
+    ]
+    for config in report["configs"]:
+        line = (
+            f"{config['max_input_side']:>6} {config['mask_upsample']:<9} {config['seconds']:>8.3f} "
+            f"{config['speedup']:>7.2f}x {config['mean_iou']:>9.4f}"
+        )
+        line += "".join(f" {config['categories'][name]['mean_iou']:>10.4f}" for name in categories)
+        lines.append(line)
+    return "\n".join(lines)
@@ -0,0 +1,325 @@
+"""
+Scheduler — 동시 호출자의 segment 요청을 micro-batch로 묶는 GPU 스케줄러
+
+SAM3Segmenter는 thread-safe 하지 않다. SegmentScheduler는 segmenter 앞에서 여러
+스레드/코루틴의 요청을 큐로 받고, 전용 worker 스레드 하나만 segmenter를 호출한다.
+
+- submit(image, prompts, merge, probe_first, confidence_threshold) → concurrent.futures.Future
+  (segment_concepts 결과)
+- submit_async(...) → asyncio Future
+- segment_concepts(...) / segment(...) → 블로킹 호출 (segmenter와 같은 인터페이스라
+  pipeline / handler에서 segmenter 대신 그대로 쓸 수 있다)
+- 첫 요청 도착 후 max_wait_ms가 지나거나 max_batch_size개가 모이면 batch를 닫고,
+  같은 (prompts, merge, confidence_threshold) 요청끼리 segment_batch 한 번으로 처리
+  (probe_first 요청은 이미지별 segment_concepts로 처리)
+- metrics: scheduler_batches, scheduler_requests, scheduler_batch_fill_ratio,
+  scheduler_queue_delay_ms (engine.metrics)
+
+SEGMENT_SCHEDULER=1 이면 pipeline과 handler가 get_scheduler()를 거쳐 segment 한다.
+"""
+
+import asyncio
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Collection, Optional
+
+from PIL import Image
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+# Route pipeline / handler segmentation through the process-wide scheduler
+SCHEDULER_ENABLED = os.getenv("SEGMENT_SCHEDULER", "0") == "1"
+
+# Max requests (images) per micro-batch
+DEFAULT_MAX_BATCH_SIZE = int(os.getenv("SCHEDULER_MAX_BATCH", "8"))
+
+# Max time a batch stays open after its first request arrives
+DEFAULT_MAX_WAIT_MS = float(os.getenv("SCHEDULER_MAX_WAIT_MS", "10"))
+
+
+@dataclass
+class _Request:
+    image: Image.Image
+    prompts: tuple[str, ...]
+    merge: frozenset
+    probe_first: bool = False
+    confidence_threshold: Optional[float] = None
+    future: Future = field(default_factory=Future)
+    enqueued: float = field(default_factory=time.perf_counter)
+
+
+class SegmentScheduler:
+    def __init__(
+        self,
+        segmenter,
+        max_batch_size: Optional[int] = None,
+        max_wait_ms: Optional[float] = None,
+    ):
+        """
+        Start the scheduler worker thread.
+
+        Args:
+            segmenter: SAM3Segmenter (only ever called from the worker thread)
+            max_batch_size: Max requests per micro-batch
+                            Default: 8 or SCHEDULER_MAX_BATCH env
+            max_wait_ms: Max wait after the first request of a batch
+                         Default: 10 or SCHEDULER_MAX_WAIT_MS env (0 = no waiting)
+
+        Raises:
+            ValueError: If max_batch_size < 1 or max_wait_ms < 0
+        """
+        self.segmenter = segmenter
+        self.max_batch_size = max_batch_size or DEFAULT_MAX_BATCH_SIZE
+        self.max_wait_ms = DEFAULT_MAX_WAIT_MS if max_wait_ms is None else max_wait_ms
+        if self.max_batch_size < 1:
+            raise ValueError(f"max_batch_size must be >= 1, got {self.max_batch_size}")
+        if self.max_wait_ms < 0:
+            raise ValueError(f"max_wait_ms must be >= 0, got {self.max_wait_ms}")
+
+        self._queue: queue.Queue = queue.Queue()
+        self._closed = False
+        self._lock = threading.Lock()
+        self._batches = 0
+        self._requests = 0
+        self._fill_total = 0.0
+        self._delay_total = 0.0
+        self._delay_max = 0.0
+        self._thread = threading.Thread(target=self._run, name="segment-scheduler", daemon=True)
+        self._thread.start()
+
+    # ---- segmenter interface ----
+
+    @property
+    def confidence_threshold(self) -> float:
+        return self.segmenter.confidence_threshold
+
+    @property
+    def model_version(self) -> str:
+        return self.segmenter.model_version
+
+    def submit(
+        self,
+        image: Image.Image,
+        prompts: list[str],
+        merge: Collection[str] = (),
+        probe_first: bool = False,
+        confidence_threshold: Optional[float] = None,
+    ) -> Future:
+        """
+        Queue one image for segmentation.
+
+        Requests with different confidence thresholds share the model but are
+        never batched together.
+
+        Returns:
+            Future resolving to segment_concepts(image, prompts, merge, probe_first,
+            confidence_threshold) output
+
+        Raises:
+            RuntimeError: If the scheduler is closed
+        """
+        request = _Request(
+            image,
+            tuple(dict.fromkeys(prompts)),
+            frozenset(merge),
+            probe_first,
+            confidence_threshold,
+        )
+        # Checked and queued under the lock so nothing lands behind close()'s sentinel
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("SegmentScheduler is closed")
+            self._queue.put(request)
+        return request.future
+
+    def submit_async(
+        self,
+        image: Image.Image,
+        prompts: list[str],
+        merge: Collection[str] = (),
+        probe_first: bool = False,
+        confidence_threshold: Optional[float] = None,
+    ) -> asyncio.Future:
+        """submit() for coroutines (awaitable on the running event loop)."""
+        return asyncio.wrap_future(
+            self.submit(image, prompts, merge, probe_first, confidence_threshold)
+        )
+
+    def segment_concepts(
+        self,
+        image: Image.Image,
+        prompts: list[str],
+        merge: Collection[str] = (),
+        probe_first: bool = False,
+        confidence_threshold: Optional[float] = None,
+    ) -> dict:
+        """Blocking submit(); same signature and result as SAM3Segmenter.segment_concepts."""
+        return self.submit(image, prompts, merge, probe_first, confidence_threshold).result()
+
+    def segment(
+        self,
+        image: Image.Image,
+        concept_text: str,
+        merge: bool = False,
+        confidence_threshold: Optional[float] = None,
+    ) -> tuple:
+        """Blocking single-prompt call; same result as SAM3Segmenter.segment."""
+        results = self.segment_concepts(
+            image,
+            [concept_text],
+            [concept_text] if merge else (),
+            confidence_threshold=confidence_threshold,
+        )
+        return results[concept_text]
+
+    # ---- lifecycle / stats ----
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        """Stop accepting requests, finish queued ones and stop the worker thread."""
+        with self._lock:
+            if not self._closed:
+                self._closed = True
+                self._queue.put(None)
+        self._thread.join(timeout)
+
+    def stats(self) -> dict:
+        """Batches, requests, mean batch fill ratio and queueing delay (ms)."""
+        with self._lock:
+            batches = self._batches
+            return {
+                "batches": batches,
+                "requests": self._requests,
+                "max_batch_size": self.max_batch_size,
+                "avg_fill_ratio": round(self._fill_total / batches, 4) if batches else 0.0,
+                "avg_queue_delay_ms": (
+                    round(self._delay_total / self._requests, 3) if self._requests else 0.0
+                ),
+                "max_queue_delay_ms": round(self._delay_max, 3),
+            }
+
+    # ---- worker thread ----
+
+    def _run(self) -> None:
+        while True:
+            batch, stop = self._collect()
+            if batch:
+                self._process(batch)
+            if stop:
+                return
+
+    def _collect(self) -> tuple[list[_Request], bool]:
+        """Block for a first request, then gather more until full or its deadline passes."""
+        first = self._queue.get()
+        if first is None:
+            return [], True
+        batch = [first]
+        deadline = first.enqueued + self.max_wait_ms / 1000
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                if remaining > 0:
+                    request = self._queue.get(timeout=remaining)
+                else:
+                    request = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if request is None:
+                return batch, True
+            batch.append(request)
+        return batch, False
+
+    def _process(self, batch: list[_Request]) -> None:
+        """
+        Run one micro-batch: one segmenter call per distinct (prompts, merge, threshold) group.
+
+        probe_first groups are segmented image by image (segment_batch does not probe).
+        """
+        started = time.perf_counter()
+        self._record(batch, started)
+
+        groups: dict[tuple, list[_Request]] = {}
+        for request in batch:
+            key = (
+                request.prompts, request.merge, request.probe_first, request.confidence_threshold
+            )
+            groups.setdefault(key, []).append(request)
+
+        for (prompts, merge, probe_first, threshold), requests in groups.items():
+            active = [r for r in requests if r.future.set_running_or_notify_cancel()]
+            if not active:
+                continue
+            options = {"merge": sorted(merge)}
+            if threshold is not None:
+                options["confidence_threshold"] = threshold
+            try:
+                if probe_first:
+                    results = [
+                        self.segmenter.segment_concepts(
+                            r.image, list(prompts), probe_first=True, **options
+                        )
+                        for r in active
+                    ]
+                elif len(active) == 1:
+                    results = [
+                        self.segmenter.segment_concepts(active[0].image, list(prompts), **options)
+                    ]
+                else:
+                    results = self.segmenter.segment_batch(
+                        [r.image for r in active], list(prompts), **options
+                    )
+            except Exception as e:
+                logger.warning(f"Scheduled segmentation of {len(active)} images failed: {str(e)}")
+                for request in active:
+                    request.future.set_exception(e)
+                continue
+            for request, result in zip(active, results):
+                request.future.set_result(result)
+
+    def _record(self, batch: list[_Request], started: float) -> None:
+        delays = [(started - r.enqueued) * 1000 for r in batch]
+        with self._lock:
+            self._batches += 1
+            self._requests += len(batch)
+            self._fill_total += len(batch) / self.max_batch_size
+            self._delay_total += sum(delays)
+            self._delay_max = max(self._delay_max, *delays)
+            fill = self._fill_total / self._batches
+            delay = self._delay_total / self._requests
+        metrics.inc("scheduler_batches")
+        metrics.inc("scheduler_requests", len(batch))
+        metrics.set_gauge("scheduler_batch_fill_ratio", round(fill, 4))
+        metrics.set_gauge("scheduler_queue_delay_ms", round(delay, 3))
+
+
+# Process-wide scheduler (one per shared segmenter)
+_scheduler: Optional[SegmentScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler(segmenter=None) -> SegmentScheduler:
+    """
+    Return the process-wide scheduler in front of the shared segmenter.
+
+    If the registry rebuilt the segmenter (checkpoint changed), the old scheduler
+    is drained and replaced.
+    """
+    global _scheduler
+    if segmenter is None:
+        from .registry import get_segmenter
+        segmenter = get_segmenter()
+
+    with _scheduler_lock:
+        if _scheduler is not None and _scheduler.segmenter is segmenter:
+            return _scheduler
+        previous = _scheduler
+        scheduler = _scheduler = SegmentScheduler(segmenter)
+    if previous is not None:
+        previous.close()
+    return scheduler
@@ -4,19 +4,199 @@ Segmenter — SAM3 Wrapper
 SAM3 (Segment Anything Model 3) wrapper for text-based image segmentation.
 - load_model() → SAM3 model
 - segment(image, concept_text) → masks + metadata
+- segment_concepts(image, prompts) → 이미지 1회 인코딩 + prompt 배치 디코딩
+- segment_batch(images, prompts) → 여러 이미지를 한 encoder 배치로 처리
+- probe(image, prompts) → mask 없이 prompt별 score/box만
+  (segmentation head 생략, 빠른 concept 존재 확인)
+- probe_first: 먼저 probe 후 threshold를 넘은 concept만 mask까지 decode
+- confidence_threshold: 호출별 override (decode 후 raw score에 적용, 모델/processor 재생성 없음)
+- text embedding LRU 캐시 (부팅 시 preset prompt로 warmup)
+- model_version → checkpoint/precision fingerprint (mask cache key)
+- precision: fp32 / bf16 / fp16 autocast / int8 (linear layer dynamic quantization, CPU)
+  (MODEL_PRECISION env)
+- from_model(model, processor) → 체크포인트 없이 stand-in 모델로 생성 (CPU 도구용)
+- execution_mode: eager / inference (호출 전체 inference_mode) / compiled (+ torch.compile,
+  compiled artifact는 COMPILE_CACHE_DIR에 저장되어 컨테이너 재시작 후 재사용)
+- max_input_side: 큰 사진을 긴 변 기준으로 줄여 processor에 전달, mask는 원본 해상도로 upsample.
+  Sam3Processor가 입력을 항상 1008 정사각형으로 resize하므로 encoder 비용은 그대로이고,
+  절약은 device mask 보간 + host 전송 크기뿐 → 기본 mask_upsample은 nearest
+  (축소 해상도 mask 확대). bilinear(logit을 원본 크기로 보간)는 품질 비교용
+- tiling: 픽셀 수가 임계값을 넘는 이미지는 겹치는 타일로 segment 후 stitch (engine.tiling)
+- timings_ms: phase별 소요 시간 (metadata + segmenter_<phase>_ms histogram,
+  SEGMENTER_PROFILE=1 이면 device sync)
+- CUDA OOM → batch를 절반으로 나눠 재시도, 성공한 크기를 기억 (oom_splits counter)
+- mask_format: dense (원본 크기 array) / compact (device에서 bbox crop + bit-pack 후 전송)
+- merge: prompt별 instance union을 device에서 수행 (preset multi_instance=False, protect concept)
+- checkpoint: sam3.pt 또는 .safetensors (mmap 로딩, scripts/convert_model.py로 변환)
 - SAM3: 848M params, 3.4GB, ~30ms/image (H200)
 - 최소: RTX 4090 (24GB), CUDA 12.6+, Python 3.12+, PyTorch 2.7+
 """
 
+import contextlib
+import functools
+import logging
 import os
-import torch
+import time
+from collections import OrderedDict
+from types import SimpleNamespace
+from typing import Collection, Optional
+
 import numpy as np
+import torch
 from PIL import Image
-from typing import Optional
+
+from . import metrics
+from .checkpoint import is_safetensors, load_safetensors_into
+from .compact_mask import CompactMask, union_masks
+from .tiling import TileConfig, stitch_instances, tile_boxes
 
 # SAM3 imports (from facebook/sam3 repo, not transformers)
-from sam3 import build_sam3_image_model
-from sam3.model.sam3_image_processor import Sam3Processor
+try:
+    from sam3 import build_sam3_image_model
+    from sam3.model.data_misc import FindStage
+    from sam3.model.sam3_image_processor import Sam3Processor
+except ImportError:
+    # CPU tooling (precision harness with a stand-in model) runs without sam3;
+    # SAM3Segmenter() itself still requires it.
+    build_sam3_image_model = None
+    Sam3Processor = None
+    FindStage = SimpleNamespace  # same keyword fields, enough for stand-in models
+
+# Supported inference precision modes (fp32 = no autocast, int8 = linear layers
+# dynamically quantized to int8, CPU only, no autocast)
+SUPPORTED_PRECISIONS = ("fp32", "bf16", "fp16", "int8")
+
+# Default precision per deployment (MODEL_PRECISION env, also the registry key)
+DEFAULT_PRECISION = os.getenv("MODEL_PRECISION", "fp32")
+
+# Execution modes: eager (autograd-free model calls only), inference (whole call under
+# torch.inference_mode), compiled (inference + torch.compile of the model entry points)
+SUPPORTED_EXECUTION_MODES = ("eager", "inference", "compiled")
+DEFAULT_EXECUTION_MODE = os.getenv("SEGMENTER_EXECUTION_MODE", "eager")
+
+# torch.compile mode for execution_mode="compiled" (default / reduce-overhead / max-autotune)
+TORCH_COMPILE_MODE = os.getenv("TORCH_COMPILE_MODE", "default")
+
+# Inductor artifact cache, on the model volume so it survives container restarts
+COMPILE_CACHE_DIR = os.getenv(
+    "COMPILE_CACHE_DIR", os.path.join(os.getenv("MODEL_CACHE_DIR", "/models"), "compile_cache")
+)
+
+# Model entry points compiled in "compiled" mode (missing ones are skipped)
+_COMPILE_TARGETS = ("backbone.forward_image", "backbone.forward_text", "forward_grounding")
+
+# Max text prompts decoded together in one forward pass (bounds decoder memory)
+DEFAULT_MAX_PROMPTS_PER_BATCH = int(os.getenv("MAX_PROMPTS_PER_BATCH", "8"))
+
+# Cross-image encoder batching (segment_batch)
+MAX_IMAGES_PER_BATCH = int(os.getenv("MAX_IMAGES_PER_BATCH", "8"))
+IMAGE_BATCH_MEMORY_MB = int(os.getenv("IMAGE_BATCH_MEMORY_MB", "1536"))
+
+# Text-embedding LRU cache size (entries, one per distinct prompt; 0 = disabled)
+DEFAULT_TEXT_CACHE_SIZE = int(os.getenv("TEXT_CACHE_SIZE", "256"))
+
+# Reduced mask resolution: images whose long side exceeds this are downscaled
+# before the processor (0 = native size); masks come back full size. The encoder
+# always runs at 1008x1008, so this only shrinks mask decoding and transfer.
+DEFAULT_MAX_INPUT_SIDE = int(os.getenv("MAX_INPUT_SIDE", "0"))
+
+# How masks are brought back to full resolution after a downscaled encode:
+# "nearest"  = threshold at the reduced size, then nearest-neighbour upsample on
+#              the host (the only mode that saves device and transfer time)
+# "bilinear" = interpolate logits straight to full size on the device (same cost
+#              as native resolution plus an extra resample; for quality comparison)
+SUPPORTED_MASK_UPSAMPLE = ("nearest", "bilinear")
+DEFAULT_MASK_UPSAMPLE = os.getenv("MASK_UPSAMPLE", "nearest")
+
+# Mask output format: "dense" = full-size bool arrays, "compact" = CompactMask
+# (cropped to the bounding box and bit-packed on the device before the host copy)
+SUPPORTED_MASK_FORMATS = ("dense", "compact")
+DEFAULT_MASK_FORMAT = os.getenv("MASK_FORMAT", "dense")
+
+# Union all instances of a prompt into one mask on the device (1 = on)
+DEFAULT_MERGE_INSTANCES = os.getenv("MERGE_INSTANCES", "0") == "1"
+
+# Synchronize the device at phase boundaries so timings_ms attributes GPU time
+# to the phase that launched it (1 = on; adds a sync per phase)
+DEFAULT_PROFILE = os.getenv("SEGMENTER_PROFILE", "0") == "1"
+
+logger = logging.getLogger(__name__)
+
+# Batch dimension of each backbone.forward_text output
+# (SAM3 text features are sequence-first: [seq, batch, dim]; mask is [batch, seq])
+_TEXT_BATCH_DIMS = {
+    "language_features": 1,
+    "language_mask": 0,
+    "language_embeds": 1,
+}
+
+
+def _model_version(checkpoint_path: str, precision: str) -> str:
+    """
+    Fingerprint of the loaded weights + inference settings.
+
+    Used by caches of segmentation results so a replaced checkpoint or a different
+    precision never serves stale masks.
+    """
+    try:
+        stat = os.stat(checkpoint_path)
+        weights = f"{os.path.basename(checkpoint_path)}:{stat.st_size}:{stat.st_mtime_ns}"
+    except OSError:
+        weights = os.path.basename(checkpoint_path)
+    return f"{weights}:{precision}"
+
+
+class TextEmbeddingCache:
+    """
+    Bounded LRU cache of per-prompt text encoder outputs.
+
+    Preset prompts are a small closed set, so after warmup nearly every lookup is a
+    hit; free-form prompts evict the least recently used entries instead of growing
+    the cache.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, dict] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, prompt: str) -> bool:
+        return prompt in self._entries
+
+    def get(self, prompt: str) -> Optional[dict]:
+        """Return cached outputs for prompt (counting hit/miss), or None."""
+        entry = self._entries.get(prompt)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(prompt)
+        self.hits += 1
+        return entry
+
+    def put(self, prompt: str, outputs: dict) -> None:
+        """Store outputs for prompt, evicting least recently used entries over max_size."""
+        if self.max_size <= 0:
+            return
+        self._entries[prompt] = outputs
+        self._entries.move_to_end(prompt)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        """Cache counters for logging/metrics."""
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
 
 
 class SAM3Segmenter:
@@ -25,18 +205,57 @@ class SAM3Segmenter:
         checkpoint_path: Optional[str] = None,
         bpe_path: Optional[str] = None,
         confidence_threshold: float = 0.5,
+        precision: Optional[str] = None,
+        max_prompts_per_batch: Optional[int] = None,
+        max_images_per_batch: Optional[int] = None,
+        text_cache_size: Optional[int] = None,
+        execution_mode: Optional[str] = None,
+        max_input_side: Optional[int] = None,
+        mask_upsample: Optional[str] = None,
+        tiling: Optional[TileConfig] = None,
+        mask_format: Optional[str] = None,
+        merge_instances: Optional[bool] = None,
+        profile: Optional[bool] = None,
     ):
         """
         Initialize SAM3 segmenter.
 
         Args:
-            checkpoint_path: Path to SAM3 checkpoint file (sam3.pt)
+            checkpoint_path: Path to SAM3 checkpoint file (sam3.pt, or a .safetensors
+                            file from scripts/convert_model.py, loaded memory-mapped)
                             Default: /models/sam3.pt or MODEL_CHECKPOINT env
             bpe_path: Path to BPE vocab file (bpe_simple_vocab_16e6.txt.gz)
                      Default: /app/sam3/sam3/assets/bpe_simple_vocab_16e6.txt.gz or BPE_PATH env
             confidence_threshold: Minimum confidence score for masks (default: 0.5)
+            precision: Inference precision mode: "fp32", "bf16" / "fp16" (autocast) or
+                       "int8" (dynamic int8 linear layers, CPU device only)
+                       Default: fp32 or MODEL_PRECISION env
+            max_prompts_per_batch: Max prompts stacked into one decoder batch
+                                   Default: 8 or MAX_PROMPTS_PER_BATCH env (1 = sequential)
+            max_images_per_batch: Images encoded together by segment_batch()
+                                  Default: None (auto from free device memory)
+            text_cache_size: Max prompts kept in the text-embedding LRU cache
+                             Default: 256 or TEXT_CACHE_SIZE env (0 = disabled)
+            execution_mode: "eager", "inference" or "compiled"
+                            Default: eager or SEGMENTER_EXECUTION_MODE env
+            max_input_side: Decode and transfer masks of images with a longer side at
+                            this size (encoder cost is unchanged: SAM3 always encodes
+                            at 1008x1008)
+                            Default: 0 = native size, or MAX_INPUT_SIDE env
+            mask_upsample: "nearest" or "bilinear" (see SUPPORTED_MASK_UPSAMPLE)
+                           Default: nearest or MASK_UPSAMPLE env
+            tiling: Tiled segmentation for very large images (engine.tiling.TileConfig)
+                    Default: TileConfig.from_env() (TILE_PIXEL_THRESHOLD=0 = off)
+            mask_format: "dense" (np.ndarray) or "compact" (engine.compact_mask.CompactMask)
+                         Default: dense or MASK_FORMAT env
+            merge_instances: Return one union mask per prompt instead of instances
+                             Default: False or MERGE_INSTANCES env
+            profile: Synchronize the device between timed phases (exact timings_ms)
+                     Default: False or SEGMENTER_PROFILE env
 
         Raises:
+            ValueError: If precision, execution_mode, mask_upsample, mask_format or
+                        max_prompts_per_batch is not supported, or int8 on a CUDA device
             FileNotFoundError: If checkpoint or bpe file not found
             RuntimeError: If model loading fails
         """
@@ -47,7 +266,11 @@ class SAM3Segmenter:
         self.bpe_path = bpe_path or os.getenv(
             "BPE_PATH", "/app/sam3/sam3/assets/bpe_simple_vocab_16e6.txt.gz"
         )
-        self.confidence_threshold = confidence_threshold
+        self._configure(
+            confidence_threshold, precision, max_prompts_per_batch, max_images_per_batch,
+            text_cache_size, execution_mode, max_input_side, mask_upsample, tiling, mask_format,
+            merge_instances, profile,
+        )
 
         # Validate files exist
         if not os.path.exists(self.checkpoint_path):
@@ -61,17 +284,40 @@ class SAM3Segmenter:
                 f"Set BPE_PATH env or ensure SAM3 repo is cloned"
             )
 
+        if build_sam3_image_model is None:
+            raise RuntimeError("Failed to load SAM3 model: sam3 package is not installed")
+
         # Enable TF32 for faster computation on Ampere+ GPUs
         torch.backends.cuda.matmul.allow_tf32 = True
         torch.backends.cudnn.allow_tf32 = True
 
         # Load model
+        start = time.perf_counter()
         try:
             print(f"Loading SAM3 model from {self.checkpoint_path}...")
-            self.model = build_sam3_image_model(
-                bpe_path=self.bpe_path,
-                checkpoint_path=self.checkpoint_path,
-            )
+            if is_safetensors(self.checkpoint_path):
+                # Build without weights, then copy tensors from the mmapped file
+                self.model = build_sam3_image_model(
+                    bpe_path=self.bpe_path,
+                    checkpoint_path=None,
+                    load_from_HF=False,
+                )
+                loaded = load_safetensors_into(self.model, self.checkpoint_path)
+                if not loaded["loaded"]:
+                    raise ValueError(
+                        f"no tensor in {self.checkpoint_path} matches the SAM3 image model"
+                    )
+                if loaded["missing"]:
+                    logger.error(
+                        f"{len(loaded['missing'])} SAM3 weights missing from "
+                        f"{self.checkpoint_path} (left randomly initialized), "
+                        f"e.g. {', '.join(loaded['missing'][:5])}"
+                    )
+            else:
+                self.model = build_sam3_image_model(
+                    bpe_path=self.bpe_path,
+                    checkpoint_path=self.checkpoint_path,
+                )
             print("SAM3 model loaded successfully!")
 
             # Create processor
@@ -82,42 +328,996 @@ class SAM3Segmenter:
 
         except Exception as e:
             raise RuntimeError(f"Failed to load SAM3 model: {str(e)}")
+        self.load_seconds = time.perf_counter() - start
+
+        self._apply_quantization(self.precision == "int8")
+        self._apply_execution_mode()
+
+    @classmethod
+    def from_model(
+        cls,
+        model,
+        processor,
+        checkpoint_path: str = "in-memory",
+        confidence_threshold: float = 0.5,
+        precision: Optional[str] = None,
+        max_prompts_per_batch: Optional[int] = None,
+        max_images_per_batch: Optional[int] = None,
+        text_cache_size: Optional[int] = None,
+        execution_mode: Optional[str] = None,
+        max_input_side: Optional[int] = None,
+        mask_upsample: Optional[str] = None,
+        tiling: Optional[TileConfig] = None,
+        mask_format: Optional[str] = None,
+        merge_instances: Optional[bool] = None,
+        profile: Optional[bool] = None,
+    ) -> "SAM3Segmenter":
+        """
+        Wrap an already built model + processor (no checkpoint loading).
+
+        Used by tooling that runs a small stand-in model with the SAM3 interface
+        (backbone.forward_text, forward_grounding, processor.set_image), e.g. the
+        precision harness on CPU.
+
+        Args:
+            model: Model exposing the SAM3 image model interface
+            processor: Processor exposing set_image / set_image_batch / device
+            checkpoint_path: Name used for model_version (default: "in-memory")
+            Other args: Same as __init__
+
+        Returns:
+            SAM3Segmenter using the given model
+        """
+        segmenter = cls.__new__(cls)
+        segmenter.checkpoint_path = checkpoint_path
+        segmenter.bpe_path = None
+        segmenter._configure(
+            confidence_threshold, precision, max_prompts_per_batch, max_images_per_batch,
+            text_cache_size, execution_mode, max_input_side, mask_upsample, tiling, mask_format,
+            merge_instances, profile,
+        )
+        segmenter.model = model
+        segmenter.processor = processor
+        segmenter.load_seconds = 0.0
+        segmenter._apply_quantization(segmenter.precision == "int8")
+        segmenter._apply_execution_mode()
+        return segmenter
+
+    def _configure(
+        self,
+        confidence_threshold: float,
+        precision: Optional[str],
+        max_prompts_per_batch: Optional[int],
+        max_images_per_batch: Optional[int],
+        text_cache_size: Optional[int],
+        execution_mode: Optional[str] = None,
+        max_input_side: Optional[int] = None,
+        mask_upsample: Optional[str] = None,
+        tiling: Optional[TileConfig] = None,
+        mask_format: Optional[str] = None,
+        merge_instances: Optional[bool] = None,
+        profile: Optional[bool] = None,
+    ) -> None:
+        """Validate and store inference settings (shared by __init__ and from_model)."""
+        self.tiling = tiling or TileConfig.from_env()
+        self.mask_format = mask_format or DEFAULT_MASK_FORMAT
+        if self.mask_format not in SUPPORTED_MASK_FORMATS:
+            raise ValueError(
+                f"Unsupported mask_format: {self.mask_format}. "
+                f"Supported: {', '.join(SUPPORTED_MASK_FORMATS)}"
+            )
+        if merge_instances is None:
+            merge_instances = DEFAULT_MERGE_INSTANCES
+        self.merge_instances = merge_instances
+        self.profile = DEFAULT_PROFILE if profile is None else profile
+        self.execution_mode = execution_mode or DEFAULT_EXECUTION_MODE
+        if self.execution_mode not in SUPPORTED_EXECUTION_MODES:
+            raise ValueError(
+                f"Unsupported execution_mode: {self.execution_mode}. "
+                f"Supported: {', '.join(SUPPORTED_EXECUTION_MODES)}"
+            )
+        self.compiled_targets: list[str] = []
+        self.confidence_threshold = confidence_threshold
+        self.max_prompts_per_batch = max_prompts_per_batch or DEFAULT_MAX_PROMPTS_PER_BATCH
+        if self.max_prompts_per_batch < 1:
+            raise ValueError(
+                f"max_prompts_per_batch must be >= 1, got {self.max_prompts_per_batch}"
+            )
+        self.max_images_per_batch = max_images_per_batch
+        # Largest batch sizes known to fit after a CUDA OOM split (None = no OOM yet)
+        self.safe_image_batch: Optional[int] = None
+        self.safe_prompt_batch: Optional[int] = None
+        self.oom_splits = 0
+        self.text_cache = TextEmbeddingCache(
+            DEFAULT_TEXT_CACHE_SIZE if text_cache_size is None else text_cache_size
+        )
+        self.precision = None
+        # Unquantized model kept while precision is int8 (to switch back)
+        self._fp32_model = None
+        self.set_input_resolution(
+            DEFAULT_MAX_INPUT_SIDE if max_input_side is None else max_input_side,
+            mask_upsample or DEFAULT_MASK_UPSAMPLE,
+        )
+        self.set_precision(precision or DEFAULT_PRECISION)
+
+    def set_precision(self, precision: str) -> None:
+        """
+        Switch inference precision mode.
+
+        Cached text embeddings were computed in the previous mode, so the text cache
+        is cleared. model_version changes with the precision. Switching to or from
+        int8 swaps the quantized model in or out.
+
+        Raises:
+            ValueError: If precision is not supported, or int8 on a CUDA device
+        """
+        if precision not in SUPPORTED_PRECISIONS:
+            raise ValueError(
+                f"Unsupported precision: {precision}. Supported: {', '.join(SUPPORTED_PRECISIONS)}"
+            )
+        if hasattr(self, "model"):
+            self._apply_quantization(precision == "int8")
+        self.precision = precision
+        self._update_model_version()
+        self.text_cache.clear()
+
+    def set_input_resolution(self, max_input_side: int, mask_upsample: str = "nearest") -> None:
+        """
+        Configure the reduced mask resolution.
+
+        Args:
+            max_input_side: Long-side limit for decoded masks (0 = native size)
+            mask_upsample: "nearest" or "bilinear"
+
+        Raises:
+            ValueError: If max_input_side is negative or mask_upsample is not supported
+        """
+        if max_input_side < 0:
+            raise ValueError(f"max_input_side must be >= 0, got {max_input_side}")
+        if mask_upsample not in SUPPORTED_MASK_UPSAMPLE:
+            raise ValueError(
+                f"Unsupported mask_upsample: {mask_upsample}. "
+                f"Supported: {', '.join(SUPPORTED_MASK_UPSAMPLE)}"
+            )
+        self.max_input_side = max_input_side
+        self.mask_upsample = mask_upsample
+        self._update_model_version()
+
+    def _update_model_version(self) -> None:
+        """model_version = checkpoint/precision fingerprint + resolution/tiling/format/merge."""
+        if self.precision is None:
+            return
+        self.model_version = _model_version(self.checkpoint_path, self.precision)
+        if self.max_input_side:
+            self.model_version += f":{self.max_input_side}{self.mask_upsample}"
+        if self.tiling.pixel_threshold:
+            self.model_version += f":tiled{self.tiling.tile_size}-{self.tiling.overlap}"
+        # Cached / bundled results keep the mask type they were produced with
+        if self.mask_format == "compact":
+            self.model_version += ":compact"
+        if self.merge_instances:
+            self.model_version += ":merged"
+
+    def _prepare_image(self, image: Image.Image) -> Image.Image:
+        """
+        Downscale image so its long side fits max_input_side (aspect ratio kept).
+
+        This does not make encoding cheaper: Sam3Processor resizes every input to
+        the fixed model resolution anyway, so this is a second resample. It only
+        shrinks the mask size used by "nearest" upsampling (device interpolation
+        and device-to-host transfer).
+        """
+        if not self.max_input_side or max(image.size) <= self.max_input_side:
+            return image
+        scale = self.max_input_side / max(image.size)
+        size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+        return image.resize(size, Image.BILINEAR)
+
+    def _full_size_state(self, image_state: dict, images: list[Image.Image]) -> dict:
+        """
+        Point the decoder at the original image sizes (bilinear upsampling).
 
-    def segment(self, image: Image.Image, concept_text: str) -> tuple[list[np.ndarray], dict]:
+        _postprocess interpolates mask logits to the state's original size, so
+        with "bilinear" masks are produced at full resolution directly.
+        """
+        if self.mask_upsample != "bilinear":
+            return image_state
+        state = dict(image_state)
+        if "original_heights" in state:
+            state["original_heights"] = [image.height for image in images]
+            state["original_widths"] = [image.width for image in images]
+        else:
+            state["original_height"] = images[0].height
+            state["original_width"] = images[0].width
+        return state
+
+    def _to_host(
+        self,
+        state: dict,
+        prompt: str,
+        image: Image.Image,
+        merge: bool,
+        threshold: float,
+        timer: Optional[metrics.PhaseTimer] = None,
+    ) -> tuple:
+        """Decoded prompt result → host (masks, metadata) at the image size ("transfer" phase)."""
+        with self._phase(timer, "transfer"):
+            result = self._extract_results(state, prompt, image, threshold, merge)
+            return self._restore_size(result, image)
+
+    def _restore_size(self, result: tuple[list[np.ndarray], dict], image: Image.Image) -> tuple:
+        """Nearest-neighbour upsample masks decoded at a reduced size back to the image size."""
+        masks, metadata = result
+        height, width = image.height, image.width
+        if not masks or tuple(masks[0].shape[-2:]) == (height, width):
+            return result
+        if isinstance(masks[0], CompactMask):
+            return [
+                CompactMask.from_dense(upsample_mask(mask, (height, width))) for mask in masks
+            ], metadata
+        return [upsample_mask(mask, (height, width)) for mask in masks], metadata
+
+    def _apply_quantization(self, enabled: bool) -> None:
+        """
+        Swap int8 dynamic-quantized linear layers in (enabled) or out.
+
+        Models with their own int8 variant (set_quantized, e.g. the ONNX backend's
+        int8 graphs) switch themselves. Otherwise every nn.Linear of a copy of the
+        model is quantized with torch dynamic quantization (int8 weights, activations
+        quantized per call); the fp32 model is kept to switch back.
+
+        Raises:
+            ValueError: If enabled on a CUDA device (dynamic int8 kernels are CPU-only)
+        """
+        set_quantized = getattr(self.model, "set_quantized", None)
+        if set_quantized is not None:
+            set_quantized(enabled)
+            return
+        if enabled and self._fp32_model is None:
+            # Sam3Processor is built without a device, so ask the weights
+            device = _model_device(self.model)
+            if device.split(":")[0] != "cpu":
+                raise ValueError(f"int8 precision runs on CPU only, model is on {device}")
+            self._fp32_model = self.model
+            self.model = quantize_linear_int8(self.model)
+        elif not enabled and self._fp32_model is not None:
+            self.model, self._fp32_model = self._fp32_model, None
+        else:
+            return
+        # Sam3Processor runs the image encoder through its own model reference
+        self.processor.model = self.model
+
+    def _apply_execution_mode(self) -> None:
+        """
+        Compile the model entry points for execution_mode="compiled".
+
+        Shapes are treated as static (dynamic=False): the image encoder always sees
+        the model resolution, and decoder batches are bounded by max_prompts_per_batch,
+        so only a handful of graphs are ever compiled. Compilation itself is lazy
+        (first call per shape); artifacts go to COMPILE_CACHE_DIR and are reused by
+        the next container on the same volume.
+        """
+        if self.execution_mode != "compiled":
+            return
+
+        enable_compile_cache()
+        for target in _COMPILE_TARGETS:
+            owner_path, _, name = target.rpartition(".")
+            path = owner_path.split(".") if owner_path else []
+            owner = functools.reduce(getattr, path, self.model)
+            fn = getattr(owner, name, None)
+            if fn is None:
+                logger.info(f"Skipping torch.compile of missing model.{target}")
+                continue
+            setattr(owner, name, torch.compile(fn, mode=TORCH_COMPILE_MODE, dynamic=False))
+            self.compiled_targets.append(target)
+        logger.info(f"torch.compile ({TORCH_COMPILE_MODE}): {', '.join(self.compiled_targets)}")
+
+    def _execution(self):
+        """Context wrapping a whole public call (inference_mode unless eager)."""
+        if self.execution_mode == "eager":
+            return contextlib.nullcontext()
+        return torch.inference_mode()
+
+    def _autocast(self):
+        """Autocast context for model forward passes (no-op for fp32 / int8)."""
+        if self.precision in ("fp32", "int8"):
+            return contextlib.nullcontext()
+        dtype = torch.bfloat16 if self.precision == "bf16" else torch.float16
+        device_type = str(self.processor.device).split(":")[0]
+        return torch.autocast(device_type=device_type, dtype=dtype)
+
+    def _new_timer(self) -> metrics.PhaseTimer:
+        """
+        Phase timer for one public call.
+
+        Every call gets its own timer, passed down to the phases it times, so
+        concurrent calls on a shared segmenter never record into each other.
+
+        Phases reported in metadata["timings_ms"] (+ "total") and the
+        segmenter_<phase>_ms histograms: preprocess (downscale), backbone (image
+        transform + encoder), text_encode, decode (grounding + postprocess),
+        transfer (device→host, mask packing / upsampling), stitch (tiled images).
+        """
+        sync = torch.cuda.synchronize if self.profile and torch.cuda.is_available() else None
+        return metrics.PhaseTimer(sync)
+
+    def _call_threshold(self, confidence_threshold: Optional[float]) -> float:
+        """
+        Threshold for one public call (None = the segmenter's confidence_threshold).
+
+        Raw scores are thresholded after decoding, so the threshold is passed down
+        as an argument and the model and processor are shared as-is.
+
+        Raises:
+            ValueError: If confidence_threshold is outside [0, 1]
+        """
+        if confidence_threshold is None:
+            return self.confidence_threshold
+        if not 0.0 <= confidence_threshold <= 1.0:
+            raise ValueError(f"confidence_threshold must be in [0, 1], got {confidence_threshold}")
+        return confidence_threshold
+
+    @staticmethod
+    def _phase(timer: Optional[metrics.PhaseTimer], name: str):
+        """Time a phase of the call owning timer (no-op without a timer)."""
+        if timer is None:
+            return contextlib.nullcontext()
+        return timer.phase(name)
+
+    @staticmethod
+    def _attach_timings(per_image: list[dict], timer: metrics.PhaseTimer) -> None:
+        """
+        Record the call's phase histograms and copy timings_ms into every metadata.
+
+        per_image holds prompt -> (masks, metadata) results, or prompt -> metadata
+        for probe().
+        """
+        timings = timer.observe("segmenter")
+        for results in per_image:
+            for result in results.values():
+                metadata = result[1] if isinstance(result, tuple) else result
+                metadata["timings_ms"] = dict(timings)
+
+    def segment(
+        self,
+        image: Image.Image,
+        concept_text: str,
+        merge: bool = False,
+        confidence_threshold: Optional[float] = None,
+    ) -> tuple[list[np.ndarray], dict]:
         """
         Segment image by concept text, return instance masks + metadata.
 
         Args:
             image: PIL Image to segment
             concept_text: Text description of concept to segment (e.g., "wall", "door", "window")
+            merge: Return one union mask instead of instance masks
+            confidence_threshold: Minimum score for this call only
+                                  Default: the segmenter's confidence_threshold
 
         Returns:
             tuple[list[np.ndarray], dict]:
                 - List of instance masks (each mask is H x W boolean array)
                 - Metadata dict with concept, instance_count, and inference info
 
+        Raises:
+            ValueError: If confidence_threshold is outside [0, 1]
+
         Example:
             >>> segmenter = SAM3Segmenter()
             >>> masks, metadata = segmenter.segment(image, "window")
             >>> print(metadata)
             {'concept': 'window', 'instance_count': 3, 'image_size': (1920, 1080)}
         """
-        # Set image
-        state = self.processor.set_image(image)
+        results = self.segment_concepts(
+            image,
+            [concept_text],
+            merge=[concept_text] if merge else (),
+            confidence_threshold=confidence_threshold,
+        )
+        return results[concept_text]
+
+    def segment_concepts(
+        self,
+        image: Image.Image,
+        prompts: list[str],
+        merge: Collection[str] = (),
+        probe_first: bool = False,
+        confidence_threshold: Optional[float] = None,
+    ) -> dict[str, tuple[list[np.ndarray], dict]]:
+        """
+        Segment image for multiple concepts, running the vision backbone only once.
+
+        The image state (backbone features) is computed once and the text prompts are
+        decoded against it in batches of max_prompts_per_batch, so N concepts cost
+        1 image encode + ceil(N / max_prompts_per_batch) decoder passes.
+
+        Args:
+            image: PIL Image to segment
+            prompts: List of concept texts (e.g., ["wall", "door", "window"]).
+                     Duplicates are segmented once.
+            merge: Prompts whose instances are unioned on the device into a single
+                   mask (e.g. single-instance preset concepts, protect concepts).
+                   All prompts are merged if the segmenter has merge_instances.
+            probe_first: Probe every prompt without masks first and fully decode only
+                         the prompts with a detection; the rest come back empty.
+                         Pays off when most prompts are absent. Ignored for tiled images.
+            confidence_threshold: Minimum score for this call only (see segment)
+
+        Returns:
+            dict mapping prompt -> (masks, metadata), in prompt order
+
+        Example:
+            >>> results = segmenter.segment_concepts(image, ["wall", "door"], merge=["wall"])
+            >>> (wall_mask,), wall_meta = results["wall"]
+        """
+        threshold = self._call_threshold(confidence_threshold)
+        timer = self._new_timer()
+        with self._execution():
+            if self.tiling.applies_to(*image.size):
+                results = self._segment_tiled(image, prompts, threshold, merge, timer)
+            else:
+                results = self._segment_image(image, prompts, threshold, merge, probe_first, timer)
+        self._attach_timings([results], timer)
+        return results
+
+    def _segment_image(
+        self,
+        image: Image.Image,
+        prompts: list[str],
+        threshold: float,
+        merge: Collection[str] = (),
+        probe_first: bool = False,
+        timer: Optional[metrics.PhaseTimer] = None,
+    ) -> dict[str, tuple[list[np.ndarray], dict]]:
+        """Encode one image (no tiling) and decode every prompt against it."""
+        # Encode image once (downscaled if larger than max_input_side)
+        encoded, image_state = self._encode_image(image, timer)
+        if encoded is not image:
+            image_state = self._full_size_state(image_state, [image])
+
+        # Decode all prompts against the cached image state
+        unique_prompts = list(dict.fromkeys(prompts))
+        detected = unique_prompts
+        if probe_first:
+            probed = self._decode_prompts(
+                image_state, unique_prompts, threshold, masks=False, timer=timer
+            )
+            detected = [
+                prompt for prompt, result in zip(unique_prompts, probed) if len(result["scores"])
+            ]
+            metrics.inc("segmenter_probe_skipped", len(unique_prompts) - len(detected))
+        decoded = dict(
+            zip(detected, self._decode_prompts(image_state, detected, threshold, timer=timer))
+        )
+
+        empty = {"masks": None, "scores": []}
+        return {
+            prompt: self._to_host(
+                decoded.get(prompt, empty), prompt, image, prompt in merge, threshold, timer
+            )
+            for prompt in unique_prompts
+        }
+
+    def _encode_image(
+        self, image: Image.Image, timer: Optional[metrics.PhaseTimer] = None
+    ) -> tuple[Image.Image, dict]:
+        """(encoded image, image state) of one image (downscaled to max_input_side first)."""
+        with self._phase(timer, "preprocess"):
+            encoded = self._prepare_image(image)
+        with self._phase(timer, "backbone"), torch.inference_mode(), self._autocast():
+            return encoded, self.processor.set_image(encoded)
+
+    def probe(
+        self, image: Image.Image, prompts: list[str], confidence_threshold: Optional[float] = None
+    ) -> dict[str, dict]:
+        """
+        Detection scores and boxes per prompt, without full-resolution masks.
+
+        The image is encoded once and every prompt is decoded with the model's
+        segmentation head detached, so no mask logits are computed, upsampled or
+        transferred. Scores and boxes match what segment_concepts() reports.
+
+        Args:
+            image: PIL Image to probe (very large images are not tiled)
+            prompts: Concept texts; duplicates are probed once
+            confidence_threshold: Minimum score for this call only (see segment)
+
+        Returns:
+            dict mapping prompt -> {"concept", "instance_count", "image_size",
+            "confidence_threshold", "scores", "boxes"} (boxes: xyxy in image pixels)
+
+        Example:
+            >>> probed = segmenter.probe(image, ["wall", "pool"])
+            >>> present = [p for p, r in probed.items() if r["instance_count"]]
+        """
+        threshold = self._call_threshold(confidence_threshold)
+        timer = self._new_timer()
+        with self._execution():
+            # Boxes are scaled to the original size whatever mask_upsample is
+            _encoded, image_state = self._encode_image(image, timer)
+            image_state = dict(
+                image_state, original_height=image.height, original_width=image.width
+            )
+            unique_prompts = list(dict.fromkeys(prompts))
+            decoded = self._decode_prompts(
+                image_state, unique_prompts, threshold, masks=False, timer=timer
+            )
+
+            results = {}
+            with self._phase(timer, "transfer"):
+                for prompt, result in zip(unique_prompts, decoded):
+                    scores = _to_list(result["scores"])
+                    results[prompt] = {
+                        "concept": prompt,
+                        "instance_count": len(scores),
+                        "image_size": image.size,
+                        "confidence_threshold": threshold,
+                        "scores": scores,
+                        "boxes": _to_list(result["boxes"]),
+                    }
+        self._attach_timings([results], timer)
+        return results
+
+    def segment_multiple(
+        self, image: Image.Image, concepts: list[str]
+    ) -> dict[str, tuple[list[np.ndarray], dict]]:
+        """
+        Segment image for multiple concepts.
+
+        Alias of segment_concepts() (image is encoded once).
+
+        Args:
+            image: PIL Image to segment
+            concepts: List of concept texts (e.g., ["wall", "door", "window"])
+
+        Returns:
+            dict mapping concept -> (masks, metadata)
+
+        Example:
+            >>> results = segmenter.segment_multiple(image, ["wall", "door"])
+            >>> wall_masks, wall_meta = results["wall"]
+        """
+        return self.segment_concepts(image, concepts)
+
+    def segment_batch(
+        self,
+        images: list[Image.Image],
+        prompts: list[str],
+        merge: Collection[str] = (),
+        confidence_threshold: Optional[float] = None,
+    ) -> list[dict[str, tuple[list[np.ndarray], dict]]]:
+        """
+        Segment several images for the same prompts using batched image encoding.
+
+        Images are encoded together (the SAM3 transform resizes every image to the
+        model resolution, so they stack into one encoder batch) and all
+        (image, prompt) queries are decoded in batches of max_prompts_per_batch.
+        Masks are returned at each image's original size.
+
+        A chunk that hits CUDA OOM is retried in halves (down to one image) and the
+        size that fit is kept in safe_image_batch for later calls.
+
+        Args:
+            images: PIL Images to segment (sizes may differ)
+            prompts: Concept texts to run on every image
+            merge: Prompts returned as one union mask (see segment_concepts)
+            confidence_threshold: Minimum score for this call only (see segment)
+
+        Returns:
+            List (same order as images) of dicts mapping prompt -> (masks, metadata)
+
+        Example:
+            >>> results = segmenter.segment_batch([img_a, img_b], ["wall", "floor"])
+            >>> wall_masks_b, _ = results[1]["wall"]
+        """
+        threshold = self._call_threshold(confidence_threshold)
+        timer = self._new_timer()
+        results = self._segment_batch(images, list(dict.fromkeys(prompts)), merge, threshold, timer)
+        self._attach_timings(results, timer)
+        return results
+
+    def _segment_batch(
+        self,
+        images: list[Image.Image],
+        unique_prompts: list[str],
+        merge: Collection[str],
+        threshold: float,
+        timer: Optional[metrics.PhaseTimer] = None,
+    ) -> list[dict[str, tuple[list[np.ndarray], dict]]]:
+        """segment_batch() body, timed by the caller's timer."""
+        results = []
+        batch_size = self.max_images_per_batch or self._auto_image_batch_size()
+
+        # Very large images are tiled one at a time instead of joining a batch
+        tiled = {}
+        for i, image in enumerate(images):
+            if self.tiling.applies_to(*image.size):
+                with self._execution():
+                    tiled[i] = self._segment_tiled(image, unique_prompts, threshold, merge, timer)
+        if tiled:
+            rest = [im for i, im in enumerate(images) if i not in tiled]
+            batched = iter(self._segment_batch(rest, unique_prompts, merge, threshold, timer))
+            return [tiled[i] if i in tiled else next(batched) for i in range(len(images))]
+
+        with self._execution():
+            start = 0
+            while start < len(images):
+                # A size that hit OOM earlier is never exceeded again
+                chunk = images[start:start + min(batch_size, self.safe_image_batch or batch_size)]
+                try:
+                    results.extend(
+                        self._segment_chunk(chunk, unique_prompts, merge, threshold, timer)
+                    )
+                except Exception as e:
+                    if len(chunk) == 1 or not is_out_of_memory(e):
+                        raise
+                else:
+                    start += len(chunk)
+                    continue
+                # Retry the same images in a halved batch (exception frame released first)
+                self.safe_image_batch = self._split_after_oom("encoder", len(chunk))
+
+        return results
+
+    def _segment_chunk(
+        self,
+        chunk: list[Image.Image],
+        prompts: list[str],
+        merge: Collection[str],
+        threshold: float,
+        timer: Optional[metrics.PhaseTimer] = None,
+    ) -> list[dict[str, tuple[list[np.ndarray], dict]]]:
+        """Encode images in one backbone pass and decode every prompt for each."""
+        with self._phase(timer, "preprocess"):
+            encoded = [self._prepare_image(image) for image in chunk]
+        with self._phase(timer, "backbone"), torch.inference_mode(), self._autocast():
+            image_state = self.processor.set_image_batch(encoded)
+        if any(e is not image for e, image in zip(encoded, chunk)):
+            image_state = self._full_size_state(image_state, chunk)
+
+        queries = [(i, prompt) for i in range(len(chunk)) for prompt in prompts]
+        decoded = iter(self._decode_queries(image_state, queries, threshold, timer=timer))
+
+        return [
+            {
+                prompt: self._to_host(
+                    next(decoded), prompt, image, prompt in merge, threshold, timer
+                )
+                for prompt in prompts
+            }
+            for image in chunk
+        ]
+
+    def _split_after_oom(self, stage: str, batch_size: int) -> int:
+        """Count an OOM split, release cached device memory and return the halved batch size."""
+        smaller = max(1, batch_size // 2)
+        self.oom_splits += 1
+        metrics.inc("segmenter_oom_splits")
+        logger.warning(
+            f"CUDA out of memory in {stage} batch of {batch_size}, retrying with {smaller}"
+        )
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+        return smaller
+
+    def _segment_tiled(
+        self,
+        image: Image.Image,
+        prompts: list[str],
+        threshold: float,
+        merge: Collection[str] = (),
+        timer: Optional[metrics.PhaseTimer] = None,
+    ) -> dict[str, tuple[list[np.ndarray], dict]]:
+        """
+        Segment a very large image tile by tile and stitch the instance masks.
+
+        Each tile is encoded on its own, so device memory stays that of one tile.
+        Instances cut by a tile border are merged in the overlap (engine.tiling).
+        """
+        unique_prompts = list(dict.fromkeys(prompts))
+        boxes = tile_boxes(image.width, image.height, self.tiling.tile_size, self.tiling.overlap)
+        per_prompt = {prompt: [] for prompt in unique_prompts}
+
+        for box in boxes:
+            tile_results = self._segment_image(
+                image.crop(box), unique_prompts, threshold, merge, timer=timer
+            )
+            for prompt, (masks, metadata) in tile_results.items():
+                per_prompt[prompt].append((box, masks, metadata.get("scores") or []))
+
+        results = {}
+        for prompt in unique_prompts:
+            with self._phase(timer, "stitch"):
+                masks, scores = stitch_instances(
+                    image.size,
+                    per_prompt[prompt],
+                    self.tiling.merge_threshold,
+                    compact=self.mask_format == "compact",
+                )
+                if (self.merge_instances or prompt in merge) and len(masks) > 1:
+                    masks, scores = [union_masks(masks)], [_max_score(scores)]
+            results[prompt] = (masks, {
+                "concept": prompt,
+                "instance_count": len(masks),
+                "image_size": image.size,
+                "confidence_threshold": threshold,
+                "scores": scores,
+                "tiles": len(boxes),
+            })
+        return results
+
+    def _auto_image_batch_size(self) -> int:
+        """
+        Pick how many images to encode together from free device memory.
+
+        Uses IMAGE_BATCH_MEMORY_MB (estimated activation memory per image, default
+        1536 MB) against 80% of currently free CUDA memory, capped at
+        MAX_IMAGES_PER_BATCH. Without CUDA, images are encoded one at a time.
+        """
+        if not torch.cuda.is_available():
+            return 1
+
+        free_bytes, _total_bytes = torch.cuda.mem_get_info()
+        per_image_bytes = IMAGE_BATCH_MEMORY_MB * 1024 * 1024
+        fits = int(free_bytes * 0.8 // per_image_bytes)
+        return max(1, min(MAX_IMAGES_PER_BATCH, fits))
+
+    def _decode_prompts(
+        self,
+        image_state: dict,
+        prompts: list[str],
+        threshold: float,
+        masks: bool = True,
+        timer: Optional[metrics.PhaseTimer] = None,
+    ) -> list[dict]:
+        """
+        Decode prompts against a single-image state.
+
+        Returns:
+            List of per-prompt results (masks, boxes, scores), in prompt order
+        """
+        queries = [(0, prompt) for prompt in prompts]
+        return self._decode_queries(image_state, queries, threshold, masks, timer)
+
+    def _decode_queries(
+        self,
+        image_state: dict,
+        queries: list[tuple[int, str]],
+        threshold: float,
+        masks: bool = True,
+        timer: Optional[metrics.PhaseTimer] = None,
+    ) -> list[dict]:
+        """
+        Decode (image index, prompt) queries, max_prompts_per_batch at a time.
+
+        On CUDA OOM the batch is halved and retried (down to 1 query); the smaller
+        size is kept in safe_prompt_batch for later calls. masks=False skips the
+        segmentation head (results carry masks=None).
+
+        Returns:
+            List of per-query results (masks, boxes, scores), in query order
+        """
+        decoded = []
+        start = 0
+        while start < len(queries):
+            size = min(self.max_prompts_per_batch, self.safe_prompt_batch or len(queries))
+            batch = queries[start:start + size]
+            try:
+                decoded.extend(
+                    self._decode_query_batch(image_state, batch, threshold, masks, timer)
+                )
+            except Exception as e:
+                if len(batch) == 1 or not is_out_of_memory(e):
+                    raise
+            else:
+                start += len(batch)
+                continue
+            self.safe_prompt_batch = self._split_after_oom("decoder", len(batch))
+        return decoded
+
+    def _decode_query_batch(
+        self,
+        image_state: dict,
+        queries: list[tuple[int, str]],
+        threshold: float,
+        masks: bool = True,
+        timer: Optional[metrics.PhaseTimer] = None,
+    ) -> list[dict]:
+        """
+        Decode a batch of (image index, prompt) queries in a single grounding pass.
+
+        Each distinct prompt is text-encoded once; every query points at its image
+        (img_ids) and its text row (text_ids). The stacked outputs are split back
+        per query.
+        """
+        prompts = list(dict.fromkeys(prompt for _, prompt in queries))
+        text_row = {prompt: i for i, prompt in enumerate(prompts)}
+        num_queries = len(queries)
+        device = self.processor.device
+
+        with torch.inference_mode():
+            # Text features for all distinct prompts (cached or one encoder call)
+            backbone_out = dict(image_state["backbone_out"])
+            with self._phase(timer, "text_encode"), self._autocast():
+                backbone_out.update(self._encode_text(prompts))
+
+            with self._phase(timer, "decode"):
+                with self._autocast(), self._mask_head(masks):
+                    find_input = FindStage(
+                        img_ids=torch.tensor(
+                            [img for img, _ in queries], dtype=torch.long, device=device
+                        ),
+                        text_ids=torch.tensor(
+                            [text_row[prompt] for _, prompt in queries],
+                            dtype=torch.long,
+                            device=device,
+                        ),
+                        input_boxes=None,
+                        input_boxes_mask=None,
+                        input_boxes_label=None,
+                        input_points=None,
+                        input_points_mask=None,
+                    )
+                    outputs = self.model.forward_grounding(
+                        backbone_out=backbone_out,
+                        find_input=find_input,
+                        geometric_prompt=self.model._get_dummy_prompt(num_prompts=num_queries),
+                        find_target=None,
+                    )
+
+                # Thresholds, box scaling and mask upsampling run in fp32
+                outputs = _to_float32(outputs)
 
-        # Set text prompt and run inference
-        state = self.processor.set_text_prompt(state=state, prompt=concept_text)
+                results = []
+                for row, (img, _) in enumerate(queries):
+                    height, width = self._original_size(image_state, img)
+                    results.append(self._postprocess(outputs, row, height, width, threshold, masks))
+            return results
 
+    @contextlib.contextmanager
+    def _mask_head(self, enabled: bool):
+        """
+        Detach the model's segmentation head while decoding without masks.
+
+        SAM3 skips mask prediction when segmentation_head is None. Models without
+        the attribute (ONNX backend) still predict masks; they are dropped later.
+        """
+        head = getattr(self.model, "segmentation_head", None)
+        if enabled or head is None:
+            yield
+            return
+        self.model.segmentation_head = None
+        try:
+            yield
+        finally:
+            self.model.segmentation_head = head
+
+    def warm_text_cache(self, prompts: list[str]) -> int:
+        """
+        Pre-encode prompts into the text-embedding cache (e.g. all preset prompts at boot).
+
+        Warmup does not count towards hit/miss counters.
+
+        Returns:
+            Number of prompts newly encoded
+        """
+        if self.text_cache.max_size <= 0:
+            return 0
+        missing = [p for p in dict.fromkeys(prompts) if p not in self.text_cache]
+
+        batch_size = self.max_prompts_per_batch
+        with torch.inference_mode(), self._autocast():
+            for start in range(0, len(missing), batch_size):
+                chunk = missing[start:start + batch_size]
+                outputs = self.model.backbone.forward_text(chunk, device=self.processor.device)
+                for i, prompt in enumerate(chunk):
+                    self.text_cache.put(prompt, _slice_text_outputs(outputs, i))
+        return len(missing)
+
+    def _encode_text(self, prompts: list[str]) -> dict:
+        """
+        Text encoder outputs for prompts, stacked in prompt order.
+
+        Cached prompts skip the text encoder; the rest are encoded in one call and
+        added to the cache.
+        """
+        per_prompt = {prompt: self.text_cache.get(prompt) for prompt in prompts}
+        missing = [prompt for prompt, outputs in per_prompt.items() if outputs is None]
+
+        if missing:
+            outputs = self.model.backbone.forward_text(missing, device=self.processor.device)
+            if len(missing) == len(prompts):
+                # Nothing cached: use the batch as-is, cache per-prompt copies
+                for i, prompt in enumerate(missing):
+                    self.text_cache.put(prompt, _slice_text_outputs(outputs, i))
+                return outputs
+            for i, prompt in enumerate(missing):
+                per_prompt[prompt] = _slice_text_outputs(outputs, i)
+                self.text_cache.put(prompt, per_prompt[prompt])
+
+        return _stack_text_outputs([per_prompt[prompt] for prompt in prompts])
+
+    @staticmethod
+    def _original_size(image_state: dict, img: int) -> tuple[int, int]:
+        """(height, width) of image `img` in a set_image / set_image_batch state."""
+        if "original_heights" in image_state:
+            return image_state["original_heights"][img], image_state["original_widths"][img]
+        return image_state["original_height"], image_state["original_width"]
+
+    def _postprocess(
+        self, outputs: dict, row: int, height: int, width: int, threshold: float, masks: bool = True
+    ) -> dict:
+        """
+        Threshold one prompt's raw grounding outputs and resize masks to the image.
+
+        Mirrors Sam3Processor._forward_grounding for a single row of a batched output.
+        With masks=False only boxes and scores are returned (masks=None).
+        """
+        # Detection probability = query score * presence score
+        probs = torch.sigmoid(outputs["pred_logits"][row]) * torch.sigmoid(
+            outputs["presence_logit_dec"][row]
+        )
+        probs = probs.squeeze(-1)
+        keep = probs > threshold
+
+        # Boxes: normalized cxcywh → absolute xyxy
+        boxes = outputs["pred_boxes"][row][keep]
+        boxes = torch.stack(
+            [
+                boxes[..., 0] - boxes[..., 2] / 2,
+                boxes[..., 1] - boxes[..., 3] / 2,
+                boxes[..., 0] + boxes[..., 2] / 2,
+                boxes[..., 1] + boxes[..., 3] / 2,
+            ],
+            dim=-1,
+        )
+        boxes = boxes * torch.tensor([width, height, width, height], device=self.processor.device)
+        if not masks:
+            return {"masks": None, "boxes": boxes, "scores": probs[keep]}
+
+        # Masks: low-res logits → image resolution probabilities
+        instance_masks = outputs["pred_masks"][row][keep]
+        instance_masks = torch.sigmoid(
+            torch.nn.functional.interpolate(
+                instance_masks[:, None], size=(height, width), mode="bilinear", align_corners=False
+            )
+        )
+
+        return {"masks": instance_masks > 0.5, "boxes": boxes, "scores": probs[keep]}
+
+    def _extract_results(
+        self,
+        state: dict,
+        concept_text: str,
+        image: Image.Image,
+        threshold: float,
+        merge: bool = False,
+    ) -> tuple[list[np.ndarray], dict]:
+        """Convert a decoded prompt result into (masks, metadata); merge = one union mask."""
+        merge = merge or self.merge_instances
         # Extract masks from state
         masks_list = []
         if "masks" in state and state["masks"] is not None:
-            # Convert masks to numpy arrays
             raw_masks = state["masks"]
+            if merge or self.mask_format == "compact":
+                # Still on the device: flatten to [N, H, W], union, crop + bit-pack
+                raw_masks = raw_masks.reshape(-1, *raw_masks.shape[-2:])
+                if merge and raw_masks.shape[0] > 1:
+                    raw_masks = _union_instances(raw_masks)
+                if self.mask_format == "compact":
+                    masks_list = compact_masks(raw_masks)
+                    raw_masks = None
+
+            # Convert masks to numpy arrays
             if isinstance(raw_masks, torch.Tensor):
                 raw_masks = raw_masks.cpu().numpy()
 
             # Handle different mask shapes: [batch, num_masks, H, W] or [num_masks, H, W] or [H, W]
-            if len(raw_masks.shape) == 4:
+            if raw_masks is None:
+                pass
+            elif len(raw_masks.shape) == 4:
                 # [batch, num_masks, H, W] → extract each mask
                 for b in range(raw_masks.shape[0]):
                     for m in range(raw_masks.shape[1]):
@@ -132,37 +1332,164 @@ class SAM3Segmenter:
             "concept": concept_text,
             "instance_count": len(masks_list),
             "image_size": image.size,
-            "confidence_threshold": self.confidence_threshold,
+            "confidence_threshold": threshold,
         }
 
         # Add scores if available
         if "scores" in state and state["scores"] is not None:
             scores = state["scores"]
             if isinstance(scores, torch.Tensor):
-                scores = scores.cpu().numpy().tolist()
+                scores = scores.cpu().numpy()
+            if isinstance(scores, np.ndarray):
+                scores = scores.tolist()
+            if merge and len(scores) > 1:
+                scores = [_max_score(scores)]
             metadata["scores"] = scores
 
         return masks_list, metadata
 
-    def segment_multiple(
-        self, image: Image.Image, concepts: list[str]
-    ) -> dict[str, tuple[list[np.ndarray], dict]]:
-        """
-        Segment image for multiple concepts.
 
-        Args:
-            image: PIL Image to segment
-            concepts: List of concept texts (e.g., ["wall", "door", "window"])
+def upsample_mask(mask: np.ndarray, size: tuple[int, int]) -> np.ndarray:
+    """Nearest-neighbour resize of a 2D mask to (height, width)."""
+    mask = np.asarray(mask)
+    height, width = size
+    rows = np.arange(height) * mask.shape[-2] // height
+    cols = np.arange(width) * mask.shape[-1] // width
+    return mask[..., rows[:, None], cols[None, :]]
 
-        Returns:
-            dict mapping concept -> (masks, metadata)
 
-        Example:
-            >>> results = segmenter.segment_multiple(image, ["wall", "door"])
-            >>> wall_masks, wall_meta = results["wall"]
-        """
-        results = {}
-        for concept in concepts:
-            masks, metadata = self.segment(image, concept)
-            results[concept] = (masks, metadata)
-        return results
+def _model_device(model) -> str:
+    """Device of the model's weights ("cpu" for a model without parameters)."""
+    parameter = next(iter(model.parameters()), None)
+    return "cpu" if parameter is None else str(parameter.device)
+
+
+def is_out_of_memory(error: BaseException) -> bool:
+    """True for CUDA out-of-memory errors (torch.cuda.OutOfMemoryError or its message)."""
+    oom_type = getattr(torch.cuda, "OutOfMemoryError", None)
+    if isinstance(oom_type, type) and isinstance(error, oom_type):
+        return True
+    return "out of memory" in str(error).lower()
+
+
+def _union_instances(masks):
+    """Union of [N, H, W] instance masks as a [1, H, W] mask (stays on the device)."""
+    if isinstance(masks, torch.Tensor):
+        return masks.any(dim=0, keepdim=True)
+    return np.any(masks, axis=0, keepdims=True)
+
+
+def _to_list(value) -> list:
+    """Device tensor / numpy array → nested Python lists."""
+    if isinstance(value, torch.Tensor):
+        value = value.cpu().numpy()
+    if isinstance(value, np.ndarray):
+        value = value.tolist()
+    return list(value)
+
+
+def _max_score(scores: list):
+    """Score of a merged mask: best instance score (None if none scored)."""
+    scores = [s for s in scores if s is not None]
+    return max(scores) if scores else None
+
+
+# Bit weights for packing 8 mask pixels into one byte (np.packbits big-endian order)
+_PACK_WEIGHTS = (128, 64, 32, 16, 8, 4, 2, 1)
+
+
+def compact_masks(masks) -> list[CompactMask]:
+    """
+    Crop [N, H, W] masks to their bounding boxes and bit-pack them.
+
+    torch tensors are cropped and packed on their device, so only the packed
+    bytes (and one small [N, 5] bounds tensor) are copied to the host.
+    numpy input goes through CompactMask.from_dense.
+    """
+    if not isinstance(masks, torch.Tensor):
+        return [CompactMask.from_dense(mask) for mask in np.asarray(masks)]
+
+    count, height, width = masks.shape
+    masks = masks > 0
+    rows = masks.any(dim=2)  # [N, H]
+    cols = masks.any(dim=1)  # [N, W]
+    # First/last set row and column per instance, one host copy for all bounds
+    bounds = torch.stack([
+        rows.any(dim=1).to(torch.int64),
+        rows.to(torch.int64).argmax(dim=1),
+        height - rows.flip(1).to(torch.int64).argmax(dim=1),
+        cols.to(torch.int64).argmax(dim=1),
+        width - cols.flip(1).to(torch.int64).argmax(dim=1),
+    ], dim=1).cpu().tolist()
+
+    weights = torch.tensor(_PACK_WEIGHTS, dtype=torch.uint8, device=masks.device)
+    result = []
+    for i, (filled, y0, y1, x0, x1) in enumerate(bounds):
+        if not filled:
+            result.append(CompactMask((height, width), (0, 0, 0, 0), np.zeros(0, dtype=np.uint8)))
+            continue
+        bits = masks[i, y0:y1, x0:x1].reshape(-1).to(torch.uint8)
+        pad = -bits.numel() % 8
+        if pad:
+            bits = torch.cat([bits, bits.new_zeros(pad)])
+        packed = (bits.view(-1, 8) * weights).sum(dim=1).to(torch.uint8)
+        result.append(CompactMask((height, width), (x0, y0, x1, y1), packed.cpu().numpy()))
+    return result
+
+
+def quantize_linear_int8(model):
+    """Copy of model with every nn.Linear dynamically quantized to int8 (CPU kernels)."""
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def enable_compile_cache(cache_dir: Optional[str] = None) -> str:
+    """
+    Point the TorchInductor artifact caches at a persistent directory.
+
+    Compiled kernels and FX graphs are written there and looked up by the next
+    process (e.g. after a container restart with the same /models volume), which
+    turns most of the first-call compile time into a cache load. Existing
+    TORCHINDUCTOR_* settings win.
+
+    Returns:
+        The cache directory in use
+    """
+    cache_dir = os.environ.setdefault("TORCHINDUCTOR_CACHE_DIR", cache_dir or COMPILE_CACHE_DIR)
+    os.environ.setdefault("TORCHINDUCTOR_FX_GRAPH_CACHE", "1")
+    os.environ.setdefault("TORCHINDUCTOR_AUTOGRAD_CACHE", "1")
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+    except OSError as e:
+        logger.warning(f"Compile cache directory unavailable ({cache_dir}): {str(e)}")
+    return cache_dir
+
+
+def _to_float32(outputs: dict) -> dict:
+    """Cast reduced-precision floating point outputs back to fp32."""
+    return {
+        key: (
+            value.float()
+            if isinstance(value, torch.Tensor) and value.is_floating_point()
+            else value
+        )
+        for key, value in outputs.items()
+    }
+
+
+def _slice_text_outputs(outputs: dict, index: int) -> dict:
+    """Copy prompt `index` out of batched forward_text outputs (batch dim kept, size 1)."""
+    sliced = {}
+    for key, value in outputs.items():
+        dim = _TEXT_BATCH_DIMS.get(key, 0)
+        selector = (slice(None),) * dim + (slice(index, index + 1),)
+        # Clone so the cache does not pin the whole batch's storage
+        sliced[key] = torch.clone(value[selector])
+    return sliced
+
+
+def _stack_text_outputs(per_prompt: list[dict]) -> dict:
+    """Concatenate per-prompt forward_text outputs back into one batch."""
+    return {
+        key: torch.cat([outputs[key] for outputs in per_prompt], dim=_TEXT_BATCH_DIMS.get(key, 0))
+        for key in per_prompt[0]
+    }
@@ -0,0 +1,172 @@
+"""
+Stages — bounded-queue producer/consumer 파이프라인
+
+각 stage는 자기 worker 스레드 수를 갖고, stage 사이는 크기 제한 queue로 연결된다.
+네트워크(download/upload/callback), GPU(segment), CPU(decode/apply/encode) 작업이
+서로 다른 item에 대해 동시에 진행된다.
+
+- Stage(name, fn, workers): fn(work_item)은 work_item을 갱신하고 다음 stage로 넘긴다
+- fn이 예외를 던지면 그 item은 on_error(work_item, stage_name, exc) 후 파이프라인에서 빠진다
+- queue가 가득 차면 앞 stage가 기다린다 (메모리에 올라가는 이미지 수 제한)
+- run() → stage별 통계: workers, processed, failed, busy_sec, max/avg_queue_depth
+"""
+
+import logging
+import queue
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()  # end-of-stream marker, one per worker
+
+
+@dataclass
+class Stage:
+    name: str
+    fn: Callable[[Any], None]
+    workers: int = 1
+
+
+@dataclass
+class StageStats:
+    workers: int
+    processed: int = 0
+    failed: int = 0
+    busy_sec: float = 0.0
+    max_queue_depth: int = 0
+    _depth_total: int = 0
+    _depth_samples: int = 0
+
+    def sample_depth(self, depth: int) -> None:
+        self.max_queue_depth = max(self.max_queue_depth, depth)
+        self._depth_total += depth
+        self._depth_samples += 1
+
+    def to_dict(self) -> dict:
+        avg_depth = self._depth_total / self._depth_samples if self._depth_samples else 0.0
+        return {
+            "workers": self.workers,
+            "processed": self.processed,
+            "failed": self.failed,
+            "busy_sec": round(self.busy_sec, 4),
+            "max_queue_depth": self.max_queue_depth,
+            "avg_queue_depth": round(avg_depth, 2),
+        }
+
+
+class StagedPipeline:
+    def __init__(
+        self,
+        stages: list[Stage],
+        queue_size: int = 4,
+        on_error: Optional[Callable[[Any, str, Exception], None]] = None,
+    ):
+        """
+        Build a pipeline of stages connected by bounded queues.
+
+        Args:
+            stages: Stages in processing order
+            queue_size: Max work items waiting in front of each stage
+            on_error: Called with (work_item, stage_name, exception) when a stage fails;
+                      the item is dropped afterwards
+        """
+        if not stages:
+            raise ValueError("StagedPipeline needs at least one stage")
+        for stage in stages:
+            if stage.workers < 1:
+                raise ValueError(
+                    f"Stage '{stage.name}' needs at least 1 worker, got {stage.workers}"
+                )
+        if queue_size < 1:
+            raise ValueError(f"queue_size must be >= 1, got {queue_size}")
+
+        self.stages = stages
+        self.queue_size = queue_size
+        self.on_error = on_error
+
+    def run(self, work_items: Iterable) -> dict[str, dict]:
+        """
+        Push every work item through all stages and wait until the last one finishes.
+
+        Returns:
+            dict: stage name -> stats (workers, processed, failed, busy_sec,
+                  max_queue_depth, avg_queue_depth)
+        """
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in self.stages]
+        stats = {stage.name: StageStats(workers=stage.workers) for stage in self.stages}
+        stats_lock = threading.Lock()
+        remaining = [stage.workers for stage in self.stages]
+
+        def put(index: int, work_item) -> None:
+            queues[index].put(work_item)
+            with stats_lock:
+                stats[self.stages[index].name].sample_depth(queues[index].qsize())
+
+        def worker(index: int) -> None:
+            stage = self.stages[index]
+            stage_stats = stats[stage.name]
+            while True:
+                work_item = queues[index].get()
+                if work_item is _DONE:
+                    break
+
+                start = time.perf_counter()
+                try:
+                    stage.fn(work_item)
+                    failed = None
+                except Exception as e:
+                    failed = e
+                elapsed = time.perf_counter() - start
+
+                with stats_lock:
+                    stage_stats.busy_sec += elapsed
+                    if failed is None:
+                        stage_stats.processed += 1
+                    else:
+                        stage_stats.failed += 1
+
+                if failed is not None:
+                    self._report_error(work_item, stage.name, failed)
+                elif index + 1 < len(self.stages):
+                    put(index + 1, work_item)
+
+            # Last worker of this stage closes the next stage
+            with stats_lock:
+                remaining[index] -= 1
+                last = remaining[index] == 0
+            if last and index + 1 < len(self.stages):
+                for _ in range(self.stages[index + 1].workers):
+                    queues[index + 1].put(_DONE)
+
+        threads = [
+            threading.Thread(
+                target=worker, args=(index,), name=f"stage-{stage.name}-{n}", daemon=True
+            )
+            for index, stage in enumerate(self.stages)
+            for n in range(stage.workers)
+        ]
+        for thread in threads:
+            thread.start()
+
+        try:
+            for work_item in work_items:
+                put(0, work_item)
+        finally:
+            for _ in range(self.stages[0].workers):
+                queues[0].put(_DONE)
+            for thread in threads:
+                thread.join()
+
+        return {name: stage_stats.to_dict() for name, stage_stats in stats.items()}
+
+    def _report_error(self, work_item, stage_name: str, error: Exception) -> None:
+        if self.on_error is None:
+            logger.error(f"Stage '{stage_name}' failed: {str(error)}")
+            return
+        try:
+            self.on_error(work_item, stage_name, error)
+        except Exception as e:
+            logger.error(f"Error handler for stage '{stage_name}' failed: {str(e)}")
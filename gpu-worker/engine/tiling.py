@@ -0,0 +1,198 @@
+"""
+Tiling — 초대형 이미지(파노라마, 도면 스캔)를 겹치는 타일로 나눠 segment
+
+이미지 픽셀 수가 pixel_threshold를 넘으면 tile_size 정사각 타일(overlap 만큼 겹침)로
+잘라 각각 segment 하고, instance mask를 원본 좌표로 이어 붙인다.
+타일 하나만 device에 올라가므로 peak device memory는 입력 크기와 무관하다.
+
+- TileConfig(pixel_threshold, tile_size, overlap, merge_threshold) / TileConfig.from_env()
+- tile_boxes(width, height, tile_size, overlap) → [(x0, y0, x1, y1), ...]
+- stitch_instances(image_size, tile_results, merge_threshold, compact) → (full-size masks, scores)
+
+병합 규칙: 서로 다른 타일의 instance가 겹치는 영역에서
+intersection / min(각자의 면적) >= merge_threshold 이면 같은 instance로 합친다.
+같은 타일 안의 instance는 모델 출력 그대로 둔다.
+"""
+
+import os
+from dataclasses import dataclass, field
+from typing import Optional
+
+import numpy as np
+
+from .compact_mask import CompactMask
+
+
+@dataclass
+class TileConfig:
+    pixel_threshold: int = 0   # tile images with more pixels than this (0 = never)
+    tile_size: int = 1008      # square tile side (SAM3 encoder resolution)
+    overlap: int = 128         # pixels shared by neighbouring tiles
+    merge_threshold: float = 0.5
+
+    def __post_init__(self):
+        if self.pixel_threshold < 0:
+            raise ValueError(f"pixel_threshold must be >= 0, got {self.pixel_threshold}")
+        if self.tile_size < 1 or not 0 <= self.overlap < self.tile_size:
+            raise ValueError(
+                "Need tile_size >= 1 and 0 <= overlap < tile_size, "
+                f"got {self.tile_size}/{self.overlap}"
+            )
+
+    @classmethod
+    def from_env(cls) -> "TileConfig":
+        """TILE_PIXEL_THRESHOLD, TILE_SIZE, TILE_OVERLAP, TILE_MERGE_THRESHOLD."""
+        return cls(
+            pixel_threshold=int(os.getenv("TILE_PIXEL_THRESHOLD", "0")),
+            tile_size=int(os.getenv("TILE_SIZE", "1008")),
+            overlap=int(os.getenv("TILE_OVERLAP", "128")),
+            merge_threshold=float(os.getenv("TILE_MERGE_THRESHOLD", "0.5")),
+        )
+
+    def applies_to(self, width: int, height: int) -> bool:
+        """True if an image of this size is segmented in tiles."""
+        return bool(self.pixel_threshold) and width * height > self.pixel_threshold
+
+
+def _starts(length: int, tile_size: int, overlap: int) -> list[int]:
+    """Tile start offsets along one axis; the last tile ends at the edge."""
+    if length <= tile_size:
+        return [0]
+    stride = tile_size - overlap
+    starts = list(range(0, length - tile_size, stride))
+    starts.append(length - tile_size)
+    return starts
+
+
+def tile_boxes(
+    width: int,
+    height: int,
+    tile_size: int,
+    overlap: int,
+) -> list[tuple[int, int, int, int]]:
+    """
+    Overlapping tiles covering the image, row by row.
+
+    Returns:
+        List of (x0, y0, x1, y1) boxes, each at most tile_size on a side
+    """
+    return [
+        (x0, y0, min(x0 + tile_size, width), min(y0 + tile_size, height))
+        for y0 in _starts(height, tile_size, overlap)
+        for x0 in _starts(width, tile_size, overlap)
+    ]
+
+
+@dataclass(eq=False)
+class _Instance:
+    """Instance mask cropped to its bounding box, in image coordinates."""
+    x0: int
+    y0: int
+    mask: np.ndarray
+    score: Optional[float]
+    tiles: set = field(default_factory=set)
+
+    @property
+    def box(self) -> tuple[int, int, int, int]:
+        return self.x0, self.y0, self.x0 + self.mask.shape[1], self.y0 + self.mask.shape[0]
+
+    def region(self, box: tuple[int, int, int, int]) -> np.ndarray:
+        """This instance's mask restricted to box (box must lie inside self.box)."""
+        x0, y0, x1, y1 = box
+        return self.mask[y0 - self.y0:y1 - self.y0, x0 - self.x0:x1 - self.x0]
+
+
+def _crop_instance(mask, offset: tuple[int, int], score, tile: int) -> Optional[_Instance]:
+    """Crop a tile mask to its bounding box and move it to image coordinates."""
+    if isinstance(mask, CompactMask):
+        if mask.empty:
+            return None
+        x0, y0 = mask.box[:2]
+        return _Instance(offset[0] + x0, offset[1] + y0, mask.crop(), score, {tile})
+    mask = np.asarray(mask) > 0
+    rows = np.flatnonzero(mask.any(axis=1))
+    if rows.size == 0:
+        return None
+    cols = np.flatnonzero(mask.any(axis=0))
+    cropped = mask[rows[0]:rows[-1] + 1, cols[0]:cols[-1] + 1]
+    return _Instance(offset[0] + int(cols[0]), offset[1] + int(rows[0]), cropped, score, {tile})
+
+
+def _overlap_ratio(a: _Instance, b: _Instance) -> float:
+    """intersection / min(area) of two instances inside their shared box."""
+    ax0, ay0, ax1, ay1 = a.box
+    bx0, by0, bx1, by1 = b.box
+    box = (max(ax0, bx0), max(ay0, by0), min(ax1, bx1), min(ay1, by1))
+    if box[0] >= box[2] or box[1] >= box[3]:
+        return 0.0
+    region_a = a.region(box)
+    region_b = b.region(box)
+    smaller = min(region_a.sum(), region_b.sum())
+    if smaller == 0:
+        return 0.0
+    return float(np.logical_and(region_a, region_b).sum() / smaller)
+
+
+def _merge(a: _Instance, b: _Instance) -> _Instance:
+    """Union of two instances (bounding box grows to cover both)."""
+    ax0, ay0, ax1, ay1 = a.box
+    bx0, by0, bx1, by1 = b.box
+    x0, y0 = min(ax0, bx0), min(ay0, by0)
+    mask = np.zeros((max(ay1, by1) - y0, max(ax1, bx1) - x0), dtype=bool)
+    for inst in (a, b):
+        ix0, iy0, ix1, iy1 = inst.box
+        mask[iy0 - y0:iy1 - y0, ix0 - x0:ix1 - x0] |= inst.mask
+    scores = [s for s in (a.score, b.score) if s is not None]
+    return _Instance(x0, y0, mask, max(scores) if scores else None, a.tiles | b.tiles)
+
+
+def stitch_instances(
+    image_size: tuple[int, int],
+    tile_results: list[tuple[tuple[int, int, int, int], list[np.ndarray], list]],
+    merge_threshold: float = 0.5,
+    compact: bool = False,
+) -> tuple[list, list]:
+    """
+    Stitch per-tile instance masks into full-image instance masks.
+
+    Args:
+        image_size: (width, height) of the full image
+        tile_results: [(tile box, tile masks (tile-sized, dense or CompactMask), tile scores), ...]
+        merge_threshold: Min intersection / min(area) in the shared region for two
+                         instances from different tiles to be merged
+        compact: Return CompactMask instances instead of full-size arrays
+
+    Returns:
+        (full-size bool masks, scores) with merged instances scored by their max
+    """
+    instances: list[_Instance] = []
+    for tile, (box, masks, scores) in enumerate(tile_results):
+        scores = list(scores) if scores is not None else []
+        for i, mask in enumerate(masks):
+            instance = _crop_instance(mask, box[:2], scores[i] if i < len(scores) else None, tile)
+            if instance is None:
+                continue
+            # Merge repeatedly: one instance can bridge several already stitched pieces
+            for other in list(instances):
+                if instance.tiles & other.tiles:
+                    continue
+                if _overlap_ratio(instance, other) >= merge_threshold:
+                    instances.remove(other)
+                    instance = _merge(other, instance)
+            instances.append(instance)
+
+    width, height = image_size
+    if compact:
+        masks = [
+            CompactMask.from_crop((height, width), inst.x0, inst.y0, inst.mask)
+            for inst in instances
+        ]
+        return masks, [instance.score for instance in instances]
+
+    full_masks = []
+    for instance in instances:
+        full = np.zeros((height, width), dtype=bool)
+        x0, y0, x1, y1 = instance.box
+        full[y0:y1, x0:x1] = instance.mask
+        full_masks.append(full)
+    return full_masks, [instance.score for instance in instances]
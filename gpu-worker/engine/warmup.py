@@ -0,0 +1,101 @@
+"""
+Warmup — 워커가 job을 받기 전 모델 준비 (readiness gate)
+
+첫 job이 모델 빌드, CUDA context 생성, kernel autotuning, text encoder warmup 비용을
+떠안지 않도록 main.py가 어댑터 시작 전에 run_warmup()을 호출한다.
+
+- 공유 registry에서 segmenter 빌드 (preload)
+- 합성 이미지 1장을 모든 preset prompt로 segment (encoder + decoder 배치 전부 실행)
+- 소요 시간 로그 + metrics gauge: segmenter_build_seconds, warmup_seconds, worker_ready
+- is_ready() → warmup 완료 여부
+"""
+
+import logging
+import os
+import time
+from typing import Optional
+
+import numpy as np
+from PIL import Image
+
+from . import metrics
+from .registry import get_registry
+
+logger = logging.getLogger(__name__)
+
+# Run the warmup in main.py before accepting jobs (0 = start immediately)
+WARMUP_ON_START = os.getenv("WARMUP_ON_START", "1") == "1"
+
+# Synthetic warmup image size (width, height), close to typical uploads
+WARMUP_IMAGE_SIZE = (1024, 768)
+
+
+def warmup_image(size: tuple[int, int] = WARMUP_IMAGE_SIZE) -> Image.Image:
+    """Deterministic gradient image with some structure for the decoder to find."""
+    width, height = size
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)
+    channels = np.broadcast_arrays(x[None, :], y[:, None], (x[None, :] + y[:, None]) / 2)
+    pixels = np.stack(channels, axis=-1)
+    pixels[height // 4:height // 2, width // 4:width // 2] = (200, 40, 40)
+    return Image.fromarray(pixels.astype(np.uint8))
+
+
+def _sync() -> None:
+    """Wait for queued GPU work so the warmup time covers it."""
+    try:
+        import torch
+    except ImportError:
+        return
+    if torch.cuda.is_available():
+        torch.cuda.synchronize()
+
+
+def run_warmup(prompts: Optional[list[str]] = None) -> dict:
+    """
+    Build the shared segmenter and run one synthetic image through every prompt.
+
+    Args:
+        prompts: Prompts to warm (default: every preset prompt)
+
+    Returns:
+        dict: build_sec, warmup_sec, total_sec, prompts
+
+    Raises:
+        Whatever building or running the segmenter raises; the worker is not
+        marked ready in that case.
+    """
+    if prompts is None:
+        from presets import preset_prompts
+        prompts = preset_prompts()
+
+    metrics.set_gauge("worker_ready", 0)
+    start = time.perf_counter()
+    segmenter = get_registry().preload()
+    build_sec = time.perf_counter() - start
+
+    warmup_start = time.perf_counter()
+    segmenter.segment_concepts(warmup_image(), prompts)
+    _sync()
+    warmup_sec = time.perf_counter() - warmup_start
+    total_sec = time.perf_counter() - start
+
+    metrics.set_gauge("segmenter_build_seconds", round(build_sec, 3))
+    metrics.set_gauge("warmup_seconds", round(warmup_sec, 3))
+    metrics.set_gauge("worker_ready", 1)
+
+    logger.info(
+        f"Warmup complete in {total_sec:.2f}s "
+        f"(build {build_sec:.2f}s, {len(prompts)} prompts {warmup_sec:.2f}s)"
+    )
+    return {
+        "build_sec": round(build_sec, 3),
+        "warmup_sec": round(warmup_sec, 3),
+        "total_sec": round(total_sec, 3),
+        "prompts": len(prompts),
+    }
+
+
+def is_ready() -> bool:
+    """True once run_warmup() has completed in this process."""
+    return metrics.snapshot().get("worker_ready") == 1
@@ -8,7 +8,7 @@ Request format:
     "input": {
         "image_url": "https://...",  # Image URL to segment
         "concepts": ["wall", "door"],  # Concepts to segment
-        "confidence_threshold": 0.5   # Optional, default 0.5
+        "confidence_threshold": 0.5   # Optional, default CONFIDENCE_THRESHOLD env (0.5)
     }
 }
 
@@ -28,7 +28,6 @@ Response format:
 }
 """
 
-import os
 import io
 import base64
 import runpod
@@ -36,19 +35,21 @@ import httpx
 import numpy as np
 from PIL import Image
 
-# Lazy load segmenter to avoid loading model on cold start inspection
-_segmenter = None
-
 
 def get_segmenter():
-    """Lazy load SAM3 segmenter (singleton pattern)."""
-    global _segmenter
-    if _segmenter is None:
-        from engine.segmenter import SAM3Segmenter
+    """
+    Lazy load SAM3 segmenter from the process-wide registry (shared with engine.pipeline).
+
+    Build options (CONFIDENCE_THRESHOLD default threshold, ...) are resolved by the
+    registry, so a segmenter preloaded by the warmup is configured the same way.
+    Requests override the threshold per call.
+    """
+    from engine.registry import get_segmenter as get_shared_segmenter
+    from engine.scheduler import SCHEDULER_ENABLED, get_scheduler
 
-        confidence = float(os.getenv("CONFIDENCE_THRESHOLD", "0.5"))
-        _segmenter = SAM3Segmenter(confidence_threshold=confidence)
-    return _segmenter
+    segmenter = get_shared_segmenter()
+    # Concurrent handler calls are micro-batched instead of racing on the model
+    return get_scheduler(segmenter) if SCHEDULER_ENABLED else segmenter
 
 
 def download_image(url: str) -> Image.Image:
@@ -59,7 +60,8 @@ def download_image(url: str) -> Image.Image:
 
 
 def mask_to_base64_png(mask: np.ndarray) -> str:
-    """Convert numpy mask to base64 encoded PNG."""
+    """Convert numpy mask (or CompactMask) to base64 encoded PNG."""
+    mask = np.asarray(mask)
     # Convert boolean/float mask to uint8 (0 or 255)
     if mask.dtype == bool:
         mask_uint8 = (mask * 255).astype(np.uint8)
@@ -102,9 +104,10 @@ def handler(job):
         image_url = job_input["image_url"]
         concepts = job_input["concepts"]
 
-        # Optional confidence threshold override
-        if "confidence_threshold" in job_input:
-            os.environ["CONFIDENCE_THRESHOLD"] = str(job_input["confidence_threshold"])
+        # Optional confidence threshold override (applied per call, the warm model is shared)
+        confidence_threshold = job_input.get("confidence_threshold")
+        if confidence_threshold is not None:
+            confidence_threshold = float(confidence_threshold)
 
         # Download image
         print(f"Downloading image from {image_url}...")
@@ -118,7 +121,9 @@ def handler(job):
         results = {}
         for concept in concepts:
             print(f"Segmenting concept: {concept}")
-            masks, metadata = segmenter.segment(image, concept)
+            masks, metadata = segmenter.segment(
+                image, concept, confidence_threshold=confidence_threshold
+            )
 
             # Convert masks to base64 PNG
             masks_base64 = [mask_to_base64_png(m) for m in masks]
@@ -148,6 +153,9 @@ def handler(job):
         return {"error": f"Segmentation failed: {str(e)}"}
 
 
-# Start Runpod serverless worker
+# Start Runpod serverless worker (after the model is built and warm)
 if __name__ == "__main__":
+    from engine.warmup import WARMUP_ON_START, run_warmup
+    if WARMUP_ON_START:
+        run_warmup()
     runpod.serverless.start({"handler": handler})
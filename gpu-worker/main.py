@@ -5,14 +5,27 @@ S3 GPU Worker — Entry Point
 - "runpod" (기본) → adapters.runpod_serverless
 - "queue_pull" → adapters.queue_pull
 
+어댑터 시작 전에 warmup (모델 빌드 + 모든 preset prompt로 합성 이미지 1장 처리)을
+끝내고 나서 job을 받는다. WARMUP_ON_START=0 이면 건너뛴다.
+
 TODO: Auto-Claude 구현
 """
 
+import logging
 import os
 
+logger = logging.getLogger(__name__)
+
 
 def main():
     adapter = os.getenv("ADAPTER", "runpod")
+    if adapter not in ("runpod", "queue_pull"):
+        raise ValueError(f"Unknown adapter: {adapter}")
+
+    # Readiness gate: no job is accepted before the model is built and warm
+    from engine.warmup import WARMUP_ON_START, run_warmup
+    if WARMUP_ON_START:
+        run_warmup()
 
     if adapter == "runpod":
         from adapters.runpod_serverless import start
@@ -20,9 +33,8 @@ def main():
     elif adapter == "queue_pull":
         from adapters.queue_pull import start
         start()
-    else:
-        raise ValueError(f"Unknown adapter: {adapter}")
 
 
 if __name__ == "__main__":
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
     main()
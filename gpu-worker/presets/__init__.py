@@ -1 +1,37 @@
 """S3 GPU Worker — 도메인별 concept 매핑 패키지"""
+
+from typing import Optional
+
+from .interior import INTERIOR_CONCEPTS
+from .seller import SELLER_CONCEPTS
+
+PRESETS = {
+    "interior": INTERIOR_CONCEPTS,
+    "seller": SELLER_CONCEPTS,
+}
+
+
+def preset_prompts() -> list[str]:
+    """
+    Every concept name and SAM3 prompt text across all presets (deduplicated).
+
+    Concept names are included because jobs send them verbatim as prompts.
+    Used to warm the segmenter's text-embedding cache at startup.
+    """
+    prompts = []
+    for concepts in PRESETS.values():
+        for concept_name, concept in concepts.items():
+            prompts.append(concept_name)
+            prompts.append(concept["prompt"])
+    return list(dict.fromkeys(prompts))
+
+
+def is_multi_instance(preset: Optional[str], concept_name: str) -> bool:
+    """
+    Whether a concept keeps separate instance masks under a preset.
+
+    Concepts marked multi_instance: False are segmented into one union mask.
+    Unknown presets and concepts keep their instances.
+    """
+    concept = PRESETS.get(preset or "", {}).get(concept_name)
+    return concept is None or concept.get("multi_instance", True)
@@ -0,0 +1,73 @@
+"""Compare latency and mask agreement of the onnxruntime CPU backend against torch.
+
+Usage:
+    python scripts/backend_check.py --tiny                                   # CPU, stand-in model
+    python scripts/backend_check.py --onnx-dir models/sam3_onnx --images a.jpg b.jpg
+    python scripts/backend_check.py --onnx-dir models/sam3_onnx --threads 8 --json
+
+Runs the same image/prompt corpus on the torch segmenter (MODEL_CHECKPOINT,
+GPU if available) and on the ONNX export (onnxruntime CPUExecutionProvider),
+and reports seconds per corpus pass, speedup and mask IoU / instance-count
+mismatches of the ONNX backend against torch.
+
+--tiny exports the small randomly initialized stand-in model from
+precision_check.py to a temporary directory, so the harness runs on CPU
+without the checkpoint or the sam3 package (torch, onnx and onnxruntime are
+still required).
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from PIL import Image
+
+if __name__ == "__main__":
+    from precision_check import TINY_INPUT_SIZE, _sync, build_tiny_segmenter, synthetic_images
+
+    from engine.onnx_backend import export_onnx, load_onnx_segmenter
+    from engine.precision_check import compare_backends, format_report
+    from presets import preset_prompts
+
+    parser = argparse.ArgumentParser(description="Compare the ONNX CPU backend against torch")
+    parser.add_argument("--tiny", action="store_true", help="Use the CPU stand-in model")
+    parser.add_argument("--onnx-dir", type=str, default=None, help="export_onnx() directory")
+    parser.add_argument(
+        "--images", nargs="*", default=None, help="Corpus image paths (default: synthetic)"
+    )
+    parser.add_argument("--num-images", type=int, default=4, help="Synthetic corpus size")
+    parser.add_argument("--num-prompts", type=int, default=8, help="Preset prompts per image")
+    parser.add_argument("--threads", type=int, default=None, help="onnxruntime intra-op threads")
+    parser.add_argument("--repeats", type=int, default=3, help="Timed passes per backend")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+
+    if args.tiny:
+        torch_segmenter = build_tiny_segmenter()
+        onnx_dir = args.onnx_dir or tempfile.mkdtemp(prefix="tiny-sam3-onnx-")
+        export_onnx(torch_segmenter.model, onnx_dir, resolution=TINY_INPUT_SIZE, source="tiny-sam3")
+        onnx_segmenter = load_onnx_segmenter(
+            onnx_dir, tokenizer=torch_segmenter.model.backbone.tokenizer, num_threads=args.threads
+        )
+    else:
+        if not args.onnx_dir:
+            parser.error("--onnx-dir is required without --tiny")
+        from engine.registry import get_segmenter
+
+        torch_segmenter = get_segmenter()
+        onnx_segmenter = load_onnx_segmenter(args.onnx_dir, num_threads=args.threads)
+
+    if args.images:
+        images = [Image.open(path).convert("RGB") for path in args.images]
+    else:
+        images = synthetic_images(args.num_images)
+
+    report = compare_backends(
+        {"torch": torch_segmenter, "onnx": onnx_segmenter},
+        images, preset_prompts()[:args.num_prompts], args.repeats, _sync,
+    )
+    print(json.dumps(report, indent=2) if args.json else format_report(report))
@@ -0,0 +1,99 @@
+"""Benchmark cold start per checkpoint format.
+
+Usage:
+    python scripts/benchmark_cold_start.py --image sample.jpg \
+        --checkpoints /models/sam3.pt /models/sam3.safetensors /models/sam3_fp16.safetensors
+
+Every checkpoint is loaded in a fresh Python process (a real cold start) that
+builds SAM3Segmenter and segments one prompt. Reported per format:
+- load: SAM3Segmenter construction time
+- first mask: load + first segment() call (time-to-first-mask)
+- peak RSS: process high-water mark (ru_maxrss)
+
+Run with --drop-caches (root) to also evict the files from the page cache
+between runs, which is what a new Runpod worker sees.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+
+def cold_start(checkpoint: str, image_path: str, prompt: str) -> dict:
+    """Measure one cold start in the current process (child side)."""
+    import resource
+
+    from PIL import Image
+
+    start = time.perf_counter()
+    from engine.segmenter import SAM3Segmenter
+
+    segmenter = SAM3Segmenter(checkpoint_path=checkpoint)
+    load_seconds = time.perf_counter() - start
+
+    image = Image.open(image_path).convert("RGB")
+    masks, _ = segmenter.segment(image, prompt)
+    first_mask = time.perf_counter() - start
+
+    return {
+        "checkpoint": os.path.basename(checkpoint),
+        "size_mb": round(os.path.getsize(checkpoint) / (1024 * 1024)),
+        "load_sec": round(load_seconds, 2),
+        "first_mask_sec": round(first_mask, 2),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024),
+        "instances": len(masks),
+    }
+
+
+def _drop_page_cache() -> None:
+    """Evict file pages so the next load reads from disk (needs root)."""
+    subprocess.run(["sync"], check=False)
+    try:
+        with open("/proc/sys/vm/drop_caches", "w") as f:
+            f.write("3\n")
+    except OSError as e:
+        print(f"Could not drop page cache: {e}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Cold-start time and peak RSS per checkpoint format"
+    )
+    parser.add_argument(
+        "--checkpoints", nargs="+", required=True, help="Checkpoint files to compare"
+    )
+    parser.add_argument("--image", type=str, required=True, help="Input image path")
+    parser.add_argument("--prompt", type=str, default="wall", help="Prompt for the first mask")
+    parser.add_argument(
+        "--drop-caches", action="store_true", help="Drop the page cache before each run"
+    )
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(cold_start(args.checkpoints[0], args.image, args.prompt)))
+        sys.exit(0)
+
+    print(f"{'checkpoint':<28} {'size MB':>8} {'load s':>7} {'1st mask s':>11} {'peak RSS MB':>12}")
+    for checkpoint in args.checkpoints:
+        if args.drop_caches:
+            _drop_page_cache()
+        output = subprocess.run(
+            [sys.executable, __file__, "--child", "--checkpoints", checkpoint,
+             "--image", args.image, "--prompt", args.prompt],
+            capture_output=True, text=True,
+        )
+        if output.returncode != 0:
+            error = output.stderr.strip().splitlines()[-1:]
+            print(f"{os.path.basename(checkpoint):<28} failed: {error}")
+            continue
+        entry = json.loads(output.stdout.strip().splitlines()[-1])
+        print(
+            f"{entry['checkpoint']:<28} {entry['size_mb']:>8} {entry['load_sec']:>7.2f} "
+            f"{entry['first_mask_sec']:>11.2f} {entry['peak_rss_mb']:>12}"
+        )
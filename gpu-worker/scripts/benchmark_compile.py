@@ -0,0 +1,110 @@
+"""Compare startup time and steady-state latency of segmenter execution modes.
+
+Usage:
+    python scripts/benchmark_compile.py --image sample.jpg              # real SAM3 model
+    python scripts/benchmark_compile.py --tiny --modes eager compiled   # CPU stand-in model
+
+For each execution mode (eager / inference / compiled) a fresh segmenter is built
+and the report shows:
+- load: model build time
+- first call: first segment_concepts() (includes torch.compile, or an Inductor
+  cache load when COMPILE_CACHE_DIR already holds artifacts from a previous run)
+- steady state: mean / p50 / p95 latency of the following calls
+
+Run it twice against the same COMPILE_CACHE_DIR to see the warm-cache startup
+that a restarted container gets.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import numpy as np
+from PIL import Image
+
+
+def _sync() -> None:
+    """Wait for queued GPU work so timings are wall-clock accurate."""
+    import torch
+
+    if torch.cuda.is_available():
+        torch.cuda.synchronize()
+
+
+def measure(build, image: Image.Image, prompts: list[str], repeats: int) -> dict:
+    """Build a segmenter and time its first and steady-state segment_concepts() calls."""
+    start = time.perf_counter()
+    segmenter = build()
+    load_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    segmenter.segment_concepts(image, prompts)
+    _sync()
+    first_call = time.perf_counter() - start
+
+    latencies = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        segmenter.segment_concepts(image, prompts)
+        _sync()
+        latencies.append(time.perf_counter() - start)
+
+    return {
+        "load_sec": round(load_seconds, 3),
+        "first_call_sec": round(first_call, 3),
+        "startup_sec": round(load_seconds + first_call, 3),
+        "steady_mean_ms": round(float(np.mean(latencies)) * 1000, 2),
+        "steady_p50_ms": round(float(np.percentile(latencies, 50)) * 1000, 2),
+        "steady_p95_ms": round(float(np.percentile(latencies, 95)) * 1000, 2),
+        "compiled_targets": list(segmenter.compiled_targets),
+    }
+
+
+def format_report(report: dict) -> str:
+    """Render per-mode measurements as a text table."""
+    lines = [f"{'mode':<10} {'load s':>7} {'1st call s':>11} {'startup s':>10} "
+             f"{'mean ms':>8} {'p50 ms':>8} {'p95 ms':>8}"]
+    for mode, entry in report.items():
+        lines.append(
+            f"{mode:<10} {entry['load_sec']:>7.2f} {entry['first_call_sec']:>11.2f} "
+            f"{entry['startup_sec']:>10.2f} {entry['steady_mean_ms']:>8.2f} "
+            f"{entry['steady_p50_ms']:>8.2f} {entry['steady_p95_ms']:>8.2f}"
+        )
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    from presets import preset_prompts
+
+    parser = argparse.ArgumentParser(
+        description="Startup vs steady-state latency per execution mode"
+    )
+    parser.add_argument("--image", type=str, default=None, help="Input image (default: synthetic)")
+    parser.add_argument("--tiny", action="store_true", help="Use the CPU stand-in model")
+    parser.add_argument("--modes", nargs="+", default=["eager", "inference", "compiled"])
+    parser.add_argument("--num-prompts", type=int, default=8, help="Prompts per call")
+    parser.add_argument("--repeats", type=int, default=20, help="Steady-state calls per mode")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+
+    if args.image:
+        image = Image.open(args.image).convert("RGB")
+    else:
+        image = Image.new("RGB", (640, 480), (120, 90, 60))
+    prompts = preset_prompts()[:args.num_prompts]
+
+    if args.tiny:
+        from precision_check import build_tiny_segmenter as build_segmenter
+    else:
+        from engine.segmenter import SAM3Segmenter as build_segmenter
+
+    report = {
+        mode: measure(lambda: build_segmenter(execution_mode=mode), image, prompts, args.repeats)
+        for mode in args.modes
+    }
+
+    print(json.dumps(report, indent=2) if args.json else format_report(report))
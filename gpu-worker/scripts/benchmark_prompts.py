@@ -0,0 +1,59 @@
+"""Benchmark batched multi-prompt decoding.
+
+Usage:
+    python scripts/benchmark_prompts.py --image sample.jpg --repeats 5
+
+Segments the image with the preset prompts (presets.preset_prompts()) at
+max_prompts_per_batch = 1..16 and reports prompts/second for each batch size,
+from the text_encode + decode phases of segment_concepts() timings_ms.
+Requires the SAM3 model (MODEL_CHECKPOINT / BPE_PATH) and a GPU.
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from PIL import Image
+
+
+def benchmark(image_path: str, batch_sizes: list[int], repeats: int, num_prompts: int) -> None:
+    """Report decode throughput (prompts/second) per max_prompts_per_batch."""
+    from engine.registry import get_segmenter
+    from presets import preset_prompts
+
+    segmenter = get_segmenter()
+    # Sync the device at phase boundaries so timings_ms holds GPU time per phase
+    segmenter.profile = True
+    prompts = preset_prompts()[:num_prompts]
+    image = Image.open(image_path).convert("RGB")
+    print(f"Image {image.size}, {len(prompts)} prompts, {repeats} repeats")
+
+    for batch_size in batch_sizes:
+        segmenter.max_prompts_per_batch = batch_size
+
+        # Warmup (kernel selection, allocator growth, text-embedding cache)
+        segmenter.segment_concepts(image, prompts)
+
+        decode_seconds = 0.0
+        for _ in range(repeats):
+            results = segmenter.segment_concepts(image, prompts)
+            timings = next(iter(results.values()))[1]["timings_ms"]
+            decode_seconds += (timings.get("text_encode", 0.0) + timings["decode"]) / 1000
+
+        throughput = len(prompts) * repeats / decode_seconds
+        print(
+            f"batch={batch_size:2d}  {throughput:8.1f} prompts/s  "
+            f"({decode_seconds / repeats * 1000:.1f} ms decode/run)"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark batched prompt decoding")
+    parser.add_argument("--image", type=str, required=True, help="Input image path")
+    parser.add_argument("--repeats", type=int, default=5, help="Timed runs per batch size")
+    parser.add_argument("--num-prompts", type=int, default=16, help="Prompts per run")
+    parser.add_argument("--max-batch", type=int, default=16, help="Largest batch size to test")
+    args = parser.parse_args()
+    benchmark(args.image, list(range(1, args.max_batch + 1)), args.repeats, args.num_prompts)
@@ -1,52 +1,94 @@
 """Convert SAM3 model weights to different formats.
 
 Usage:
+    python scripts/convert_model.py --input ../cf-backend/weights/sam3.pt --format safetensors
     python scripts/convert_model.py --input ../cf-backend/weights/sam3.pt --format fp16
+    python scripts/convert_model.py --input ../cf-backend/weights/sam3.pt --format onnx
+    python scripts/convert_model.py --input ../cf-backend/weights/sam3.pt --format int8
 
-TODO: 실제 SAM3 모델 변환 로직 구현.
+safetensors / fp16 write sam3.safetensors / sam3_fp16.safetensors next to the
+input. Point MODEL_CHECKPOINT at the result: SAM3Segmenter loads it memory-mapped.
+
+onnx writes a sam3_onnx/ directory (image encoder, text encoder, decoder graphs +
+manifest.json). Point MODEL_CHECKPOINT at the directory to segment with
+onnxruntime on CPU (engine.onnx_backend); compare against torch with
+scripts/backend_check.py.
+
+int8 adds dynamically quantized graphs (linear layer weights in int8) to an ONNX
+export, exporting sam3_onnx/ first when the input is a checkpoint. The fp32 graphs
+are kept; MODEL_PRECISION=int8 selects the quantized ones. Check accuracy and
+latency against fp32 with scripts/precision_check.py --onnx-dir ... --precisions fp32 int8.
+
+TODO: tensorrt 변환 구현.
 """
 
 import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
 
 
-def convert_model(input_path: str, output_format: str) -> None:
+def convert_model(input_path: str, output_format: str, output_path: str = None) -> None:
     """모델 가중치 변환.
 
     Supported formats:
-    - fp16: FP32 → FP16 (메모리 절약)
-    - onnx: PyTorch → ONNX (추론 최적화)
-    - tensorrt: PyTorch → TensorRT (NVIDIA 최적화)
-
-    TODO:
-    1. PyTorch 모델 로드
-    2. 변환 실행
-    3. 변환된 가중치 저장
+    - safetensors: sam3.pt → safetensors (mmap 로딩, cold start 단축)
+    - fp16: sam3.pt → FP16 safetensors (파일 크기/IO 절반)
+    - onnx: PyTorch → ONNX graphs (onnxruntime CPU backend)
+    - int8: ONNX graphs → dynamic int8 quantized linear layers (CPU)
+    - tensorrt: PyTorch → TensorRT (NVIDIA 최적화) — TODO
     """
-    # import torch
-    #
-    # if output_format == "fp16":
-    #     model = torch.load(input_path, map_location="cpu")
-    #     model = model.half()
-    #     output_path = input_path.replace(".pt", "_fp16.pt")
-    #     torch.save(model, output_path)
-    #     print(f"Saved FP16 model to {output_path}")
-    #
-    # elif output_format == "onnx":
-    #     # torch.onnx.export(...)
-    #     pass
+    if output_format in ("safetensors", "fp16"):
+        from engine.checkpoint import convert_checkpoint
+
+        dtype = "fp16" if output_format == "fp16" else None
+        written = convert_checkpoint(input_path, output_path, dtype=dtype)
+        size_mb = os.path.getsize(written) / (1024 * 1024)
+        print(f"Saved {output_format} checkpoint to {written} ({size_mb:.0f} MB)")
+        return
+
+    if output_format == "onnx":
+        from engine.onnx_backend import export_sam3_onnx
+
+        written = export_sam3_onnx(input_path, output_path)
+        print(f"Saved ONNX model to {written}")
+        return
+
+    if output_format == "int8":
+        from engine.onnx_backend import export_sam3_onnx, is_onnx_model, quantize_onnx
+
+        if is_onnx_model(input_path):
+            model_dir = input_path
+        else:
+            model_dir = export_sam3_onnx(input_path, output_path)
+        quantize_onnx(model_dir)
+        print(f"Saved int8 ONNX graphs to {model_dir} (MODEL_PRECISION=int8)")
+        return
 
     print(f"TODO: Convert {input_path} to {output_format}")
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Convert SAM3 model weights")
-    parser.add_argument("--input", type=str, required=True, help="Input weights path")
+    parser.add_argument(
+        "--input",
+        type=str,
+        required=True,
+        help="Input weights path (or ONNX export dir for int8)",
+    )
     parser.add_argument(
         "--format",
         type=str,
-        choices=["fp16", "onnx", "tensorrt"],
-        default="fp16",
+        choices=["safetensors", "fp16", "onnx", "int8", "tensorrt"],
+        default="safetensors",
         help="Output format",
     )
+    parser.add_argument(
+        "--output",
+        type=str,
+        default=None,
+        help="Output path (default: next to input)",
+    )
     args = parser.parse_args()
-    convert_model(args.input, args.format)
+    convert_model(args.input, args.format, args.output)
@@ -0,0 +1,216 @@
+"""Check mask drift and speedup of reduced-precision inference.
+
+Usage:
+    python scripts/precision_check.py --tiny                      # CPU, stand-in model
+    python scripts/precision_check.py --images a.jpg b.jpg        # real SAM3 model
+    python scripts/precision_check.py --tiny --precisions fp32 bf16 --json
+    python scripts/precision_check.py --onnx-dir sam3_onnx --precisions fp32 int8 --legacy-prompts
+
+Runs the same image/prompt corpus in every precision mode (fp32 baseline, then
+bf16 / fp16 autocast, int8 dynamic quantization) and reports, per mode, seconds
+per corpus pass, speedup, mean/min mask IoU against fp32 and instance-count
+mismatches.
+
+--onnx-dir runs the onnxruntime CPU backend (int8 needs convert_model.py
+--format int8 first). --legacy-prompts uses every docs/legacy-prompts.json
+prompt instead of the first --num-prompts preset prompts.
+
+--tiny uses a small randomly initialized model with the SAM3 interface, so the
+harness itself runs on CPU without the checkpoint or the sam3 package (torch is
+still required). Without --images a synthetic corpus is generated.
+"""
+
+import argparse
+import json
+import os
+import sys
+import zlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import numpy as np
+from PIL import Image
+
+# Encoder input side of the tiny stand-in model
+TINY_INPUT_SIZE = 64
+
+
+def build_tiny_segmenter(seed: int = 0, **options):
+    """SAM3Segmenter around a small CPU stand-in for the SAM3 image model.
+
+    options are passed to SAM3Segmenter.from_model (precision, execution_mode, ...).
+    """
+    import torch
+    from torch import nn
+
+    from engine.segmenter import SAM3Segmenter
+
+    dim, num_queries, seq, size = 32, 8, 4, TINY_INPUT_SIZE
+    torch.manual_seed(seed)
+
+    class TinyBackbone(nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.vision = nn.Sequential(
+                nn.Conv2d(3, dim, 4, stride=4), nn.GELU(), nn.Conv2d(dim, dim, 3, padding=1)
+            )
+            self.tokens = nn.Embedding(1024, dim)
+            self.text = nn.Sequential(nn.Linear(dim, dim), nn.GELU(), nn.Linear(dim, dim))
+            self.context_length = seq
+
+        @staticmethod
+        def tokenizer(prompts, context_length=seq):
+            return torch.tensor(
+                [
+                    [zlib.crc32(f"{p}:{i}".encode()) % 1024 for i in range(context_length)]
+                    for p in prompts
+                ]
+            )
+
+        def forward_image(self, pixels):
+            return {"vision_features": self.vision(pixels)}
+
+        def forward_text(self, prompts, device=None):
+            ids = self.tokenizer(prompts, context_length=self.context_length)
+            if device is not None:
+                ids = ids.to(device)
+            features = self.text(self.tokens(ids)).transpose(0, 1)  # [seq, N, D]
+            return {
+                "language_features": features,
+                "language_mask": torch.zeros(len(prompts), seq, dtype=torch.bool, device=device),
+                "language_embeds": features,
+            }
+
+    class TinySam3(nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.backbone = TinyBackbone()
+            self.queries = nn.Parameter(torch.randn(num_queries, dim))
+            self.mix = nn.Linear(2 * dim, dim)
+            self.score = nn.Linear(dim, 1)
+            self.presence = nn.Linear(dim, 1)
+            self.box = nn.Linear(dim, 4)
+
+        def _get_dummy_prompt(self, num_prompts=1):
+            return None
+
+        def forward_grounding(self, backbone_out, find_input, geometric_prompt, find_target=None):
+            vision = backbone_out["vision_features"][find_input.img_ids]  # [Q, D, h, w]
+            text = backbone_out["language_features"].mean(0)[find_input.text_ids]  # [Q, D]
+            pooled = vision.mean(dim=(2, 3))
+            hidden = torch.tanh(self.mix(torch.cat([pooled, text], dim=-1)))  # [Q, D]
+            queries = self.queries[None] + hidden[:, None]  # [Q, NQ, D]
+            return {
+                "pred_logits": 3 * self.score(queries),
+                "presence_logit_dec": self.presence(hidden) + 3.0,
+                "pred_masks": torch.einsum("qnd,qdhw->qnhw", queries, vision) / dim**0.5,
+                "pred_boxes": torch.sigmoid(self.box(queries)),
+            }
+
+    class TinyProcessor:
+        device = "cpu"
+
+        def __init__(self, model):
+            self.model = model
+
+        def _pixels(self, images):
+            # Same resize + normalization as Sam3Processor (and the ONNX backend)
+            arrays = [
+                np.asarray(image.convert("RGB").resize((size, size), Image.BILINEAR),
+                           dtype=np.float32)
+                for image in images
+            ]
+            normalized = (np.stack(arrays) / 255.0 - 0.5) / 0.5
+            return torch.from_numpy(normalized).float().permute(0, 3, 1, 2)
+
+        def set_image(self, image, state=None):
+            return {
+                "original_height": image.size[1],
+                "original_width": image.size[0],
+                "backbone_out": self.model.backbone.forward_image(self._pixels([image])),
+            }
+
+        def set_image_batch(self, images, state=None):
+            return {
+                "original_heights": [image.size[1] for image in images],
+                "original_widths": [image.size[0] for image in images],
+                "backbone_out": self.model.backbone.forward_image(self._pixels(images)),
+            }
+
+    model = TinySam3().eval()
+    return SAM3Segmenter.from_model(
+        model, TinyProcessor(model), checkpoint_path="tiny-sam3", **options
+    )
+
+
+def synthetic_images(count: int, size: tuple[int, int] = (160, 120)) -> list[Image.Image]:
+    """Deterministic gradient + block images."""
+    rng = np.random.default_rng(0)
+    images = []
+    for _ in range(count):
+        width, height = size
+        base = np.linspace(0, 255, width, dtype=np.float32)[None, :, None] * rng.random(3)
+        pixels = np.broadcast_to(base, (height, width, 3)).copy()
+        x, y = rng.integers(0, width // 2), rng.integers(0, height // 2)
+        pixels[y:y + height // 3, x:x + width // 3] = rng.integers(0, 255, 3)
+        images.append(Image.fromarray(pixels.astype(np.uint8)))
+    return images
+
+
+def _sync() -> None:
+    """Wait for queued GPU work so timings are wall-clock accurate."""
+    import torch
+
+    if torch.cuda.is_available():
+        torch.cuda.synchronize()
+
+
+if __name__ == "__main__":
+    from engine.precision_check import compare_precisions, format_report
+    from presets import preset_prompts
+
+    parser = argparse.ArgumentParser(
+        description="Compare mask IoU drift and speed across precision modes"
+    )
+    parser.add_argument("--tiny", action="store_true", help="Use the CPU stand-in model")
+    parser.add_argument(
+        "--images", nargs="*", default=None, help="Corpus image paths (default: synthetic)"
+    )
+    parser.add_argument("--num-images", type=int, default=4, help="Synthetic corpus size")
+    parser.add_argument("--num-prompts", type=int, default=8, help="Preset prompts per image")
+    parser.add_argument("--onnx-dir", type=str, default=None, help="ONNX export dir (CPU backend)")
+    parser.add_argument("--threads", type=int, default=None, help="onnxruntime intra-op threads")
+    parser.add_argument(
+        "--legacy-prompts", action="store_true", help="Use the docs/legacy-prompts.json corpus"
+    )
+    parser.add_argument("--precisions", nargs="+", default=["fp32", "bf16", "fp16"])
+    parser.add_argument("--repeats", type=int, default=3, help="Timed passes per mode")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+
+    if args.tiny:
+        segmenter = build_tiny_segmenter()
+    elif args.onnx_dir:
+        from engine.onnx_backend import load_onnx_segmenter
+
+        segmenter = load_onnx_segmenter(args.onnx_dir, num_threads=args.threads)
+    else:
+        from engine.registry import get_segmenter
+
+        segmenter = get_segmenter()
+
+    if args.images:
+        images = [Image.open(path).convert("RGB") for path in args.images]
+    else:
+        images = synthetic_images(args.num_images)
+
+    if args.legacy_prompts:
+        from engine.resolution_check import load_prompt_categories
+
+        categories = load_prompt_categories()
+        prompts = list(dict.fromkeys(p for group in categories.values() for p in group))
+    else:
+        prompts = preset_prompts()[:args.num_prompts]
+
+    report = compare_precisions(segmenter, images, prompts, args.precisions, args.repeats, _sync)
+    print(json.dumps(report, indent=2) if args.json else format_report(report))
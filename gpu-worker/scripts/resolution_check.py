@@ -0,0 +1,55 @@
+"""Report mask quality of downscaled encoding against native resolution.
+
+Usage:
+    python scripts/resolution_check.py --images phone1.jpg phone2.jpg
+    python scripts/resolution_check.py --images phone1.jpg --sides 1008 1536 --modes nearest
+
+Segments every image with every docs/legacy-prompts.json prompt at native
+resolution, then with each max_input_side / mask_upsample combination, and
+prints seconds, speedup and mask IoU vs native per prompt category.
+Encoder cost does not change with the side (SAM3 always encodes 1008x1008), so
+any speedup comes from smaller mask decoding / transfer in nearest mode; the
+report says so in its header.
+--tiny runs the CPU stand-in model on synthetic 4000x3000 images.
+"""
+
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from PIL import Image
+
+if __name__ == "__main__":
+    from engine.resolution_check import compare_resolutions, format_report, load_prompt_categories
+
+    parser = argparse.ArgumentParser(
+        description="Mask IoU of downscaled encoding vs native resolution"
+    )
+    parser.add_argument("--images", nargs="*", default=None, help="Full-resolution photos")
+    parser.add_argument("--tiny", action="store_true", help="Use the CPU stand-in model")
+    parser.add_argument("--sides", nargs="+", type=int, default=[1008, 1536, 2048])
+    parser.add_argument("--modes", nargs="+", default=["nearest", "bilinear"])
+    parser.add_argument("--prompts", type=str, default=None, help="Prompt categories JSON")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+
+    if args.tiny:
+        from precision_check import build_tiny_segmenter, synthetic_images
+
+        segmenter = build_tiny_segmenter()
+    else:
+        from engine.registry import get_segmenter
+
+        segmenter = get_segmenter()
+
+    if args.images:
+        images = [Image.open(path).convert("RGB") for path in args.images]
+    else:
+        images = synthetic_images(2, size=(4000, 3000))
+
+    categories = load_prompt_categories(args.prompts) if args.prompts else load_prompt_categories()
+    report = compare_resolutions(segmenter, images, categories, args.sides, args.modes)
+    print(json.dumps(report, indent=2) if args.json else format_report(report))
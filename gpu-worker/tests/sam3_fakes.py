@@ -0,0 +1,155 @@
+"""
+Test doubles for SAM3 inference without torch / sam3 installed
+
+- make_fake_torch(): MagicMock torch whose tensor math is backed by numpy
+- FakeSam3Model: deterministic stand-in for the SAM3 image model
+  (backbone.forward_text, forward_grounding, _get_dummy_prompt; no pred_masks
+  while segmentation_head is None)
+- make_fake_processor(): stand-in for Sam3Processor.set_image / set_image_batch
+- FakeFindStage: records img_ids / text_ids like sam3's FindStage
+
+Grounding outputs for a query depend only on its prompt's text features and its
+image's features, so batched and sequential decoding must produce identical results.
+"""
+
+import zlib
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+import numpy as np
+
+NUM_QUERIES = 5
+LOW_RES = 8
+TEXT_SEQ = 4
+TEXT_DIM = 8
+
+
+class FakeTensor:
+    """Stand-in for torch.Tensor type checks (fakes return numpy arrays)"""
+
+
+def _interpolate(x, size, mode="bilinear", align_corners=False):
+    """Nearest-neighbour resize of [N, C, h, w] arrays (enough for shape logic)"""
+    height, width = size
+    rows = np.arange(height) * x.shape[-2] // height
+    cols = np.arange(width) * x.shape[-1] // width
+    return x[..., rows[:, None], cols[None, :]]
+
+
+def make_fake_torch() -> MagicMock:
+    """MagicMock torch module with numpy-backed math used by the segmenter"""
+    fake = MagicMock()
+    fake.Tensor = FakeTensor
+    fake.long = np.int64
+    fake.sigmoid = lambda x: 1.0 / (1.0 + np.exp(-np.asarray(x, dtype=np.float64)))
+    fake.stack = lambda xs, dim=0: np.stack(xs, axis=dim)
+    fake.cat = lambda xs, dim=0: np.concatenate(xs, axis=dim)
+    fake.clone = lambda x: x.copy()
+    fake.tensor = lambda data, dtype=np.float64, **kwargs: np.asarray(data, dtype=dtype)
+    fake.zeros = lambda n, **kwargs: np.zeros(n, dtype=np.int64)
+    fake.arange = lambda n, **kwargs: np.arange(n, dtype=np.int64)
+    fake.nn.functional.interpolate = _interpolate
+    return fake
+
+
+def _prompt_features(prompt: str) -> np.ndarray:
+    """Deterministic [TEXT_SEQ, TEXT_DIM] features for a prompt"""
+    rng = np.random.default_rng(zlib.crc32(prompt.encode()))
+    return rng.normal(size=(TEXT_SEQ, TEXT_DIM))
+
+
+class _FakeBackbone:
+    def __init__(self, model):
+        self._model = model
+
+    def forward_text(self, prompts, device=None):
+        self._model.text_batches.append(list(prompts))
+        features = np.stack([_prompt_features(p) for p in prompts], axis=1)  # [seq, N, D]
+        return {
+            "language_features": features,
+            "language_mask": np.zeros((len(prompts), TEXT_SEQ), dtype=bool),  # [N, seq]
+            "language_embeds": features.copy(),
+        }
+
+
+class FakeFindStage(SimpleNamespace):
+    """sam3.model.data_misc.FindStage stand-in (keeps constructor kwargs)"""
+
+
+class FakeSam3Model:
+    """Deterministic SAM3 stand-in recording decoder batch sizes"""
+
+    def __init__(self):
+        self.backbone = _FakeBackbone(self)
+        self.segmentation_head = SimpleNamespace()
+        self.text_batches = []
+        self.grounding_batches = []
+        self.mask_batches = []
+        self.device = "cpu"
+
+    def parameters(self):
+        yield SimpleNamespace(device=self.device)
+
+    def _get_dummy_prompt(self, num_prompts=1):
+        return {"num_prompts": num_prompts}
+
+    def forward_grounding(self, backbone_out, find_input, geometric_prompt, find_target=None):
+        features = backbone_out["language_features"]
+        vision = backbone_out["vision_features"]
+        num_queries = len(find_input.img_ids)
+        self.grounding_batches.append(num_queries)
+        if self.segmentation_head is not None:
+            self.mask_batches.append(num_queries)
+
+        logits, presence, masks, boxes = [], [], [], []
+        for img, text in zip(find_input.img_ids, find_input.text_ids):
+            query_features = np.concatenate([features[:, text].ravel(), vision[img].ravel()])
+            seed = zlib.crc32(np.round(query_features, 6).tobytes())
+            rng = np.random.default_rng(seed)
+            logits.append(rng.normal(scale=3.0, size=(NUM_QUERIES, 1)))
+            presence.append(np.array([2.0]))
+            masks.append(rng.normal(size=(NUM_QUERIES, LOW_RES, LOW_RES)))
+            boxes.append(rng.uniform(0.1, 0.5, size=(NUM_QUERIES, 4)))
+
+        outputs = {
+            "pred_logits": np.stack(logits),
+            "presence_logit_dec": np.stack(presence),
+            "pred_boxes": np.stack(boxes),
+        }
+        if self.segmentation_head is not None:
+            outputs["pred_masks"] = np.stack(masks)
+        return outputs
+
+
+def _vision_features(image) -> np.ndarray:
+    """Per-image features derived from pixel content (channel means)"""
+    pixels = np.asarray(image.convert("RGB"), dtype=np.float64)
+    return pixels.mean(axis=(0, 1)) / 255.0
+
+
+def make_fake_processor() -> MagicMock:
+    """Sam3Processor stand-in: set_image / set_image_batch return image state dicts"""
+    processor = MagicMock()
+    processor.device = "cpu"
+    processor.image_batches = []
+
+    def set_image(image, state=None):
+        width, height = image.size
+        processor.image_batches.append(1)
+        return {
+            "original_height": height,
+            "original_width": width,
+            "backbone_out": {"vision_features": _vision_features(image)[None]},
+        }
+
+    def set_image_batch(images, state=None):
+        processor.image_batches.append(len(images))
+        return {
+            "original_heights": [image.size[1] for image in images],
+            "original_widths": [image.size[0] for image in images],
+            "backbone_out": {"vision_features": np.stack([_vision_features(i) for i in images])},
+        }
+
+    processor.set_image.side_effect = set_image
+    processor.set_image_batch.side_effect = set_image_batch
+    return processor
@@ -8,6 +8,7 @@ Tests verify:
 - Output is PIL Image with correct format
 - Multi-instance mask handling
 - Edge cases (missing concepts, invalid colors, dimension mismatches)
+- CompactMask masks and protect masks match dense results
 """
 
 import os
@@ -20,6 +21,7 @@ import sys
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
 
 from engine.applier import apply_rules, _parse_color, _normalize_mask
+from engine.compact_mask import CompactMask
 
 
 @pytest.fixture
@@ -524,3 +526,47 @@ class TestApplyRulesIntegration:
         # Result should be RGB
         assert result.mode == "RGB"
         assert isinstance(result, Image.Image)
+
+
+class TestApplyRulesCompactMasks:
+    """Test apply_rules() with CompactMask inputs"""
+
+    def test_compact_matches_dense(self, test_image, multi_instance_masks):
+        """Test compact instance masks produce the same image as dense masks"""
+        concepts = {"Floor": {"action": "recolor", "value": "#3366CC"}}
+        compact = [CompactMask.from_dense(m) for m in multi_instance_masks]
+
+        dense_result = apply_rules(test_image, {"Floor": multi_instance_masks}, concepts)
+        compact_result = apply_rules(test_image, {"Floor": compact}, concepts)
+
+        np.testing.assert_array_equal(np.array(compact_result), np.array(dense_result))
+
+    def test_single_compact_mask(self, test_image, simple_mask):
+        concepts = {"Floor": {"action": "recolor", "value": "#0000FF"}}
+
+        result = apply_rules(test_image, {"Floor": CompactMask.from_dense(simple_mask)}, concepts)
+
+        assert tuple(np.array(result)[25, 25]) == (0, 0, 255)
+        assert tuple(np.array(result)[75, 75]) == (255, 0, 0)
+
+    @pytest.mark.parametrize("compact_protect", [False, True])
+    def test_protect_with_compact_masks(self, test_image, simple_mask, protect_mask,
+                                        compact_protect):
+        """Test dense and compact protect masks are honoured by compact and dense masks"""
+        concepts = {"Floor": {"action": "recolor", "value": "#0000FF"}}
+        protect = CompactMask.from_dense(protect_mask) if compact_protect else protect_mask
+
+        expected = apply_rules(test_image, {"Floor": simple_mask}, concepts, protect_mask)
+        for masks in ({"Floor": [CompactMask.from_dense(simple_mask)]}, {"Floor": simple_mask}):
+            result = apply_rules(test_image, masks, concepts, protect)
+            np.testing.assert_array_equal(np.array(result), np.array(expected))
+
+        assert tuple(np.array(expected)[10, 10]) == (255, 0, 0)
+
+    def test_compact_mask_size_mismatch_skipped(self, test_image):
+        mask = np.ones((50, 50), dtype=bool)
+        concepts = {"Floor": {"action": "recolor", "value": "#0000FF"}}
+
+        result = apply_rules(test_image, {"Floor": [CompactMask.from_dense(mask)]}, concepts)
+
+        np.testing.assert_array_equal(np.array(result), np.array(test_image))
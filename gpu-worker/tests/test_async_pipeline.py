@@ -0,0 +1,263 @@
+"""
+Integration tests for the asyncio pipeline with all mocks
+
+Tests verify:
+- process_job_async matches process_job results (items, callbacks, uploads)
+- Network concurrency (io_concurrency) is independent of batch_concurrency
+- Per-item failures send failure callbacks and do not stop other items
+- Per-stage stats in the result summary
+- run_async_job works with and without a running event loop
+- Runpod adapter dispatches on PIPELINE_ENGINE
+"""
+
+import asyncio
+import io
+import os
+import sys
+import threading
+import time
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import numpy as np
+import pytest
+from PIL import Image
+
+# Add parent directory to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from engine.async_pipeline import process_job_async, run_async_job
+from engine.mask_cache import MaskCache
+from engine.pipeline import STAGE_NAMES
+
+
+@pytest.fixture(autouse=True)
+def mask_cache():
+    """Fresh memory-only mask cache per test (no cross-test hits, no disk writes)"""
+    cache = MaskCache(disk_dir=None)
+    with patch('engine.pipeline.get_mask_cache', return_value=cache):
+        yield cache
+
+
+@pytest.fixture
+def mock_env():
+    env_vars = {
+        "GPU_CALLBACK_SECRET": "test-callback-secret",
+        "LOG_LEVEL": "ERROR",
+    }
+    with patch.dict(os.environ, env_vars, clear=False):
+        yield env_vars
+
+
+@pytest.fixture
+def photos():
+    """Distinct JPEG photos keyed by input_key"""
+    result = {}
+    for i in range(6):
+        buffer = io.BytesIO()
+        Image.new("RGB", (100, 100), (40 * i, 100, 200)).save(buffer, format="JPEG")
+        result[f"in/{i}.jpg"] = buffer.getvalue()
+    return result
+
+
+@pytest.fixture
+def mock_segmenter():
+    """Shared segmenter mock returning one full-image mask per prompt"""
+    with patch('engine.pipeline.get_segmenter') as mock_get_segmenter:
+        segmenter = MagicMock()
+        segmenter.confidence_threshold = 0.5
+        segmenter.model_version = "sam3.pt:test:fp32"
+
+        def segment_concepts(image, prompts, merge=()):
+            mask = np.ones((100, 100), dtype=bool)
+            return {
+                p: ([mask], {"concept": p, "instance_count": 1, "scores": [0.95]})
+                for p in prompts
+            }
+
+        segmenter.segment_concepts.side_effect = segment_concepts
+        mock_get_segmenter.return_value = segmenter
+        yield segmenter
+
+
+@pytest.fixture
+def mock_r2_client(photos):
+    with patch('engine.async_pipeline.R2Client') as mock_client_class:
+        client = MagicMock()
+        client.download.side_effect = lambda key: photos[key]
+        client.upload.return_value = None
+        mock_client_class.return_value = client
+        yield client
+
+
+@pytest.fixture
+def mock_report():
+    with patch('engine.async_pipeline.report_async', new_callable=AsyncMock) as report:
+        report.return_value = True
+        yield report
+
+
+def make_job(count: int = 3, **extra) -> dict:
+    job = {
+        "job_id": "job-async",
+        "user_id": "user-abc",
+        "concepts": {"Floor": {"action": "recolor", "value": "#FF5733"}},
+        "protect": [],
+        "items": [
+            {
+                "idx": i,
+                "input_key": f"in/{i}.jpg",
+                "output_key": f"out/{i}.png",
+                "preview_key": f"prev/{i}.jpg",
+            }
+            for i in range(count)
+        ],
+        "callback_url": "https://api.workers.dev/jobs/job-async/callback",
+        "batch_concurrency": 2,
+    }
+    job.update(extra)
+    return job
+
+
+class TestProcessJobAsync:
+    """Test asyncio pipeline end to end"""
+
+    def test_all_items_processed(self, mock_env, mock_segmenter, mock_r2_client, mock_report):
+        """Test every item is segmented, uploaded and reported"""
+        result = asyncio.run(process_job_async(make_job(3)))
+
+        assert result["total_items"] == 3
+        assert result["successful_items"] == 3
+        assert result["failed_items"] == 0
+        assert mock_segmenter.segment_concepts.call_count == 3
+
+        upload_keys = sorted(c[0][0] for c in mock_r2_client.upload.call_args_list)
+        for i in range(3):
+            assert f"out/{i}.png" in upload_keys
+            assert f"prev/{i}.jpg" in upload_keys
+
+        completed = [c for c in mock_report.call_args_list if c.kwargs["status"] == "completed"]
+        assert sorted(c.kwargs["idx"] for c in completed) == [0, 1, 2]
+        assert completed[0].kwargs["output_key"].startswith("out/")
+
+    def test_empty_items(self, mock_env, mock_segmenter, mock_r2_client, mock_report):
+        """Test a job without items returns immediately"""
+        result = asyncio.run(process_job_async(make_job(0)))
+
+        assert result == {"total_items": 0, "successful_items": 0, "failed_items": 0, "errors": []}
+
+    def test_download_failure_isolated(self, mock_env, mock_segmenter, mock_r2_client,
+                                       mock_report, photos):
+        """Test a missing photo fails only its item, with a failure callback"""
+        del photos["in/1.jpg"]
+
+        result = asyncio.run(process_job_async(make_job(3)))
+
+        assert result["successful_items"] == 2
+        assert result["failed_items"] == 1
+        failed = [c for c in mock_report.call_args_list if c.kwargs["status"] == "failed"]
+        assert [c.kwargs["idx"] for c in failed] == [1]
+        assert result["stages"]["download"]["failed"] == 1
+
+    def test_segmenter_failure_fails_all(self, mock_env, mock_r2_client, mock_report):
+        """Test a failed segmenter build fails every item and is not retried"""
+        failure = RuntimeError("Failed to load SAM3 model")
+        with patch('engine.pipeline.get_segmenter', side_effect=failure) as get:
+            result = asyncio.run(process_job_async(make_job(3)))
+
+        get.assert_called_once()
+        assert result["failed_items"] == 3
+        assert any("Failed to initialize SAM3 segmenter" in e for e in result["errors"])
+
+    def test_stage_stats(self, mock_env, mock_segmenter, mock_r2_client, mock_report):
+        """Test summary reports every stage like the threaded pipeline"""
+        result = asyncio.run(process_job_async(make_job(3, io_concurrency=5)))
+
+        assert list(result["stages"]) == list(STAGE_NAMES)
+        assert result["stages"]["download"]["workers"] == 5
+        assert result["stages"]["apply"]["workers"] == 2
+        assert result["stages"]["segment"]["workers"] == 1
+        for stats in result["stages"].values():
+            assert stats["processed"] == 3
+
+    def test_io_concurrency_exceeds_batch_concurrency(self, mock_env, mock_segmenter,
+                                                      mock_r2_client, mock_report, photos):
+        """Test downloads overlap beyond batch_concurrency"""
+        active = []
+        peak = [0]
+        lock = threading.Lock()
+
+        def slow_download(key):
+            with lock:
+                active.append(key)
+                peak[0] = max(peak[0], len(active))
+            time.sleep(0.05)
+            with lock:
+                active.remove(key)
+            return photos[key]
+
+        mock_r2_client.download.side_effect = slow_download
+
+        asyncio.run(process_job_async(make_job(6, batch_concurrency=1, io_concurrency=6)))
+
+        assert peak[0] > 1
+
+    def test_identical_photos_segmented_once(self, mock_env, mock_segmenter, mock_r2_client,
+                                             mock_report, photos):
+        """Test byte-identical items share one segmentation"""
+        photos["in/1.jpg"] = photos["in/0.jpg"]
+        photos["in/2.jpg"] = photos["in/0.jpg"]
+
+        result = asyncio.run(process_job_async(make_job(3)))
+
+        assert mock_segmenter.segment_concepts.call_count == 1
+        assert result["successful_items"] == 3
+
+
+class TestRunAsyncJob:
+    """Test synchronous wrapper"""
+
+    def test_without_running_loop(self, mock_env, mock_segmenter, mock_r2_client, mock_report):
+        """Test wrapper runs the job from plain sync code"""
+        assert run_async_job(make_job(2))["successful_items"] == 2
+
+    def test_inside_running_loop(self, mock_env, mock_segmenter, mock_r2_client, mock_report):
+        """Test wrapper also works when called by a sync handler inside an event loop"""
+        async def runpod_worker_loop():
+            return run_async_job(make_job(2))
+
+        assert asyncio.run(runpod_worker_loop())["successful_items"] == 2
+
+
+class TestRunpodAdapterEngine:
+    """Test PIPELINE_ENGINE selection in the Runpod adapter"""
+
+    @pytest.fixture
+    def adapter(self):
+        from adapters import runpod_serverless
+        return runpod_serverless
+
+    def test_default_engine_is_asyncio(self, adapter):
+        """Test handler uses the asyncio pipeline by default"""
+        with patch.dict(os.environ, {}, clear=False), \
+                patch('engine.async_pipeline.run_async_job',
+                      return_value={"total_items": 1}) as run:
+            os.environ.pop("PIPELINE_ENGINE", None)
+            result = adapter.handler({"input": make_job(1)})
+
+        run.assert_called_once()
+        assert result == {"output": {"total_items": 1}}
+
+    def test_threads_engine(self, adapter):
+        """Test PIPELINE_ENGINE=threads uses process_job"""
+        with patch.dict(os.environ, {"PIPELINE_ENGINE": "threads"}), \
+                patch('engine.pipeline.process_job', return_value={"total_items": 1}) as run:
+            adapter.handler({"input": make_job(1)})
+
+        run.assert_called_once()
+
+    def test_unknown_engine(self, adapter):
+        """Test an unknown engine is reported as a handler error"""
+        with patch.dict(os.environ, {"PIPELINE_ENGINE": "bogus"}):
+            result = adapter.handler({"input": make_job(1)})
+
+        assert "Unknown PIPELINE_ENGINE" in result["error"]
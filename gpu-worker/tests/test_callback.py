@@ -9,18 +9,21 @@ Tests verify:
 - Error handling returns False instead of raising exceptions
 - Payload structure includes idx, status, and optional fields
 - Job ID extraction from callback URL
+- report_async sends the same request with an async client
 """
 
+import asyncio
 import os
-import pytest
+import sys
 import time
-from unittest.mock import Mock, patch, MagicMock
+from unittest.mock import AsyncMock, MagicMock, Mock, patch
+
 import httpx
+import pytest
 
 # Import the module under test
-import sys
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
-from engine.callback import report, _extract_job_id, _generate_idempotency_key
+from engine.callback import _extract_job_id, _generate_idempotency_key, report, report_async
 
 
 @pytest.fixture
@@ -539,3 +542,49 @@ class TestCallbackEdgeCases:
         call_args = mock_httpx_client.post.call_args
         payload = call_args[1]['json']
         assert "파일을 찾을 수 없습니다" in payload['error']
+
+
+@pytest.fixture
+def mock_async_client():
+    """Mock httpx.AsyncClient to avoid actual HTTP requests"""
+    with patch('engine.callback.httpx.AsyncClient') as mock_client_class:
+        mock_client = MagicMock()
+        mock_client.post = AsyncMock()
+        mock_client_class.return_value.__aenter__ = AsyncMock(return_value=mock_client)
+        mock_client_class.return_value.__aexit__ = AsyncMock(return_value=None)
+        yield mock_client
+
+
+class TestCallbackReportAsync:
+    """Test async callback used by the asyncio pipeline"""
+
+    def test_same_request_as_sync(self, mock_env, mock_httpx_client, mock_async_client):
+        """Test report_async posts the same payload and headers as report"""
+        mock_httpx_client.post.return_value = Mock(raise_for_status=Mock())
+        mock_async_client.post.return_value = Mock(raise_for_status=Mock())
+        kwargs = dict(
+            callback_url="https://api.workers.dev/jobs/job-123/callback",
+            idx=3, status="completed", output_key="out/3.png", preview_key="prev/3.jpg",
+            idempotency_key="job-123:3",
+        )
+
+        assert report(**kwargs) is True
+        assert asyncio.run(report_async(**kwargs)) is True
+
+        assert mock_async_client.post.call_args == mock_httpx_client.post.call_args
+
+    def test_retry_then_give_up(self, mock_env, mock_async_client):
+        """Test report_async retries once and returns False instead of raising"""
+        mock_async_client.post.side_effect = httpx.ConnectError("Connection refused")
+
+        with patch('engine.callback.asyncio.sleep', new_callable=AsyncMock) as mock_sleep:
+            result = asyncio.run(report_async(
+                callback_url="https://api.workers.dev/jobs/job-123/callback",
+                idx=0,
+                status="failed",
+                error="boom",
+            ))
+
+        assert result is False
+        assert mock_async_client.post.call_count == 2
+        mock_sleep.assert_awaited_once_with(1)
@@ -0,0 +1,176 @@
+"""
+Unit tests for checkpoint format helpers
+
+Tests verify:
+- safetensors detection by extension
+- sam3.pt → image-model state dict key mapping (model wrapper, detector prefix)
+- load_safetensors_into() copies tensors one by one and reports key mismatches
+- SAM3Segmenter builds without weights and loads .safetensors checkpoints itself
+  (no matching tensor = load error, missing weights = error log)
+"""
+
+import os
+import sys
+from types import ModuleType
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+import pytest
+
+# Add parent directory to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+# Mock torch and sam3 before importing engine modules
+sys.modules.setdefault('torch', MagicMock())
+for _name in ('sam3', 'sam3.model', 'sam3.model.sam3_image_processor', 'sam3.model.data_misc'):
+    sys.modules.setdefault(_name, MagicMock())
+
+from engine.checkpoint import is_safetensors, load_safetensors_into, sam3_image_state_dict  # noqa: E402
+from tests.sam3_fakes import FakeSam3Model, make_fake_processor  # noqa: E402
+
+
+class FakeParam:
+    """Parameter stand-in recording copy_() sources"""
+
+    def __init__(self):
+        self.copied = None
+
+    def copy_(self, value):
+        self.copied = value
+
+
+class FakeSafeOpen:
+    """safetensors.safe_open stand-in over a dict, counting get_tensor() calls"""
+
+    def __init__(self, tensors):
+        self.tensors = tensors
+        self.reads = []
+
+    def __call__(self, path, framework, device):
+        assert framework == "pt" and device == "cpu"
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def keys(self):
+        return list(self.tensors)
+
+    def get_tensor(self, key):
+        self.reads.append(key)
+        return self.tensors[key]
+
+
+@pytest.fixture
+def fake_safetensors():
+    """Install a fake safetensors module whose safe_open serves given tensors"""
+    def install(tensors):
+        opener = FakeSafeOpen(tensors)
+        module = ModuleType("safetensors")
+        module.safe_open = opener
+        return opener, patch.dict(sys.modules, {"safetensors": module})
+    return install
+
+
+class TestStateDictMapping:
+    """Test sam3.pt key mapping"""
+
+    def test_detector_keys_unwrapped(self):
+        """Test model wrapper and detector prefix are removed, tracker keys dropped"""
+        checkpoint = {"model": {
+            "detector.backbone.w": 1,
+            "detector.head.b": 2,
+            "tracker.memory.w": 3,
+        }}
+
+        assert sam3_image_state_dict(checkpoint) == {"backbone.w": 1, "head.b": 2}
+
+    def test_plain_state_dict_kept(self):
+        """Test already mapped state dicts pass through"""
+        assert sam3_image_state_dict({"backbone.w": 1}) == {"backbone.w": 1}
+
+    def test_extension(self):
+        assert is_safetensors("/models/sam3_fp16.safetensors")
+        assert not is_safetensors("/models/sam3.pt")
+
+
+class TestLoadSafetensors:
+    """Test mmap loading into an existing model"""
+
+    def test_copies_every_known_key(self, fake_safetensors):
+        """Test tensors are copied into matching parameters, one read per key"""
+        params = {"a.weight": FakeParam(), "b.bias": FakeParam()}
+        model = MagicMock()
+        model.state_dict.return_value = params
+        opener, modules = fake_safetensors({"a.weight": np.ones(2), "b.bias": np.zeros(1)})
+
+        with modules:
+            report = load_safetensors_into(model, "/models/sam3.safetensors")
+
+        model.state_dict.assert_called_once_with(keep_vars=True)
+        assert report == {"loaded": 2, "missing": [], "unexpected": []}
+        np.testing.assert_array_equal(params["a.weight"].copied, np.ones(2))
+        assert sorted(opener.reads) == ["a.weight", "b.bias"]
+
+    def test_reports_missing_and_unexpected(self, fake_safetensors):
+        """Test key mismatches are returned instead of raising"""
+        model = MagicMock()
+        model.state_dict.return_value = {"a.weight": FakeParam(), "c.weight": FakeParam()}
+        opener, modules = fake_safetensors({"a.weight": np.ones(1), "old.weight": np.ones(1)})
+
+        with modules:
+            report = load_safetensors_into(model, "/models/sam3.safetensors")
+
+        assert report == {"loaded": 1, "missing": ["c.weight"], "unexpected": ["old.weight"]}
+        assert opener.reads == ["a.weight"]
+
+
+class TestSegmenterCheckpointFormats:
+    """Test SAM3Segmenter picks the loader by checkpoint format"""
+
+    FULL_LOAD = {"loaded": 3, "missing": [], "unexpected": []}
+
+    def build(self, checkpoint_path, report=FULL_LOAD):
+        from engine.segmenter import SAM3Segmenter
+
+        model = FakeSam3Model()
+        with patch('engine.segmenter.os.path.exists', return_value=True), \
+             patch('engine.segmenter.build_sam3_image_model', return_value=model) as build, \
+             patch('engine.segmenter.Sam3Processor', return_value=make_fake_processor()), \
+             patch('engine.segmenter.load_safetensors_into', return_value=report) as load:
+            SAM3Segmenter(checkpoint_path=checkpoint_path, bpe_path="/models/bpe.gz")
+        return model, build, load
+
+    def test_pt_loaded_by_sam3(self):
+        """Test sam3.pt is passed to the sam3 builder as before"""
+        _, build, load = self.build("/models/sam3.pt")
+
+        assert build.call_args.kwargs["checkpoint_path"] == "/models/sam3.pt"
+        load.assert_not_called()
+
+    def test_safetensors_loaded_mmapped(self):
+        """Test .safetensors builds an empty model and loads weights itself"""
+        model, build, load = self.build("/models/sam3_fp16.safetensors")
+
+        assert build.call_args.kwargs["checkpoint_path"] is None
+        assert build.call_args.kwargs["load_from_HF"] is False
+        load.assert_called_once_with(model, "/models/sam3_fp16.safetensors")
+
+    def test_safetensors_without_matching_weights_fails(self):
+        """Test an empty or foreign safetensors file does not build a random model"""
+        report = {"loaded": 0, "missing": ["a.weight"], "unexpected": ["other.weight"]}
+
+        with pytest.raises(RuntimeError, match="matches the SAM3 image model"):
+            self.build("/models/sam3.safetensors", report)
+
+    def test_safetensors_missing_weights_logged(self, caplog):
+        """Test weights absent from the file are reported at error level"""
+        report = {"loaded": 2, "missing": ["a.weight", "b.bias"], "unexpected": []}
+
+        with caplog.at_level("ERROR", logger="engine.segmenter"):
+            self.build("/models/sam3.safetensors", report)
+
+        assert "2 SAM3 weights missing" in caplog.text and "a.weight" in caplog.text
@@ -0,0 +1,124 @@
+"""
+Unit tests for CompactMask (bounding box crop + bit-packed instance masks)
+
+Tests verify:
+- from_dense / to_dense round trip, bounding box and packed size
+- Empty masks
+- region() for boxes inside, overlapping and outside the mask
+- np.asarray() support (mask cache / bundle code paths)
+- union_masks() for compact, dense and mixed inputs
+"""
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+# Add parent directory to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from engine.compact_mask import CompactMask, union_masks
+
+
+@pytest.fixture
+def dense_mask():
+    """100x80 mask with an irregular 13x21 blob"""
+    mask = np.zeros((80, 100), dtype=bool)
+    mask[10:23, 30:51] = True
+    mask[10, 30] = False
+    mask[15:18, 40:44] = False
+    return mask
+
+
+class TestCompactMask:
+    def test_round_trip(self, dense_mask):
+        compact = CompactMask.from_dense(dense_mask)
+
+        assert compact.shape == (80, 100)
+        assert compact.box == (30, 10, 51, 23)
+        assert np.array_equal(compact.to_dense(), dense_mask)
+        assert np.array_equal(compact.crop(), dense_mask[10:23, 30:51])
+
+    def test_packed_size(self, dense_mask):
+        """Test 1 bit per pixel of the bounding box only"""
+        compact = CompactMask.from_dense(dense_mask)
+        assert compact.nbytes == (13 * 21 + 7) // 8
+        assert compact.nbytes < dense_mask.nbytes / 50
+
+    def test_uint8_255_input(self, dense_mask):
+        compact = CompactMask.from_dense(dense_mask.astype(np.uint8) * 255)
+        assert np.array_equal(compact.to_dense(), dense_mask)
+
+    def test_empty_mask(self):
+        compact = CompactMask.from_dense(np.zeros((5, 7), dtype=bool))
+
+        assert compact.empty
+        assert compact.box == (0, 0, 0, 0)
+        assert compact.crop().shape == (0, 0)
+        assert compact.to_dense().shape == (5, 7)
+        assert not compact.to_dense().any()
+
+    @pytest.mark.parametrize("box", [
+        (0, 0, 100, 80),
+        (35, 12, 45, 20),
+        (0, 0, 33, 11),
+        (60, 50, 90, 70),
+    ])
+    def test_region(self, dense_mask, box):
+        """Test region() equals slicing the dense mask (inside, overlapping, disjoint boxes)"""
+        x0, y0, x1, y1 = box
+        compact = CompactMask.from_dense(dense_mask)
+        assert np.array_equal(compact.region(box), dense_mask[y0:y1, x0:x1])
+
+    def test_asarray(self, dense_mask):
+        compact = CompactMask.from_dense(dense_mask)
+
+        assert np.array_equal(np.asarray(compact), dense_mask)
+        assert np.asarray(compact, dtype=np.uint8).dtype == np.uint8
+        assert compact.ndim == 2
+
+
+class TestUnionMasks:
+    def test_compact_union_stays_compact(self):
+        a = np.zeros((40, 40), dtype=bool)
+        b = np.zeros((40, 40), dtype=bool)
+        a[2:10, 2:10] = True
+        b[20:30, 25:35] = True
+
+        union = union_masks([CompactMask.from_dense(a), CompactMask.from_dense(b)])
+
+        assert isinstance(union, CompactMask)
+        assert union.box == (2, 2, 35, 30)
+        assert np.array_equal(union.to_dense(), a | b)
+
+    def test_dense_union_unchanged(self):
+        """Test dense inputs keep np.maximum semantics (values and dtype)"""
+        a = np.zeros((4, 4), dtype=np.uint8)
+        b = np.zeros((4, 4), dtype=np.uint8)
+        a[0, 0] = 255
+        b[3, 3] = 255
+
+        union = union_masks([a, b])
+
+        assert union.dtype == np.uint8
+        assert np.array_equal(union, np.maximum(a, b))
+
+    def test_mixed_union(self):
+        a = np.zeros((4, 4), dtype=np.uint8)
+        a[0, 0] = 255
+        b = np.zeros((4, 4), dtype=bool)
+        b[3, 3] = True
+
+        union = union_masks([a, CompactMask.from_dense(b)])
+
+        assert union.dtype == bool
+        assert union[0, 0] and union[3, 3] and union.sum() == 2
+
+    def test_single_and_empty(self, dense_mask):
+        compact = CompactMask.from_dense(dense_mask)
+        assert union_masks([compact]) is compact
+        assert union_masks([]) is None
+
+        empty = CompactMask.from_dense(np.zeros((80, 100), dtype=bool))
+        assert np.array_equal(union_masks([empty, compact]).to_dense(), dense_mask)
@@ -0,0 +1,154 @@
+"""
+Unit tests for R2 mask bundles
+
+Tests verify:
+- Deterministic bundle key derived from the input key
+- Round trip of masks, metadata, model version, threshold, image hash and merged prompts
+- Bit-packed encoding is much smaller than raw masks
+- Invalid data is rejected with ValueError
+- CompactMasks come back as CompactMasks; format 1 (dense only) bundles still load
+"""
+
+import io
+import json
+import os
+import sys
+
+import numpy as np
+import pytest
+
+# Add parent directory to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from engine.compact_mask import CompactMask
+from engine.mask_bundle import bundle_key, decode_bundle, encode_bundle
+
+
+@pytest.fixture
+def results():
+    """Segment results shaped like SAM3Segmenter.segment_concepts() output"""
+    rng = np.random.default_rng(0)
+    wall = [rng.random((48, 64)) > 0.5 for _ in range(2)]
+    floor = [np.zeros((48, 64), dtype=np.uint8)]
+    floor[0][10:20, 5:30] = 255
+    return {
+        "wall": (wall, {"concept": "wall", "instance_count": 2, "image_size": (64, 48),
+                        "confidence_threshold": 0.5, "scores": [0.91, 0.72]}),
+        "floor": (floor, {"concept": "floor", "instance_count": 1, "image_size": (64, 48),
+                          "confidence_threshold": 0.5, "scores": [0.88]}),
+        "door": ([], {"concept": "door", "instance_count": 0, "image_size": (64, 48),
+                      "confidence_threshold": 0.5, "scores": []}),
+    }
+
+
+class TestBundleKey:
+    """Test deterministic R2 key derivation"""
+
+    def test_inputs_prefix_mapped_to_masks(self):
+        """Test key follows the masks/{userId}/{jobId}/{idx} layout"""
+        assert bundle_key("inputs/u_abc/job_123/0.jpg") == "masks/u_abc/job_123/0_masks.npz"
+
+    def test_same_input_same_key(self):
+        """Test reruns referencing the same photo share one key"""
+        assert bundle_key("inputs/u/j/3.png") == bundle_key("inputs/u/j/3.png")
+
+    def test_other_prefix_kept(self):
+        """Test keys outside inputs/ are nested under masks/"""
+        assert bundle_key("in/0.jpg") == "masks/in/0_masks.npz"
+
+
+class TestEncodeDecode:
+    """Test bundle serialization"""
+
+    def test_round_trip(self, results):
+        """Test masks and metadata survive encode/decode"""
+        bundle = decode_bundle(encode_bundle(results, "sam3.pt:1:fp32", 0.5, "abc123"))
+
+        assert bundle.model_version == "sam3.pt:1:fp32"
+        assert bundle.confidence_threshold == 0.5
+        assert bundle.image_hash == "abc123"
+        assert list(bundle.results) == ["wall", "floor", "door"]
+        for name, (masks, metadata) in results.items():
+            decoded_masks, decoded_metadata = bundle.results[name]
+            assert decoded_metadata == metadata
+            assert len(decoded_masks) == len(masks)
+            for original, decoded in zip(masks, decoded_masks):
+                assert decoded.dtype == bool
+                np.testing.assert_array_equal(decoded, np.asarray(original) > 0)
+
+    def test_bit_packed_size(self):
+        """Test bundle is far smaller than the raw bool masks"""
+        rng = np.random.default_rng(1)
+        masks = [rng.random((256, 256)) > 0.5 for _ in range(4)]
+        data = encode_bundle({"wall": (masks, {"scores": [0.9] * 4})}, "v1", 0.5, "h")
+
+        raw_bytes = sum(m.nbytes for m in masks)
+        assert len(data) < raw_bytes / 6
+
+    def test_invalid_data_rejected(self):
+        """Test non-bundle bytes raise ValueError"""
+        with pytest.raises(ValueError, match="Invalid mask bundle"):
+            decode_bundle(b"\xff\xd8 jpeg bytes")
+
+    def test_unsupported_format_rejected(self, results, monkeypatch):
+        """Test bundles from a newer format version are rejected"""
+        import engine.mask_bundle as mask_bundle
+
+        newer = max(mask_bundle.SUPPORTED_BUNDLE_FORMATS) + 1
+        monkeypatch.setattr(mask_bundle, "BUNDLE_FORMAT", newer)
+        data = encode_bundle(results, "v1", 0.5, "h")
+        monkeypatch.undo()
+
+        with pytest.raises(ValueError, match="Unsupported mask bundle format"):
+            decode_bundle(data)
+
+
+class TestCompactMasks:
+    """Test CompactMask results in bundles"""
+
+    def test_round_trip(self, results):
+        """Test compact concepts decode as the same CompactMasks, dense ones stay dense"""
+        compact = [CompactMask.from_dense(m) for m in results["wall"][0]]
+        compact.append(CompactMask.from_dense(np.zeros((48, 64), dtype=bool)))
+        results["wall"] = (compact, dict(results["wall"][1], instance_count=3))
+
+        bundle = decode_bundle(encode_bundle(results, "sam3.pt:1:fp32:compact", 0.5, "abc123"))
+
+        masks, metadata = bundle.results["wall"]
+        assert metadata == results["wall"][1]
+        assert all(isinstance(m, CompactMask) for m in masks)
+        for original, decoded in zip(compact, masks):
+            assert decoded.box == original.box and decoded.shape == original.shape
+            np.testing.assert_array_equal(decoded.to_dense(), original.to_dense())
+        assert isinstance(bundle.results["floor"][0][0], np.ndarray)
+
+    def test_format_1_bundle_loads(self, results, monkeypatch):
+        from engine import mask_bundle
+        monkeypatch.setattr(mask_bundle, "BUNDLE_FORMAT", 1)
+        data = encode_bundle(results, "v1", 0.5, "h")
+        monkeypatch.undo()
+
+        assert list(decode_bundle(data).results) == ["wall", "floor", "door"]
+
+
+class TestMergedPrompts:
+    """Test the merged (union mask) prompt set recorded in the header"""
+
+    def test_round_trip(self, results):
+        bundle = decode_bundle(encode_bundle(results, "v1", 0.5, "h", merged={"floor", "grout"}))
+
+        # Only prompts present in the bundle are recorded
+        assert bundle.merged == {"floor"}
+
+    def test_nothing_merged(self, results):
+        assert decode_bundle(encode_bundle(results, "v1", 0.5, "h")).merged == frozenset()
+
+    def test_unrecorded_merge_is_none(self, results):
+        """Test bundles written before merged was recorded decode with merged=None"""
+        with np.load(io.BytesIO(encode_bundle(results, "v1", 0.5, "h"))) as archive:
+            header, bits = json.loads(str(archive["header"])), archive["bits"]
+        del header["merged"]
+        buffer = io.BytesIO()
+        np.savez_compressed(buffer, header=np.array(json.dumps(header)), bits=bits)
+
+        assert decode_bundle(buffer.getvalue()).merged is None
@@ -0,0 +1,228 @@
+"""
+Unit tests for the content-addressed mask cache
+
+Tests verify:
+- Key covers image hash, prompt, confidence threshold and model version
+- Memory tier LRU bounded by mask bytes
+- Disk tier round trip, promotion to memory, and size-based eviction
+- Corrupt disk entries are discarded
+- CompactMask results stay compact through both tiers
+- Process-wide cache lives under MODEL_CACHE_DIR
+"""
+
+import os
+import sys
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+
+# Add parent directory to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import engine.mask_cache as mask_cache_module
+from engine.compact_mask import CompactMask
+from engine.mask_cache import MaskCache, cache_key, get_mask_cache, image_digest
+
+
+def make_result(value: int = 1, count: int = 2, size: int = 32):
+    """(masks, metadata) shaped like SAM3Segmenter.segment() output"""
+    masks = [np.full((size, size), bool(value % 2)) for _ in range(count)]
+    metadata = {
+        "concept": f"concept-{value}",
+        "instance_count": count,
+        "image_size": (size, size),
+        "confidence_threshold": 0.5,
+        "scores": [0.9] * count,
+    }
+    return masks, metadata
+
+
+def assert_same_result(expected, actual):
+    expected_masks, expected_metadata = expected
+    actual_masks, actual_metadata = actual
+    assert len(expected_masks) == len(actual_masks)
+    for a, b in zip(expected_masks, actual_masks):
+        np.testing.assert_array_equal(a, b)
+    assert expected_metadata == actual_metadata
+
+
+class TestCacheKey:
+    """Test cache key composition"""
+
+    def test_image_digest_is_content_hash(self):
+        """Test identical bytes hash identically"""
+        assert image_digest(b"photo") == image_digest(b"photo")
+        assert image_digest(b"photo") != image_digest(b"photo2")
+
+    @pytest.mark.parametrize("changed", [
+        ("other-image", "wall", 0.5, "v1"),
+        ("image", "floor", 0.5, "v1"),
+        ("image", "wall", 0.6, "v1"),
+        ("image", "wall", 0.5, "v2"),
+    ])
+    def test_every_component_changes_key(self, changed):
+        """Test image, prompt, threshold and model version are all part of the key"""
+        assert cache_key("image", "wall", 0.5, "v1") != cache_key(*changed)
+
+
+class TestMemoryTier:
+    """Test in-memory LRU tier"""
+
+    def test_put_get(self):
+        """Test stored result is returned and counted as a hit"""
+        cache = MaskCache(disk_dir=None)
+        result = make_result()
+        cache.put("img", "wall", 0.5, "v1", result)
+
+        assert_same_result(result, cache.get("img", "wall", 0.5, "v1"))
+        assert cache.get("img", "floor", 0.5, "v1") is None
+        assert cache.stats()["hits"] == 1
+        assert cache.stats()["misses"] == 1
+
+    def test_lru_eviction_by_bytes(self):
+        """Test least recently used entries are evicted over the byte budget"""
+        entry_bytes = 2 * 32 * 32  # two 32x32 bool masks
+        cache = MaskCache(memory_bytes=2 * entry_bytes, disk_dir=None)
+
+        cache.put("img", "a", 0.5, "v1", make_result(1))
+        cache.put("img", "b", 0.5, "v1", make_result(2))
+        cache.get("img", "a", 0.5, "v1")  # a becomes most recent
+        cache.put("img", "c", 0.5, "v1", make_result(3))
+
+        assert cache.get("img", "a", 0.5, "v1") is not None
+        assert cache.get("img", "b", 0.5, "v1") is None
+        assert cache.stats()["memory_bytes"] == 2 * entry_bytes
+
+    def test_oversized_result_not_kept_in_memory(self):
+        """Test a result larger than the memory budget is skipped"""
+        cache = MaskCache(memory_bytes=10, disk_dir=None)
+        cache.put("img", "wall", 0.5, "v1", make_result())
+
+        assert cache.stats()["memory_entries"] == 0
+
+    def test_empty_masks_cached(self):
+        """Test 'no instances found' results are cached too"""
+        cache = MaskCache(disk_dir=None)
+        empty = ([], {"concept": "wall", "instance_count": 0, "scores": []})
+        cache.put("img", "wall", 0.5, "v1", empty)
+
+        masks, metadata = cache.get("img", "wall", 0.5, "v1")
+        assert masks == []
+        assert metadata["instance_count"] == 0
+
+
+class TestDiskTier:
+    """Test on-disk tier under the cache directory"""
+
+    def test_survives_new_cache_instance(self, tmp_path):
+        """Test results written by one worker process are read by the next"""
+        result = make_result()
+        MaskCache(disk_dir=str(tmp_path)).put("img", "wall", 0.5, "v1", result)
+
+        fresh = MaskCache(disk_dir=str(tmp_path))
+        assert_same_result(result, fresh.get("img", "wall", 0.5, "v1"))
+        assert fresh.stats()["disk_hits"] == 1
+
+    def test_disk_hit_promoted_to_memory(self, tmp_path):
+        """Test second lookup after a disk hit is served from memory"""
+        MaskCache(disk_dir=str(tmp_path)).put("img", "wall", 0.5, "v1", make_result())
+        fresh = MaskCache(disk_dir=str(tmp_path))
+
+        fresh.get("img", "wall", 0.5, "v1")
+        fresh.get("img", "wall", 0.5, "v1")
+
+        assert fresh.stats()["disk_hits"] == 1
+        assert fresh.stats()["hits"] == 2
+
+    def test_size_based_eviction(self, tmp_path):
+        """Test least recently used files are deleted over the disk budget"""
+        probe = MaskCache(disk_dir=str(tmp_path / "probe"))
+        probe.put("img", "probe", 0.5, "v1", make_result(1))
+        file_size = probe.stats()["disk_bytes"]
+
+        cache = MaskCache(memory_bytes=0, disk_dir=str(tmp_path / "cache"),
+                          disk_bytes=int(file_size * 2.5))
+        cache.put("img", "a", 0.5, "v1", make_result(1))
+        cache.put("img", "b", 0.5, "v1", make_result(1))
+        path_a = cache._path(cache_key("img", "a", 0.5, "v1"))
+        path_b = cache._path(cache_key("img", "b", 0.5, "v1"))
+        os.utime(path_a, (1, 1))
+        os.utime(path_b, (2, 2))
+        cache.get("img", "a", 0.5, "v1")  # touch a → b is now least recently used
+        cache.put("img", "c", 0.5, "v1", make_result(1))
+
+        assert os.path.exists(path_a)
+        assert not os.path.exists(path_b)
+        assert cache.stats()["disk_bytes"] <= int(file_size * 2.5)
+
+    def test_zero_disk_budget_disables_disk(self, tmp_path):
+        """Test disk_bytes=0 writes nothing"""
+        cache = MaskCache(disk_dir=str(tmp_path), disk_bytes=0)
+        cache.put("img", "wall", 0.5, "v1", make_result())
+
+        assert os.listdir(tmp_path) == []
+
+    def test_corrupt_file_discarded(self, tmp_path):
+        """Test unreadable cache files count as misses and are removed"""
+        cache = MaskCache(memory_bytes=0, disk_dir=str(tmp_path))
+        cache.put("img", "wall", 0.5, "v1", make_result())
+        path = cache._path(cache_key("img", "wall", 0.5, "v1"))
+        with open(path, "wb") as f:
+            f.write(b"not an npz")
+
+        assert cache.get("img", "wall", 0.5, "v1") is None
+        assert not os.path.exists(path)
+
+
+class TestDefaultCache:
+    """Test process-wide cache helper"""
+
+    def test_disk_dir_under_model_cache_dir(self, tmp_path):
+        """Test default cache writes to MODEL_CACHE_DIR/mask_cache"""
+        with patch.dict(os.environ, {"MODEL_CACHE_DIR": str(tmp_path)}), \
+                patch.object(mask_cache_module, "_cache", None):
+            cache = get_mask_cache()
+
+            assert cache.disk_dir == os.path.join(str(tmp_path), "mask_cache")
+            assert get_mask_cache() is cache
+
+
+class TestCompactMasks:
+    """Test CompactMask results are cached as box + packed bits"""
+
+    def compact_result(self):
+        masks, metadata = make_result(count=0, size=48)
+        dense = np.zeros((48, 64), dtype=bool)
+        dense[5:20, 10:33] = True
+        dense[7, 40] = True
+        empty = np.zeros((48, 64), dtype=bool)
+        masks = [CompactMask.from_dense(dense), CompactMask.from_dense(empty)]
+        return masks, dict(metadata, instance_count=2)
+
+    def test_round_trip_both_tiers(self, tmp_path):
+        """Test memory and disk hits both return CompactMasks equal to the stored ones"""
+        result = self.compact_result()
+        cache = MaskCache(disk_dir=str(tmp_path))
+        cache.put("img", "wall", 0.5, "v1:compact", result)
+
+        memory_hit = cache.get("img", "wall", 0.5, "v1:compact")
+        disk_hit = MaskCache(disk_dir=str(tmp_path)).get("img", "wall", 0.5, "v1:compact")
+
+        for hit in (memory_hit, disk_hit):
+            masks, _ = hit
+            assert all(isinstance(m, CompactMask) for m in masks)
+            assert [m.box for m in masks] == [m.box for m in result[0]]
+            assert_same_result(result, hit)
+
+    def test_disk_file_not_expanded(self, tmp_path):
+        """Test the disk entry stores packed crops, not full-size arrays"""
+        dense = np.zeros((2000, 2000), dtype=bool)
+        dense[100:110, 100:110] = True
+        cache = MaskCache(disk_dir=str(tmp_path))
+        cache.put("img", "wall", 0.5, "v1", ([CompactMask.from_dense(dense)], {"scores": [0.9]}))
+
+        with patch('engine.mask_cache.np.stack') as stack:
+            MaskCache(disk_dir=str(tmp_path)).get("img", "wall", 0.5, "v1")
+        stack.assert_not_called()
+        assert cache.stats()["disk_bytes"] < 2000
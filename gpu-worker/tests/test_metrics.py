@@ -0,0 +1,109 @@
+"""
+Unit tests for process-wide worker metrics
+
+Tests verify:
+- Gauges, counters and snapshot() / reset()
+- Fixed-bucket histograms exported with cumulative bucket counts
+- PhaseTimer accumulation, totals and device sync at phase boundaries
+"""
+
+import os
+import sys
+from unittest.mock import MagicMock
+
+import pytest
+
+# Add parent directory to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from engine import metrics
+from engine.metrics import PhaseTimer
+
+
+@pytest.fixture(autouse=True)
+def clean_metrics():
+    metrics.reset()
+    yield
+    metrics.reset()
+
+
+class TestValues:
+    def test_gauge_and_counter(self):
+        metrics.set_gauge("worker_ready", 1)
+        metrics.inc("jobs")
+        metrics.inc("jobs", 2)
+
+        assert metrics.snapshot() == {"worker_ready": 1, "jobs": 3}
+
+    def test_reset(self):
+        metrics.inc("jobs")
+        metrics.observe("latency_ms", 3)
+        metrics.reset()
+
+        assert metrics.snapshot() == {}
+
+
+class TestHistograms:
+    def test_cumulative_buckets(self):
+        for value in (0.5, 1, 3, 40, 20000):
+            metrics.observe("latency_ms", value)
+
+        histogram = metrics.snapshot()["latency_ms"]
+
+        assert histogram["count"] == 5
+        assert histogram["sum"] == pytest.approx(20044.5)
+        assert histogram["buckets"]["1"] == 2  # bounds are inclusive
+        assert histogram["buckets"]["5"] == 3
+        assert histogram["buckets"]["50"] == 4
+        assert histogram["buckets"]["10000"] == 4
+        assert histogram["buckets"]["inf"] == 5
+
+    def test_snapshot_is_a_copy(self):
+        metrics.observe("latency_ms", 1)
+        metrics.snapshot()["latency_ms"]["count"] = 100
+
+        assert metrics.snapshot()["latency_ms"]["count"] == 1
+
+
+class TestPhaseTimer:
+    def test_phases_accumulate(self):
+        timer = PhaseTimer()
+        with timer.phase("decode"):
+            pass
+        with timer.phase("transfer"):
+            pass
+        with timer.phase("decode"):
+            pass
+
+        timings = timer.timings_ms()
+
+        assert list(timings) == ["decode", "transfer", "total"]
+        assert timings["total"] >= timings["decode"] >= 0
+
+    def test_phase_recorded_on_error(self):
+        timer = PhaseTimer()
+        with pytest.raises(ValueError):
+            with timer.phase("decode"):
+                raise ValueError("boom")
+
+        assert "decode" in timer.timings_ms()
+
+    def test_sync_at_boundaries(self):
+        sync = MagicMock()
+        timer = PhaseTimer(sync=sync)
+        with timer.phase("backbone"):
+            assert sync.call_count == 1
+
+        assert sync.call_count == 2
+
+    def test_observe_histograms(self):
+        timer = PhaseTimer()
+        with timer.phase("backbone"):
+            pass
+
+        timings = timer.observe("segmenter")
+
+        snapshot = metrics.snapshot()
+        assert set(timings) == {"backbone", "total"}
+        assert snapshot["segmenter_backbone_ms"]["count"] == 1
+        assert snapshot["segmenter_total_ms"]["count"] == 1
@@ -0,0 +1,373 @@
+"""
+Unit tests for the onnxruntime CPU backend
+
+Tests verify:
+- Nested model outputs flatten to named tensors and back (dicts, lists, None slots)
+- Export directory detection and manifest validation
+- Processor preprocessing matches Sam3Processor (resize, [-1, 1] normalization)
+- load_onnx_segmenter() creates CPU sessions with the requested thread counts
+- SAM3Segmenter runs end to end on fake onnxruntime sessions (single / batched / tiled)
+- int8 graphs: quantize_onnx() settings, precision="int8" loading and switching
+- The registry builds the ONNX backend for an export directory
+"""
+
+import json
+import os
+import sys
+import zlib
+from types import ModuleType, SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+import pytest
+from PIL import Image
+
+# Add parent directory to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+# Mock torch and sam3 before importing engine modules
+sys.modules.setdefault('torch', MagicMock())
+for _name in ('sam3', 'sam3.model', 'sam3.model.sam3_image_processor', 'sam3.model.data_misc'):
+    sys.modules.setdefault(_name, MagicMock())
+
+from engine.onnx_backend import (  # noqa: E402
+    ONNX_FORMAT_VERSION,
+    OnnxSam3Processor,
+    _flatten,
+    _unflatten,
+    is_onnx_model,
+    load_manifest,
+    load_onnx_segmenter,
+)
+from tests.sam3_fakes import FakeFindStage, FakeSam3Model, make_fake_torch  # noqa: E402
+
+CONTEXT_LENGTH = 4
+TEXT_DIM = 8
+RESOLUTION = 16
+
+MANIFEST = {
+    "format_version": ONNX_FORMAT_VERSION,
+    "opset": 17,
+    "resolution": RESOLUTION,
+    "context_length": CONTEXT_LENGTH,
+    "image_outputs": ["vision_features"],
+    "text_outputs": ["language_features", "language_mask"],
+    "decoder_outputs": ["pred_logits", "presence_logit_dec", "pred_masks", "pred_boxes"],
+    "source": "sam3.pt",
+}
+
+
+def fake_tokenizer(texts, context_length=CONTEXT_LENGTH):
+    """Deterministic token ids per prompt"""
+    return np.array([
+        [zlib.crc32(f"{t}:{i}".encode()) % 1000 for i in range(context_length)] for t in texts
+    ])
+
+
+class FakeSession:
+    """onnxruntime.InferenceSession stand-in dispatching on the graph file name"""
+
+    def __init__(self, path, sess_options=None, providers=None):
+        self.path = path
+        self.options = sess_options
+        self.providers = providers
+        self.grounding = FakeSam3Model()
+        self.feeds = []
+
+    def get_inputs(self):
+        names = {
+            "image_encoder.onnx": ["pixels"],
+            "text_encoder.onnx": ["token_ids"],
+            "decoder.onnx": [
+                "img_ids", "text_ids", "vision_features", "language_features", "language_mask",
+            ],
+        }[self.graph]
+        return [SimpleNamespace(name=name) for name in names]
+
+    @property
+    def graph(self):
+        return os.path.basename(self.path).replace(".int8", "")
+
+    def run(self, output_names, feeds):
+        self.feeds.append(feeds)
+        graph = self.graph
+        if graph == "image_encoder.onnx":
+            # Channel means per image, like the fake torch processor
+            return [feeds["pixels"].mean(axis=(2, 3))]
+        if graph == "text_encoder.onnx":
+            ids = feeds["token_ids"]
+            features = np.stack([
+                np.random.default_rng(row.tolist()).normal(size=(CONTEXT_LENGTH, TEXT_DIM))
+                for row in ids
+            ], axis=1)  # [seq, N, D]
+            return [features, np.zeros((len(ids), CONTEXT_LENGTH), dtype=bool)]
+        outputs = self.grounding.forward_grounding(
+            {
+                "vision_features": feeds["vision_features"],
+                "language_features": feeds["language_features"],
+            },
+            SimpleNamespace(img_ids=feeds["img_ids"], text_ids=feeds["text_ids"]),
+            geometric_prompt=None,
+        )
+        return [outputs[name] for name in output_names]
+
+
+def make_fake_onnxruntime() -> ModuleType:
+    ort = ModuleType("onnxruntime")
+    ort.SessionOptions = lambda: SimpleNamespace()
+    ort.GraphOptimizationLevel = SimpleNamespace(ORT_ENABLE_ALL="all")
+    ort.sessions = []
+
+    def create(path, sess_options=None, providers=None):
+        session = FakeSession(path, sess_options, providers)
+        ort.sessions.append(session)
+        return session
+
+    ort.InferenceSession = create
+
+    ort.quantization = ModuleType("onnxruntime.quantization")
+    ort.quantization.QuantType = SimpleNamespace(QInt8="qint8")
+    ort.quantization.calls = []
+
+    def quantize_dynamic(model_input, model_output, **kwargs):
+        names = (os.path.basename(model_input), os.path.basename(model_output))
+        ort.quantization.calls.append((*names, kwargs))
+        with open(model_output, "wb") as f:
+            f.write(b"int8")
+
+    ort.quantization.quantize_dynamic = quantize_dynamic
+    return ort
+
+
+@pytest.fixture
+def fake_torch():
+    fake = make_fake_torch()
+    fake.from_numpy = lambda array: array
+    fake.cuda.is_available.return_value = False
+    with patch('engine.segmenter.torch', fake), \
+         patch('engine.onnx_backend.torch', fake), \
+         patch('engine.segmenter.FindStage', FakeFindStage):
+        yield fake
+
+
+@pytest.fixture
+def fake_ort():
+    ort = make_fake_onnxruntime()
+    modules = {"onnxruntime": ort, "onnxruntime.quantization": ort.quantization}
+    with patch.dict(sys.modules, modules):
+        yield ort
+
+
+@pytest.fixture
+def model_dir(tmp_path):
+    for name in ("image_encoder.onnx", "text_encoder.onnx", "decoder.onnx"):
+        (tmp_path / name).write_bytes(b"onnx")
+    (tmp_path / "manifest.json").write_text(json.dumps(MANIFEST))
+    return str(tmp_path)
+
+
+@pytest.fixture
+def onnx_segmenter(fake_torch, fake_ort, model_dir):
+    return load_onnx_segmenter(model_dir, tokenizer=fake_tokenizer, num_threads=3,
+                               inter_op_threads=1)
+
+
+def images():
+    return [Image.new('RGB', (64, 48), (40 * i, 90, 200 - 30 * i)) for i in range(3)]
+
+
+class TestFlatten:
+    def test_round_trip(self, fake_torch):
+        a, b, c = np.zeros(1), np.ones(2), np.full(3, 2.0)
+        nested = {"vision_features": a, "backbone_fpn": [b, None, c], "sam2": None}
+
+        flat = _flatten(nested)
+
+        assert [name for name, _ in flat] == ["vision_features", "backbone_fpn.0", "backbone_fpn.2"]
+        restored = _unflatten([name for name, _ in flat], [value for _, value in flat])
+        assert restored["vision_features"] is a
+        assert restored["backbone_fpn"][0] is b and restored["backbone_fpn"][1] is None
+        assert restored["backbone_fpn"][2] is c
+        assert "sam2" not in restored
+
+
+class TestManifest:
+    def test_is_onnx_model(self, model_dir, tmp_path_factory):
+        assert is_onnx_model(model_dir)
+        assert not is_onnx_model(str(tmp_path_factory.mktemp("empty")))
+        assert not is_onnx_model("/models/sam3.pt")
+
+    def test_missing_manifest(self, tmp_path):
+        with pytest.raises(FileNotFoundError):
+            load_manifest(str(tmp_path))
+
+    def test_unsupported_version(self, model_dir):
+        with open(os.path.join(model_dir, "manifest.json"), "w") as f:
+            json.dump({**MANIFEST, "format_version": ONNX_FORMAT_VERSION + 1}, f)
+
+        with pytest.raises(ValueError, match="Re-export"):
+            load_manifest(model_dir)
+
+
+class TestProcessor:
+    def test_pixels_normalized(self):
+        processor = OnnxSam3Processor(model=None, resolution=RESOLUTION)
+        black, white = Image.new('RGB', (40, 30)), Image.new('RGB', (20, 50), (255, 255, 255))
+
+        pixels = processor._pixels([black, white])
+
+        assert pixels.shape == (2, 3, RESOLUTION, RESOLUTION)
+        assert pixels.dtype == np.float32
+        np.testing.assert_allclose(pixels[0], -1.0)
+        np.testing.assert_allclose(pixels[1], 1.0)
+
+    def test_batch_state(self, fake_torch):
+        model = MagicMock()
+        processor = OnnxSam3Processor(model, resolution=RESOLUTION)
+
+        state = processor.set_image_batch(images()[:2])
+
+        assert state["original_heights"] == [48, 48] and state["original_widths"] == [64, 64]
+        pixels = model.backbone.forward_image.call_args.args[0]
+        assert pixels.shape == (2, 3, RESOLUTION, RESOLUTION)
+
+
+class TestLoadOnnxSegmenter:
+    def test_cpu_sessions_and_threads(self, onnx_segmenter, fake_ort, fake_torch, model_dir):
+        assert [os.path.basename(s.path) for s in fake_ort.sessions] == [
+            "image_encoder.onnx", "text_encoder.onnx", "decoder.onnx",
+        ]
+        for session in fake_ort.sessions:
+            assert session.providers == ["CPUExecutionProvider"]
+            assert session.options.intra_op_num_threads == 3
+            assert session.options.inter_op_num_threads == 1
+            assert session.options.graph_optimization_level == "all"
+        fake_torch.set_num_threads.assert_called_once_with(3)
+        assert onnx_segmenter.precision == "fp32"
+        assert onnx_segmenter.model_version.startswith("manifest.json:")
+
+    def test_default_threads_left_to_onnxruntime(self, fake_torch, fake_ort, model_dir):
+        load_onnx_segmenter(model_dir, tokenizer=fake_tokenizer, num_threads=0, inter_op_threads=0)
+
+        assert not hasattr(fake_ort.sessions[0].options, "intra_op_num_threads")
+        fake_torch.set_num_threads.assert_not_called()
+
+    def test_segment_concepts(self, onnx_segmenter, fake_ort):
+        results = onnx_segmenter.segment_concepts(images()[0], ["wall", "floor", "window"])
+
+        for prompt, (masks, metadata) in results.items():
+            assert metadata["concept"] == prompt
+            assert metadata["instance_count"] == len(masks) == len(metadata["scores"])
+            assert all(mask.shape == (48, 64) for mask in masks)
+        decoder = fake_ort.sessions[2]
+        assert list(decoder.feeds[0]["text_ids"]) == [0, 1, 2]
+
+    def test_batch_matches_single(self, onnx_segmenter):
+        """Test img_ids route each query to its own image's features"""
+        prompts = ["wall", "floor"]
+        batched = onnx_segmenter.segment_batch(images(), prompts)
+
+        for image, result in zip(images(), batched):
+            single = onnx_segmenter.segment_concepts(image, prompts)
+            for prompt in prompts:
+                assert single[prompt][1]["scores"] == result[prompt][1]["scores"]
+                for a, b in zip(single[prompt][0], result[prompt][0]):
+                    np.testing.assert_array_equal(a, b)
+
+    def test_probe_without_segmentation_head(self, onnx_segmenter):
+        """Test probe() works on a model without a detachable mask head"""
+        probes = onnx_segmenter.probe(images()[0], ["wall", "floor"])
+        full = onnx_segmenter.segment_concepts(images()[0], ["wall", "floor"])
+
+        for prompt, probe in probes.items():
+            assert probe["scores"] == full[prompt][1]["scores"]
+
+    def test_text_cache_skips_text_graph(self, onnx_segmenter, fake_ort):
+        onnx_segmenter.warm_text_cache(["wall", "floor"])
+        text_session = fake_ort.sessions[1]
+        runs = len(text_session.feeds)
+
+        onnx_segmenter.segment_concepts(images()[0], ["wall", "floor"])
+
+        assert len(text_session.feeds) == runs
+
+    def test_tiled(self, fake_torch, fake_ort, model_dir):
+        from engine.tiling import TileConfig
+        tiling = TileConfig(pixel_threshold=5000, tile_size=48, overlap=8)
+        segmenter = load_onnx_segmenter(model_dir, tokenizer=fake_tokenizer, tiling=tiling)
+
+        masks, metadata = segmenter.segment(Image.new('RGB', (160, 60)), "wall")
+
+        assert metadata["tiles"] == 8
+        assert all(mask.shape == (60, 160) for mask in masks)
+
+    def test_precision_ignored(self, fake_torch, fake_ort, model_dir):
+        segmenter = load_onnx_segmenter(model_dir, tokenizer=fake_tokenizer, precision="bf16")
+
+        assert segmenter.precision == "fp32"
+
+
+class TestInt8:
+    @pytest.fixture
+    def quantized_dir(self, fake_ort, model_dir):
+        from engine.onnx_backend import quantize_onnx
+        quantize_onnx(model_dir)
+        return model_dir
+
+    def test_quantize_linear_layers(self, fake_ort, quantized_dir):
+        calls = fake_ort.quantization.calls
+
+        assert [(src, dst) for src, dst, _ in calls] == [
+            ("image_encoder.onnx", "image_encoder.int8.onnx"),
+            ("text_encoder.onnx", "text_encoder.int8.onnx"),
+            ("decoder.onnx", "decoder.int8.onnx"),
+        ]
+        for _, _, options in calls:
+            assert options["op_types_to_quantize"] == ["MatMul", "Gemm"]
+            assert options["weight_type"] == "qint8" and options["per_channel"] is True
+        assert load_manifest(quantized_dir)["precisions"] == ["fp32", "int8"]
+        assert os.path.exists(os.path.join(quantized_dir, "decoder.onnx"))
+
+    def test_load_int8(self, fake_torch, fake_ort, quantized_dir):
+        segmenter = load_onnx_segmenter(quantized_dir, tokenizer=fake_tokenizer, precision="int8")
+
+        assert [os.path.basename(s.path) for s in fake_ort.sessions] == [
+            "image_encoder.int8.onnx", "text_encoder.int8.onnx", "decoder.int8.onnx",
+        ]
+        assert segmenter.precision == "int8"
+        assert segmenter.model_version.endswith(":int8")
+        masks, _ = segmenter.segment(images()[0], "wall")
+        fake_torch.autocast.assert_not_called()
+
+    def test_switch_precision(self, fake_torch, fake_ort, quantized_dir):
+        """Test set_precision swaps graph variants (fp32 sessions reloaded once)"""
+        segmenter = load_onnx_segmenter(quantized_dir, tokenizer=fake_tokenizer, precision="int8")
+
+        segmenter.set_precision("fp32")
+        segmenter.set_precision("bf16")
+
+        assert [os.path.basename(s.path) for s in fake_ort.sessions[3:]] == [
+            "image_encoder.onnx", "text_encoder.onnx", "decoder.onnx",
+        ]
+        assert segmenter.model.quantized is False
+        assert segmenter.processor.model is segmenter.model
+
+    def test_int8_requires_quantized_graphs(self, fake_torch, fake_ort, model_dir):
+        with pytest.raises(ValueError, match="--format int8"):
+            load_onnx_segmenter(model_dir, tokenizer=fake_tokenizer, precision="int8")
+
+
+class TestRegistryFactory:
+    def test_onnx_directory_builds_onnx_backend(self, model_dir):
+        from engine.registry import _default_factory
+        from presets import preset_prompts
+
+        with patch('engine.onnx_backend.load_onnx_segmenter') as load, \
+             patch('engine.segmenter.SAM3Segmenter') as torch_class:
+            segmenter = _default_factory(checkpoint_path=model_dir, bpe_path="/models/bpe.gz",
+                                         precision="fp32")
+
+        torch_class.assert_not_called()
+        load.assert_called_once_with(model_dir, bpe_path="/models/bpe.gz", precision="fp32")
+        assert segmenter is load.return_value
+        segmenter.warm_text_cache.assert_called_once_with(preset_prompts())
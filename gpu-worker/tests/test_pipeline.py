@@ -3,12 +3,17 @@ Integration tests for full pipeline with all mocks
 
 Tests verify:
 - Full end-to-end flow from job spec to callbacks
-- Two-stage pipeline: segment once, apply rules N times
+- Two-stage pipeline: segment each distinct photo once, apply rules N times
+- GPU segmentation of the next item overlaps apply/upload of the previous one
+- Per-stage stats and worker overrides in the result summary
 - Per-item callbacks after each upload
 - Error handling for partial job failures
 - Protect mask functionality
+- Union masks for protect and single-instance (preset multi_instance=False) concepts
 - Batch concurrency processing
 - R2 upload/download integration
+- Mask cache reuse across jobs with different rules
+- R2 mask bundle upload and reuse_masks reruns
 """
 
 import os
@@ -27,6 +32,16 @@ sys.modules['torch'] = MagicMock()
 sys.modules['transformers'] = MagicMock()
 
 from engine.pipeline import process_job, _callback_failure
+from engine.mask_cache import MaskCache, image_digest  # noqa: E402
+from engine.mask_bundle import decode_bundle  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def mask_cache():
+    """Fresh memory-only mask cache per test (no cross-test hits, no disk writes)"""
+    cache = MaskCache(disk_dir=None)
+    with patch('engine.pipeline.get_mask_cache', return_value=cache):
+        yield cache
 
 
 @pytest.fixture
@@ -65,12 +80,14 @@ def test_image_bytes(test_image):
 
 @pytest.fixture
 def mock_sam3_segmenter():
-    """Mock SAM3Segmenter to avoid model loading"""
-    with patch('engine.pipeline.SAM3Segmenter') as mock_segmenter_class:
+    """Mock shared SAM3Segmenter to avoid model loading"""
+    with patch('engine.pipeline.get_segmenter') as mock_get_segmenter:
         mock_segmenter = MagicMock()
+        mock_segmenter.confidence_threshold = 0.5
+        mock_segmenter.model_version = "sam3.pt:test:fp32"
 
         # Mock segment() to return dummy masks and metadata
-        def segment_side_effect(image, concept_text):
+        def segment_side_effect(image, concept_text, merge=False):
             # Return single instance mask for simplicity
             mask = np.ones((100, 100), dtype=np.uint8) * 255
             metadata = {
@@ -80,8 +97,12 @@ def mock_sam3_segmenter():
             }
             return [mask], metadata
 
+        def segment_concepts_side_effect(image, prompts, merge=()):
+            return {prompt: segment_side_effect(image, prompt) for prompt in prompts}
+
         mock_segmenter.segment.side_effect = segment_side_effect
-        mock_segmenter_class.return_value = mock_segmenter
+        mock_segmenter.segment_concepts.side_effect = segment_concepts_side_effect
+        mock_get_segmenter.return_value = mock_segmenter
 
         yield mock_segmenter
 
@@ -150,7 +171,7 @@ class TestPipelineBasicFlow:
         assert len(result["errors"]) == 0
 
         # Verify segmenter was called
-        assert mock_sam3_segmenter.segment.called
+        assert mock_sam3_segmenter.segment_concepts.called
 
         # Verify R2 download was called
         mock_r2_client.download.assert_called()
@@ -214,11 +235,11 @@ class TestPipelineBasicFlow:
 
 
 class TestPipelineTwoStagePattern:
-    """Test two-stage pipeline pattern: segment once, apply many"""
+    """Test two-stage pipeline pattern: segment once per distinct photo, apply many"""
 
     def test_segment_called_once_per_concept(self, mock_env, mock_sam3_segmenter,
                                               mock_r2_client, mock_callback):
-        """Test that segmentation happens once per concept, not per item"""
+        """Test byte-identical items are segmented once per concept, not per item"""
         job_message = {
             "job_id": "job-2stage",
             "user_id": "user-abc",
@@ -237,38 +258,457 @@ class TestPipelineTwoStagePattern:
 
         result = process_job(job_message)
 
-        # Verify segmenter.segment() was called exactly once per concept (2 concepts)
-        # Not once per item (which would be 6 calls for 2 concepts * 3 items)
-        segment_calls = mock_sam3_segmenter.segment.call_count
-        assert segment_calls == 2  # Only 2 concepts, called once each
+        # Verify all concepts were segmented in a single segment_concepts() call
+        # Not once per item (which would be 6 decodes for 2 concepts * 3 items)
+        mock_sam3_segmenter.segment_concepts.assert_called_once()
+        prompts = mock_sam3_segmenter.segment_concepts.call_args[0][1]
+        assert prompts == ["Floor", "Wall"]
+        assert not mock_sam3_segmenter.segment.called
 
         # Verify all items still processed successfully
         assert result["successful_items"] == 3
 
     def test_masks_reused_across_items(self, mock_env, mock_sam3_segmenter,
                                        mock_r2_client, mock_callback, basic_job_message):
-        """Test that masks from Stage 1 are reused in Stage 2 for all items"""
+        """Test masks of identical photos are reused in Stage 2 for all items"""
         # Add more items to basic job
         basic_job_message["items"].extend([
             {"idx": 1, "input_key": "in/1.jpg", "output_key": "out/1.png", "preview_key": "prev/1.jpg"},
             {"idx": 2, "input_key": "in/2.jpg", "output_key": "out/2.png", "preview_key": "prev/2.jpg"}
         ])
 
-        # Track segment calls
-        segment_calls_before = mock_sam3_segmenter.segment.call_count
+        result = process_job(basic_job_message)
+
+        # Segmentation should only happen once (1 concept in basic job), not once per item
+        assert mock_sam3_segmenter.segment_concepts.call_count == 1
+        assert mock_sam3_segmenter.segment_concepts.call_args[0][1] == ["Floor"]
+
+        # But all 3 items should be processed
+        assert result["successful_items"] == 3
+
+    def test_probe_first_option(self, mock_env, mock_sam3_segmenter,
+                                mock_r2_client, mock_callback, basic_job_message):
+        """Test the job's probe_first flag reaches segment_concepts()"""
+        segment = mock_sam3_segmenter.segment.side_effect
+
+        def segment_concepts(image, prompts, merge=(), probe_first=False):
+            return {p: segment(image, p) for p in prompts}
+
+        mock_sam3_segmenter.segment_concepts.side_effect = segment_concepts
+        basic_job_message["probe_first"] = True
 
         result = process_job(basic_job_message)
 
-        # Segmentation should only happen once per concept (1 concept in basic job)
-        segment_calls_after = mock_sam3_segmenter.segment.call_count
-        new_segment_calls = segment_calls_after - segment_calls_before
+        assert result["successful_items"] == 1
+        assert mock_sam3_segmenter.segment_concepts.call_args.kwargs["probe_first"] is True
+        mock_sam3_segmenter.segment.assert_not_called()
 
-        # Should be 1 call for 1 concept, not 3 calls for 3 items
-        assert new_segment_calls == 1
 
-        # But all 3 items should be processed
+def _jpeg_bytes(color) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (100, 100), color).save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+class TestPipelinePerItemSegmentation:
+    """Test Stage 1 produces masks per item"""
+
+    @pytest.fixture
+    def three_photos(self, mock_r2_client):
+        """Three distinct photos keyed by input_key"""
+        photos = {f"in/{i}.jpg": _jpeg_bytes((40 * i, 100, 200)) for i in range(3)}
+        mock_r2_client.download.side_effect = lambda key: photos[key]
+        return photos
+
+    @pytest.fixture
+    def three_item_job(self, basic_job_message):
+        basic_job_message["items"] = [
+            {"idx": i, "input_key": f"in/{i}.jpg", "output_key": f"out/{i}.png", "preview_key": ""}
+            for i in range(3)
+        ]
+        return basic_job_message
+
+    def test_each_distinct_photo_segmented(self, mock_env, mock_sam3_segmenter, mock_callback,
+                                           three_photos, three_item_job):
+        """Test every distinct photo gets its own segmentation"""
+        result = process_job(three_item_job)
+
+        assert mock_sam3_segmenter.segment_concepts.call_count == 3
         assert result["successful_items"] == 3
 
+    def test_items_get_their_own_masks(self, mock_env, mock_sam3_segmenter, mock_callback,
+                                       three_photos, three_item_job):
+        """Test apply_rules receives the masks segmented from the same item"""
+        segmented = {}
+
+        def segment_concepts(image, prompts, merge=()):
+            mask = np.zeros((100, 100), dtype=bool)
+            mask[0, len(segmented)] = True  # unique per call
+            segmented[image.getpixel((50, 50))] = mask
+            return {
+                p: ([mask], {"concept": p, "instance_count": 1, "scores": [0.9]})
+                for p in prompts
+            }
+
+        mock_sam3_segmenter.segment_concepts.side_effect = segment_concepts
+        applied = []
+
+        def apply_rules(image, masks, concepts, protect_mask=None):
+            applied.append((image.getpixel((50, 50)), masks["Floor"][0]))
+            return image.convert("RGB")
+
+        with patch('engine.pipeline.apply_rules', side_effect=apply_rules):
+            process_job(three_item_job)
+
+        assert len(applied) == 3
+        for pixel, mask in applied:
+            assert mask is segmented[pixel]
+
+    def test_segmentation_overlaps_uploads(self, mock_env, mock_sam3_segmenter, mock_callback,
+                                           mock_r2_client, three_photos, three_item_job):
+        """Test item 1 is segmented while item 0 is still uploading"""
+        import threading
+
+        item1_segmented = threading.Event()
+        overlapped = []
+        photo1 = Image.open(io.BytesIO(three_photos["in/1.jpg"])).convert("RGB").getpixel((50, 50))
+        segment_concepts = mock_sam3_segmenter.segment_concepts.side_effect
+
+        def segment_and_signal(image, prompts, merge=()):
+            results = segment_concepts(image, prompts, merge)
+            if image.convert("RGB").getpixel((50, 50)) == photo1:
+                item1_segmented.set()
+            return results
+
+        def upload(key, data, content_type="image/png"):
+            if key == "out/0.png":
+                overlapped.append(item1_segmented.wait(timeout=5))
+
+        mock_sam3_segmenter.segment_concepts.side_effect = segment_and_signal
+        mock_r2_client.upload.side_effect = upload
+
+        result = process_job(three_item_job)
+
+        assert overlapped == [True]
+        assert result["successful_items"] == 3
+
+    def test_identical_bytes_segmented_once(self, mock_env, mock_sam3_segmenter, mock_callback,
+                                            mock_r2_client, three_photos, three_item_job):
+        """Test a duplicated photo inside a job is not segmented twice"""
+        three_photos["in/2.jpg"] = three_photos["in/0.jpg"]
+
+        result = process_job(three_item_job)
+
+        assert mock_sam3_segmenter.segment_concepts.call_count == 2
+        assert result["successful_items"] == 3
+
+    def test_same_image_masks_bounded(self, mock_env, mock_sam3_segmenter, mock_callback,
+                                      mock_r2_client, basic_job_message):
+        """Test only the last few images' masks are held; older repeats hit the mask cache"""
+        from engine import pipeline
+
+        photos = {f"in/{i}.jpg": _jpeg_bytes((10 * i, 100, 200)) for i in range(20)}
+        photos["in/20.jpg"] = photos["in/0.jpg"]  # repeat long after it was evicted
+        mock_r2_client.download.side_effect = lambda key: photos[key]
+        basic_job_message["items"] = [
+            {"idx": i, "input_key": key, "output_key": f"out/{i}.png", "preview_key": ""}
+            for i, key in enumerate(photos)
+        ]
+        held = []
+        remember = pipeline._JobRunner._remember_masks
+
+        def remember_and_count(runner, work):
+            remember(runner, work)
+            held.append(len(runner._masks_by_hash))
+
+        with patch.object(pipeline, "DEFAULT_SAME_IMAGE_ENTRIES", 2), \
+             patch.object(pipeline._JobRunner, "_remember_masks", remember_and_count):
+            result = process_job(basic_job_message)
+
+        assert result["successful_items"] == 21
+        assert len(held) == 21 and max(held) == 2
+        assert mock_sam3_segmenter.segment_concepts.call_count == 20
+
+    def test_segmenter_built_once_when_failing(self, mock_env, mock_callback,
+                                               three_photos, three_item_job):
+        """Test a failing segmenter build is not retried for every item"""
+        with patch('engine.pipeline.get_segmenter') as mock_get_segmenter:
+            mock_get_segmenter.side_effect = RuntimeError("Failed to load SAM3 model")
+
+            result = process_job(three_item_job)
+
+        mock_get_segmenter.assert_called_once()
+        assert result["failed_items"] == 3
+
+    def test_download_failure_fails_only_that_item(self, mock_env, mock_sam3_segmenter,
+                                                   mock_callback, three_photos, three_item_job):
+        """Test a missing photo does not fail the other items"""
+        del three_photos["in/1.jpg"]
+
+        result = process_job(three_item_job)
+
+        assert result["successful_items"] == 2
+        assert result["failed_items"] == 1
+
+    def test_bundle_per_item(self, mock_env, mock_sam3_segmenter, mock_callback,
+                             mock_r2_client, three_photos, three_item_job):
+        """Test every segmented item gets its own mask bundle"""
+        process_job(three_item_job)
+
+        uploaded = [c[0][0] for c in mock_r2_client.upload.call_args_list]
+        bundle_keys = [key for key in uploaded if key.startswith("masks/")]
+        assert sorted(bundle_keys) == [f"masks/in/{i}_masks.npz" for i in range(3)]
+
+
+class TestPipelineStages:
+    """Test staged pipeline stats and configuration"""
+
+    def test_stage_stats_in_summary(self, mock_env, mock_sam3_segmenter, mock_r2_client,
+                                    mock_callback, basic_job_message):
+        """Test result summary reports every stage with queue depth and busy time"""
+        result = process_job(basic_job_message)
+
+        assert list(result["stages"]) == [
+            "download", "decode", "segment", "apply", "encode", "upload", "callback"
+        ]
+        for stats in result["stages"].values():
+            assert stats["processed"] == 1
+            assert stats["failed"] == 0
+            assert stats["busy_sec"] >= 0
+            assert stats["max_queue_depth"] >= 1
+
+    def test_failed_stage_counted(self, mock_env, mock_sam3_segmenter, mock_r2_client,
+                                  mock_callback, basic_job_message):
+        """Test an upload failure stops the item before the callback stage"""
+        mock_r2_client.upload.side_effect = RuntimeError("Failed to upload to R2")
+
+        result = process_job(basic_job_message)
+
+        assert result["failed_items"] == 1
+        assert result["stages"]["upload"]["failed"] == 1
+        assert result["stages"]["callback"]["processed"] == 0
+
+    def test_stage_workers_follow_batch_concurrency(self, mock_env, mock_sam3_segmenter,
+                                                    mock_r2_client, mock_callback,
+                                                    basic_job_message):
+        """Test network/CPU stages use batch_concurrency, GPU stage stays single"""
+        basic_job_message["batch_concurrency"] = 3
+
+        stages = process_job(basic_job_message)["stages"]
+
+        assert stages["download"]["workers"] == 3
+        assert stages["upload"]["workers"] == 3
+        assert stages["segment"]["workers"] == 1
+
+    def test_stage_workers_override(self, mock_env, mock_sam3_segmenter, mock_r2_client,
+                                    mock_callback, basic_job_message):
+        """Test stage_workers overrides apply except for the GPU stage"""
+        basic_job_message["stage_workers"] = {"upload": 6, "segment": 4, "bogus": 2}
+
+        stages = process_job(basic_job_message)["stages"]
+
+        assert stages["upload"]["workers"] == 6
+        assert stages["segment"]["workers"] == 1
+        assert "bogus" not in stages
+
+
+class TestPipelineMaskCache:
+    """Test Stage 1 mask cache ("same photos, different rules")"""
+
+    def test_rerun_with_different_rules_skips_sam3(self, mock_env, mock_sam3_segmenter,
+                                                   mock_r2_client, mock_callback,
+                                                   basic_job_message):
+        """Test re-running the same photo with only rule changes does no inference"""
+        process_job(basic_job_message)
+
+        concepts = {
+            name: {"action": "recolor", "value": "#00FF00"}
+            for name in basic_job_message["concepts"]
+        }
+        rerun = dict(basic_job_message, job_id="job-b", concepts=concepts)
+        result = process_job(rerun)
+
+        assert mock_sam3_segmenter.segment_concepts.call_count == 1
+        assert result["successful_items"] == result["total_items"]
+
+    def test_only_uncached_prompts_segmented(self, mock_env, mock_sam3_segmenter,
+                                             mock_r2_client, mock_callback, basic_job_message):
+        """Test a new concept on a cached photo segments only that concept"""
+        process_job(basic_job_message)
+
+        extended = dict(basic_job_message, concepts={
+            **basic_job_message["concepts"], "Ceiling": {"action": "recolor", "value": "#FFFFFF"}
+        })
+        process_job(extended)
+
+        last_prompts = mock_sam3_segmenter.segment_concepts.call_args[0][1]
+        assert last_prompts == ["Ceiling"]
+
+    def test_cache_keyed_by_model_version(self, mock_env, mock_sam3_segmenter,
+                                          mock_r2_client, mock_callback, basic_job_message):
+        """Test a different model version does not reuse cached masks"""
+        process_job(basic_job_message)
+
+        mock_sam3_segmenter.model_version = "sam3.pt:other:fp32"
+        process_job(basic_job_message)
+
+        assert mock_sam3_segmenter.segment_concepts.call_count == 2
+
+    def test_cache_keyed_by_image_content(self, mock_env, mock_sam3_segmenter,
+                                          mock_r2_client, mock_callback, basic_job_message):
+        """Test a different photo does not reuse cached masks"""
+        process_job(basic_job_message)
+
+        other = io.BytesIO()
+        Image.new("RGB", (100, 100), (10, 200, 30)).save(other, format="JPEG")
+        mock_r2_client.download.return_value = other.getvalue()
+        process_job(basic_job_message)
+
+        assert mock_sam3_segmenter.segment_concepts.call_count == 2
+
+    def test_failed_concepts_not_cached(self, mock_env, mock_r2_client, mock_callback,
+                                        mask_cache, basic_job_message):
+        """Test segmentation failures are retried on the next job"""
+        with patch('engine.pipeline.get_segmenter') as mock_get_segmenter:
+            mock_segmenter = MagicMock()
+            mock_segmenter.confidence_threshold = 0.5
+            mock_segmenter.model_version = "sam3.pt:test:fp32"
+            mock_segmenter.segment_concepts.side_effect = RuntimeError("CUDA error")
+            mock_segmenter.segment.side_effect = RuntimeError("CUDA error")
+            mock_get_segmenter.return_value = mock_segmenter
+
+            process_job(basic_job_message)
+
+        assert mask_cache.stats()["memory_entries"] == 0
+
+
+class TestPipelineMaskBundle:
+    """Test R2 mask bundles (reuse across workers)"""
+
+    BUNDLE_KEY = "masks/user-abc/job-test-123/0_masks.npz"
+
+    @pytest.fixture
+    def r2_store(self, mock_r2_client, test_image_bytes, basic_job_message):
+        """Dict-backed R2: uploads are visible to later downloads"""
+        store = {basic_job_message["items"][0]["input_key"]: test_image_bytes}
+
+        def download(key):
+            if key not in store:
+                raise RuntimeError(f"Failed to download {key} from R2: NoSuchKey")
+            return store[key]
+
+        def upload(key, data, content_type="image/png"):
+            store[key] = data
+
+        mock_r2_client.download.side_effect = download
+        mock_r2_client.upload.side_effect = upload
+        return store
+
+    def test_bundle_uploaded_after_segmentation(self, mock_env, mock_sam3_segmenter,
+                                                mock_callback, r2_store, basic_job_message):
+        """Test segmented masks are persisted under the deterministic key"""
+        process_job(basic_job_message)
+
+        bundle = decode_bundle(r2_store[self.BUNDLE_KEY])
+        assert list(bundle.results) == ["Floor"]
+        assert bundle.model_version == "sam3.pt:test:fp32"
+        assert bundle.results["Floor"][1]["scores"] == [0.95]
+
+    def test_reuse_masks_skips_segmentation(self, mock_env, mock_sam3_segmenter, mock_callback,
+                                            mask_cache, r2_store, basic_job_message):
+        """Test a rerun on another worker loads the bundle instead of running SAM3"""
+        process_job(basic_job_message)
+        mask_cache.clear()  # another worker: no warm local cache
+        mock_sam3_segmenter.segment_concepts.reset_mock()
+
+        result = process_job(dict(basic_job_message, reuse_masks=True))
+
+        mock_sam3_segmenter.segment_concepts.assert_not_called()
+        assert result["successful_items"] == 1
+
+    def test_reuse_masks_segments_only_missing(self, mock_env, mock_sam3_segmenter, mock_callback,
+                                               mask_cache, r2_store, basic_job_message):
+        """Test prompts absent from the bundle are segmented and the bundle extended"""
+        process_job(basic_job_message)
+        mask_cache.clear()
+
+        rerun = dict(basic_job_message, reuse_masks=True, protect=["Grout"])
+        process_job(rerun)
+
+        assert mock_sam3_segmenter.segment_concepts.call_args[0][1] == ["Grout"]
+        assert set(decode_bundle(r2_store[self.BUNDLE_KEY]).results) == {"Floor", "Grout"}
+
+    def test_missing_bundle_falls_back_to_segmentation(self, mock_env, mock_sam3_segmenter,
+                                                       mock_callback, r2_store, basic_job_message):
+        """Test reuse_masks without a bundle still segments"""
+        result = process_job(dict(basic_job_message, reuse_masks=True))
+
+        assert mock_sam3_segmenter.segment_concepts.call_count == 1
+        assert result["successful_items"] == 1
+
+    def test_stale_bundle_ignored(self, mock_env, mock_sam3_segmenter, mock_callback,
+                                  mask_cache, r2_store, basic_job_message):
+        """Test a bundle written for different image bytes is not reused"""
+        process_job(basic_job_message)
+        mask_cache.clear()
+
+        replaced = io.BytesIO()
+        Image.new("RGB", (100, 100), (10, 200, 30)).save(replaced, format="JPEG")
+        r2_store[basic_job_message["items"][0]["input_key"]] = replaced.getvalue()
+        process_job(dict(basic_job_message, reuse_masks=True))
+
+        assert mock_sam3_segmenter.segment_concepts.call_count == 2
+
+    @pytest.mark.parametrize("attribute, value", [
+        ("model_version", "sam3.pt:test:bf16"),
+        ("model_version", "sam3.pt:test:fp32:merged"),
+        ("confidence_threshold", 0.7),
+    ])
+    def test_bundle_from_other_segmenter_ignored(self, mock_env, mock_sam3_segmenter, mock_callback,
+                                                 mask_cache, r2_store, basic_job_message,
+                                                 attribute, value):
+        """Test a bundle written with another model_version / threshold is not reused"""
+        process_job(basic_job_message)
+        mask_cache.clear()
+
+        setattr(mock_sam3_segmenter, attribute, value)
+        process_job(dict(basic_job_message, reuse_masks=True))
+
+        assert mock_sam3_segmenter.segment_concepts.call_count == 2
+        bundle = decode_bundle(r2_store[self.BUNDLE_KEY])
+        assert getattr(bundle, attribute) == value
+
+    def test_bundle_with_other_merge_not_reused(self, mock_env, mock_sam3_segmenter, mock_callback,
+                                                mask_cache, r2_store, basic_job_message):
+        """Test union masks in a bundle do not serve a rerun that keeps instances (and back)"""
+        process_job(basic_job_message)  # interior preset: Floor is single-instance (merged)
+        mask_cache.clear()
+        assert decode_bundle(r2_store[self.BUNDLE_KEY]).merged == {"Floor"}
+
+        process_job(dict(basic_job_message, reuse_masks=True, preset=None))
+        assert mock_sam3_segmenter.segment_concepts.call_count == 2
+        assert decode_bundle(r2_store[self.BUNDLE_KEY]).merged == set()
+
+        mask_cache.clear()
+        process_job(dict(basic_job_message, reuse_masks=True, preset=None))
+        assert mock_sam3_segmenter.segment_concepts.call_count == 2
+
+    def test_bundle_upload_failure_does_not_fail_job(self, mock_env, mock_sam3_segmenter,
+                                                     mock_callback, r2_store, basic_job_message,
+                                                     mock_r2_client):
+        """Test a failed bundle upload only logs a warning"""
+        def upload(key, data, content_type="image/png"):
+            if key.startswith("masks/"):
+                raise RuntimeError("Failed to upload to R2")
+            r2_store[key] = data
+
+        mock_r2_client.upload.side_effect = upload
+
+        result = process_job(basic_job_message)
+
+        assert result["successful_items"] == 1
+        assert result["errors"] == []
+
 
 class TestPipelineWithProtect:
     """Test pipeline with protect masks"""
@@ -291,14 +731,39 @@ class TestPipelineWithProtect:
 
         result = process_job(job_message)
 
-        # Verify segmentation was called for main concepts + protect concepts
-        segment_calls = mock_sam3_segmenter.segment.call_count
-        assert segment_calls == 3  # 1 main concept + 2 protect concepts
+        # Verify main concepts + protect concepts share one image encoding
+        mock_sam3_segmenter.segment_concepts.assert_called_once()
+        prompts = mock_sam3_segmenter.segment_concepts.call_args[0][1]
+        assert prompts == ["Floor", "Grout", "Trim"]  # 1 main concept + 2 protect concepts
 
         # Verify job succeeded
         assert result["successful_items"] == 1
         assert result["failed_items"] == 0
 
+    def test_protect_concept_overlapping_rule_concept(self, mock_env, mock_sam3_segmenter,
+                                                      mock_r2_client, mock_callback):
+        """Test a concept used both as rule and protect is segmented once"""
+        job_message = {
+            "job_id": "job-protect-dup",
+            "user_id": "user-test",
+            "concepts": {"Tile": {"action": "recolor", "value": "#AABBCC"}},
+            "protect": ["Tile", "Grout"],
+            "items": [
+                {
+                    "idx": 0,
+                    "input_key": "in/0.jpg",
+                    "output_key": "out/0.png",
+                    "preview_key": "prev/0.jpg",
+                }
+            ],
+            "callback_url": "https://api.workers.dev/callback"
+        }
+
+        result = process_job(job_message)
+
+        assert mock_sam3_segmenter.segment_concepts.call_args[0][1] == ["Tile", "Grout"]
+        assert result["successful_items"] == 1
+
     def test_protect_concepts_in_segment_calls(self, mock_env, mock_sam3_segmenter,
                                                 mock_r2_client, mock_callback):
         """Test that protect concept names are passed to segmenter"""
@@ -317,8 +782,8 @@ class TestPipelineWithProtect:
 
         process_job(job_message)
 
-        # Extract all concept names passed to segment()
-        segment_call_args = [call[0][1] for call in mock_sam3_segmenter.segment.call_args_list]
+        # Extract all concept names passed to segment_concepts()
+        segment_call_args = mock_sam3_segmenter.segment_concepts.call_args[0][1]
 
         # Should include main concept and protect concepts
         assert "Wall" in segment_call_args
@@ -326,6 +791,77 @@ class TestPipelineWithProtect:
         assert "Door" in segment_call_args
 
 
+class TestPipelineInstanceUnion:
+    """Test union masks for protect and single-instance preset concepts"""
+
+    def union_job(self, **overrides):
+        return {
+            "job_id": "job-union",
+            "user_id": "user-test",
+            "preset": "interior",
+            "concepts": {
+                "Wall": {"action": "recolor", "value": "#AABBCC"},
+                "Window": {"action": "recolor", "value": "#112233"},
+                "Custom_Thing": {"action": "recolor", "value": "#445566"},
+            },
+            "protect": ["Door"],
+            "items": [
+                {
+                    "idx": 0,
+                    "input_key": "in/0.jpg",
+                    "output_key": "out/0.png",
+                    "preview_key": "prev/0.jpg",
+                }
+            ],
+            "callback_url": "https://api.workers.dev/callback",
+            **overrides,
+        }
+
+    def test_merge_driven_by_preset_and_protect(self, mock_env, mock_sam3_segmenter,
+                                                mock_r2_client, mock_callback):
+        """Test multi_instance=False and protect concepts are requested as unions"""
+        process_job(self.union_job())
+
+        merge = mock_sam3_segmenter.segment_concepts.call_args.kwargs["merge"]
+        assert sorted(merge) == ["Door", "Wall"]  # Window is multi-instance, Custom_Thing unknown
+
+    def test_no_preset_merges_only_protect(self, mock_env, mock_sam3_segmenter,
+                                           mock_r2_client, mock_callback):
+        process_job(self.union_job(preset=None))
+
+        assert mock_sam3_segmenter.segment_concepts.call_args.kwargs["merge"] == ["Door"]
+
+    def test_per_concept_fallback_keeps_merge(self, mock_env, mock_sam3_segmenter,
+                                              mock_r2_client, mock_callback):
+        """Test the per-prompt retry still asks for union masks"""
+        mock_sam3_segmenter.segment_concepts.side_effect = RuntimeError("batch failed")
+
+        process_job(self.union_job())
+
+        merged = {c.args[1]: c.kwargs["merge"] for c in mock_sam3_segmenter.segment.call_args_list}
+        assert merged == {"Wall": True, "Window": False, "Custom_Thing": False, "Door": True}
+
+    def test_union_results_cached_apart(self, mock_env, mock_sam3_segmenter,
+                                        mock_r2_client, mock_callback, mask_cache):
+        """Test a prompt segmented as a union is not served as instances (and vice versa)"""
+        door = {"Door": {"action": "recolor", "value": "#AABBCC"}}
+        process_job(self.union_job(concepts=door, protect=[]))
+        process_job(self.union_job(concepts={}, protect=["Door"]))
+
+        assert mock_sam3_segmenter.segment_concepts.call_count == 2
+        image_hash = image_digest(mock_r2_client.download.return_value)
+        assert mask_cache.get(image_hash, "Door", 0.5, "sam3.pt:test:fp32:merged") is not None
+
+    def test_is_multi_instance(self):
+        from presets import is_multi_instance
+
+        assert is_multi_instance("interior", "Window")
+        assert not is_multi_instance("interior", "Wall")
+        assert not is_multi_instance("seller", "Product")
+        assert is_multi_instance("interior", "Unknown")
+        assert is_multi_instance(None, "Wall")
+
+
 class TestPipelineCallbacks:
     """Test per-item callback functionality"""
 
@@ -424,9 +960,9 @@ class TestPipelineErrorHandling:
 
     def test_segmenter_initialization_failure(self, mock_env, mock_r2_client, mock_callback):
         """Test handling of segmenter initialization failure"""
-        with patch('engine.pipeline.SAM3Segmenter') as mock_segmenter_class:
+        with patch('engine.pipeline.get_segmenter') as mock_get_segmenter:
             # Make segmenter initialization fail
-            mock_segmenter_class.side_effect = RuntimeError("Failed to load SAM3 model")
+            mock_get_segmenter.side_effect = RuntimeError("Failed to load SAM3 model")
 
             job_message = {
                 "job_id": "job-segmenter-fail",
@@ -505,11 +1041,11 @@ class TestPipelineErrorHandling:
 
     def test_concept_segmentation_failure(self, mock_env, mock_r2_client, mock_callback):
         """Test that job continues if one concept fails to segment"""
-        with patch('engine.pipeline.SAM3Segmenter') as mock_segmenter_class:
+        with patch('engine.pipeline.get_segmenter') as mock_get_segmenter:
             mock_segmenter = MagicMock()
 
             # Make segment fail for specific concept
-            def segment_side_effect(image, concept_text):
+            def segment_side_effect(image, concept_text, merge=False):
                 if concept_text == "Floor":
                     raise RuntimeError("Failed to segment Floor")
                 # Return dummy mask for other concepts
@@ -518,7 +1054,9 @@ class TestPipelineErrorHandling:
                 return [mask], metadata
 
             mock_segmenter.segment.side_effect = segment_side_effect
-            mock_segmenter_class.return_value = mock_segmenter
+            # Combined call fails → pipeline retries per concept
+            mock_segmenter.segment_concepts.side_effect = RuntimeError("Failed to segment Floor")
+            mock_get_segmenter.return_value = mock_segmenter
 
             job_message = {
                 "job_id": "job-concept-fail",
@@ -566,6 +1104,7 @@ class TestPipelineEdgeCases:
 
         # Segmenter should not be called
         assert not mock_sam3_segmenter.segment.called
+        assert not mock_sam3_segmenter.segment_concepts.called
 
     def test_no_protect_concepts(self, mock_env, mock_sam3_segmenter,
                                   mock_r2_client, mock_callback, basic_job_message):
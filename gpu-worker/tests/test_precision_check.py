@@ -0,0 +1,184 @@
+"""
+Unit tests for the precision accuracy/speed harness
+
+Tests verify:
+- mask_iou() on unions of instance masks, including empty cases
+- compare_precisions() runs fp32 first and reports IoU drift per mode
+- Instance-count mismatches and lowest-IoU pairs are reported
+- A failing mode is recorded without aborting the report
+- The segmenter's precision is restored afterwards
+- compare_backends() compares backends against the first one
+- End to end with SAM3Segmenter.from_model and a fake SAM3 model
+"""
+
+import os
+import sys
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+import pytest
+from PIL import Image
+
+# Add parent directory to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+# Mock torch and sam3 before importing segmenter
+sys.modules.setdefault('torch', MagicMock())
+for _name in ('sam3', 'sam3.model', 'sam3.model.sam3_image_processor', 'sam3.model.data_misc'):
+    sys.modules.setdefault(_name, MagicMock())
+
+from engine.precision_check import compare_backends, compare_precisions, format_report, mask_iou  # noqa: E402
+from engine.segmenter import SAM3Segmenter  # noqa: E402
+from tests.sam3_fakes import FakeFindStage, FakeSam3Model, make_fake_processor, make_fake_torch  # noqa: E402
+
+
+class StubSegmenter:
+    """Segmenter whose masks shift right by `shift[precision]` pixels"""
+
+    def __init__(self, shift: dict, fail: tuple = ()):
+        self.precision = "fp32"
+        self.shift = shift
+        self.fail = fail
+        self.modes_run = []
+
+    def set_precision(self, precision):
+        self.precision = precision
+
+    def segment_concepts(self, image, prompts):
+        if self.precision in self.fail:
+            raise RuntimeError(f"{self.precision} not supported on this device")
+        self.modes_run.append(self.precision)
+        mask = np.zeros((10, 10), dtype=bool)
+        offset = self.shift.get(self.precision, 0)
+        mask[:, offset:offset + 5] = True
+        count = 2 if offset >= 3 else 1
+        return {p: ([mask] * count, {"instance_count": count}) for p in prompts}
+
+
+@pytest.fixture
+def images():
+    return [Image.new('RGB', (10, 10), (i * 60, 0, 0)) for i in range(2)]
+
+
+class TestMaskIou:
+    """Test IoU of instance mask unions"""
+
+    def test_identical(self):
+        mask = np.eye(4, dtype=bool)
+        assert mask_iou([mask], [mask]) == 1.0
+
+    def test_partial_overlap(self):
+        a = np.zeros((4, 4), dtype=bool)
+        b = np.zeros((4, 4), dtype=bool)
+        a[:, :2] = True
+        b[:, 1:3] = True
+        assert mask_iou([a], [b]) == pytest.approx(4 / 12)
+
+    def test_union_of_instances(self):
+        """Test split instances compare equal to one merged mask"""
+        left = np.zeros((4, 4), dtype=bool)
+        right = np.zeros((4, 4), dtype=bool)
+        left[:, :2] = True
+        right[:, 2:] = True
+        assert mask_iou([left, right], [np.ones((4, 4), dtype=bool)]) == 1.0
+
+    def test_empty(self):
+        """Test both empty is perfect agreement, one empty is none"""
+        assert mask_iou([], []) == 1.0
+        assert mask_iou([np.ones((3, 3), dtype=bool)], []) == 0.0
+        assert mask_iou([np.zeros((3, 3), dtype=bool)], [np.zeros((3, 3), dtype=bool)]) == 1.0
+
+
+class TestComparePrecisions:
+    """Test per-mode drift and speedup report"""
+
+    def test_baseline_first_and_drift_reported(self, images):
+        """Test fp32 runs first and shifted masks lower the IoU"""
+        segmenter = StubSegmenter({"bf16": 0, "fp16": 1})
+
+        report = compare_precisions(segmenter, images, ["wall", "floor"], ("bf16", "fp16"),
+                                    repeats=1)
+
+        assert segmenter.modes_run[0] == "fp32"
+        assert list(report["modes"]) == ["fp32", "bf16", "fp16"]
+        assert report["pairs"] == 4
+        assert report["modes"]["bf16"]["mean_iou"] == 1.0
+        assert report["modes"]["fp16"]["mean_iou"] == pytest.approx(4 / 6, abs=1e-4)
+        assert report["modes"]["fp16"]["min_iou"] == pytest.approx(4 / 6, abs=1e-4)
+        assert report["modes"]["fp32"]["speedup"] is not None
+
+    def test_count_mismatches_and_worst_pairs(self, images):
+        """Test instance-count differences and worst pairs are listed"""
+        report = compare_precisions(StubSegmenter({"fp16": 3}), images, ["wall"], ("fp16",),
+                                    repeats=1)
+
+        entry = report["modes"]["fp16"]
+        assert entry["count_mismatches"] == 2
+        assert len(entry["worst"]) == 2
+        assert entry["worst"][0]["prompt"] == "wall"
+        assert "fp16" in format_report(report)
+
+    def test_failed_mode_recorded(self, images):
+        """Test a mode that raises is reported and the rest still run"""
+        segmenter = StubSegmenter({}, fail=("fp16",))
+
+        report = compare_precisions(segmenter, images, ["wall"], repeats=1)
+
+        assert "not supported" in report["modes"]["fp16"]["error"]
+        assert report["modes"]["bf16"]["mean_iou"] == 1.0
+        assert "failed" in format_report(report)
+
+    def test_precision_restored(self, images):
+        """Test the segmenter ends in its original mode"""
+        segmenter = StubSegmenter({})
+        segmenter.precision = "bf16"
+
+        compare_precisions(segmenter, images, ["wall"], repeats=1)
+
+        assert segmenter.precision == "bf16"
+
+
+class TestCompareBackends:
+    """Test backend latency / agreement report (e.g. torch vs onnx)"""
+
+    def test_first_backend_is_baseline(self, images):
+        backends = {"torch": StubSegmenter({}), "onnx": StubSegmenter({"fp32": 1})}
+
+        report = compare_backends(backends, images, ["wall", "floor"], repeats=1)
+
+        assert report["baseline"] == "torch"
+        assert list(report["modes"]) == ["torch", "onnx"]
+        assert report["modes"]["torch"]["mean_iou"] == 1.0
+        assert report["modes"]["onnx"]["mean_iou"] == pytest.approx(4 / 6, abs=1e-4)
+        assert report["modes"]["onnx"]["speedup"] is not None
+        assert "onnx" in format_report(report)
+
+    def test_failed_backend_recorded(self, images):
+        backends = {"torch": StubSegmenter({}), "onnx": StubSegmenter({}, fail=("fp32",))}
+
+        report = compare_backends(backends, images, ["wall"], repeats=1)
+
+        assert "not supported" in report["modes"]["onnx"]["error"]
+
+    def test_failed_baseline_raises(self, images):
+        backends = {"torch": StubSegmenter({}, fail=("fp32",)), "onnx": StubSegmenter({})}
+
+        with pytest.raises(RuntimeError):
+            compare_backends(backends, images, ["wall"], repeats=1)
+
+
+class TestHarnessWithSegmenter:
+    """Test the harness against SAM3Segmenter.from_model on CPU"""
+
+    def test_fake_model_has_no_drift(self, images):
+        """Test a precision-independent model gives IoU 1.0 in every mode"""
+        with patch('engine.segmenter.torch', make_fake_torch()), \
+             patch('engine.segmenter.FindStage', FakeFindStage):
+            segmenter = SAM3Segmenter.from_model(FakeSam3Model(), make_fake_processor())
+            report = compare_precisions(segmenter, images, ["wall surface", "floor surface"],
+                                        repeats=1)
+
+        for mode in ("fp32", "bf16", "fp16"):
+            assert report["modes"][mode]["mean_iou"] == 1.0
+            assert report["modes"][mode]["count_mismatches"] == 0
+        assert segmenter.precision == "fp32"
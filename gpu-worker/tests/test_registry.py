@@ -0,0 +1,236 @@
+"""
+Unit tests for the process-wide segmenter registry
+
+Tests verify:
+- Segmenter is built once per (checkpoint, bpe, precision) key
+- build_count counts actual model builds
+- preload / evict / clear lifecycle hooks
+- Reload when the checkpoint file changes on disk
+- Environment variable key resolution and build option defaults
+- Failed builds are not cached
+"""
+
+import os
+import sys
+import threading
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+# Add parent directory to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from engine.registry import SegmenterRegistry, get_registry, get_segmenter
+
+
+@pytest.fixture
+def checkpoint(tmp_path):
+    """Create a fake checkpoint file"""
+    path = tmp_path / "sam3.pt"
+    path.write_bytes(b"weights-v1")
+    return str(path)
+
+
+@pytest.fixture
+def stub_factory():
+    """Stub model factory returning a new Mock per build"""
+    def build(checkpoint_path, bpe_path, precision, **options):
+        segmenter = MagicMock()
+        segmenter.checkpoint_path = checkpoint_path
+        segmenter.bpe_path = bpe_path
+        segmenter.precision = precision
+        segmenter.options = options
+        return segmenter
+
+    return MagicMock(side_effect=build)
+
+
+@pytest.fixture
+def registry(stub_factory):
+    return SegmenterRegistry(factory=stub_factory)
+
+
+class TestRegistryGet:
+    """Test SegmenterRegistry.get() caching"""
+
+    def test_builds_once_for_same_key(self, registry, stub_factory, checkpoint):
+        """Test repeated get() returns the same warm segmenter"""
+        first = registry.get(checkpoint_path=checkpoint, bpe_path="/bpe.gz")
+        second = registry.get(checkpoint_path=checkpoint, bpe_path="/bpe.gz")
+
+        assert first is second
+        assert registry.build_count == 1
+        stub_factory.assert_called_once()
+
+    def test_factory_receives_key_and_options(self, registry, stub_factory, checkpoint):
+        """Test factory is called with resolved key and extra options"""
+        segmenter = registry.get(
+            checkpoint_path=checkpoint, bpe_path="/bpe.gz", precision="fp32",
+            confidence_threshold=0.3,
+        )
+
+        assert segmenter.checkpoint_path == checkpoint
+        assert segmenter.bpe_path == "/bpe.gz"
+        assert segmenter.precision == "fp32"
+        assert segmenter.options == {"confidence_threshold": 0.3}
+
+    def test_threshold_default_from_env(self, registry, checkpoint):
+        """Test CONFIDENCE_THRESHOLD is the build default whoever builds first"""
+        with patch.dict(os.environ, {"CONFIDENCE_THRESHOLD": "0.35"}):
+            segmenter = registry.preload(checkpoint_path=checkpoint)
+
+        assert segmenter.options == {"confidence_threshold": 0.35}
+
+    def test_different_precision_builds_separately(self, registry, checkpoint):
+        """Test precision is part of the key"""
+        a = registry.get(checkpoint_path=checkpoint, bpe_path="/bpe.gz", precision="fp32")
+        b = registry.get(checkpoint_path=checkpoint, bpe_path="/bpe.gz", precision="bf16")
+
+        assert a is not b
+        assert registry.build_count == 2
+        assert len(registry.keys()) == 2
+
+    def test_different_bpe_builds_separately(self, registry, checkpoint):
+        """Test BPE path is part of the key"""
+        a = registry.get(checkpoint_path=checkpoint, bpe_path="/a.gz")
+        b = registry.get(checkpoint_path=checkpoint, bpe_path="/b.gz")
+
+        assert a is not b
+        assert registry.build_count == 2
+
+    def test_options_ignored_when_cached(self, registry, checkpoint):
+        """Test extra options only apply to the build"""
+        first = registry.get(checkpoint_path=checkpoint, confidence_threshold=0.5)
+        second = registry.get(checkpoint_path=checkpoint, confidence_threshold=0.9)
+
+        assert first is second
+        assert second.options == {"confidence_threshold": 0.5}
+
+    def test_failed_build_not_cached(self, checkpoint):
+        """Test a factory error propagates and nothing is cached"""
+        factory = MagicMock(side_effect=RuntimeError("Failed to load SAM3 model"))
+        registry = SegmenterRegistry(factory=factory)
+
+        with pytest.raises(RuntimeError):
+            registry.get(checkpoint_path=checkpoint)
+
+        assert registry.build_count == 0
+        assert registry.keys() == []
+
+    def test_concurrent_get_builds_once(self, registry, checkpoint):
+        """Test concurrent callers share a single build"""
+        results = []
+
+        def worker():
+            results.append(registry.get(checkpoint_path=checkpoint))
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        assert registry.build_count == 1
+        assert all(r is results[0] for r in results)
+
+
+class TestRegistryLifecycle:
+    """Test preload / evict / reload hooks"""
+
+    def test_preload_builds_and_caches(self, registry, checkpoint):
+        """Test preload() warms the registry for later get()"""
+        preloaded = registry.preload(checkpoint_path=checkpoint)
+
+        assert registry.build_count == 1
+        assert registry.get(checkpoint_path=checkpoint) is preloaded
+        assert registry.build_count == 1
+
+    def test_evict_forces_rebuild(self, registry, checkpoint):
+        """Test evict() drops the segmenter so next get() rebuilds"""
+        first = registry.get(checkpoint_path=checkpoint)
+
+        assert registry.evict(checkpoint_path=checkpoint) is True
+        assert registry.evict(checkpoint_path=checkpoint) is False
+
+        second = registry.get(checkpoint_path=checkpoint)
+        assert second is not first
+        assert registry.build_count == 2
+
+    def test_clear_drops_everything(self, registry, checkpoint):
+        """Test clear() empties the registry"""
+        registry.get(checkpoint_path=checkpoint, precision="fp32")
+        registry.get(checkpoint_path=checkpoint, precision="bf16")
+
+        registry.clear()
+
+        assert registry.keys() == []
+
+    def test_reload_on_checkpoint_change(self, registry, checkpoint):
+        """Test get() rebuilds when the checkpoint file changes"""
+        first = registry.get(checkpoint_path=checkpoint)
+
+        with open(checkpoint, "wb") as f:
+            f.write(b"weights-v2-larger")
+
+        second = registry.get(checkpoint_path=checkpoint)
+
+        assert second is not first
+        assert registry.build_count == 2
+        # Unchanged file → cached again
+        assert registry.get(checkpoint_path=checkpoint) is second
+
+    def test_reload_on_mtime_change(self, registry, checkpoint):
+        """Test same-size checkpoint replacement is detected via mtime"""
+        first = registry.get(checkpoint_path=checkpoint)
+
+        stat = os.stat(checkpoint)
+        os.utime(checkpoint, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+        assert registry.get(checkpoint_path=checkpoint) is not first
+
+
+class TestRegistryKeyResolution:
+    """Test environment variable key resolution"""
+
+    def test_resolve_key_from_env(self):
+        """Test key falls back to MODEL_CHECKPOINT / BPE_PATH / MODEL_PRECISION"""
+        env = {
+            "MODEL_CHECKPOINT": "/env/sam3.pt",
+            "BPE_PATH": "/env/bpe.gz",
+            "MODEL_PRECISION": "bf16",
+        }
+        with patch.dict(os.environ, env, clear=False):
+            assert SegmenterRegistry.resolve_key() == ("/env/sam3.pt", "/env/bpe.gz", "bf16")
+
+    def test_resolve_key_defaults(self):
+        """Test default key matches SAM3Segmenter defaults"""
+        with patch.dict(os.environ, {}, clear=False):
+            for var in ("MODEL_CHECKPOINT", "BPE_PATH", "MODEL_PRECISION"):
+                os.environ.pop(var, None)
+
+            assert SegmenterRegistry.resolve_key() == (
+                "/models/sam3.pt",
+                "/app/sam3/sam3/assets/bpe_simple_vocab_16e6.txt.gz",
+                "fp32",
+            )
+
+    def test_explicit_args_override_env(self):
+        """Test explicit arguments win over environment"""
+        with patch.dict(os.environ, {"MODEL_CHECKPOINT": "/env/sam3.pt"}, clear=False):
+            key = SegmenterRegistry.resolve_key(checkpoint_path="/arg/sam3.pt")
+            assert key[0] == "/arg/sam3.pt"
+
+
+class TestDefaultRegistry:
+    """Test process-wide default registry helpers"""
+
+    def test_get_registry_is_singleton(self):
+        """Test get_registry() always returns the same registry"""
+        assert get_registry() is get_registry()
+
+    def test_get_segmenter_uses_default_registry(self, checkpoint):
+        """Test get_segmenter() delegates to the default registry"""
+        with patch.object(get_registry(), "get") as mock_get:
+            get_segmenter(checkpoint_path=checkpoint, confidence_threshold=0.4)
+
+            mock_get.assert_called_once_with(checkpoint, None, None, confidence_threshold=0.4)
@@ -0,0 +1,81 @@
+"""
+Unit tests for the input-resolution quality report
+
+Tests verify:
+- docs/legacy-prompts.json categories are loaded
+- compare_resolutions() reports IoU vs native masks per category and config
+- The segmenter's resolution settings are restored afterwards
+"""
+
+import os
+import sys
+
+import numpy as np
+import pytest
+from PIL import Image
+
+# Add parent directory to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from engine.resolution_check import compare_resolutions, format_report, load_prompt_categories
+
+
+class StubSegmenter:
+    """Masks lose their last `drop[side]` columns when encoded at a reduced side"""
+
+    def __init__(self, drop: dict):
+        self.drop = drop
+        self.max_input_side = 0
+        self.mask_upsample = "bilinear"
+        self.settings = []
+
+    def set_input_resolution(self, max_input_side, mask_upsample="bilinear"):
+        self.max_input_side = max_input_side
+        self.mask_upsample = mask_upsample
+        self.settings.append((max_input_side, mask_upsample))
+
+    def segment_concepts(self, image, prompts):
+        mask = np.zeros((10, 10), dtype=bool)
+        mask[:, :10 - self.drop.get(self.max_input_side, 0)] = True
+        return {p: ([mask], {"instance_count": 1}) for p in prompts}
+
+
+@pytest.fixture
+def images():
+    return [Image.new('RGB', (10, 10)) for _ in range(2)]
+
+
+class TestLoadPromptCategories:
+    def test_legacy_prompts(self):
+        """Test the bundled corpus loads with its categories"""
+        categories = load_prompt_categories()
+
+        assert {"objects", "complex", "background", "body_parts"} <= set(categories)
+        assert "person" in categories["objects"]
+
+
+class TestCompareResolutions:
+    def test_iou_per_category_and_config(self, images):
+        """Test each side/mode pair reports per-category IoU vs native"""
+        categories = {"a": ["wall"], "b": ["floor", "door"]}
+        segmenter = StubSegmenter({512: 5})
+
+        report = compare_resolutions(segmenter, images, categories, sides=(512, 1024),
+                                     upsample_modes=("nearest",))
+
+        assert report["prompts"] == 3
+        configs = {(c["max_input_side"], c["mask_upsample"]): c for c in report["configs"]}
+        assert configs[(512, "nearest")]["categories"]["b"]["mean_iou"] == 0.5
+        assert configs[(512, "nearest")]["mean_iou"] == 0.5
+        assert configs[(1024, "nearest")]["categories"]["a"]["min_iou"] == 1.0
+        assert "512" in format_report(report)
+
+    def test_settings_restored(self, images):
+        """Test the original max_input_side / upsample mode are put back"""
+        segmenter = StubSegmenter({})
+        segmenter.max_input_side, segmenter.mask_upsample = 2048, "nearest"
+
+        compare_resolutions(segmenter, images, {"a": ["wall"]}, sides=(512,))
+
+        assert segmenter.settings[0] == (0, "nearest")
+        assert (segmenter.max_input_side, segmenter.mask_upsample) == (2048, "nearest")
@@ -0,0 +1,307 @@
+"""
+Unit tests for the micro-batching segment scheduler
+
+Tests verify:
+- Requests queued while the GPU is busy are run as one segment_batch() call
+- A lone request uses segment_concepts(); prompt sets / merge lists are grouped apart
+- probe_first requests are segmented per image with probe_first=True
+- Per-request confidence thresholds are forwarded and never batched together
+- Futures resolve with each caller's own result, errors reach every caller
+- submit_async() from coroutines, blocking segment_concepts() / segment()
+- Batch fill ratio and queueing delay metrics
+- close() and the process-wide get_scheduler()
+"""
+
+import asyncio
+import os
+import sys
+import threading
+
+import pytest
+from PIL import Image
+
+# Add parent directory to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from engine import metrics
+from engine import scheduler as scheduler_module
+from engine.scheduler import SegmentScheduler, get_scheduler
+
+
+class FakeSegmenter:
+    """Records calls; results are tagged with the image colour so callers can be told apart"""
+
+    confidence_threshold = 0.5
+    model_version = "sam3.pt:test:fp32"
+
+    def __init__(self):
+        self.calls = []
+        self.release = threading.Event()
+        self.release.set()
+        self.busy = threading.Event()
+        self.error = None
+
+    def _result(self, image, prompts, merge, threshold=None):
+        return {
+            p: ([], {
+                "concept": p,
+                "pixel": image.getpixel((0, 0)),
+                "merged": p in merge,
+                "threshold": threshold,
+            })
+            for p in prompts
+        }
+
+    def segment_concepts(self, image, prompts, merge=(), probe_first=False,
+                         confidence_threshold=None):
+        name = "segment_concepts" + ("+probe" if probe_first else "")
+        self.calls.append((name, 1, list(prompts)))
+        self.busy.set()
+        self.release.wait(5)
+        if self.error:
+            raise self.error
+        return self._result(image, prompts, merge, confidence_threshold)
+
+    def segment_batch(self, images, prompts, merge=(), confidence_threshold=None):
+        self.calls.append(("segment_batch", len(images), list(prompts)))
+        if self.error:
+            raise self.error
+        return [self._result(image, prompts, merge, confidence_threshold) for image in images]
+
+
+def photo(value: int) -> Image.Image:
+    return Image.new('RGB', (8, 8), (value, value, value))
+
+
+@pytest.fixture(autouse=True)
+def clean_metrics():
+    metrics.reset()
+    yield
+    metrics.reset()
+
+
+@pytest.fixture
+def segmenter():
+    return FakeSegmenter()
+
+
+@pytest.fixture
+def scheduler(segmenter):
+    scheduler = SegmentScheduler(segmenter, max_batch_size=4, max_wait_ms=0)
+    yield scheduler
+    scheduler.close(timeout=5)
+
+
+def block_worker(scheduler, segmenter):
+    """Occupy the worker with one request so the next ones queue up"""
+    segmenter.release.clear()
+    future = scheduler.submit(photo(0), ["wall"])
+    assert segmenter.busy.wait(5)
+    return future
+
+
+class TestMicroBatching:
+    def test_queued_requests_batched(self, scheduler, segmenter):
+        """Test requests arriving while the GPU is busy share one segment_batch call"""
+        blocker = block_worker(scheduler, segmenter)
+        futures = [scheduler.submit(photo(v), ["wall", "floor"]) for v in (10, 20, 30)]
+        segmenter.release.set()
+
+        results = [f.result(timeout=5) for f in futures]
+
+        assert blocker.result(timeout=5)["wall"][1]["pixel"] == (0, 0, 0)
+        assert segmenter.calls[1] == ("segment_batch", 3, ["wall", "floor"])
+        pixels = [r["floor"][1]["pixel"] for r in results]
+        assert pixels == [(10, 10, 10), (20, 20, 20), (30, 30, 30)]
+
+    def test_batch_size_bounded(self, scheduler, segmenter):
+        blocker = block_worker(scheduler, segmenter)
+        futures = [scheduler.submit(photo(v), ["wall"]) for v in range(6)]
+        segmenter.release.set()
+        for f in [blocker, *futures]:
+            f.result(timeout=5)
+
+        assert [c[1] for c in segmenter.calls] == [1, 4, 2]
+
+    def test_groups_by_prompts_and_merge(self, scheduler, segmenter):
+        """Test different prompt lists / merge sets are never mixed in one call"""
+        blocker = block_worker(scheduler, segmenter)
+        a = scheduler.submit(photo(1), ["wall"])
+        b = scheduler.submit(photo(2), ["door"])
+        c = scheduler.submit(photo(3), ["wall"], merge=["wall"])
+        d = scheduler.submit(photo(4), ["wall"])
+        segmenter.release.set()
+
+        assert a.result(timeout=5)["wall"][1]["merged"] is False
+        assert "door" in b.result(timeout=5)
+        assert c.result(timeout=5)["wall"][1]["merged"] is True
+        assert d.result(timeout=5)["wall"][1]["pixel"] == (4, 4, 4)
+        blocker.result(timeout=5)
+        assert sorted(segmenter.calls[1:]) == [
+            ("segment_batch", 2, ["wall"]),
+            ("segment_concepts", 1, ["door"]),
+            ("segment_concepts", 1, ["wall"]),
+        ]
+
+    def test_probe_first_per_image(self, scheduler, segmenter):
+        """Test probe_first requests are not batched with plain ones"""
+        blocker = block_worker(scheduler, segmenter)
+        probed = [scheduler.submit(photo(v), ["wall"], probe_first=True) for v in (1, 2)]
+        plain = scheduler.submit(photo(3), ["wall"])
+        segmenter.release.set()
+
+        assert [f.result(timeout=5)["wall"][1]["pixel"] for f in probed] == [(1, 1, 1), (2, 2, 2)]
+        plain.result(timeout=5)
+        blocker.result(timeout=5)
+        assert sorted(segmenter.calls[1:]) == [
+            ("segment_concepts", 1, ["wall"]),
+            ("segment_concepts+probe", 1, ["wall"]),
+            ("segment_concepts+probe", 1, ["wall"]),
+        ]
+
+    def test_groups_by_threshold(self, scheduler, segmenter):
+        """Test each request is segmented at its own confidence threshold"""
+        blocker = block_worker(scheduler, segmenter)
+        low = [scheduler.submit(photo(v), ["wall"], confidence_threshold=0.3) for v in (1, 2)]
+        default = scheduler.submit(photo(3), ["wall"])
+        segmenter.release.set()
+
+        assert [f.result(timeout=5)["wall"][1]["threshold"] for f in low] == [0.3, 0.3]
+        assert default.result(timeout=5)["wall"][1]["threshold"] is None
+        blocker.result(timeout=5)
+        assert sorted(segmenter.calls[1:]) == [
+            ("segment_batch", 2, ["wall"]),
+            ("segment_concepts", 1, ["wall"]),
+        ]
+
+    def test_waits_for_more_requests(self, segmenter):
+        """Test a batch stays open for max_wait_ms after its first request"""
+        scheduler = SegmentScheduler(segmenter, max_batch_size=2, max_wait_ms=2000)
+        try:
+            first = scheduler.submit(photo(1), ["wall"])
+            second = scheduler.submit(photo(2), ["wall"])
+            first.result(timeout=5)
+            second.result(timeout=5)
+        finally:
+            scheduler.close(timeout=5)
+
+        assert segmenter.calls == [("segment_batch", 2, ["wall"])]
+
+    def test_error_reaches_every_caller(self, scheduler, segmenter):
+        blocker = block_worker(scheduler, segmenter)
+        futures = [scheduler.submit(photo(v), ["wall"]) for v in (1, 2)]
+        segmenter.error = RuntimeError("CUDA error")
+        segmenter.release.set()
+
+        for future in [blocker, *futures]:
+            with pytest.raises(RuntimeError, match="CUDA error"):
+                future.result(timeout=5)
+
+        # The worker keeps serving after a failure
+        segmenter.error = None
+        assert "wall" in scheduler.segment_concepts(photo(3), ["wall"])
+
+
+class TestCallerInterface:
+    def test_blocking_calls(self, scheduler):
+        results = scheduler.segment_concepts(photo(5), ["wall", "wall", "door"])
+        masks, metadata = scheduler.segment(photo(6), "door", merge=True, confidence_threshold=0.7)
+
+        assert list(results) == ["wall", "door"]
+        assert metadata["merged"] is True and metadata["pixel"] == (6, 6, 6)
+        assert metadata["threshold"] == 0.7
+        assert scheduler.model_version == "sam3.pt:test:fp32"
+        assert scheduler.confidence_threshold == 0.5
+
+    def test_submit_async(self, scheduler):
+        async def run():
+            return await asyncio.gather(
+                *(scheduler.submit_async(photo(v), ["wall"]) for v in (1, 2, 3))
+            )
+
+        results = asyncio.run(run())
+
+        assert [r["wall"][1]["pixel"][0] for r in results] == [1, 2, 3]
+
+    def test_closed_scheduler_rejects(self, segmenter):
+        scheduler = SegmentScheduler(segmenter)
+        scheduler.close(timeout=5)
+
+        with pytest.raises(RuntimeError):
+            scheduler.submit(photo(1), ["wall"])
+
+    def test_close_during_submit(self, segmenter):
+        """Test a request queued while close() runs still resolves (never behind the sentinel)"""
+        scheduler = SegmentScheduler(segmenter, max_wait_ms=0)
+        put = scheduler._queue.put
+        closer = threading.Thread(target=scheduler.close, kwargs={"timeout": 5})
+
+        def put_racing_close(item):
+            if item is not None and not closer.is_alive():
+                closer.start()
+                closer.join(0.2)  # close() gets as far as it can before this put
+            put(item)
+
+        scheduler._queue.put = put_racing_close
+        future = scheduler.submit(photo(1), ["wall"])
+        closer.join(5)
+
+        assert future.result(timeout=5)["wall"][1]["pixel"] == (1, 1, 1)
+        with pytest.raises(RuntimeError):
+            scheduler.submit(photo(2), ["wall"])
+
+    @pytest.mark.parametrize("kwargs", [{"max_batch_size": -1}, {"max_wait_ms": -5}])
+    def test_invalid_settings(self, segmenter, kwargs):
+        with pytest.raises(ValueError):
+            SegmentScheduler(segmenter, **kwargs)
+
+
+class TestSchedulerMetrics:
+    def test_fill_ratio_and_delay(self, scheduler, segmenter):
+        blocker = block_worker(scheduler, segmenter)
+        futures = [scheduler.submit(photo(v), ["wall"]) for v in (1, 2)]
+        segmenter.release.set()
+        for f in [blocker, *futures]:
+            f.result(timeout=5)
+
+        stats = scheduler.stats()
+        assert stats["batches"] == 2
+        assert stats["requests"] == 3
+        assert stats["avg_fill_ratio"] == pytest.approx((1 / 4 + 2 / 4) / 2)
+        assert stats["max_queue_delay_ms"] >= stats["avg_queue_delay_ms"] > 0
+
+        snapshot = metrics.snapshot()
+        assert snapshot["scheduler_batches"] == 2
+        assert snapshot["scheduler_requests"] == 3
+        assert snapshot["scheduler_batch_fill_ratio"] == pytest.approx(stats["avg_fill_ratio"])
+        assert snapshot["scheduler_queue_delay_ms"] > 0
+
+
+class TestGetScheduler:
+    @pytest.fixture(autouse=True)
+    def reset_global(self):
+        yield
+        if scheduler_module._scheduler is not None:
+            scheduler_module._scheduler.close(timeout=5)
+        scheduler_module._scheduler = None
+
+    def test_shared_per_segmenter(self, segmenter):
+        scheduler = get_scheduler(segmenter)
+        assert get_scheduler(segmenter) is scheduler
+
+        rebuilt = FakeSegmenter()
+        replacement = get_scheduler(rebuilt)
+
+        assert replacement is not scheduler and replacement.segmenter is rebuilt
+        with pytest.raises(RuntimeError):
+            scheduler.submit(photo(1), ["wall"])
+
+    def test_pipeline_routes_through_scheduler(self, segmenter, monkeypatch):
+        """Test SEGMENT_SCHEDULER makes the job runner segment via the shared scheduler"""
+        from engine import pipeline
+
+        monkeypatch.setattr(pipeline, "SCHEDULER_ENABLED", True)
+        monkeypatch.setattr(pipeline, "get_segmenter", lambda: segmenter)
+        runner = pipeline._JobRunner({"concepts": {}}, {"errors": []}, r2_client=None)
+
+        assert runner._get_segmenter() is get_scheduler(segmenter)
@@ -0,0 +1,1278 @@
+"""
+Unit tests for SAM3Segmenter inference paths with a fake SAM3 model
+
+Tests verify:
+- segment_concepts() encodes the image once for all prompts
+- Cached image state is not mutated by prompt decoding
+- segment() / segment_multiple() delegate to segment_concepts()
+- Batched prompt decoding matches the sequential path
+- max_prompts_per_batch bounds decoder batch size
+- segment_batch() encodes several images together and matches per-image results
+- Image batch size selection from free device memory
+- Text-embedding LRU cache (hits skip the text encoder, bounded size, warmup)
+- Precision modes (fp32 / bf16 / fp16 autocast) and from_model()
+- Execution modes (eager / inference / compiled) and the compile cache directory
+- Adaptive input resolution (downscaled encode, full-size masks)
+- Tiled segmentation of very large images
+- Compact (cropped, bit-packed) masks and merged instances
+- CUDA OOM recovery by batch halving (encoder and decoder)
+- Score-only probe() and probe_first decoding
+- Per-call confidence_threshold override on a shared model
+"""
+
+import os
+import sys
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+import pytest
+from PIL import Image
+
+# Add parent directory to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+# Mock torch and sam3 before importing segmenter
+# (sam3 is installed from the facebookresearch/sam3 repo in the Docker image only)
+sys.modules.setdefault('torch', MagicMock())
+for _name in ('sam3', 'sam3.model', 'sam3.model.sam3_image_processor', 'sam3.model.data_misc'):
+    sys.modules.setdefault(_name, MagicMock())
+
+from engine.compact_mask import CompactMask  # noqa: E402
+from engine.segmenter import SAM3Segmenter, TextEmbeddingCache  # noqa: E402
+from tests.sam3_fakes import FakeFindStage, FakeSam3Model, make_fake_processor, make_fake_torch  # noqa: E402
+
+PROMPTS = [
+    "wall surface", "floor surface", "ceiling", "window", "door", "frame and molding trim",
+    "tile", "grout lines between tiles", "cabinet door", "countertop surface",
+    "light fixture", "door handle or knob", "main product item", "brand logo",
+    "product body", "glossy highlight reflection",
+]
+
+
+@pytest.fixture
+def fake_torch():
+    """Numpy-backed torch (and FindStage) inside the segmenter module"""
+    with patch('engine.segmenter.torch', make_fake_torch()) as fake, \
+         patch('engine.segmenter.FindStage', FakeFindStage):
+        fake.cuda.is_available.return_value = False
+        yield fake
+
+
+@pytest.fixture
+def make_segmenter(fake_torch):
+    """Factory for SAM3Segmenter instances backed by FakeSam3Model"""
+    def build(**kwargs):
+        with patch('engine.segmenter.os.path.exists', return_value=True), \
+             patch('engine.segmenter.build_sam3_image_model', return_value=FakeSam3Model()), \
+             patch('engine.segmenter.Sam3Processor', return_value=make_fake_processor()):
+            options = {"checkpoint_path": "/models/sam3.pt", "bpe_path": "/models/bpe.gz", **kwargs}
+            return SAM3Segmenter(**options)
+
+    return build
+
+
+@pytest.fixture
+def segmenter(make_segmenter):
+    return make_segmenter()
+
+
+@pytest.fixture
+def test_image():
+    return Image.new('RGB', (64, 48))
+
+
+def assert_same_results(a: dict, b: dict):
+    """Assert two segment_concepts() results are identical"""
+    assert list(a.keys()) == list(b.keys())
+    for prompt in a:
+        masks_a, meta_a = a[prompt]
+        masks_b, meta_b = b[prompt]
+        assert len(masks_a) == len(masks_b), prompt
+        for ma, mb in zip(masks_a, masks_b):
+            np.testing.assert_array_equal(ma, mb)
+        assert without_timings(meta_a) == without_timings(meta_b)
+
+
+def without_timings(metadata: dict) -> dict:
+    """Metadata minus the wall-clock phase timings (never equal between runs)"""
+    return {k: v for k, v in metadata.items() if k != "timings_ms"}
+
+
+class TestSegmentConcepts:
+    """Test SAM3Segmenter.segment_concepts()"""
+
+    def test_image_encoded_once(self, segmenter, test_image):
+        """Test set_image runs once regardless of prompt count"""
+        prompts = ["wall", "floor", "ceiling", "window", "door", "tile"]
+
+        results = segmenter.segment_concepts(test_image, prompts)
+
+        segmenter.processor.set_image.assert_called_once_with(test_image)
+        assert list(results.keys()) == prompts
+
+    def test_results_structure(self, segmenter, test_image):
+        """Test each prompt maps to (masks, metadata)"""
+        results = segmenter.segment_concepts(test_image, ["wall", "door"])
+
+        masks, metadata = results["wall"]
+        assert isinstance(masks, list)
+        assert all(m.shape == (48, 64) for m in masks)
+        assert all(m.dtype == bool for m in masks)
+        assert metadata["concept"] == "wall"
+        assert metadata["instance_count"] == len(masks)
+        assert metadata["image_size"] == (64, 48)
+        assert len(metadata["scores"]) == len(masks)
+        assert all(score > segmenter.confidence_threshold for score in metadata["scores"])
+
+    def test_duplicate_prompts_decoded_once(self, segmenter, test_image):
+        """Test duplicate prompts are only decoded once"""
+        results = segmenter.segment_concepts(test_image, ["wall", "wall", "door"])
+
+        assert list(results.keys()) == ["wall", "door"]
+        assert segmenter.model.text_batches == [["wall", "door"]]
+
+    def test_cached_image_state_not_mutated(self, segmenter, test_image):
+        """Test prompt decoding does not write into the cached image state"""
+        image_states = []
+        original_set_image = segmenter.processor.set_image.side_effect
+
+        def recording_set_image(image):
+            state = original_set_image(image)
+            image_states.append(state)
+            return state
+
+        segmenter.processor.set_image.side_effect = recording_set_image
+
+        segmenter.segment_concepts(test_image, ["wall", "door"])
+
+        state = image_states[0]
+        assert "masks" not in state
+        assert list(state["backbone_out"].keys()) == ["vision_features"]
+
+    def test_empty_prompts(self, segmenter, test_image):
+        """Test empty prompt list returns empty results"""
+        assert segmenter.segment_concepts(test_image, []) == {}
+        assert segmenter.model.grounding_batches == []
+
+    def test_threshold_filters_instances(self, make_segmenter, test_image):
+        """Test a higher confidence threshold keeps a subset of instances"""
+        low = make_segmenter(confidence_threshold=0.1).segment_concepts(test_image, PROMPTS)
+        high = make_segmenter(confidence_threshold=0.9).segment_concepts(test_image, PROMPTS)
+
+        for prompt in PROMPTS:
+            assert high[prompt][1]["instance_count"] <= low[prompt][1]["instance_count"]
+
+
+class TestSegmentDelegation:
+    """Test segment() and segment_multiple() use the shared path"""
+
+    def test_segment_single_concept(self, segmenter, test_image):
+        """Test segment() returns the segment_concepts() result for one prompt"""
+        masks, metadata = segmenter.segment(test_image, "window")
+
+        assert metadata["concept"] == "window"
+        assert len(masks) == metadata["instance_count"]
+        segmenter.processor.set_image.assert_called_once()
+
+    def test_segment_multiple_encodes_once(self, segmenter, test_image):
+        """Test segment_multiple() no longer re-encodes per concept"""
+        results = segmenter.segment_multiple(test_image, ["wall", "floor", "ceiling"])
+
+        assert set(results.keys()) == {"wall", "floor", "ceiling"}
+        segmenter.processor.set_image.assert_called_once()
+
+
+class TestBatchedPromptDecoding:
+    """Test batched multi-prompt decoding"""
+
+    def test_batched_matches_sequential(self, make_segmenter, test_image):
+        """Test one decoder batch gives the same masks/scores as one prompt per pass"""
+        sequential = make_segmenter(max_prompts_per_batch=1)
+        batched = make_segmenter(max_prompts_per_batch=16)
+
+        expected = sequential.segment_concepts(test_image, PROMPTS)
+        actual = batched.segment_concepts(test_image, PROMPTS)
+
+        assert_same_results(expected, actual)
+        assert sequential.model.grounding_batches == [1] * len(PROMPTS)
+        assert batched.model.grounding_batches == [len(PROMPTS)]
+
+    @pytest.mark.parametrize("batch_size", [2, 3, 5, 7])
+    def test_uneven_chunks_match_sequential(self, make_segmenter, test_image, batch_size):
+        """Test chunked batches (last chunk smaller) still split back per prompt"""
+        expected = make_segmenter(max_prompts_per_batch=1).segment_concepts(test_image, PROMPTS)
+        actual = make_segmenter(max_prompts_per_batch=batch_size).segment_concepts(
+            test_image, PROMPTS
+        )
+
+        assert_same_results(expected, actual)
+
+    def test_max_prompts_per_batch_bounds_batches(self, make_segmenter, test_image):
+        """Test decoder batches never exceed max_prompts_per_batch"""
+        segmenter = make_segmenter(max_prompts_per_batch=4)
+
+        segmenter.segment_concepts(test_image, PROMPTS[:10])
+
+        assert segmenter.model.grounding_batches == [4, 4, 2]
+        assert [len(b) for b in segmenter.model.text_batches] == [4, 4, 2]
+
+    def test_max_prompts_per_batch_from_env(self, make_segmenter):
+        """Test default batch size comes from MAX_PROMPTS_PER_BATCH"""
+        with patch('engine.segmenter.DEFAULT_MAX_PROMPTS_PER_BATCH', 3):
+            assert make_segmenter().max_prompts_per_batch == 3
+
+    def test_invalid_max_prompts_per_batch(self, make_segmenter):
+        """Test non-positive batch size is rejected"""
+        with pytest.raises(ValueError):
+            make_segmenter(max_prompts_per_batch=-1)
+
+
+@pytest.fixture
+def photos():
+    """Differently sized and colored images (a job's items)"""
+    return [
+        Image.new('RGB', (64, 48), color=(200, 180, 160)),
+        Image.new('RGB', (40, 40), color=(20, 60, 90)),
+        Image.new('RGB', (32, 56), color=(120, 10, 240)),
+        Image.new('RGB', (64, 48), color=(0, 255, 0)),
+        Image.new('RGB', (48, 64), color=(90, 90, 90)),
+    ]
+
+
+class TestSegmentBatch:
+    """Test cross-image batching with segment_batch()"""
+
+    def test_matches_per_image_segmentation(self, make_segmenter, photos):
+        """Test batched encoding returns the same masks as one image at a time"""
+        prompts = PROMPTS[:6]
+        single = make_segmenter()
+        expected = [single.segment_concepts(image, prompts) for image in photos]
+
+        batched = make_segmenter(max_images_per_batch=8)
+        actual = batched.segment_batch(photos, prompts)
+
+        assert len(actual) == len(photos)
+        for exp, act in zip(expected, actual):
+            assert_same_results(exp, act)
+
+    def test_masks_at_original_size(self, make_segmenter, photos):
+        """Test each image's masks come back at its own resolution"""
+        results = make_segmenter(max_images_per_batch=8).segment_batch(photos, ["wall", "door"])
+
+        for image, result in zip(photos, results):
+            width, height = image.size
+            for masks, metadata in result.values():
+                assert metadata["image_size"] == image.size
+                assert all(m.shape == (height, width) for m in masks)
+
+    def test_images_encoded_together(self, make_segmenter, photos):
+        """Test images are stacked into encoder batches of max_images_per_batch"""
+        segmenter = make_segmenter(max_images_per_batch=2)
+
+        segmenter.segment_batch(photos, ["wall"])
+
+        assert segmenter.processor.image_batches == [2, 2, 1]
+        assert not segmenter.processor.set_image.called
+
+    def test_queries_respect_max_prompts_per_batch(self, make_segmenter, photos):
+        """Test (image, prompt) queries are chunked by max_prompts_per_batch"""
+        segmenter = make_segmenter(max_images_per_batch=5, max_prompts_per_batch=4)
+
+        segmenter.segment_batch(photos, ["wall", "floor"])  # 10 queries
+
+        assert segmenter.model.grounding_batches == [4, 4, 2]
+
+    def test_distinct_prompts_text_encoded_once_per_batch(self, make_segmenter, photos):
+        """Test a decoder batch spanning images encodes each prompt once"""
+        segmenter = make_segmenter(max_images_per_batch=5, max_prompts_per_batch=16)
+
+        segmenter.segment_batch(photos[:3], ["wall", "floor"])
+
+        assert segmenter.model.text_batches == [["wall", "floor"]]
+
+    def test_empty_images(self, segmenter):
+        """Test empty image list returns empty results"""
+        assert segmenter.segment_batch([], ["wall"]) == []
+
+
+class TestAutoImageBatchSize:
+    """Test image batch size selection from device memory"""
+
+    def test_cpu_uses_single_image(self, segmenter, fake_torch):
+        """Test without CUDA images are encoded one at a time"""
+        fake_torch.cuda.is_available.return_value = False
+
+        assert segmenter._auto_image_batch_size() == 1
+
+    def test_sized_from_free_memory(self, segmenter, fake_torch):
+        """Test batch size uses 80% of free memory / per-image estimate"""
+        fake_torch.cuda.is_available.return_value = True
+        fake_torch.cuda.mem_get_info.return_value = (10 * 1024**3, 24 * 1024**3)
+
+        with patch('engine.segmenter.IMAGE_BATCH_MEMORY_MB', 1024), \
+             patch('engine.segmenter.MAX_IMAGES_PER_BATCH', 64):
+            assert segmenter._auto_image_batch_size() == 8
+
+    def test_capped_by_max_images(self, segmenter, fake_torch):
+        """Test batch size never exceeds MAX_IMAGES_PER_BATCH"""
+        fake_torch.cuda.is_available.return_value = True
+        fake_torch.cuda.mem_get_info.return_value = (80 * 1024**3, 80 * 1024**3)
+
+        with patch('engine.segmenter.MAX_IMAGES_PER_BATCH', 4):
+            assert segmenter._auto_image_batch_size() == 4
+
+    def test_low_memory_still_one(self, segmenter, fake_torch):
+        """Test batch size is at least 1 even when memory is short"""
+        fake_torch.cuda.is_available.return_value = True
+        fake_torch.cuda.mem_get_info.return_value = (100 * 1024**2, 24 * 1024**3)
+
+        assert segmenter._auto_image_batch_size() == 1
+
+    def test_auto_used_when_unset(self, segmenter, photos):
+        """Test segment_batch() falls back to auto batch size"""
+        with patch.object(segmenter, '_auto_image_batch_size', return_value=3) as auto:
+            segmenter.segment_batch(photos, ["wall"])
+
+        auto.assert_called_once()
+        assert segmenter.processor.image_batches == [3, 2]
+
+
+class TestTextEmbeddingCache:
+    """Test TextEmbeddingCache LRU behaviour"""
+
+    def test_hit_and_miss_counters(self):
+        """Test get() counts hits and misses"""
+        cache = TextEmbeddingCache(max_size=4)
+
+        assert cache.get("wall") is None
+        cache.put("wall", {"language_features": 1})
+        assert cache.get("wall") == {"language_features": 1}
+
+        assert cache.stats() == {"size": 1, "max_size": 4, "hits": 1, "misses": 1}
+
+    def test_lru_eviction(self):
+        """Test least recently used prompt is evicted over max_size"""
+        cache = TextEmbeddingCache(max_size=2)
+        cache.put("wall", {})
+        cache.put("floor", {})
+        cache.get("wall")  # wall becomes most recent
+        cache.put("door", {})
+
+        assert "wall" in cache
+        assert "door" in cache
+        assert "floor" not in cache
+        assert len(cache) == 2
+
+    def test_zero_size_disables(self):
+        """Test max_size=0 never stores entries"""
+        cache = TextEmbeddingCache(max_size=0)
+        cache.put("wall", {})
+
+        assert len(cache) == 0
+
+
+class TestSegmenterTextCache:
+    """Test text-embedding cache inside SAM3Segmenter"""
+
+    def test_second_call_skips_text_encoder(self, segmenter, test_image):
+        """Test repeated prompts hit the cache instead of the text encoder"""
+        segmenter.segment_concepts(test_image, ["wall", "floor"])
+        segmenter.segment_concepts(test_image, ["wall", "floor"])
+
+        assert segmenter.model.text_batches == [["wall", "floor"]]
+        assert segmenter.text_cache.hits == 2
+        assert segmenter.text_cache.misses == 2
+
+    def test_partial_hits_encode_only_missing(self, segmenter, test_image):
+        """Test only uncached prompts go to the text encoder"""
+        segmenter.segment_concepts(test_image, ["wall"])
+        segmenter.segment_concepts(test_image, ["door", "wall", "floor"])
+
+        assert segmenter.model.text_batches == [["wall"], ["door", "floor"]]
+
+    def test_cached_results_match_uncached(self, make_segmenter, test_image):
+        """Test results are identical with and without cached embeddings"""
+        uncached = make_segmenter(text_cache_size=0)
+        cached = make_segmenter()
+        cached.warm_text_cache(PROMPTS[::2])
+
+        expected = uncached.segment_concepts(test_image, PROMPTS)
+        actual = cached.segment_concepts(test_image, PROMPTS)
+
+        assert_same_results(expected, actual)
+
+    def test_cache_bounded(self, make_segmenter, test_image):
+        """Test free-form prompts cannot grow the cache past its size"""
+        segmenter = make_segmenter(text_cache_size=4)
+
+        segmenter.segment_concepts(test_image, [f"free-form prompt {i}" for i in range(10)])
+
+        assert len(segmenter.text_cache) == 4
+
+    def test_warm_text_cache(self, make_segmenter, test_image):
+        """Test warmup encodes in batches and later calls are all hits"""
+        segmenter = make_segmenter(max_prompts_per_batch=4)
+
+        warmed = segmenter.warm_text_cache(PROMPTS[:10])
+
+        assert warmed == 10
+        assert [len(b) for b in segmenter.model.text_batches] == [4, 4, 2]
+        assert segmenter.text_cache.stats()["misses"] == 0
+
+        segmenter.segment_concepts(test_image, PROMPTS[:10])
+
+        assert len(segmenter.model.text_batches) == 3
+        assert segmenter.text_cache.hits == 10
+
+    def test_warm_skips_cached(self, segmenter):
+        """Test warmup only encodes prompts not yet cached"""
+        segmenter.warm_text_cache(["wall", "floor"])
+
+        assert segmenter.warm_text_cache(["wall", "floor", "door"]) == 1
+
+    def test_text_cache_size_from_env(self, make_segmenter):
+        """Test default size comes from TEXT_CACHE_SIZE"""
+        with patch('engine.segmenter.DEFAULT_TEXT_CACHE_SIZE', 7):
+            assert make_segmenter().text_cache.max_size == 7
+
+
+class TestPresetWarmup:
+    """Test registry default factory warms the cache with preset prompts"""
+
+    def test_default_factory_warms_preset_prompts(self):
+        """Test every preset concept name and prompt is warmed at build time"""
+        from engine.registry import _default_factory
+        from presets import preset_prompts
+
+        with patch('engine.segmenter.SAM3Segmenter') as mock_class:
+            segmenter = _default_factory(
+                checkpoint_path="/models/sam3.pt", bpe_path="/models/bpe.gz", precision="fp32"
+            )
+
+        assert segmenter is mock_class.return_value
+        segmenter.warm_text_cache.assert_called_once_with(preset_prompts())
+
+    def test_preset_prompts_cover_presets(self):
+        """Test preset_prompts() includes concept names and prompt texts"""
+        from presets import preset_prompts
+        from presets.interior import INTERIOR_CONCEPTS
+        from presets.seller import SELLER_CONCEPTS
+
+        prompts = preset_prompts()
+
+        for concepts in (INTERIOR_CONCEPTS, SELLER_CONCEPTS):
+            for name, concept in concepts.items():
+                assert name in prompts
+                assert concept["prompt"] in prompts
+        assert len(prompts) == len(set(prompts))
+
+
+class TestModelVersion:
+    """Test model_version fingerprint used by result caches"""
+
+    def test_changes_with_checkpoint_contents(self, make_segmenter, tmp_path):
+        """Test replacing the checkpoint changes model_version"""
+        checkpoint = tmp_path / "sam3.pt"
+        checkpoint.write_bytes(b"weights-v1")
+        before = make_segmenter(checkpoint_path=str(checkpoint)).model_version
+
+        checkpoint.write_bytes(b"weights-v2-larger")
+        after = make_segmenter(checkpoint_path=str(checkpoint)).model_version
+
+        assert before != after
+        assert before.startswith("sam3.pt:")
+        assert before.endswith(":fp32")
+
+
+class TestPrecisionModes:
+    """Test fp32 / bf16 / fp16 autocast selection"""
+
+    def test_unsupported_precision_rejected(self, make_segmenter):
+        """Test unknown modes raise ValueError before loading the model"""
+        with pytest.raises(ValueError, match="Unsupported precision"):
+            make_segmenter(precision="int4")
+
+    def test_default_from_env(self, make_segmenter):
+        """Test MODEL_PRECISION picks the mode when none is passed"""
+        with patch('engine.segmenter.DEFAULT_PRECISION', "bf16"):
+            assert make_segmenter().precision == "bf16"
+
+    def test_fp32_does_not_autocast(self, segmenter, test_image, fake_torch):
+        """Test fp32 runs without torch.autocast"""
+        segmenter.segment_concepts(test_image, ["wall surface"])
+
+        fake_torch.autocast.assert_not_called()
+
+    @pytest.mark.parametrize("precision,dtype", [("bf16", "bfloat16"), ("fp16", "float16")])
+    def test_reduced_precision_autocasts(self, make_segmenter, test_image, fake_torch,
+                                         precision, dtype):
+        """Test bf16 / fp16 wrap model calls in autocast with the matching dtype"""
+        make_segmenter(precision=precision).segment_concepts(test_image, ["wall surface"])
+
+        fake_torch.autocast.assert_called_with(device_type="cpu", dtype=getattr(fake_torch, dtype))
+
+    def test_results_unchanged_by_mode_switch(self, segmenter, test_image):
+        """Test postprocessing is unaffected by the mode (fake model is precision-independent)"""
+        fp32 = segmenter.segment_concepts(test_image, PROMPTS[:4])
+        segmenter.set_precision("bf16")
+        bf16 = segmenter.segment_concepts(test_image, PROMPTS[:4])
+
+        assert_same_results(fp32, bf16)
+
+    def test_set_precision_clears_text_cache(self, segmenter, test_image):
+        """Test switching modes drops embeddings computed in the old mode"""
+        segmenter.segment_concepts(test_image, ["wall surface"])
+        version = segmenter.model_version
+
+        segmenter.set_precision("fp16")
+
+        assert len(segmenter.text_cache) == 0
+        assert segmenter.model_version.endswith(":fp16")
+        assert segmenter.model_version != version
+
+    def test_set_precision_validates(self, segmenter):
+        """Test set_precision rejects unknown modes and keeps the current one"""
+        with pytest.raises(ValueError):
+            segmenter.set_precision("fp8")
+        assert segmenter.precision == "fp32"
+
+
+class TestInt8Precision:
+    """Test int8 dynamic quantization of the torch model"""
+
+    @pytest.fixture
+    def quantized_model(self, fake_torch):
+        model = FakeSam3Model()
+        fake_torch.ao.quantization.quantize_dynamic.return_value = model
+        return model
+
+    def test_linear_layers_quantized(self, make_segmenter, fake_torch, quantized_model, test_image):
+        segmenter = make_segmenter(precision="int8")
+        fp32_model = fake_torch.ao.quantization.quantize_dynamic.call_args.args[0]
+
+        fake_torch.ao.quantization.quantize_dynamic.assert_called_once_with(
+            fp32_model, {fake_torch.nn.Linear}, dtype=fake_torch.qint8
+        )
+        assert segmenter.model is quantized_model
+        assert segmenter.processor.model is quantized_model
+        assert segmenter.model_version.endswith(":int8")
+
+        segmenter.segment_concepts(test_image, PROMPTS[:2])
+        assert quantized_model.grounding_batches
+        fake_torch.autocast.assert_not_called()
+
+    def test_switch_back_restores_fp32_model(self, segmenter, fake_torch, quantized_model):
+        fp32_model = segmenter.model
+
+        segmenter.set_precision("int8")
+        segmenter.set_precision("int8")
+        assert fake_torch.ao.quantization.quantize_dynamic.call_count == 1
+
+        segmenter.set_precision("fp32")
+        assert segmenter.model is fp32_model
+        assert segmenter.processor.model is fp32_model
+
+    def test_cuda_rejected(self, segmenter, quantized_model):
+        """Test int8 on a CUDA model fails before any state changes"""
+        segmenter.model.device = "cuda:0"
+
+        with pytest.raises(ValueError, match="cuda:0"):
+            segmenter.set_precision("int8")
+
+        assert segmenter.precision == "fp32"
+        assert segmenter.model is not quantized_model
+
+    def test_model_device_checked_not_processor(self, segmenter, quantized_model):
+        """Test the guard follows the weights (Sam3Processor is built without a device)"""
+        segmenter.processor.device = "cuda:0"
+
+        segmenter.set_precision("int8")
+
+        assert segmenter.model is quantized_model
+
+
+class TestFromModel:
+    """Test wrapping an already built model"""
+
+    def test_matches_checkpoint_segmenter(self, segmenter, fake_torch, test_image):
+        """Test from_model() gives the same results as a checkpoint-built segmenter"""
+        wrapped = SAM3Segmenter.from_model(FakeSam3Model(), make_fake_processor())
+
+        assert_same_results(
+            wrapped.segment_concepts(test_image, PROMPTS[:3]),
+            segmenter.segment_concepts(test_image, PROMPTS[:3]),
+        )
+        assert wrapped.model_version == "in-memory:fp32"
+
+    def test_options_validated(self, fake_torch):
+        """Test from_model() applies the same validation as __init__"""
+        with pytest.raises(ValueError):
+            SAM3Segmenter.from_model(FakeSam3Model(), make_fake_processor(), precision="int4")
+
+
+class TestExecutionModes:
+    """Test eager / inference / compiled execution paths"""
+
+    @pytest.fixture
+    def inference_depth(self, fake_torch):
+        """Track how many torch.inference_mode() contexts are active"""
+        depth = [0]
+
+        class Context:
+            def __enter__(self):
+                depth[0] += 1
+
+            def __exit__(self, *exc):
+                depth[0] -= 1
+
+        fake_torch.inference_mode.side_effect = Context
+        return depth
+
+    def test_unsupported_mode_rejected(self, make_segmenter):
+        """Test unknown execution modes raise ValueError"""
+        with pytest.raises(ValueError, match="Unsupported execution_mode"):
+            make_segmenter(execution_mode="jit")
+
+    def test_default_from_env(self, make_segmenter):
+        """Test SEGMENTER_EXECUTION_MODE picks the mode when none is passed"""
+        with patch('engine.segmenter.DEFAULT_EXECUTION_MODE', "inference"):
+            assert make_segmenter().execution_mode == "inference"
+
+    @pytest.mark.parametrize("mode,wrapped", [
+        ("eager", False),
+        ("inference", True),
+        ("compiled", True),
+    ])
+    def test_whole_call_under_inference_mode(self, make_segmenter, test_image, inference_depth,
+                                             fake_torch, mode, wrapped, tmp_path):
+        """Test result extraction runs inside inference_mode unless eager"""
+        fake_torch.compile.side_effect = lambda fn, **kwargs: fn
+        with patch.dict(os.environ, {"TORCHINDUCTOR_CACHE_DIR": str(tmp_path)}):
+            segmenter = make_segmenter(execution_mode=mode)
+        seen = []
+        extract = segmenter._extract_results
+        segmenter._extract_results = lambda *args: seen.append(inference_depth[0]) or extract(*args)
+
+        segmenter.segment_concepts(test_image, ["wall surface", "door"])
+        segmenter.segment_batch([test_image], ["wall surface"])
+
+        assert seen and all((depth > 0) == wrapped for depth in seen)
+        assert inference_depth[0] == 0
+
+    def test_eager_and_inference_do_not_compile(self, make_segmenter, fake_torch):
+        """Test torch.compile is only used in compiled mode"""
+        make_segmenter(execution_mode="eager")
+        make_segmenter(execution_mode="inference")
+
+        fake_torch.compile.assert_not_called()
+
+    def test_compiled_mode_compiles_entry_points(self, make_segmenter, fake_torch, test_image,
+                                                 tmp_path):
+        """Test existing model entry points are compiled with static shapes"""
+        fake_torch.compile.side_effect = lambda fn, **kwargs: fn
+
+        with patch.dict(os.environ, {"TORCHINDUCTOR_CACHE_DIR": str(tmp_path / "inductor")}):
+            segmenter = make_segmenter(execution_mode="compiled")
+
+        # FakeSam3Model has no backbone.forward_image → skipped
+        assert segmenter.compiled_targets == ["backbone.forward_text", "forward_grounding"]
+        for call in fake_torch.compile.call_args_list:
+            assert call.kwargs["dynamic"] is False
+        results = segmenter.segment_concepts(test_image, ["wall surface"])
+        assert results["wall surface"][1]["concept"] == "wall surface"
+
+    def test_compile_cache_directory(self, tmp_path):
+        """Test the Inductor cache goes to COMPILE_CACHE_DIR unless already configured"""
+        from engine.segmenter import enable_compile_cache
+
+        target = tmp_path / "compile_cache"
+        with patch.dict(os.environ, {}, clear=False):
+            for name in ("TORCHINDUCTOR_CACHE_DIR", "TORCHINDUCTOR_FX_GRAPH_CACHE"):
+                os.environ.pop(name, None)
+            assert enable_compile_cache(str(target)) == str(target)
+            assert os.environ["TORCHINDUCTOR_FX_GRAPH_CACHE"] == "1"
+        assert target.is_dir()
+
+        with patch.dict(os.environ, {"TORCHINDUCTOR_CACHE_DIR": "/custom"}):
+            assert enable_compile_cache(str(target)) == "/custom"
+
+
+class TestAdaptiveInputResolution:
+    """Test max_input_side downscaling with full-resolution masks"""
+
+    @pytest.fixture
+    def large_image(self):
+        image = Image.new('RGB', (200, 150))
+        image.paste((200, 30, 30), (40, 30, 120, 90))
+        return image
+
+    def test_native_size_by_default(self, segmenter, large_image):
+        """Test images are encoded unchanged without max_input_side"""
+        segmenter.segment_concepts(large_image, ["wall surface"])
+
+        assert segmenter.processor.set_image.call_args.args[0] is large_image
+
+    @pytest.mark.parametrize("mode", ["bilinear", "nearest"])
+    def test_downscaled_encode_full_size_masks(self, make_segmenter, large_image, mode):
+        """Test the encoder sees the reduced image and masks come back at full size"""
+        segmenter = make_segmenter(max_input_side=40, mask_upsample=mode)
+
+        results = segmenter.segment_concepts(large_image, PROMPTS[:6])
+
+        assert segmenter.processor.set_image.call_args.args[0].size == (40, 30)
+        assert any(masks for masks, _ in results.values())
+        for masks, metadata in results.values():
+            assert metadata["image_size"] == (200, 150)
+            for mask in masks:
+                assert mask.shape == (150, 200)
+
+    def test_small_images_not_upscaled(self, make_segmenter, test_image):
+        """Test images within the limit are encoded as-is"""
+        segmenter = make_segmenter(max_input_side=1024)
+
+        segmenter.segment_concepts(test_image, ["wall surface"])
+
+        assert segmenter.processor.set_image.call_args.args[0] is test_image
+
+    def test_segment_batch_full_size_masks(self, make_segmenter, large_image, test_image):
+        """Test batched encoding downscales per image and restores each size"""
+        segmenter = make_segmenter(max_input_side=40, mask_upsample="nearest",
+                                   max_images_per_batch=2)
+
+        results = segmenter.segment_batch([large_image, test_image], PROMPTS[:6])
+
+        encoded = segmenter.processor.set_image_batch.call_args.args[0]
+        assert [image.size for image in encoded] == [(40, 30), (40, 30)]
+        for image, per_image in zip([large_image, test_image], results):
+            for masks, _ in per_image.values():
+                assert all(mask.shape == (image.height, image.width) for mask in masks)
+
+    def test_model_version_includes_resolution(self, make_segmenter):
+        """Test cached masks are keyed by the resolution settings"""
+        native = make_segmenter().model_version
+        reduced = make_segmenter(max_input_side=1536, mask_upsample="nearest").model_version
+
+        assert reduced == native + ":1536nearest"
+
+    def test_nearest_by_default(self, make_segmenter):
+        """Test a reduced resolution upsamples masks on the host unless bilinear is asked for"""
+        segmenter = make_segmenter(max_input_side=1536)
+
+        assert segmenter.mask_upsample == "nearest"
+        assert segmenter.model_version.endswith(":1536nearest")
+
+    @pytest.mark.parametrize("kwargs", [{"max_input_side": -1}, {"mask_upsample": "bicubic"}])
+    def test_invalid_settings(self, make_segmenter, kwargs):
+        with pytest.raises(ValueError):
+            make_segmenter(**kwargs)
+
+    def test_upsample_mask_nearest(self):
+        """Test nearest upsampling repeats pixels"""
+        from engine.segmenter import upsample_mask
+
+        mask = np.array([[True, False], [False, True]])
+        expected = np.repeat(np.repeat(mask, 2, axis=0), 3, axis=1)
+
+        np.testing.assert_array_equal(upsample_mask(mask, (4, 6)), expected)
+
+
+class TestTiledSegmentation:
+    """Test tiled mode for images above the pixel threshold"""
+
+    @pytest.fixture
+    def tiled_segmenter(self, make_segmenter):
+        from engine.tiling import TileConfig
+        return make_segmenter(tiling=TileConfig(pixel_threshold=5000, tile_size=48, overlap=8))
+
+    @pytest.fixture
+    def panorama(self):
+        return Image.new('RGB', (160, 60), (90, 120, 150))
+
+    def test_tiles_encoded_separately(self, tiled_segmenter, panorama):
+        """Test the encoder only ever sees tile-sized images"""
+        results = tiled_segmenter.segment_concepts(panorama, PROMPTS[:4])
+
+        sizes = [c.args[0].size for c in tiled_segmenter.processor.set_image.call_args_list]
+        assert len(sizes) == 8  # 4 columns x 2 rows
+        assert all(w <= 48 and h <= 48 for w, h in sizes)
+        for masks, metadata in results.values():
+            assert metadata["tiles"] == 8
+            assert metadata["image_size"] == (160, 60)
+            assert metadata["instance_count"] == len(masks) == len(metadata["scores"])
+            assert all(mask.shape == (60, 160) for mask in masks)
+
+    def test_small_images_not_tiled(self, tiled_segmenter, test_image):
+        """Test images under the threshold take the single-encode path"""
+        results = tiled_segmenter.segment_concepts(test_image, ["wall surface"])
+
+        assert tiled_segmenter.processor.set_image.call_count == 1
+        assert "tiles" not in results["wall surface"][1]
+
+    def test_segment_batch_mixes_tiled_and_batched(self, tiled_segmenter, panorama, test_image):
+        """Test large images are tiled while the rest are still batch-encoded"""
+        images = [test_image, panorama, test_image]
+        results = tiled_segmenter.segment_batch(images, ["wall surface"])
+
+        sizes = [r["wall surface"][1]["image_size"] for r in results]
+        assert sizes == [(64, 48), (160, 60), (64, 48)]
+        assert results[1]["wall surface"][1]["tiles"] == 8
+        assert tiled_segmenter.processor.set_image_batch.called
+
+    def test_model_version_marks_tiling(self, tiled_segmenter):
+        assert tiled_segmenter.model_version.endswith(":tiled48-8")
+
+
+class TestCompactMasks:
+    """Test mask_format="compact" and merge_instances"""
+
+    def test_compact_matches_dense(self, make_segmenter, test_image):
+        """Test compact masks decode to the dense masks with identical metadata"""
+        dense = make_segmenter().segment_concepts(test_image, PROMPTS)
+        compact = make_segmenter(mask_format="compact").segment_concepts(test_image, PROMPTS)
+
+        assert any(masks for masks, _ in compact.values())
+        for prompt, (masks, metadata) in compact.items():
+            assert all(isinstance(m, CompactMask) for m in masks)
+            assert all(m.shape == (48, 64) for m in masks)
+            assert without_timings(metadata) == without_timings(dense[prompt][1])
+        assert_same_results(compact, dense)
+
+    def test_compact_full_size_after_downscale(self, make_segmenter):
+        """Test nearest-upsampled compact masks come back at the image size"""
+        image = Image.new('RGB', (200, 150), (120, 60, 30))
+        segmenter = make_segmenter(mask_format="compact", max_input_side=40,
+                                   mask_upsample="nearest")
+        dense_segmenter = make_segmenter(max_input_side=40, mask_upsample="nearest")
+        dense = dense_segmenter.segment_concepts(image, PROMPTS[:6])
+
+        results = segmenter.segment_concepts(image, PROMPTS[:6])
+
+        for masks, _ in results.values():
+            assert all(isinstance(m, CompactMask) and m.shape == (150, 200) for m in masks)
+        assert_same_results(results, dense)
+
+    def test_compact_tiled(self, make_segmenter):
+        from engine.tiling import TileConfig
+        tiling = TileConfig(pixel_threshold=5000, tile_size=48, overlap=8)
+        panorama = Image.new('RGB', (160, 60), (90, 120, 150))
+
+        dense = make_segmenter(tiling=tiling).segment_concepts(panorama, PROMPTS[:4])
+        compact_segmenter = make_segmenter(tiling=tiling, mask_format="compact")
+        compact = compact_segmenter.segment_concepts(panorama, PROMPTS[:4])
+
+        for masks, _ in compact.values():
+            assert all(isinstance(m, CompactMask) for m in masks)
+        assert_same_results(compact, dense)
+
+    @pytest.mark.parametrize("mask_format", ["dense", "compact"])
+    def test_merge_instances(self, make_segmenter, test_image, mask_format):
+        """Test merged output is the union of the instances, scored by the best instance"""
+        instances = make_segmenter().segment_concepts(test_image, PROMPTS)
+        merging = make_segmenter(merge_instances=True, mask_format=mask_format)
+        merged = merging.segment_concepts(test_image, PROMPTS)
+
+        assert any(len(masks) > 1 for masks, _ in instances.values())
+        for prompt, (masks, metadata) in merged.items():
+            instance_masks, instance_meta = instances[prompt]
+            if not instance_masks:
+                assert masks == []
+                continue
+            assert len(masks) == metadata["instance_count"] == 1
+            np.testing.assert_array_equal(np.asarray(masks[0]),
+                                          np.logical_or.reduce(instance_masks))
+            assert metadata["scores"] == [max(instance_meta["scores"])]
+
+    def test_merge_selected_prompts(self, segmenter, make_segmenter, test_image):
+        """Test merge= unions only the listed prompts (segment_concepts, segment, segment_batch)"""
+        instances = make_segmenter().segment_concepts(test_image, PROMPTS)
+        multi = [p for p in PROMPTS if len(instances[p][0]) > 1]
+        merged_prompt, kept_prompt = multi[0], multi[1]
+
+        results = segmenter.segment_concepts(test_image, PROMPTS, merge=[merged_prompt])
+        batch = segmenter.segment_batch([test_image], PROMPTS, merge=[merged_prompt])[0]
+        single_masks, _ = segmenter.segment(test_image, merged_prompt, merge=True)
+
+        for per_prompt in (results, batch):
+            assert len(per_prompt[merged_prompt][0]) == 1
+            assert len(per_prompt[kept_prompt][0]) == len(instances[kept_prompt][0])
+        np.testing.assert_array_equal(single_masks[0], results[merged_prompt][0][0])
+        assert segmenter.model_version == make_segmenter().model_version
+
+    def test_merge_marks_model_version(self, make_segmenter):
+        base = make_segmenter().model_version
+        assert make_segmenter(merge_instances=True).model_version == base + ":merged"
+        assert make_segmenter(mask_format="compact").model_version == base + ":compact"
+        both = make_segmenter(mask_format="compact", merge_instances=True)
+        assert both.model_version.endswith(":compact:merged")
+
+    def test_invalid_format(self, make_segmenter):
+        with pytest.raises(ValueError):
+            make_segmenter(mask_format="rle")
+
+    def test_compact_masks_numpy(self, fake_torch):
+        from engine.segmenter import compact_masks
+
+        masks = np.zeros((3, 10, 12), dtype=bool)
+        masks[0, 2:5, 3:9] = True
+        masks[2, 9, 11] = True
+
+        compact = compact_masks(masks)
+
+        assert [m.box for m in compact] == [(3, 2, 9, 5), (0, 0, 0, 0), (11, 9, 12, 10)]
+        for mask, expected in zip(compact, masks):
+            np.testing.assert_array_equal(mask.to_dense(), expected)
+
+
+class TestOomRecovery:
+    """Test CUDA OOM handling in the batched encoder / decoder paths"""
+
+    OOM = "CUDA out of memory. Tried to allocate 2.00 GiB"
+
+    @pytest.fixture(autouse=True)
+    def clean_metrics(self):
+        from engine import metrics
+        metrics.reset()
+        yield
+        metrics.reset()
+
+    def limit_encoder(self, segmenter, max_images):
+        """Make set_image_batch raise an OOM-shaped error above max_images"""
+        encode = segmenter.processor.set_image_batch.side_effect
+
+        def set_image_batch(images, state=None):
+            if len(images) > max_images:
+                raise RuntimeError(self.OOM)
+            return encode(images, state)
+
+        segmenter.processor.set_image_batch.side_effect = set_image_batch
+
+    def limit_decoder(self, segmenter, max_queries):
+        """Make forward_grounding raise an OOM-shaped error above max_queries"""
+        decode = segmenter.model.forward_grounding
+
+        def forward_grounding(backbone_out, find_input, geometric_prompt, find_target=None):
+            if len(find_input.img_ids) > max_queries:
+                raise RuntimeError(self.OOM)
+            return decode(backbone_out, find_input, geometric_prompt, find_target)
+
+        segmenter.model.forward_grounding = forward_grounding
+
+    @pytest.fixture
+    def images(self):
+        return [Image.new('RGB', (64, 48), (40 * i, 90, 200 - 30 * i)) for i in range(5)]
+
+    def test_encoder_batch_halved_and_remembered(self, make_segmenter, images):
+        from engine import metrics
+        expected = make_segmenter(max_images_per_batch=1).segment_batch(images, PROMPTS[:3])
+        segmenter = make_segmenter(max_images_per_batch=8)
+        self.limit_encoder(segmenter, 2)
+
+        results = segmenter.segment_batch(images, PROMPTS[:3])
+
+        for got, want in zip(results, expected):
+            assert_same_results(got, want)
+        assert segmenter.processor.image_batches == [2, 2, 1]
+        assert segmenter.safe_image_batch == 2
+        assert segmenter.oom_splits == 1
+        assert metrics.snapshot()["segmenter_oom_splits"] == 1
+
+        # The safe size is used straight away next time (no new OOM)
+        segmenter.segment_batch(images[:4], PROMPTS[:3])
+        assert segmenter.processor.image_batches[3:] == [2, 2]
+        assert segmenter.oom_splits == 1
+
+    def test_decoder_batch_halved(self, make_segmenter, test_image):
+        expected = make_segmenter(max_prompts_per_batch=1).segment_concepts(test_image, PROMPTS[:6])
+        segmenter = make_segmenter(max_prompts_per_batch=8)
+        self.limit_decoder(segmenter, 3)
+
+        results = segmenter.segment_concepts(test_image, PROMPTS[:6])
+
+        assert_same_results(results, expected)
+        assert segmenter.model.grounding_batches == [3, 3]
+        assert segmenter.safe_prompt_batch == 3
+        assert segmenter.oom_splits == 1
+
+    def test_oom_at_batch_size_one_raises(self, make_segmenter, images):
+        segmenter = make_segmenter(max_images_per_batch=4)
+        self.limit_encoder(segmenter, 0)
+
+        with pytest.raises(RuntimeError, match="out of memory"):
+            segmenter.segment_batch(images[:2], ["wall surface"])
+        assert segmenter.oom_splits == 1  # 2 → 1, then gave up
+
+    def test_other_errors_not_split(self, make_segmenter, images):
+        segmenter = make_segmenter(max_images_per_batch=4)
+        error = RuntimeError("device-side assert triggered")
+        segmenter.processor.set_image_batch.side_effect = error
+
+        with pytest.raises(RuntimeError, match="device-side assert"):
+            segmenter.segment_batch(images, ["wall surface"])
+        assert segmenter.oom_splits == 0
+        assert segmenter.safe_image_batch is None
+
+    def test_is_out_of_memory(self, fake_torch):
+        from engine.segmenter import is_out_of_memory
+
+        assert is_out_of_memory(RuntimeError(self.OOM))
+        assert not is_out_of_memory(ValueError("bad prompt"))
+
+
+class TestPhaseTimings:
+    """Test per-phase timings in metadata and metrics histograms"""
+
+    PHASES = {"preprocess", "backbone", "text_encode", "decode", "transfer", "total"}
+
+    @pytest.fixture(autouse=True)
+    def clean_metrics(self):
+        from engine import metrics
+        metrics.reset()
+        yield
+        metrics.reset()
+
+    def test_timings_in_metadata(self, segmenter, test_image):
+        results = segmenter.segment_concepts(test_image, PROMPTS[:3])
+
+        for _, metadata in results.values():
+            timings = metadata["timings_ms"]
+            assert set(timings) == self.PHASES
+            assert all(ms >= 0 for ms in timings.values())
+            assert timings["total"] >= timings["backbone"]
+
+    def test_histograms_recorded(self, segmenter, test_image):
+        from engine import metrics
+
+        segmenter.segment_concepts(test_image, PROMPTS[:2])
+        segmenter.segment(test_image, "wall surface")
+
+        snapshot = metrics.snapshot()
+        for phase in self.PHASES:
+            assert snapshot[f"segmenter_{phase}_ms"]["count"] == 2
+
+    def test_segment_batch_timings(self, segmenter):
+        from engine import metrics
+        images = [Image.new('RGB', (64, 48), (30 * i, 60, 90)) for i in range(3)]
+
+        results = segmenter.segment_batch(images, PROMPTS[:2])
+
+        for per_image in results:
+            for _, metadata in per_image.values():
+                assert set(metadata["timings_ms"]) == self.PHASES
+        # One call, one observation per phase
+        assert metrics.snapshot()["segmenter_total_ms"]["count"] == 1
+
+    def test_probe_timings(self, segmenter, test_image):
+        """Test probe() reports and records the same phases as segment_concepts()"""
+        from engine import metrics
+
+        probes = segmenter.probe(test_image, PROMPTS[:2])
+
+        assert all(set(probe["timings_ms"]) == self.PHASES for probe in probes.values())
+        assert metrics.snapshot()["segmenter_total_ms"]["count"] == 1
+
+    def test_tiled_stitch_phase(self, make_segmenter):
+        from engine.tiling import TileConfig
+        segmenter = make_segmenter(tiling=TileConfig(pixel_threshold=5000, tile_size=48, overlap=8))
+
+        results = segmenter.segment_concepts(Image.new('RGB', (160, 60)), PROMPTS[:2])
+
+        assert "stitch" in results[PROMPTS[0]][1]["timings_ms"]
+
+    def test_concurrent_calls_time_separately(self, segmenter, test_image):
+        """Test two overlapping calls on a shared segmenter each get their own timings"""
+        import threading
+
+        from engine import metrics
+
+        # Both calls are inside the segmenter at once before either encodes
+        barrier = threading.Barrier(2, timeout=5)
+        prepare = segmenter._prepare_image
+
+        def prepare_together(image):
+            barrier.wait()
+            return prepare(image)
+
+        segmenter._prepare_image = prepare_together
+        results = [None, None]
+
+        def run(i):
+            results[i] = segmenter.segment_concepts(test_image, PROMPTS[:2])
+
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        for per_call in results:
+            for _, metadata in per_call.values():
+                assert set(metadata["timings_ms"]) == self.PHASES
+        assert metrics.snapshot()["segmenter_total_ms"]["count"] == 2
+
+    def test_batch_with_tiled_image_single_timer(self, make_segmenter):
+        """Test a tiled image in segment_batch is timed by the batch call, not its own"""
+        from engine import metrics
+        from engine.tiling import TileConfig
+        segmenter = make_segmenter(tiling=TileConfig(pixel_threshold=5000, tile_size=48, overlap=8))
+
+        images = [Image.new('RGB', (160, 60)), Image.new('RGB', (40, 30))]
+        results = segmenter.segment_batch(images, PROMPTS[:2])
+
+        assert all("stitch" in per_image[PROMPTS[0]][1]["timings_ms"] for per_image in results)
+        assert metrics.snapshot()["segmenter_total_ms"]["count"] == 1
+
+    def test_profile_synchronizes_device(self, make_segmenter, fake_torch, test_image):
+        """Test SEGMENTER_PROFILE mode syncs CUDA at phase boundaries"""
+        fake_torch.cuda.is_available.return_value = True
+        make_segmenter(profile=True).segment_concepts(test_image, PROMPTS[:2])
+
+        assert fake_torch.cuda.synchronize.call_count > 0
+
+    def test_no_sync_by_default(self, make_segmenter, fake_torch, test_image):
+        fake_torch.cuda.is_available.return_value = True
+        make_segmenter(profile=False).segment_concepts(test_image, PROMPTS[:2])
+
+        fake_torch.cuda.synchronize.assert_not_called()
+
+
+class TestProbe:
+    """Test probe() and segment_concepts(probe_first=True)"""
+
+    def test_probe_matches_segment_scores(self, segmenter, make_segmenter, test_image):
+        """Test probe scores/counts equal full segmentation, without mask decoding"""
+        probes = segmenter.probe(test_image, PROMPTS)
+        full = make_segmenter().segment_concepts(test_image, PROMPTS)
+
+        assert list(probes) == PROMPTS
+        for prompt, probe in probes.items():
+            _masks, metadata = full[prompt]
+            assert probe["scores"] == metadata["scores"]
+            assert probe["instance_count"] == metadata["instance_count"]
+            assert len(probe["boxes"]) == probe["instance_count"]
+            assert all(len(box) == 4 for box in probe["boxes"])
+        assert segmenter.model.mask_batches == []
+        assert segmenter.model.segmentation_head is not None
+
+    def test_probe_boxes_in_original_pixels(self, make_segmenter):
+        """Test boxes are scaled to the original size even when encoded downscaled"""
+        image = Image.new('RGB', (400, 300), (120, 80, 40))
+        small = make_segmenter(max_input_side=100, mask_upsample="nearest").probe(image, PROMPTS)
+        full = make_segmenter().probe(image, PROMPTS)
+
+        detected = [p for p in PROMPTS if full[p]["boxes"]]
+        assert detected
+        for prompt in detected:
+            np.testing.assert_allclose(small[prompt]["boxes"], full[prompt]["boxes"])
+
+    def test_probe_first_matches_full_decode(self, make_segmenter, test_image):
+        """Test probe_first returns the same masks, decoding masks only for detected prompts"""
+        segmenter = make_segmenter(confidence_threshold=0.87)
+        probed = segmenter.segment_concepts(test_image, PROMPTS, merge=["wall surface"],
+                                            probe_first=True)
+        full = make_segmenter(confidence_threshold=0.87).segment_concepts(
+            test_image, PROMPTS, merge=["wall surface"]
+        )
+
+        assert_same_results(probed, full)
+        detected = sum(1 for _masks, metadata in full.values() if metadata["instance_count"])
+        assert 0 < detected < len(PROMPTS)
+        assert sum(segmenter.model.mask_batches) == detected
+
+    def test_probe_first_skips_decode_when_nothing_detected(self, make_segmenter, test_image):
+        segmenter = make_segmenter(confidence_threshold=1.0)
+
+        results = segmenter.segment_concepts(test_image, ["wall", "door"], probe_first=True)
+
+        assert segmenter.model.mask_batches == []
+        assert all(masks == [] and metadata["scores"] == [] for masks, metadata in results.values())
+
+
+class TestCallThreshold:
+    """Test the per-call confidence_threshold override"""
+
+    @pytest.mark.parametrize("threshold", [0.0, 0.8, 0.87])
+    def test_matches_segmenter_built_with_threshold(self, segmenter, make_segmenter, test_image,
+                                                    threshold):
+        """Test an override gives the same results as a segmenter built with that threshold"""
+        overridden = segmenter.segment_concepts(test_image, PROMPTS, confidence_threshold=threshold)
+        built = make_segmenter(confidence_threshold=threshold).segment_concepts(test_image, PROMPTS)
+
+        assert_same_results(overridden, built)
+        thresholds = [metadata["confidence_threshold"] for _masks, metadata in overridden.values()]
+        assert all(value == threshold for value in thresholds)
+
+    def test_default_restored_after_call(self, segmenter, make_segmenter, test_image):
+        segmenter.segment(test_image, "wall", confidence_threshold=0.0)
+        masks, metadata = segmenter.segment(test_image, "wall")
+
+        assert metadata["confidence_threshold"] == segmenter.confidence_threshold == 0.5
+        reference = make_segmenter().segment_concepts(test_image, ["wall"])
+        assert_same_results({"wall": (masks, metadata)}, reference)
+
+    def test_model_shared(self, segmenter, test_image):
+        """Test overrides reuse the same model, processor and image encoding path"""
+        model, processor = segmenter.model, segmenter.processor
+
+        low = segmenter.segment(test_image, "wall", confidence_threshold=0.0)[1]["instance_count"]
+        high = segmenter.segment(test_image, "wall", confidence_threshold=0.87)[1]["instance_count"]
+
+        assert low > high
+        assert segmenter.model is model and segmenter.processor is processor
+        assert processor.set_image.call_count == 2
+
+    def test_segment_batch_and_probe(self, segmenter, make_segmenter):
+        images = [Image.new('RGB', (32, 24), (v, v, v)) for v in (30, 200)]
+        reference = make_segmenter(confidence_threshold=0.8)
+
+        batched = segmenter.segment_batch(images, PROMPTS, confidence_threshold=0.8)
+        probes = segmenter.probe(images[0], PROMPTS, confidence_threshold=0.8)
+
+        for image, result in zip(images, batched):
+            assert_same_results(result, reference.segment_concepts(image, PROMPTS))
+        assert all(probe["scores"] == batched[0][p][1]["scores"] for p, probe in probes.items())
+
+    def test_tiled(self, make_segmenter):
+        from engine.tiling import TileConfig
+        segmenter = make_segmenter(tiling=TileConfig(pixel_threshold=1000, tile_size=32, overlap=8))
+        image = Image.new('RGB', (80, 40), (90, 60, 30))
+
+        _masks, metadata = segmenter.segment(image, "wall", confidence_threshold=0.0)
+
+        assert metadata["tiles"] > 1 and metadata["confidence_threshold"] == 0.0
+
+    @pytest.mark.parametrize("threshold", [-0.1, 1.5])
+    def test_invalid_threshold(self, segmenter, test_image, threshold):
+        with pytest.raises(ValueError):
+            segmenter.segment(test_image, "wall", confidence_threshold=threshold)
+        assert segmenter.segment(test_image, "wall")[1]["confidence_threshold"] == 0.5
+
+    def test_concurrent_calls_keep_their_threshold(self, segmenter, make_segmenter, test_image):
+        """Test overlapping calls with different thresholds on a shared segmenter"""
+        import threading
+
+        # Both calls are inside the segmenter at once before either decodes
+        barrier = threading.Barrier(2, timeout=5)
+        prepare = segmenter._prepare_image
+
+        def prepare_together(image):
+            barrier.wait()
+            return prepare(image)
+
+        segmenter._prepare_image = prepare_together
+        thresholds = [0.0, 0.87]
+        results = [None, None]
+
+        def run(i):
+            results[i] = segmenter.segment_concepts(test_image, PROMPTS,
+                                                    confidence_threshold=thresholds[i])
+
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        for threshold, result in zip(thresholds, results):
+            built = make_segmenter(confidence_threshold=threshold)
+            reference = built.segment_concepts(test_image, PROMPTS)
+            assert_same_results(result, reference)
@@ -0,0 +1,138 @@
+"""
+Unit tests for tiled segmentation helpers
+
+Tests verify:
+- Tile grid covers the image with the requested overlap, last tile at the edge
+- TileConfig validation and pixel threshold
+- Instances cut by a tile border are merged in the overlap
+- Separate instances and same-tile instances are kept apart
+- Scores of merged instances
+- Compact (CompactMask) tile input and output
+"""
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+# Add parent directory to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from engine.compact_mask import CompactMask
+from engine.tiling import TileConfig, stitch_instances, tile_boxes
+
+
+def tile_mask(full: np.ndarray, box) -> np.ndarray:
+    """Cut the tile region out of a full-image mask"""
+    x0, y0, x1, y1 = box
+    return full[y0:y1, x0:x1].copy()
+
+
+class TestTileBoxes:
+    def test_single_tile_for_small_image(self):
+        assert tile_boxes(500, 400, 1008, 128) == [(0, 0, 500, 400)]
+
+    def test_grid_covers_image_with_overlap(self):
+        """Test every pixel is covered and neighbours share the overlap"""
+        boxes = tile_boxes(250, 120, 100, 20)
+
+        covered = np.zeros((120, 250), dtype=int)
+        for x0, y0, x1, y1 in boxes:
+            assert x1 - x0 <= 100 and y1 - y0 <= 100
+            covered[y0:y1, x0:x1] += 1
+        assert covered.min() >= 1
+        xs = sorted({box[0] for box in boxes})
+        assert xs == [0, 80, 150]
+        assert max(box[2] for box in boxes) == 250
+
+
+class TestTileConfig:
+    def test_threshold(self):
+        config = TileConfig(pixel_threshold=1000)
+        assert config.applies_to(50, 30)
+        assert not config.applies_to(10, 10)
+        assert not TileConfig().applies_to(100000, 100000)
+
+    @pytest.mark.parametrize("kwargs", [
+        {"overlap": 1008},
+        {"tile_size": 0},
+        {"pixel_threshold": -1},
+    ])
+    def test_invalid(self, kwargs):
+        with pytest.raises(ValueError):
+            TileConfig(**kwargs)
+
+    def test_from_env(self, monkeypatch):
+        monkeypatch.setenv("TILE_PIXEL_THRESHOLD", "20000000")
+        monkeypatch.setenv("TILE_OVERLAP", "64")
+        config = TileConfig.from_env()
+        assert (config.pixel_threshold, config.tile_size, config.overlap) == (20000000, 1008, 64)
+
+
+class TestStitchInstances:
+    def test_border_instance_merged(self):
+        """Test an object spanning two tiles becomes one full-size instance"""
+        full = np.zeros((60, 150), dtype=bool)
+        full[10:40, 30:120] = True
+        boxes = tile_boxes(150, 60, 100, 40)
+
+        masks, scores = stitch_instances(
+            (150, 60),
+            [(box, [tile_mask(full, box)], [0.7 + i / 10]) for i, box in enumerate(boxes)],
+        )
+
+        assert len(masks) == 1
+        np.testing.assert_array_equal(masks[0], full)
+        assert scores == [pytest.approx(0.8)]
+
+    def test_separate_objects_kept(self):
+        """Test objects that only meet tile borders in different places stay apart"""
+        left = np.zeros((60, 150), dtype=bool)
+        right = np.zeros((60, 150), dtype=bool)
+        left[5:20, 5:40] = True
+        right[30:50, 110:145] = True
+        boxes = tile_boxes(150, 60, 100, 40)
+
+        tile_results = []
+        for box in boxes:
+            masks = [m for m in (tile_mask(left, box), tile_mask(right, box)) if m.any()]
+            tile_results.append((box, masks, [0.9] * len(masks)))
+
+        masks, _ = stitch_instances((150, 60), tile_results)
+
+        assert len(masks) == 2
+        assert sorted(int(m.sum()) for m in masks) == sorted([int(left.sum()), int(right.sum())])
+
+    def test_same_tile_instances_not_merged(self):
+        """Test overlapping instances from one tile stay separate (model output kept)"""
+        a = np.zeros((20, 20), dtype=bool)
+        a[2:10, 2:10] = True
+        b = a.copy()
+
+        masks, _ = stitch_instances((20, 20), [((0, 0, 20, 20), [a, b], [0.9, 0.8])])
+
+        assert len(masks) == 2
+
+    def test_empty_masks_dropped(self):
+        masks, scores = stitch_instances((10, 10), [((0, 0, 10, 10), [np.zeros((10, 10))], [0.9])])
+        assert masks == [] and scores == []
+
+    def test_compact_output_matches_dense(self):
+        """Test compact=True returns CompactMasks equal to the dense stitch of compact tiles"""
+        obj = np.zeros((60, 150), dtype=bool)
+        obj[10:40, 70:90] = True
+        boxes = tile_boxes(150, 60, 100, 40)
+        dense_tiles = [(box, [tile_mask(obj, box)], [0.9]) for box in boxes]
+        compact_tiles = [
+            (box, [CompactMask.from_dense(m) for m in masks], scores)
+            for box, masks, scores in dense_tiles
+        ]
+
+        dense, _ = stitch_instances((150, 60), dense_tiles)
+        compact, scores = stitch_instances((150, 60), compact_tiles, compact=True)
+
+        assert len(compact) == 1 and isinstance(compact[0], CompactMask)
+        assert compact[0].box == (70, 10, 90, 40)
+        assert np.array_equal(compact[0].to_dense(), dense[0])
+        assert scores == [0.9]
@@ -0,0 +1,187 @@
+"""
+Unit tests for startup warmup and the readiness gate
+
+Tests verify:
+- run_warmup() builds the shared segmenter and segments every preset prompt
+- Warmup durations are recorded as metrics and the worker is marked ready
+- A failed warmup leaves the worker not ready
+- main() finishes the warmup before starting the adapter (and can skip it)
+- Worker metrics are attached to Runpod handler responses
+- The warmed segmenter is built with the same options handler.get_segmenter() expects
+"""
+
+import os
+import sys
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+# Add parent directory to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from engine import metrics
+from engine.registry import SegmenterRegistry
+from engine.warmup import is_ready, run_warmup, warmup_image
+
+
+@pytest.fixture(autouse=True)
+def clean_metrics():
+    metrics.reset()
+    yield
+    metrics.reset()
+
+
+@pytest.fixture
+def segmenter():
+    return MagicMock()
+
+
+@pytest.fixture
+def registry(segmenter):
+    """Registry whose factory returns the mock segmenter (no model load)"""
+    registry = SegmenterRegistry(factory=MagicMock(return_value=segmenter))
+    with patch('engine.warmup.get_registry', return_value=registry):
+        yield registry
+
+
+class TestRunWarmup:
+    """Test warmup of the shared segmenter"""
+
+    def test_segments_every_preset_prompt(self, registry, segmenter):
+        """Test one synthetic image goes through all preset prompts"""
+        from presets import preset_prompts
+
+        report = run_warmup()
+
+        image, prompts = segmenter.segment_concepts.call_args.args
+        assert prompts == preset_prompts()
+        assert image.size == (1024, 768)
+        assert report["prompts"] == len(preset_prompts())
+        assert registry.build_count == 1
+
+    def test_metrics_and_ready(self, registry, segmenter):
+        """Test durations are exposed as metrics and readiness flips"""
+        assert not is_ready()
+
+        report = run_warmup(["wall"])
+
+        snapshot = metrics.snapshot()
+        assert snapshot["worker_ready"] == 1
+        assert snapshot["warmup_seconds"] == report["warmup_sec"]
+        assert snapshot["segmenter_build_seconds"] == report["build_sec"]
+        assert report["total_sec"] >= report["warmup_sec"]
+        assert is_ready()
+
+    def test_reuses_prebuilt_segmenter(self, registry, segmenter):
+        """Test a later get_segmenter() call gets the warmed instance"""
+        run_warmup(["wall"])
+
+        assert registry.get() is segmenter
+        assert registry.build_count == 1
+
+    def test_failure_not_ready(self, registry, segmenter):
+        """Test a failing warmup raises and the worker stays not ready"""
+        segmenter.segment_concepts.side_effect = RuntimeError("CUDA out of memory")
+
+        with pytest.raises(RuntimeError):
+            run_warmup(["wall"])
+
+        assert not is_ready()
+        assert "warmup_seconds" not in metrics.snapshot()
+
+    def test_warmup_image_deterministic(self):
+        assert warmup_image().tobytes() == warmup_image().tobytes()
+
+
+class TestMainReadinessGate:
+    """Test main.py starts the adapter only after the warmup"""
+
+    def test_warmup_before_adapter_start(self):
+        """Test the adapter starts after the warmup finished"""
+        import main
+
+        calls = []
+        with patch.dict(os.environ, {"ADAPTER": "runpod"}), \
+             patch('engine.warmup.WARMUP_ON_START', True), \
+             patch('engine.warmup.run_warmup', side_effect=lambda: calls.append("warmup")), \
+             patch('adapters.runpod_serverless.start', side_effect=lambda: calls.append("start")):
+            main.main()
+
+        assert calls == ["warmup", "start"]
+
+    def test_failed_warmup_never_starts(self):
+        """Test a worker that cannot warm up does not accept jobs"""
+        import main
+
+        failure = RuntimeError("Failed to load SAM3 model")
+        with patch.dict(os.environ, {"ADAPTER": "runpod"}), \
+             patch('engine.warmup.WARMUP_ON_START', True), \
+             patch('engine.warmup.run_warmup', side_effect=failure), \
+             patch('adapters.runpod_serverless.start') as start:
+            with pytest.raises(RuntimeError):
+                main.main()
+
+        start.assert_not_called()
+
+    def test_warmup_disabled(self):
+        """Test WARMUP_ON_START=0 starts the adapter immediately"""
+        import main
+
+        with patch.dict(os.environ, {"ADAPTER": "runpod"}), \
+             patch('engine.warmup.WARMUP_ON_START', False), \
+             patch('engine.warmup.run_warmup') as warmup, \
+             patch('adapters.runpod_serverless.start') as start:
+            main.main()
+
+        warmup.assert_not_called()
+        start.assert_called_once()
+
+    def test_unknown_adapter_rejected_before_warmup(self):
+        """Test a bad ADAPTER fails fast without building the model"""
+        import main
+
+        with patch.dict(os.environ, {"ADAPTER": "bogus"}), \
+             patch('engine.warmup.run_warmup') as warmup:
+            with pytest.raises(ValueError, match="Unknown adapter"):
+                main.main()
+
+        warmup.assert_not_called()
+
+
+class TestHandlerWorkerMetrics:
+    """Test metrics exposure in Runpod responses"""
+
+    def test_metrics_attached(self):
+        """Test recorded worker metrics are returned with the job output"""
+        from adapters import runpod_serverless
+
+        metrics.set_gauge("warmup_seconds", 12.5)
+        with patch('adapters.runpod_serverless.run_pipeline', return_value={"total_items": 1}):
+            result = runpod_serverless.handler({"input": {"job_id": "j"}})
+
+        assert result["output"]["worker_metrics"] == {"warmup_seconds": 12.5}
+
+
+class TestWarmupBuildOptions:
+    """Test warmup and the handler resolve segmenter build options the same way"""
+
+    def test_handler_after_warmup_keeps_env_threshold(self):
+        """Test CONFIDENCE_THRESHOLD applies when the warmup built the segmenter first"""
+        sys.modules.setdefault('runpod', MagicMock())
+        import handler
+
+        def build(checkpoint_path, bpe_path, precision, **options):
+            segmenter = MagicMock()
+            segmenter.confidence_threshold = options["confidence_threshold"]
+            return segmenter
+
+        registry = SegmenterRegistry(factory=build)
+        with patch.dict(os.environ, {"CONFIDENCE_THRESHOLD": "0.3"}), \
+             patch('engine.registry._registry', registry), \
+             patch('engine.warmup.get_registry', return_value=registry), \
+             patch('engine.scheduler.SCHEDULER_ENABLED', False):
+            run_warmup(["wall"])
+            segmenter = handler.get_segmenter()
+
+        assert registry.build_count == 1
+        assert segmenter.confidence_threshold == 0.3